@@ -0,0 +1,803 @@
+import re
+import json
+import time
+import uuid
+import hashlib
+import itertools
+import threading
+from collections import Counter, deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from requests.adapters import HTTPAdapter
+
+
+# local stand-ins for the parts of the Dropbox and Google Drive apis the stores use.
+# one http server answers both, the real host name is the first path segment:
+#   https://www.googleapis.com/drive/v3/files -> http://127.0.0.1:<port>/www.googleapis.com/drive/v3/files
+# every access token is a separate account with its own files, counters and rate limit
+
+
+class FakeRequest:
+    def __init__(self, method, host, path, query, headers, body):
+        self.method = method
+        self.host = host
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body.decode() or 'null')
+
+
+class FakeResponse:
+    def __init__(self, status, body=b'', content_type='application/json', headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+        self.headers = headers or {}
+
+
+class FakeAccount:
+    def __init__(self, quota=None):
+        self.lock = threading.RLock()
+        # bytes of file data the account may hold, None is unlimited
+        self.quota = quota
+        self.counter = itertools.count(1)
+        self.google_files = {
+            FakeGoogleDrive.root_id: {'id': FakeGoogleDrive.root_id, 'name': FakeGoogleDrive.root_alias,
+                                      'mimeType': FakeGoogleDrive.folder_type, 'parents': []}
+        }
+        self.dropbox_entries = {'': {'name': '', 'display': '', 'dir': True, 'id': 'id:0'}}
+        # upload sessions, list cursors, change tokens and batch jobs
+        self.sessions = {}
+        self.requests = Counter()
+        # calls carried inside google batch requests, they don't count as requests
+        self.batched = Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.throttled = 0
+        # send times of the last second, for the rate limit
+        self.sent = deque()
+
+    def next_id(self):
+        return next(self.counter)
+
+    def used(self):
+        return (sum(len(entry['data']) for entry in self.dropbox_entries.values() if not entry['dir'])
+                + sum(len(file['data']) for file in self.google_files.values() if 'data' in file))
+
+    def fits(self, size: int):
+        return self.quota is None or self.used() + size <= self.quota
+
+    def stats(self):
+        with self.lock:
+            return {
+                'requests': sum(self.requests.values()),
+                'endpoints': dict(self.requests),
+                'batched': dict(self.batched),
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'throttled': self.throttled
+            }
+
+
+class FakeDropbox:
+    hosts = ('api.dropboxapi.com', 'content.dropboxapi.com')
+    hash_block_size = 4 * 1024 * 1024
+
+    def __init__(self, page_size=500):
+        self.page_size = page_size
+
+    def throttle(self):
+        return FakeResponse(429, {'error_summary': 'too_many_requests/', 'error': {'.tag': 'too_many_requests'}},
+                            headers={'Retry-After': '1'})
+
+    @staticmethod
+    def error(summary, error, status=409):
+        return FakeResponse(status, {'error_summary': summary, 'error': error})
+
+    @staticmethod
+    def not_found(tag='path'):
+        return FakeDropbox.error('{0}/not_found/'.format(tag), {'.tag': tag, tag: {'.tag': 'not_found'}})
+
+    @staticmethod
+    def conflict(kind):
+        return FakeDropbox.error('path/conflict/{0}/'.format(kind),
+                                 {'.tag': 'path', 'path': {'.tag': 'conflict', 'conflict': {'.tag': kind}}})
+
+    @staticmethod
+    def parent(key):
+        return key.rsplit('/', 1)[0]
+
+    def content_hash(self, data):
+        digests = b''.join(hashlib.sha256(data[offset:offset + self.hash_block_size]).digest()
+                           for offset in range(0, len(data), self.hash_block_size))
+        return hashlib.sha256(digests).hexdigest()
+
+    def metadata(self, account, key):
+        entry = account.dropbox_entries[key]
+        result = {
+            '.tag': 'folder' if entry['dir'] else 'file',
+            'name': entry['name'],
+            'path_lower': key,
+            'path_display': entry['display'],
+            'id': entry['id']
+        }
+        if not entry['dir']:
+            result.update(size=len(entry['data']), rev=entry['rev'], content_hash=entry['hash'],
+                          server_modified='2020-01-01T00:00:00Z')
+        return result
+
+    def snapshot(self, account):
+        return {key: (entry.get('rev') or entry['id'], entry['display'])
+                for key, entry in account.dropbox_entries.items() if key}
+
+    def make_parents(self, account, display):
+        # dropbox creates missing parent folders
+        parts = display.split('/')
+        for index in range(2, len(parts)):
+            display_parent = '/'.join(parts[:index])
+            if display_parent.lower() not in account.dropbox_entries:
+                account.dropbox_entries[display_parent.lower()] = {
+                    'name': parts[index - 1], 'display': display_parent, 'dir': True,
+                    'id': 'id:{0}'.format(account.next_id())}
+
+    def add_file(self, account, display, data):
+        key = display.lower()
+        if key in account.dropbox_entries:
+            return None
+        self.make_parents(account, display)
+        account.dropbox_entries[key] = {
+            'name': display.rsplit('/', 1)[1], 'display': display, 'dir': False, 'data': data,
+            'id': 'id:{0}'.format(account.next_id()), 'rev': 'rev{0}'.format(account.next_id()),
+            'hash': self.content_hash(data)}
+        return self.metadata(account, key)
+
+    def add_folder(self, account, display):
+        key = display.lower()
+        if key in account.dropbox_entries:
+            return None
+        self.make_parents(account, display)
+        account.dropbox_entries[key] = {'name': display.rsplit('/', 1)[1], 'display': display, 'dir': True,
+                                        'id': 'id:{0}'.format(account.next_id())}
+        return self.metadata(account, key)
+
+    def delete(self, account, key):
+        if key not in account.dropbox_entries:
+            return None
+        metadata = self.metadata(account, key)
+        for child in [child for child in account.dropbox_entries if child == key or child.startswith(key + '/')]:
+            del account.dropbox_entries[child]
+        return metadata
+
+    def relocate(self, account, from_path, to_path, moving):
+        # (metadata, None) or (None, relocation error)
+        source, target = from_path.lower(), to_path.lower()
+        if source not in account.dropbox_entries:
+            return None, {'.tag': 'from_lookup', 'from_lookup': {'.tag': 'not_found'}}
+        if target in account.dropbox_entries:
+            return None, {'.tag': 'to', 'to': {'.tag': 'conflict', 'conflict': {'.tag': 'file'}}}
+        self.make_parents(account, to_path)
+        for key in sorted(key for key in account.dropbox_entries if key == source or key.startswith(source + '/')):
+            entry = dict(account.dropbox_entries[key])
+            entry['display'] = to_path + entry['display'][len(from_path):]
+            if key == source:
+                entry['name'] = to_path.rsplit('/', 1)[1]
+            if moving:
+                del account.dropbox_entries[key]
+            else:
+                entry['id'] = 'id:{0}'.format(account.next_id())
+                if not entry['dir']:
+                    entry['rev'] = 'rev{0}'.format(account.next_id())
+            account.dropbox_entries[entry['display'].lower()] = entry
+        return self.metadata(account, target), None
+
+    def handle(self, account, request):
+        path = request.path
+        if path == '/2/files/upload':
+            if not account.fits(len(request.body)):
+                return self.error('path/insufficient_space/', {'.tag': 'path', 'upload_session_id': '',
+                                                               'reason': {'.tag': 'insufficient_space'}})
+            metadata = self.add_file(account, json.loads(request.headers['Dropbox-API-Arg'])['path'], request.body)
+            if metadata is None:
+                # upload wraps the write error in `reason`, session finish in `path`
+                return self.error('path/conflict/file/', {'.tag': 'path', 'upload_session_id': '',
+                                                          'reason': {'.tag': 'conflict', 'conflict': {'.tag': 'file'}}})
+            return FakeResponse(200, metadata)
+        if path.startswith('/2/files/upload_session/'):
+            return self.upload_session(account, request, path.rsplit('/', 1)[1])
+        if path == '/2/files/download':
+            key = json.loads(request.headers['Dropbox-API-Arg'])['path'].lower()
+            if key not in account.dropbox_entries or account.dropbox_entries[key]['dir']:
+                return self.not_found()
+            status, data = byte_range(request.headers.get('Range'), account.dropbox_entries[key]['data'])
+            return FakeResponse(status, data, 'application/octet-stream',
+                                {'Dropbox-API-Result': json.dumps(self.metadata(account, key))})
+        body = request.json()
+        if path == '/2/files/create_folder':
+            if not account.fits(1):
+                return self.error('path/insufficient_space/', {'.tag': 'path', 'path': {'.tag': 'insufficient_space'}})
+            metadata = self.add_folder(account, body['path'])
+            return FakeResponse(200, metadata) if metadata else self.conflict('folder')
+        if path == '/2/files/get_metadata':
+            key = body['path'].lower()
+            if key not in account.dropbox_entries:
+                return self.not_found()
+            return FakeResponse(200, self.metadata(account, key))
+        if path == '/2/files/delete':
+            metadata = self.delete(account, body['path'].lower())
+            return FakeResponse(200, metadata) if metadata else self.not_found('path_lookup')
+        if path in ('/2/files/copy_v2', '/2/files/move_v2'):
+            metadata, error = self.relocate(account, body['from_path'], body['to_path'], path == '/2/files/move_v2')
+            if error is not None:
+                return self.error('{0}/'.format(error['.tag']), error)
+            return FakeResponse(200, {'metadata': metadata})
+        if path in ('/2/files/delete_batch', '/2/files/create_folder_batch'):
+            return self.batch(account, path, body)
+        if path in ('/2/files/copy_batch_v2', '/2/files/move_batch_v2'):
+            entries = []
+            for item in body['entries']:
+                metadata, error = self.relocate(account, item['from_path'], item['to_path'],
+                                                path == '/2/files/move_batch_v2')
+                if error is not None:
+                    entries.append({'.tag': 'failure', 'failure': {'.tag': 'relocation_error',
+                                                                   'relocation_error': error}})
+                else:
+                    entries.append({'.tag': 'success', 'success': metadata})
+            job_id = uuid.uuid4().hex
+            account.sessions[job_id] = [{'.tag': 'in_progress'}, {'.tag': 'complete', 'entries': entries}]
+            return FakeResponse(200, {'.tag': 'async_job_id', 'async_job_id': job_id})
+        if path.endswith(('_batch/check', '_batch/check_v2')):
+            return FakeResponse(200, account.sessions[body['async_job_id']].pop(0))
+        if path == '/2/files/list_folder':
+            return self.list_folder(account, body)
+        if path == '/2/users/get_space_usage':
+            return FakeResponse(200, {'used': account.used(), 'allocation': {
+                '.tag': 'individual', 'allocated': account.quota if account.quota is not None else 2 ** 50}})
+        if path == '/2/files/list_folder/continue':
+            if body['cursor'] not in account.sessions:
+                return self.error('reset/', {'.tag': 'reset'})
+            return self.list_folder(account, account.sessions.pop(body['cursor']))
+        return self.error('unknown/', {'.tag': 'unknown {0}'.format(path)}, 400)
+
+    def upload_session(self, account, request, operation):
+        arg = json.loads(request.headers['Dropbox-API-Arg'])
+        if operation == 'start':
+            session_id = uuid.uuid4().hex
+            account.sessions[session_id] = request.body
+            return FakeResponse(200, {'session_id': session_id})
+        cursor = arg['cursor']
+        if cursor['session_id'] not in account.sessions:
+            return self.error('not_found/', {'.tag': 'not_found'})
+        received = account.sessions[cursor['session_id']]
+        if cursor['offset'] != len(received):
+            error = {'.tag': 'incorrect_offset', 'correct_offset': len(received)}
+            if operation != 'append_v2':
+                error = {'.tag': 'lookup_failed', 'lookup_failed': error}
+            return self.error('incorrect_offset/', error)
+        account.sessions[cursor['session_id']] = received + request.body
+        if operation == 'append_v2':
+            return FakeResponse(200, b'null')
+        if not account.fits(len(account.sessions[cursor['session_id']])):
+            return self.error('path/insufficient_space/', {'.tag': 'path', 'path': {'.tag': 'insufficient_space'}})
+        metadata = self.add_file(account, arg['commit']['path'], account.sessions.pop(cursor['session_id']))
+        return FakeResponse(200, metadata) if metadata else self.conflict('file')
+
+    def batch(self, account, path, body):
+        entries = []
+        deleting = path == '/2/files/delete_batch'
+        for item in body['entries'] if deleting else body['paths']:
+            if deleting:
+                metadata = self.delete(account, item['path'].lower())
+                failure = {'.tag': 'path_lookup', 'path_lookup': {'.tag': 'not_found'}}
+            else:
+                metadata = self.add_folder(account, item)
+                failure = {'.tag': 'path', 'path': {'.tag': 'conflict', 'conflict': {'.tag': 'folder'}}}
+            if metadata:
+                entries.append({'.tag': 'success', 'metadata': metadata})
+            else:
+                entries.append({'.tag': 'failure', 'failure': failure})
+        if deleting or body.get('force_async'):
+            # answered by the first /check after one in_progress
+            job_id = uuid.uuid4().hex
+            account.sessions[job_id] = [{'.tag': 'in_progress'}, {'.tag': 'complete', 'entries': entries}]
+            return FakeResponse(200, {'.tag': 'async_job_id', 'async_job_id': job_id})
+        return FakeResponse(200, {'.tag': 'complete', 'entries': entries})
+
+    def list_folder(self, account, body):
+        if '_changes_since' in body:
+            # continuing the cursor of a finished recursive listing gives the changes since
+            before, after = body['_changes_since'], self.snapshot(account)
+            entries = [{'.tag': 'deleted', 'name': before[key][1].rsplit('/', 1)[1], 'path_lower': key,
+                        'path_display': before[key][1]} for key in sorted(before) if key not in after]
+            entries += [self.metadata(account, key) for key in sorted(after) if before.get(key) != after[key]]
+            cursor = uuid.uuid4().hex
+            account.sessions[cursor] = {'_changes_since': after}
+            return FakeResponse(200, {'entries': entries, 'cursor': cursor, 'has_more': False})
+        key = body['path'].lower()
+        if key not in account.dropbox_entries:
+            return self.not_found()
+        if body.get('recursive'):
+            children = sorted(child for child in account.dropbox_entries if child.startswith(key + '/'))
+        else:
+            children = sorted(child for child in account.dropbox_entries if child and self.parent(child) == key)
+        start = body.get('_start', 0)
+        end = start + min(body.get('limit', self.page_size), self.page_size)
+        cursor = uuid.uuid4().hex
+        if end < len(children):
+            account.sessions[cursor] = dict(body, _start=end)
+        elif body.get('recursive'):
+            account.sessions[cursor] = {'_changes_since': self.snapshot(account)}
+        return FakeResponse(200, {'entries': [self.metadata(account, child) for child in children[start:end]],
+                                  'cursor': cursor, 'has_more': end < len(children)})
+
+
+class FakeGoogleDrive:
+    hosts = ('www.googleapis.com',)
+    root_id = 'root0'
+    root_alias = 'appDataFolder'
+    folder_type = 'application/vnd.google-apps.folder'
+    default_fields = ('kind', 'id', 'name', 'mimeType')
+
+    def __init__(self, page_size=1000):
+        self.page_size = page_size
+
+    def throttle(self):
+        return self.error(403, 'userRateLimitExceeded')
+
+    @staticmethod
+    def error(status, reason):
+        return FakeResponse(status, {'error': {'code': status, 'errors': [{'reason': reason}], 'message': reason}})
+
+    def file_id(self, file_id):
+        return FakeGoogleDrive.root_id if file_id == FakeGoogleDrive.root_alias else file_id
+
+    def view(self, file, fields=None):
+        keys = FakeGoogleDrive.default_fields
+        if fields:
+            inner = re.search(r'(?:files|file)\((.*?)\)', fields)
+            keys = [key.strip() for key in (inner.group(1) if inner else fields).split(',')]
+        view = dict(file, kind='drive#file')
+        return {key: view[key] for key in keys if key in view}
+
+    def snapshot(self, account):
+        return {file_id: (file['name'], tuple(file['parents']), file.get('headRevisionId'))
+                for file_id, file in account.google_files.items() if file_id != FakeGoogleDrive.root_id}
+
+    def create(self, account, metadata, data=None):
+        # None when a parent is missing, False when the data doesn't fit the quota
+        if data is not None and not account.fits(len(data)):
+            return False
+        parents = [self.file_id(parent) for parent in metadata.get('parents', [FakeGoogleDrive.root_id])]
+        if any(parent not in account.google_files for parent in parents):
+            return None
+        file_id = 'f{0}'.format(account.next_id())
+        file = {'id': file_id, 'name': metadata['name'], 'parents': parents,
+                'mimeType': metadata.get('mimeType', 'application/octet-stream'),
+                'modifiedTime': '2020-01-01T00:00:00.000Z'}
+        if 'appProperties' in metadata:
+            file['appProperties'] = {key: str(value).lower() if isinstance(value, bool) else str(value)
+                                     for key, value in metadata['appProperties'].items()}
+        if data is not None:
+            file.update(data=data, size=str(len(data)), md5Checksum=hashlib.md5(data).hexdigest(),
+                        headRevisionId='r{0}'.format(account.next_id()))
+        account.google_files[file_id] = file
+        return file
+
+    def created(self, file):
+        if file is False:
+            return self.error(403, 'storageQuotaExceeded')
+        return FakeResponse(200, self.view(file)) if file else self.error(404, 'notFound')
+
+    def delete(self, account, file_id):
+        for child in [child for child, file in account.google_files.items() if file_id in file['parents']]:
+            self.delete(account, child)
+        account.google_files.pop(file_id, None)
+
+    def handle(self, account, request):
+        path, query = request.path, request.query
+        if path == '/batch/drive/v3':
+            return self.batch(account, request)
+        if path == '/drive/v3/changes/startPageToken':
+            token = uuid.uuid4().hex
+            account.sessions[token] = self.snapshot(account)
+            return FakeResponse(200, {'startPageToken': token})
+        if path == '/drive/v3/changes':
+            return self.changes(account, query)
+        if path == '/drive/v3/about':
+            quota = {'usage': str(account.used())}
+            if account.quota is not None:
+                quota['limit'] = str(account.quota)
+            return FakeResponse(200, {'storageQuota': quota})
+        if path in ('/drive/v3/files', '/drive/v3/files/'):
+            if request.method == 'GET':
+                return self.search(account, query)
+            file = self.create(account, request.json())
+            return FakeResponse(200, self.view(file)) if file else self.error(404, 'notFound')
+        match = re.match(r'/drive/v3/files/([^/]+)/copy$', path)
+        if match:
+            return self.copy(account, self.file_id(match.group(1)), request.json())
+        match = re.match(r'/drive/v3/files/([^/]+)$', path)
+        if match:
+            file = account.google_files.get(self.file_id(match.group(1)))
+            if file is None:
+                return self.error(404, 'notFound')
+            if request.method == 'PATCH':
+                return self.update(account, file, query, request.json())
+            if request.method == 'DELETE':
+                self.delete(account, file['id'])
+                return FakeResponse(204)
+            if query.get('alt') == 'media':
+                status, data = byte_range(request.headers.get('Range'), file.get('data', b''))
+                return FakeResponse(status, data, 'application/octet-stream')
+            return FakeResponse(200, self.view(file, query.get('fields')))
+        if path == '/upload/drive/v3/files':
+            if request.method == 'PUT':
+                return self.upload_part(account, request)
+            if query.get('uploadType') == 'resumable':
+                metadata = request.json()
+                if any(self.file_id(parent) not in account.google_files for parent in metadata.get('parents', [])):
+                    return self.error(404, 'notFound')
+                upload_id = uuid.uuid4().hex
+                account.sessions[upload_id] = {'metadata': metadata, 'data': b''}
+                location = 'https://www.googleapis.com/upload/drive/v3/files?uploadType=resumable&upload_id={0}'
+                return FakeResponse(200, headers={'Location': location.format(upload_id)})
+            if query.get('uploadType') == 'multipart':
+                metadata, data = self.parse_related(request)
+                return self.created(self.create(account, metadata, data))
+        return self.error(400, 'unknown {0} {1}'.format(request.method, path))
+
+    def copy(self, account, file_id, metadata):
+        file = account.google_files.get(file_id)
+        if file is None:
+            return self.error(404, 'notFound')
+        if file['mimeType'] == FakeGoogleDrive.folder_type:
+            return self.error(403, 'cannotCopyFile')
+        metadata = dict(metadata, mimeType=file['mimeType'])
+        if 'appProperties' in file:
+            metadata['appProperties'] = file['appProperties']
+        return self.created(self.create(account, metadata, file['data']))
+
+    def update(self, account, file, query, metadata):
+        added = [parent for parent in query.get('addParents', '').split(',') if parent]
+        removed = [parent for parent in query.get('removeParents', '').split(',') if parent]
+        # like drive, parents are changed by real ids only
+        if any(parent not in account.google_files for parent in added):
+            return self.error(404, 'notFound')
+        if any(parent not in file['parents'] for parent in removed):
+            return self.error(400, 'badRequest')
+        file['parents'] = [parent for parent in file['parents'] if parent not in removed] + added
+        if 'name' in metadata:
+            file['name'] = metadata['name']
+        # like drive, the given properties are merged into the kept ones
+        for key, value in metadata.get('appProperties', {}).items():
+            file.setdefault('appProperties', {})[key] = str(value).lower() if isinstance(value, bool) else str(value)
+        return FakeResponse(200, self.view(file, query.get('fields')))
+
+    def search(self, account, query):
+        q = query.get('q', '')
+        parent = re.search(r"'([^']*)' in parents", q)
+        name = re.search(r"name = '((?:[^'\\]|\\.)*)'", q)
+        parent_id = self.file_id(parent.group(1)) if parent else None
+        name = name.group(1).replace("\\'", "'") if name else None
+        files = [file for file in account.google_files.values()
+                 if file['id'] != FakeGoogleDrive.root_id
+                 and (parent_id is None or parent_id in file['parents'])
+                 and (name is None or file['name'] == name)]
+        page_size = min(int(query.get('pageSize', 100)), self.page_size)
+        start = int(query.get('pageToken', 0))
+        result = {'files': [self.view(file, query.get('fields')) for file in files[start:start + page_size]]}
+        if start + page_size < len(files):
+            result['nextPageToken'] = str(start + page_size)
+        return FakeResponse(200, result)
+
+    def changes(self, account, query):
+        if query.get('pageToken') not in account.sessions:
+            return self.error(404, 'notFound')
+        before, after = account.sessions[query['pageToken']], self.snapshot(account)
+        fields = query.get('fields', '')
+        inner = re.search(r'file\((.*)\)\)', fields)
+        changes = [{'fileId': file_id, 'removed': True} for file_id in before if file_id not in after]
+        changes += [{'fileId': file_id, 'removed': False,
+                     'file': self.view(account.google_files[file_id], inner.group(1) if inner else None)}
+                    for file_id in after if before.get(file_id) != after[file_id]]
+        token = uuid.uuid4().hex
+        account.sessions[token] = after
+        return FakeResponse(200, {'changes': changes, 'newStartPageToken': token})
+
+    def upload_part(self, account, request):
+        upload = account.sessions.get(request.query.get('upload_id'))
+        if upload is None:
+            return self.error(404, 'notFound')
+        received, total = request.headers['Content-Range'].split(' ')[1].split('/')
+        if received != '*':
+            first = int(received.split('-')[0])
+            if first != len(upload['data']):
+                return self.error(400, 'badRequest')
+            upload['data'] += request.body
+        if total != '*' and len(upload['data']) == int(total):
+            del account.sessions[request.query['upload_id']]
+            return self.created(self.create(account, upload['metadata'], upload['data']))
+        headers = {'Range': 'bytes=0-{0}'.format(len(upload['data']) - 1)} if upload['data'] else {}
+        return FakeResponse(308, headers=headers)
+
+    @staticmethod
+    def parse_related(request):
+        boundary = re.search(r'boundary="?([^";]+)"?', request.headers['Content-Type']).group(1).encode()
+        parts = request.body.split(b'--' + boundary)
+        metadata = parts[1].split(b'\r\n\r\n', 1)[1][:-2]
+        # the data part may hold the boundary text itself, join everything up to the closing one
+        data = (b'--' + boundary).join(parts[2:-1]).split(b'\r\n\r\n', 1)[1][:-2]
+        return json.loads(metadata.decode()), data
+
+    def batch(self, account, request):
+        boundary = re.search(r'boundary="?([^";]+)"?', request.headers['Content-Type']).group(1)
+        answers = []
+        for part in request.body.split(('--' + boundary).encode())[1:]:
+            if part.startswith(b'--'):
+                break
+            head, inner = part.strip(b'\r\n').split(b'\r\n\r\n', 1)
+            content_id = re.search(rb'Content-ID: <(.*)>', head).group(1).decode()
+            line, _, rest = inner.partition(b'\r\n')
+            method, url, _ = line.decode().split(' ')
+            body = rest.split(b'\r\n\r\n', 1)[1].strip(b'\r\n') if b'\r\n\r\n' in rest else b''
+            url = urlsplit(url)
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            account.batched['{0} {1}{2}'.format(method, request.host, endpoint(url.path))] += 1
+            answer = self.handle(account, FakeRequest(method, request.host, url.path, query, {}, body))
+            answers.append('--batch_answer\r\nContent-Type: application/http\r\nContent-ID: <response-{0}>\r\n\r\n'
+                           'HTTP/1.1 {1} X\r\nContent-Type: {2}\r\n\r\n{3}\r\n'
+                           .format(content_id, answer.status, answer.content_type, answer.body.decode()))
+        answers.append('--batch_answer--\r\n')
+        return FakeResponse(200, ''.join(answers).encode(), 'multipart/mixed; boundary=batch_answer')
+
+
+def byte_range(header, data):
+    if not header:
+        return 200, data
+    first, last = header.split('=', 1)[1].split('-')
+    first = int(first)
+    last = int(last) if last else len(data) - 1
+    if first >= len(data):
+        return 416, b''
+    return 206, data[first:last + 1]
+
+
+def endpoint(path):
+    # ids don't make separate endpoints
+    return re.sub(r'^(/drive/v3/files/)[^/]+(/copy)?$', r'\1<id>\2', path.rstrip('/'))
+
+
+class FakeRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, don't let them wait for an ack
+    disable_nagle_algorithm = True
+    paced_write_size = 64 * 1024
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return bytes(body)
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def write(self, response, pace=None):
+        self.send_response(response.status)
+        self.send_header('Content-Type', response.content_type)
+        self.send_header('Content-Length', str(len(response.body)))
+        for name, value in response.headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if pace is None:
+            self.wfile.write(response.body)
+            return
+        # sent at the bandwidth, so clients can use the first bytes before the last arrive
+        for offset in range(0, len(response.body), FakeRequestHandler.paced_write_size):
+            piece = response.body[offset:offset + FakeRequestHandler.paced_write_size]
+            pace(len(piece))
+            self.wfile.write(piece)
+
+    def handle_request(self):
+        server = self.server.fake
+        url = urlsplit(self.path)
+        host, _, path = url.path[1:].partition('/')
+        path = '/' + path
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        body = self.read_body()
+        if host == '_stats':
+            return self.write(FakeResponse(200, server.account(path[1:]).stats()))
+        token = (self.headers.get('Authorization') or ' ').split(' ', 1)[1]
+        if path in ('/oauth2/token', '/oauth2/v4/token'):
+            return self.write(FakeResponse(200, {'access_token': token or 'refreshed', 'token_type': 'Bearer',
+                                                 'expires_in': 14400}))
+        provider = server.providers.get(host)
+        if provider is None:
+            return self.write(FakeResponse(404, b'unknown host', 'text/plain'))
+        account = server.account(token)
+        request = FakeRequest(self.command, host, path, query, self.headers, body)
+        server.delay(len(body))
+        with account.lock:
+            account.requests['{0} {1}{2}'.format(self.command, host, endpoint(path))] += 1
+            account.bytes_in += len(body)
+            if server.over_limit(account):
+                account.throttled += 1
+                response = provider.throttle()
+            else:
+                response = provider.handle(account, request)
+            account.bytes_out += len(response.body)
+        server.delay(0)
+        self.write(response, server.pace)
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def do_PUT(self):
+        self.handle_request()
+
+    def do_PATCH(self):
+        self.handle_request()
+
+    def do_DELETE(self):
+        self.handle_request()
+
+
+class FakeServer:
+    # latency is added once to every request in seconds, bandwidth in bytes per second applies to each
+    # request and response body, rate_limit is the requests per second of an account before it is throttled,
+    # quota the bytes of data every account may hold. None turns each of them off. page_size caps the entries
+    # of one listing response
+    def __init__(self, latency=None, bandwidth=None, rate_limit=None, page_size=None, port=0, quota=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.rate_limit = rate_limit
+        self.quota = quota
+        self.providers = {}
+        if page_size:
+            providers = (FakeDropbox(page_size), FakeGoogleDrive(page_size))
+        else:
+            providers = (FakeDropbox(), FakeGoogleDrive())
+        for provider in providers:
+            for host in provider.hosts:
+                self.providers[host] = provider
+        self.__accounts = {}
+        self.__lock = threading.Lock()
+        self.__server = ThreadingHTTPServer(('127.0.0.1', port), FakeRequestHandler)
+        self.__server.daemon_threads = True
+        self.__server.fake = self
+        self.__thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}'.format(self.__server.server_address[1])
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def account(self, token: str):
+        with self.__lock:
+            if token not in self.__accounts:
+                self.__accounts[token] = FakeAccount(self.quota)
+            return self.__accounts[token]
+
+    def delay(self, size: int):
+        wait = 0
+        if self.latency:
+            wait += self.latency / 2
+        if self.bandwidth:
+            wait += size / self.bandwidth
+        if wait:
+            time.sleep(wait)
+
+    def pace(self, size: int):
+        if self.bandwidth:
+            time.sleep(size / self.bandwidth)
+
+    def over_limit(self, account):
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        while account.sent and account.sent[0] < now - 1:
+            account.sent.popleft()
+        if len(account.sent) >= self.rate_limit:
+            return True
+        account.sent.append(now)
+        return False
+
+
+class RedirectAdapter(HTTPAdapter):
+    # sends https://<host>/<path> to <base>/<host>/<path>
+    def __init__(self, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip('/')
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        request.url = '{0}/{1}{2}{3}'.format(self.base_url, url.netloc, url.path, '?' + url.query if url.query else '')
+        return super().send(request, **kwargs)
+
+
+class RedirectSession:
+    # the parts of an aiohttp session the async stores use, sending https://<host>/<path> to
+    # <base>/<host>/<path>
+    def __init__(self, base_url, session):
+        self.base_url = base_url.rstrip('/')
+        self.session = session
+
+    @property
+    def closed(self):
+        return self.session.closed
+
+    def redirect(self, url):
+        url = urlsplit(url)
+        return '{0}/{1}{2}{3}'.format(self.base_url, url.netloc, url.path, '?' + url.query if url.query else '')
+
+    def request(self, method, url, **kwargs):
+        return self.session.request(method, self.redirect(url), **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.session.post(self.redirect(url), **kwargs)
+
+    async def close(self):
+        await self.session.close()
+
+
+def fake_config(project_dir, name, **options):
+    # config and token files for stores named `name`, every provider gets its own account
+    for provider in ('google', 'dropbox'):
+        token = {
+            'access_token': '{0}-{1}'.format(provider, name),
+            'refresh_token': 'refresh',
+            'token_type': 'Bearer',
+            'expires_in': 14400,
+            'expires_at': time.time() + 14400
+        }
+        with open(project_dir / '{0}_token_{1}.json'.format(provider, name), 'w') as token_file:
+            token_file.write(json.dumps(token))
+    config = {
+        'google_client_id': 'fake',
+        'google_client_secret': 'fake',
+        'dropbox_client_id': 'fake',
+        'dropbox_client_secret': 'fake',
+        '__project_dir': project_dir
+    }
+    config.update(options)
+    return config
+
+
+def connect(store, url: str, pool_size=10):
+    # points a blocking store at the fake server, wrapper stores pass their inner stores
+    store.session.mount('https://', RedirectAdapter(url, pool_connections=pool_size, pool_maxsize=pool_size))
+    return store
+
+
+def connect_async(store, url: str):
+    # points an async store at the fake server
+    get_session = store.get_session
+    store.get_session = lambda: RedirectSession(url, get_session())
+    return store
@@ -0,0 +1,66 @@
+import os
+import json
+import argparse
+import tracemalloc
+from email.mime.multipart import MIMEMultipart
+from email.mime.application import MIMEApplication
+from email.encoders import encode_noop
+from store.multipart import MultipartRelatedEncoder
+
+
+def email_mime_body(meta, data):
+    # request body as GoogleDriveStore built it with email.mime
+    related = MIMEMultipart('related', 'separator')
+    mm = MIMEApplication(json.dumps(meta), 'json', encode_noop)
+    mm.set_payload(json.dumps(meta))
+    dd = MIMEApplication(data)
+    related.attach(mm)
+    related.attach(dd)
+    return related.as_string().split('\n\n', 1)[1]
+
+
+def encoder_body(meta, data):
+    return MultipartRelatedEncoder([
+        ('application/json; charset=UTF-8', json.dumps(meta).encode()),
+        ('application/octet-stream', data)
+    ])
+
+
+def send(body):
+    # count what would go on the wire, chunk by chunk like http.client does
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if isinstance(body, bytes):
+        return len(body)
+    sent = 0
+    for chunk in body:
+        sent += len(chunk)
+    return sent
+
+
+def measure(build, meta, data):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    sent = send(build(meta, data))
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return sent, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='multipart upload body: email.mime vs MultipartRelatedEncoder')
+    parser.add_argument('--size', type=int, default=16, help='payload size in MB')
+    args = parser.parse_args()
+
+    data = os.urandom(args.size * 1024 * 1024)
+    meta = {'name': 'benchmark', 'parents': ['appDataFolder']}
+    print('payload {0:>14,d} bytes'.format(len(data)))
+    print('{0:<12}{1:>16}{2:>12}{3:>16}{4:>12}'.format('method', 'bytes sent', 'overhead', 'peak memory', 'x payload'))
+    for name, build in (('email.mime', email_mime_body), ('encoder', encoder_body)):
+        sent, peak = measure(build, meta, data)
+        print('{0:<12}{1:>16,d}{2:>11.1f}%{3:>16,d}{4:>12.2f}'.format(
+            name, sent, (sent - len(data)) * 100 / len(data), peak, peak / len(data)))
+
+
+if __name__ == '__main__':
+    main()
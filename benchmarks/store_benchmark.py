@@ -0,0 +1,207 @@
+import os
+import sys
+import time
+import uuid
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from pathlib import Path, PurePath
+import requests
+from benchmarks.fake_servers import FakeServer, fake_config, connect
+from store import DropboxStore, GoogleDriveStore, InMemoryStore, LocalDiskStore
+
+
+# runs store operations against the local fake servers and reports what they cost.
+# every scenario runs in its own process with its own account, so the peak rss and the
+# request counts belong to that scenario only. setup requests are not counted.
+# the local providers show what the stores cost without any network, they make no requests
+
+providers = {
+    'dropbox': DropboxStore,
+    'google': GoogleDriveStore,
+    'memory': InMemoryStore,
+    'disk': LocalDiskStore
+}
+no_requests = {'requests': 0, 'bytes_in': 0, 'bytes_out': 0, 'throttled': 0}
+
+
+def make_store(provider, url, project_dir, name, options):
+    if provider == 'memory':
+        return InMemoryStore()
+    if provider == 'disk':
+        return LocalDiskStore(project_dir / name)
+    config = fake_config(project_dir, name, upload_part_size=options.part_size * 1024)
+    return connect(providers[provider](config, name), url, options.workers)
+
+
+def bench_dir(store):
+    store.make_dir(PurePath('/'), 'bench')
+    return PurePath('/bench')
+
+
+def upload_scenario(store, options, reopen):
+    directory = bench_dir(store)
+    payload = os.urandom(options.size * 1024)
+
+    def run():
+        for index in range(options.files):
+            store.upload_file(directory / 'file{0}'.format(index), payload)
+        return options.files
+    return run
+
+
+def download_scenario(store, options, reopen):
+    directory = bench_dir(store)
+    payload = os.urandom(options.size * 1024)
+    paths = [directory / 'file{0}'.format(index) for index in range(options.files)]
+    store.upload_many([(path, payload) for path in paths], options.workers)
+
+    def run():
+        for path in paths:
+            if len(store.download_file(path)) != len(payload):
+                raise Exception('download fail : reason = wrong size')
+        return len(paths)
+    return run
+
+
+def list_scenario(store, options, reopen):
+    directory = bench_dir(store)
+    store.upload_many([(directory / 'file{0}'.format(index), b'x') for index in range(options.files)],
+                      options.workers)
+
+    def run():
+        for repeat in range(options.repeat):
+            if len(store.get_list(directory)) != options.files:
+                raise Exception('get list fail : reason = wrong count')
+        return options.repeat
+    return run
+
+
+def lookup_scenario(store, options, reopen):
+    # files at the end of a deep path, looked up by a new store that has nothing cached
+    directory = PurePath('/')
+    for level in range(options.depth):
+        store.make_dir(directory, 'level{0}'.format(level))
+        directory = directory / 'level{0}'.format(level)
+    paths = [directory / 'file{0}'.format(index) for index in range(options.files)]
+    store.upload_many([(path, b'x') for path in paths], options.workers)
+
+    def run():
+        fresh = reopen()
+        for path in paths:
+            fresh.get_entry(path)
+        return len(paths)
+    return run
+
+
+def bulk_scenario(store, options, reopen):
+    directory = bench_dir(store)
+    payload = os.urandom(options.size * 1024)
+    paths = [directory / 'file{0}'.format(index) for index in range(options.files)]
+
+    def run():
+        results = store.upload_many([(path, payload) for path in paths], options.workers)
+        results += store.download_many(paths, options.workers)
+        results += store.remove_batch(paths)
+        failed = [result for result in results if not result.ok]
+        if failed:
+            raise failed[0].error
+        return len(results)
+    return run
+
+
+scenarios = {
+    'upload': upload_scenario,
+    'download': download_scenario,
+    'list': list_scenario,
+    'lookup': lookup_scenario,
+    'bulk': bulk_scenario
+}
+
+
+def stats(url, provider, name):
+    if provider in ('memory', 'disk'):
+        return no_requests
+    return requests.get('{0}/_stats/{1}-{2}'.format(url, provider, name)).json()
+
+
+def run_scenario(url, provider, scenario, options, results):
+    project_dir = Path(tempfile.mkdtemp())
+    name = uuid.uuid4().hex
+    reopen = lambda: make_store(provider, url, project_dir, name, options)
+    if provider == 'memory':
+        # a new store would be empty
+        memory = reopen()
+        reopen = lambda: memory
+    try:
+        run = scenarios[scenario](reopen(), options, reopen)
+        before = stats(url, provider, name)
+        started = time.perf_counter()
+        ops = run()
+        elapsed = time.perf_counter() - started
+        after = stats(url, provider, name)
+    except Exception as e:
+        results.put({'error': '{0}: {1}'.format(type(e).__name__, e)})
+        return
+    results.put({
+        'ops': ops,
+        'seconds': elapsed,
+        'requests': after['requests'] - before['requests'],
+        'bytes_in': after['bytes_in'] - before['bytes_in'],
+        'bytes_out': after['bytes_out'] - before['bytes_out'],
+        'throttled': after['throttled'] - before['throttled'],
+        # kilobytes on linux
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    })
+
+
+def measure(url, provider, scenario, options):
+    # spawned, so the child doesn't start with the memory of this process
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=run_scenario, args=(url, provider, scenario, options, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='store operations against local fake dropbox and google drive, or local stores')
+    parser.add_argument('--provider', nargs='+', choices=sorted(providers), default=sorted(providers))
+    parser.add_argument('--scenario', nargs='+', choices=list(scenarios), default=list(scenarios))
+    parser.add_argument('--files', type=int, default=50, help='files per scenario')
+    parser.add_argument('--size', type=int, default=256, help='file size in KB')
+    parser.add_argument('--part-size', type=int, default=8 * 1024, help='upload part size in KB')
+    parser.add_argument('--depth', type=int, default=8, help='directory depth of the lookup scenario')
+    parser.add_argument('--repeat', type=int, default=10, help='listings of the list scenario')
+    parser.add_argument('--workers', type=int, default=8, help='threads of the bulk operations')
+    parser.add_argument('--latency', type=float, default=0, help='round trip latency in ms')
+    parser.add_argument('--bandwidth', type=float, default=0, help='bandwidth per request in MB/s, 0 is unlimited')
+    parser.add_argument('--rate-limit', type=int, default=0, help='requests per second per account, 0 is unlimited')
+    options = parser.parse_args()
+
+    server = FakeServer(options.latency / 1000 or None, options.bandwidth * 1024 * 1024 or None,
+                        options.rate_limit or None).start()
+    print('{0:<9}{1:<10}{2:>7}{3:>10}{4:>10}{5:>9}{6:>14}{7:>14}{8:>10}{9:>12}'.format(
+        'provider', 'scenario', 'ops', 'ops/s', 'requests', 'req/op', 'bytes sent', 'bytes recv', 'throttled',
+        'peak rss'))
+    failed = False
+    for provider in options.provider:
+        for scenario in options.scenario:
+            result = measure(server.url, provider, scenario, options)
+            if 'error' in result:
+                failed = True
+                print('{0:<9}{1:<10}{2}'.format(provider, scenario, result['error']))
+                continue
+            print('{0:<9}{1:<10}{2:>7d}{3:>10.1f}{4:>10d}{5:>9.2f}{6:>14,d}{7:>14,d}{8:>10d}{9:>10.1f}MB'.format(
+                provider, scenario, result['ops'], result['ops'] / result['seconds'], result['requests'],
+                result['requests'] / result['ops'], result['bytes_in'], result['bytes_out'], result['throttled'],
+                result['peak_rss'] / 1024 / 1024))
+    server.stop()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,3 @@
 from . store_exception import *
 
-__all__ = ['DuplicateEntryError', 'NoEntryError', 'DiskFullError']
+__all__ = ['DuplicateEntryError', 'NoEntryError', 'DiskFullError', 'CursorResetError']
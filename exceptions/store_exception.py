@@ -10,4 +10,10 @@ class DuplicateEntryError(Exception):
 
 class DiskFullError(Exception):
     def __init__(self, message):
-        self.message = message
\ No newline at end of file
+        self.message = message
+
+
+class CursorResetError(Exception):
+    # a change cursor expired, list everything again
+    def __init__(self, message):
+        self.message = message
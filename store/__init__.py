@@ -1,6 +1,36 @@
 from . store import Store
 from . directory_entry import DirectoryEntry
+from . bulk_result import BulkResult
+from . change import Change
 from . google_drive_store import GoogleDriveStore
 from . dropbox_store import DropboxStore
+from . striped_store import StripedStore
+from . redundant_store import RedundantStore
+from . async_store import AsyncStore
+from . async_google_drive_store import AsyncGoogleDriveStore
+from . async_dropbox_store import AsyncDropboxStore
+from . metadata_index import MetadataIndex
+from . indexed_store import IndexedStore
+from . chunker import ContentChunker
+from . dedup_store import DedupStore
+from . block_cache import BlockCache
+from . cached_store import CachedStore
+from . store_metrics import StoreMetrics
+from . sync_plan import SyncPlan
+from . sync_engine import SyncEngine
+from . transform import Transform, ZlibTransform, ZstdTransform, EncryptionTransform
+from . transform_store import TransformStore
+from . remote_file import RemoteFile
+from . in_memory_store import InMemoryStore
+from . local_disk_store import LocalDiskStore
+from . tiered_store import TieredStore
+from . store_pool import StorePool
+from . placement_scheduler import PlacementScheduler
 
-__all__ = ['Store', 'GoogleDriveStore', 'DirectoryEntry', 'DropboxStore']
+__all__ = ['Store', 'GoogleDriveStore', 'DirectoryEntry', 'BulkResult', 'DropboxStore', 'StripedStore',
+           'RedundantStore', 'AsyncStore', 'AsyncGoogleDriveStore', 'AsyncDropboxStore', 'Change', 'MetadataIndex',
+           'IndexedStore', 'ContentChunker', 'DedupStore', 'BlockCache',
+           'CachedStore', 'StoreMetrics', 'SyncPlan', 'SyncEngine',
+           'Transform', 'ZlibTransform', 'ZstdTransform', 'EncryptionTransform', 'TransformStore',
+           'RemoteFile', 'InMemoryStore', 'LocalDiskStore', 'TieredStore',
+           'StorePool', 'PlacementScheduler']
@@ -0,0 +1,231 @@
+import json
+from pathlib import PurePath
+from . async_store import AsyncStore, aiohttp
+from . request_scheduler import RequestScheduler
+from . store_metrics import StoreMetrics
+from . directory_entry import DirectoryEntry
+from . stream import asplit_first_part, aiter_with_last, range_header, aiter_response
+from exceptions import *
+
+
+class AsyncDropboxStore(AsyncStore):
+    __download_url = "https://content.dropboxapi.com/2/files/download"
+    __upload_url = "https://content.dropboxapi.com/2/files/upload"
+    __delete_url = "https://api.dropboxapi.com/2/files/delete"
+    __mkdir_url = "https://api.dropboxapi.com/2/files/create_folder"
+    __list_url = "https://api.dropboxapi.com/2/files/list_folder"
+    __session_start_url = "https://content.dropboxapi.com/2/files/upload_session/start"
+    __session_append_url = "https://content.dropboxapi.com/2/files/upload_session/append_v2"
+    __session_finish_url = "https://content.dropboxapi.com/2/files/upload_session/finish"
+
+    def __init__(self, global_config, name):
+        super().__init__()
+        self.client_id = global_config['dropbox_client_id']
+        self.client_secret = global_config['dropbox_client_secret']
+        self.token_path = global_config['__project_dir'] / ('dropbox_token_{0}.json'.format(name))
+        self.token_url = "https://api.dropboxapi.com/oauth2/token"
+        self.upload_part_size = min(global_config.get('upload_part_size', self.upload_part_size),
+                                    150 * 1024 * 1024)
+        self.load_token()
+        self.metrics = global_config.get('__metrics') or StoreMetrics()
+        # shared with the blocking stores of the same account
+        self.scheduler = RequestScheduler.for_account(str(self.token_path), global_config.get('dropbox_request_rate'),
+                                                      global_config.get('dropbox_request_burst'))
+
+    async def download_file(self, path: PurePath):
+        response = await self.__open_download(path)
+        async with response:
+            return await response.read()
+
+    async def download_stream(self, path: PurePath, offset=0, length=None):
+        if length == 0:
+            return
+        response = await self.__open_download(path, range_header(offset, length))
+        async for chunk in aiter_response(response, self.download_chunk_size, offset, length):
+            yield chunk
+
+    async def __open_download(self, path: PurePath, content_range=None):
+        headers = {
+            'Dropbox-API-Arg': json.dumps({'path': path.as_posix()})
+        }
+        if content_range:
+            headers['Range'] = content_range
+        response = await self.open('POST', self.__download_url, headers=headers, idempotent=True)
+        if response.status < 400 or response.status == 416:
+            return response
+        async with response:
+            response = await response.json(content_type=None)
+        reason = response['error']['path']['.tag']
+        if 'not_found' == reason:
+            raise NoEntryError('download fail')
+        raise Exception('download fail : reason = {0}'.format(reason))
+
+    async def upload_file(self, path: PurePath, data, is_chunk=False):
+        parts, single = await asplit_first_part(data, self.upload_part_size)
+        if single:
+            await self.__upload_single(path, await parts.__anext__())
+            return
+        cursor = {
+            'session_id': None,
+            'offset': 0
+        }
+        async for part, is_last in aiter_with_last(parts):
+            if cursor['session_id'] is None:
+                response = await self.__send_part(self.__session_start_url, {'close': False}, part)
+                if 'session_id' in response:
+                    cursor['session_id'] = response['session_id']
+            elif not is_last:
+                response = await self.__send_part(self.__session_append_url, {'cursor': cursor, 'close': False},
+                                                  part)
+            else:
+                args = {
+                    'cursor': cursor,
+                    'commit': {
+                        'path': path.as_posix(),
+                        'mode': 'add',
+                        'autorename': False
+                    }
+                }
+                response = await self.__send_part(self.__session_finish_url, args, part)
+            if 'error' in response:
+                error = response['error']
+                if 'path' == error['.tag']:
+                    self.__raise_write_error(error['path']['.tag'])
+                raise Exception('upload fail : reason = {0}'.format(error['.tag']))
+            cursor['offset'] += len(part)
+
+    async def __upload_single(self, path: PurePath, data: bytes):
+        # sent once like DropboxStore, an 'add' that went through would come back as a conflict
+        args = {
+            'path': path.as_posix(),
+            'mode': 'add'
+        }
+        headers = {
+            'Content-Type': 'application/octet-stream',
+            'Dropbox-API-Arg': json.dumps(args)
+        }
+        response = await self.request('POST', self.__upload_url, data=data, headers=headers)
+        if response.status >= 500:
+            raise Exception('upload fail : reason = status {0}'.format(response.status))
+        response = await response.json(content_type=None)
+        if 'error' in response:
+            self.__raise_write_error(response['error']['reason']['.tag'])
+
+    async def __send_part(self, url: str, args, part: bytes):
+        # same recovery as DropboxStore, resend from the offset dropbox reports
+        sent = 0
+        failures = 0
+        offset = args['cursor']['offset'] if 'cursor' in args else 0
+        while failures <= self.upload_part_retries:
+            request_args = dict(args)
+            if 'cursor' in args:
+                request_args['cursor'] = dict(args['cursor'], offset=offset + sent)
+            headers = {
+                'Content-Type': 'application/octet-stream',
+                'Dropbox-API-Arg': json.dumps(request_args)
+            }
+            try:
+                response = await self.request('POST', url, data=part[sent:], headers=headers)
+            except aiohttp.ClientError:
+                failures += 1
+                continue
+            if response.status >= 500:
+                failures += 1
+                continue
+            result = (await response.json(content_type=None)) or {}
+            if 'error' not in result:
+                return result
+            error = result['error']
+            if 'lookup_failed' == error['.tag']:
+                error = error['lookup_failed']
+            if 'incorrect_offset' == error['.tag'] and offset <= error['correct_offset'] <= offset + len(part):
+                # a correct offset that doesn't move forward counts as a failed try, a server
+                # repeating it would keep the part going round forever
+                if error['correct_offset'] - offset <= sent:
+                    failures += 1
+                sent = error['correct_offset'] - offset
+                continue
+            return result
+        raise Exception('upload fail : reason = part retries exhausted')
+
+    def __raise_write_error(self, reason):
+        if 'conflict' == reason:
+            raise DuplicateEntryError('duplicate upload')
+        elif 'malformed_path' == reason:
+            raise NoEntryError('wrong path')
+        elif 'insufficient_space' == reason:
+            raise DiskFullError('upload fail')
+        else:
+            raise Exception('upload fail : reason = {0}'.format(reason))
+
+    async def get_list(self, path: PurePath):
+        body = {'path': path.as_posix()}
+        if body['path'] == '/':
+            body['path'] = ''
+        url = self.__list_url
+        results = []
+        while True:
+            response = await self.request('POST', url, data=json.dumps(body),
+                                          headers={'Content-Type': 'application/json'}, idempotent=True)
+            result = await response.json(content_type=None)
+            if response.status >= 400:
+                reason = response.status
+                if 'error' in result:
+                    error = result['error']
+                    reason = error['path']['.tag'] if 'path' in error else error['.tag']
+                if 'not_found' == reason:
+                    raise NoEntryError('get list fail')
+                raise Exception('get list fail : reason = {0}'.format(reason))
+            for file in result['entries']:
+                results.append(self.__make_entry(file))
+            if result['has_more'] is False:
+                break
+            url = self.__list_url + '/continue'
+            body = {'cursor': result['cursor']}
+        return results
+
+    @staticmethod
+    def __make_entry(file):
+        entry = DirectoryEntry(file['name'], file_id=file.get('id'))
+        if file['.tag'] == 'folder':
+            entry.is_dir = True
+        else:
+            entry.file_size = file.get('size', 0)
+            entry.content_hash = file.get('content_hash')
+            entry.revision = file.get('rev')
+            entry.modified = file.get('server_modified')
+        return entry
+
+    async def make_dir(self, path: PurePath, name: str):
+        body = {
+            'path': (path / name).as_posix(),
+            'autorename': False
+        }
+        response = await self.request('POST', self.__mkdir_url, data=json.dumps(body),
+                                      headers={'Content-Type': 'application/json'})
+        response = await response.json(content_type=None)
+        if 'error' in response:
+            reason = response['error']['path']['.tag']
+            if 'conflict' == reason:
+                raise DuplicateEntryError("make dir fail")
+            elif 'insufficient_space' == reason:
+                raise DiskFullError("make dir fail")
+            else:
+                raise Exception('make dir fail : reason = {0}'.format(reason))
+
+    async def remove(self, path: PurePath):
+        body = {
+            'path': path.as_posix()
+        }
+        response = await self.request('POST', self.__delete_url, data=json.dumps(body),
+                                      headers={'Content-Type': 'application/json'})
+        response = await response.json(content_type=None)
+        if 'error' in response:
+            reason = response['error']['.tag']
+            if 'path_lookup' == reason:
+                reason = response['error']['path_lookup']['.tag']
+                if 'not_found' == reason:
+                    raise NoEntryError('remove fail')
+            elif 'path_write' == reason:
+                reason = response['error']['path_write']['.tag']
+            raise Exception('remove fail : reason = {0}'.format(reason))
@@ -0,0 +1,295 @@
+import json
+from typing import Dict
+from pathlib import PurePath
+from . async_store import AsyncStore, aiohttp
+from . request_scheduler import RequestScheduler
+from . store_metrics import StoreMetrics
+from . directory_entry import DirectoryEntry
+from . path_cache import PathCache
+from . multipart import MultipartRelatedEncoder
+from . stream import asplit_first_part, aiter_with_last, range_header, aiter_response
+from exceptions import *
+
+
+class StaleIdError(Exception):
+    # a cached file id answered 404
+    pass
+
+
+if aiohttp is not None:
+    class MultipartPayload(aiohttp.payload.Payload):
+        # sends a MultipartRelatedEncoder block by block with its length known up front, so the
+        # data is not copied into one body. it can be written again when a request is retried
+        def __init__(self, body: MultipartRelatedEncoder):
+            super().__init__(body, content_type=body.content_type)
+            self._size = len(body)
+
+        def __len__(self):
+            return self._size
+
+        def decode(self, encoding='utf-8', errors='strict'):
+            return b''.join(self._value).decode(encoding, errors)
+
+        async def write(self, writer):
+            for block in self._value:
+                await writer.write(block)
+
+
+class AsyncGoogleDriveStore(AsyncStore):
+    __root_id = 'appDataFolder'
+    __file_url = "https://www.googleapis.com/drive/v3/files/"
+    __upload_url = "https://www.googleapis.com/upload/drive/v3/files"
+    __folder_type = 'application/vnd.google-apps.folder'
+    __file_fields = 'id,name,mimeType,size,md5Checksum,headRevisionId,modifiedTime,appProperties'
+    __part_unit = 256 * 1024
+
+    def __init__(self, global_config: Dict, name: str):
+        super().__init__()
+        self.client_id = global_config['google_client_id']
+        self.client_secret = global_config['google_client_secret']
+        self.token_path = global_config['__project_dir'] / ('google_token_{0}.json'.format(name))
+        self.token_url = "https://www.googleapis.com/oauth2/v4/token"
+        self.load_token()
+        self.metrics = global_config.get('__metrics') or StoreMetrics()
+        # shared with the blocking stores of the same account
+        self.scheduler = RequestScheduler.for_account(str(self.token_path), global_config.get('google_request_rate'),
+                                                      global_config.get('google_request_burst'))
+        self.__path_cache = PathCache(global_config.get('google_path_cache_size', 4096))
+        part_size = global_config.get('upload_part_size', self.upload_part_size)
+        unit = AsyncGoogleDriveStore.__part_unit
+        self.upload_part_size = max(1, -(-part_size // unit)) * unit
+
+    async def __checked(self, method: str, url: str, **kwargs):
+        response = await self.request(method, url, **kwargs)
+        if response.status == 404:
+            raise StaleIdError(url)
+        response.raise_for_status()
+        return response
+
+    @staticmethod
+    async def __raise_for_upload(response):
+        # same as GoogleDriveStore, a full drive answers 403 with its own reason
+        if response.status == 403 and 'storageQuotaExceeded' in await response.text():
+            raise DiskFullError('upload fail')
+        if response.status == 404:
+            raise StaleIdError(response.url)
+        response.raise_for_status()
+
+    async def search_files_with_parent_id(self, parent_id: str, filename=""):
+        params = {
+            'corpora': 'user',
+            'pageSize': 1000,
+            'spaces': AsyncGoogleDriveStore.__root_id,
+            'q': "'{0}' in parents".format(parent_id),
+            'fields': 'nextPageToken,files({0})'.format(AsyncGoogleDriveStore.__file_fields)
+        }
+        if filename:
+            params['q'] = params['q'] + " and name = '{0}'".format(filename.replace("'", r"\'"))
+        results = []
+        while True:
+            response = await self.__checked('GET', AsyncGoogleDriveStore.__file_url, params=params)
+            response = await response.json()
+            results.extend(response.get('files', []))
+            if 'nextPageToken' not in response:
+                break
+            params['pageToken'] = response['nextPageToken']
+        return results
+
+    async def get_file_id(self, path: PurePath, refresh=False):
+        parts = path.parts[1:]
+        depth, parent_id = 0, None
+        if not refresh:
+            depth, parent_id = self.__path_cache.lookup(parts)
+        if parent_id is None:
+            parent_id = AsyncGoogleDriveStore.__root_id
+        for index in range(depth, len(parts)):
+            search = await self.search_files_with_parent_id(parent_id, parts[index])
+            if not search:
+                if index == depth > 0 and not await self.__exists(parent_id):
+                    # the cached parent is stale, resolve the path again from the root
+                    self.__path_cache.invalidate(parts[:index])
+                    return await self.get_file_id(path, refresh=True)
+                self.__path_cache.invalidate(parts[:index + 1])
+                raise NoEntryError('path is not valid')
+            parent_id = search[0]['id']
+            self.__path_cache.put(parts[:index + 1], parent_id)
+        return parent_id
+
+    async def __exists(self, file_id: str):
+        # a stale parent id also gives an empty search, one metadata call tells
+        try:
+            await self.__checked('GET', AsyncGoogleDriveStore.__file_url + file_id)
+        except StaleIdError:
+            return False
+        return True
+
+    async def __with_file_id(self, path: PurePath, action):
+        try:
+            return await action(await self.get_file_id(path))
+        except StaleIdError:
+            pass
+        # cached id was stale, resolve the path again from the root
+        try:
+            return await action(await self.get_file_id(path, refresh=True))
+        except StaleIdError:
+            raise NoEntryError('path is not valid')
+
+    async def download_file(self, path: PurePath):
+        async def download(file_id):
+            response = await self.__checked('GET', AsyncGoogleDriveStore.__file_url + file_id,
+                                            params={'alt': 'media'})
+            return await response.read()
+        return await self.__with_file_id(path, download)
+
+    async def download_stream(self, path: PurePath, offset=0, length=None):
+        if length == 0:
+            return
+        headers = {}
+        content_range = range_header(offset, length)
+        if content_range:
+            headers['Range'] = content_range
+
+        async def open_download(file_id):
+            response = await self.open('GET', AsyncGoogleDriveStore.__file_url + file_id,
+                                       params={'alt': 'media'}, headers=headers)
+            if response.status == 404:
+                response.release()
+                raise StaleIdError(file_id)
+            if response.status >= 400 and response.status != 416:
+                response.release()
+                response.raise_for_status()
+            return response
+
+        response = await self.__with_file_id(path, open_download)
+        async for chunk in aiter_response(response, self.download_chunk_size, offset, length):
+            yield chunk
+
+    async def upload_file(self, path: PurePath, data, is_chunk=False):
+        parts, single = await asplit_first_part(data, self.upload_part_size)
+        if single:
+            data = await parts.__anext__()
+
+        async def upload(parent_id):
+            # prevent duplicate path
+            if await self.search_files_with_parent_id(parent_id, path.name):
+                raise DuplicateEntryError('Duplicate path')
+            metadata = {
+                'name': path.name,
+                'parents': [parent_id]
+            }
+            if is_chunk:
+                metadata['appProperties'] = {
+                    'chunk': True
+                }
+            if single:
+                return await self.__upload_file(metadata, data)
+            return await self.__upload_resumable(metadata, parts)
+
+        file = await self.__with_file_id(path.parent, upload)
+        self.__path_cache.put(path.parts[1:], file['id'])
+        return file
+
+    async def __upload_file(self, meta: Dict, data: bytes):
+        body = MultipartRelatedEncoder([
+            ('application/json; charset=UTF-8', json.dumps(meta).encode()),
+            ('application/octet-stream', data)
+        ])
+        response = await self.request('POST', AsyncGoogleDriveStore.__upload_url, data=MultipartPayload(body),
+                                      headers={'Content-Type': body.content_type},
+                                      params={'uploadType': 'multipart'})
+        await AsyncGoogleDriveStore.__raise_for_upload(response)
+        return await response.json()
+
+    async def __upload_resumable(self, meta: Dict, parts):
+        response = await self.request('POST', AsyncGoogleDriveStore.__upload_url, data=json.dumps(meta),
+                                      headers={'Content-Type': 'application/json; charset=UTF-8'},
+                                      params={'uploadType': 'resumable'})
+        await AsyncGoogleDriveStore.__raise_for_upload(response)
+        session_url = response.headers['Location']
+        offset = 0
+        async for part, is_last in aiter_with_last(parts):
+            total = str(offset + len(part)) if is_last else '*'
+            response = await self.__send_part(session_url, part, offset, total)
+            offset += len(part)
+        return await response.json(content_type=None)
+
+    async def __send_part(self, session_url: str, part: bytes, offset: int, total: str):
+        # same recovery as GoogleDriveStore, ask how much is persisted and resume from there
+        sent = 0
+        for attempt in range(self.upload_part_retries + 1):
+            content_range = 'bytes {0}-{1}/{2}'.format(offset + sent, offset + len(part) - 1, total)
+            try:
+                response = await self.request('PUT', session_url, data=part[sent:], idempotent=False,
+                                              headers={'Content-Range': content_range}, allow_redirects=False)
+            except aiohttp.ClientError:
+                response = None
+            if response is not None and response.status < 500 and response.status != 308:
+                if response.status in (404, 410):
+                    raise Exception('upload fail : reason = upload session expired')
+                await AsyncGoogleDriveStore.__raise_for_upload(response)
+                return response
+            if response is None or response.status >= 500:
+                try:
+                    response = await self.request('PUT', session_url, allow_redirects=False,
+                                                  headers={'Content-Range': 'bytes */{0}'.format(total)})
+                except aiohttp.ClientError:
+                    continue
+                if response.status in (200, 201):
+                    return response
+                if response.status != 308:
+                    continue
+            persisted = 0
+            if 'Range' in response.headers:
+                persisted = int(response.headers['Range'].rsplit('-', 1)[1]) + 1
+            if persisted < offset:
+                raise Exception('upload fail : reason = upload session lost data')
+            if persisted >= offset + len(part):
+                return response
+            sent = persisted - offset
+        raise Exception('upload fail : reason = part retries exhausted')
+
+    async def get_list(self, path: PurePath):
+        async def list_children(parent_id):
+            search = await self.search_files_with_parent_id(parent_id)
+            if not search:
+                # a stale parent id also gives an empty result, make sure it still exists
+                await self.__checked('GET', AsyncGoogleDriveStore.__file_url + parent_id)
+            return search
+
+        return [AsyncGoogleDriveStore.__make_entry(file) for file in await self.__with_file_id(path, list_children)]
+
+    @staticmethod
+    def __make_entry(file):
+        entry = DirectoryEntry(file['name'], file_id=file.get('id'), modified=file.get('modifiedTime'))
+        if file['mimeType'] == AsyncGoogleDriveStore.__folder_type:
+            entry.is_dir = True
+        else:
+            entry.file_size = int(file.get('size', 0))
+            entry.is_chunk = 'chunk' in file.get('appProperties', {})
+            entry.content_hash = file.get('md5Checksum')
+            entry.revision = file.get('headRevisionId')
+        return entry
+
+    async def make_dir(self, path: PurePath, name: str):
+        async def create(parent_id):
+            if await self.search_files_with_parent_id(parent_id, name):
+                raise DuplicateEntryError('Duplicate path')
+            metadata = {
+                'parents': [parent_id],
+                'name': name,
+                'mimeType': AsyncGoogleDriveStore.__folder_type
+            }
+            response = await self.__checked('POST', AsyncGoogleDriveStore.__file_url, data=json.dumps(metadata),
+                                            headers={'Content-Type': 'application/json'})
+            return await response.json()
+
+        folder = await self.__with_file_id(path, create)
+        self.__path_cache.put((path / name).parts[1:], folder['id'])
+
+    async def remove(self, path: PurePath):
+        # if path is directory all descendants will be deleted
+        async def delete(file_id):
+            await self.__checked('DELETE', AsyncGoogleDriveStore.__file_url + file_id)
+
+        await self.__with_file_id(path, delete)
+        self.__path_cache.invalidate(path.parts[1:])
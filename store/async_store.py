@@ -0,0 +1,200 @@
+import json
+import time
+import asyncio
+from urllib.parse import urlsplit
+from pathlib import PurePath
+from abc import ABC, abstractclassmethod
+from . store_metrics import StoreMetrics, instrument_methods, body_size
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncStore(ABC):
+    # asyncio counterpart of Store. every call of one store goes through a single pooled
+    # aiohttp session, so one event loop can drive thousands of transfers without a thread each.
+    # tokens are the same json files the blocking stores use, run their oauth2 dance first
+    token_url = ""
+    token_path = None
+    token = None
+    session = None
+    client_secret = ""
+    client_id = ""
+    upload_part_size = 8 * 1024 * 1024
+    upload_part_retries = 3
+    download_chunk_size = 1024 * 1024
+    # open connections per store, and how long an idle one is kept alive
+    pool_size = 100
+    keepalive_timeout = 60
+    # a RequestScheduler, set by the stores to the one of their account
+    scheduler = None
+    idempotent_methods = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+    # StoreMetrics the calls and requests of the store are recorded in
+    metrics = None
+    uninstrumented = ('load_token', 'save_token', 'authorized', 'close', 'get_session', 'can_refresh',
+                      'refresh_token', 'open', 'request')
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        instrument_methods(cls, AsyncStore.uninstrumented)
+
+    def __init__(self):
+        if aiohttp is None:
+            raise ImportError('async stores need aiohttp')
+        self.__refresh_lock = None
+
+    def load_token(self):
+        if self.token_path.exists():
+            try:
+                with open(self.token_path, 'r') as token_file:
+                    self.token = json.loads(token_file.read())
+            except json.JSONDecodeError:
+                self.token = None
+
+    def save_token(self, token=None):
+        if token:
+            self.token = token
+        with open(self.token_path, 'w') as token_json:
+            token_json.write(json.dumps(self.token, indent=4))
+
+    def authorized(self):
+        return bool(self.token) and 'access_token' in self.token
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def get_session(self):
+        # created lazily so it binds to the running loop
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive_timeout)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    def can_refresh(self):
+        return bool(self.token) and 'refresh_token' in self.token
+
+    async def refresh_token(self, stale_token=None):
+        if not self.can_refresh():
+            raise Exception('refresh token fail : reason = no refresh token')
+        if self.__refresh_lock is None:
+            self.__refresh_lock = asyncio.Lock()
+        async with self.__refresh_lock:
+            if stale_token is not None and self.token['access_token'] != stale_token:
+                # another task refreshed it while we waited
+                return
+            if self.metrics is not None:
+                self.metrics.record_refresh()
+            body = {
+                'grant_type': 'refresh_token',
+                'refresh_token': self.token['refresh_token'],
+                'client_id': self.client_id,
+                'client_secret': self.client_secret
+            }
+            async with self.get_session().post(self.token_url, data=body) as response:
+                response.raise_for_status()
+                token = await response.json()
+            token.setdefault('refresh_token', self.token['refresh_token'])
+            if 'expires_in' in token:
+                token['expires_at'] = time.time() + token['expires_in']
+            self.save_token(token)
+
+    def __expired(self):
+        return 'expires_at' in self.token and self.token['expires_at'] < time.time() + 30
+
+    async def open(self, method: str, url: str, headers=None, idempotent=None, **kwargs):
+        # returns the response unread, release it or use it with `async with`.
+        # idempotent marks POST calls that only read
+        if not self.authorized():
+            raise Exception('not authorized : reason = no access token')
+        if self.__expired() and self.can_refresh():
+            await self.refresh_token(self.token['access_token'])
+        if idempotent is None:
+            idempotent = method.upper() in AsyncStore.idempotent_methods
+        data = kwargs.get('data')
+        # a consumed stream can't be sent again
+        replayable = not (hasattr(data, 'read') or hasattr(data, '__anext__') or hasattr(data, '__next__'))
+        for attempt in range(2):
+            access_token = self.token['access_token']
+            request_headers = dict(headers or {})
+            request_headers['Authorization'] = 'Bearer {0}'.format(access_token)
+
+            sends = []
+
+            async def send():
+                started = time.perf_counter()
+                sends.append(started)
+                try:
+                    response = await self.get_session().request(method, url, headers=request_headers, **kwargs)
+                except Exception as e:
+                    self.__record(method, url, data, None, started, attempt + len(sends) - 1, error=e)
+                    raise
+                # google tells a rate limit from other 403s in the body
+                body = await response.read() if response.status == 403 else None
+                self.__record(method, url, data, response, started, attempt + len(sends) - 1, body=body)
+                return response
+
+            if self.scheduler is None or not replayable:
+                response = await send()
+            else:
+                response = await self.scheduler.arun(send, idempotent,
+                                                     (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+            if response.status == 401 and attempt == 0 and self.can_refresh():
+                response.release()
+                await self.refresh_token(access_token)
+                continue
+            if self.scheduler is not None and self.scheduler.is_throttle(
+                    response.status, await response.read() if response.status == 403 else None):
+                # still throttled once the retries ran out
+                response.release()
+                raise Exception('{0} {1} fail : reason = rate limited'.format(method.upper(), urlsplit(url).path))
+            return response
+
+    def __record(self, method, url, data, response, started, attempt, error=None, body=None):
+        if self.metrics is None:
+            return
+        status = response.status if response is not None else None
+        bytes_in = (response.content_length or 0) if response is not None else 0
+        throttled = status == 429 or (self.scheduler is not None and self.scheduler.is_throttle(status, body))
+        self.metrics.record_request(method, url, status, time.perf_counter() - started, body_size(data), bytes_in,
+                                    attempt, throttled, error)
+
+    async def request(self, method: str, url: str, **kwargs):
+        # returns the response with its body already read, the connection goes back to the pool
+        response = await self.open(method, url, **kwargs)
+        await response.read()
+        return response
+
+    @abstractclassmethod
+    async def download_file(self, path: PurePath):
+        pass
+
+    @abstractclassmethod
+    def download_stream(self, path: PurePath, offset: int, length: int):
+        # async generator of bytes, length None reads up to the end of the file
+        pass
+
+    @abstractclassmethod
+    async def upload_file(self, path: PurePath, data, is_chunk: bool):
+        # data can be bytes, a file-like object or an (async) iterable of bytes
+        pass
+
+    @abstractclassmethod
+    async def get_list(self, path: PurePath):
+        pass
+
+    @abstractclassmethod
+    async def make_dir(self, path: PurePath, name: str):
+        pass
+
+    @abstractclassmethod
+    async def remove(self, path: PurePath):
+        pass
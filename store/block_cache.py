@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+
+
+class BlockCache:
+    # fixed size blocks of files kept on local disk, with a sqlite index next to them.
+    # every path remembers the revision its blocks belong to, a new revision drops them.
+    # least recently used blocks are evicted once the blocks take more than max_bytes
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024, block_size=1024 * 1024):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.__lock = threading.RLock()
+        self.__db = sqlite3.connect(str(self.directory / 'index.db'), check_same_thread=False)
+        self.__db.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                revision TEXT,
+                size INTEGER,
+                block_size INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS blocks (
+                path TEXT,
+                block INTEGER,
+                bytes INTEGER,
+                used INTEGER,
+                PRIMARY KEY (path, block)
+            );
+            CREATE INDEX IF NOT EXISTS blocks_used ON blocks (used);
+        ''')
+        self.__total = self.__db.execute('SELECT COALESCE(SUM(bytes), 0) FROM blocks').fetchone()[0]
+        # use counter, orders blocks by their last use
+        self.__clock = self.__db.execute('SELECT COALESCE(MAX(used), 0) FROM blocks').fetchone()[0]
+
+    def close(self):
+        self.__db.close()
+
+    @property
+    def total_bytes(self):
+        return self.__total
+
+    def __block_file(self, path: str, block: int):
+        return self.directory / '{0}.{1}'.format(hashlib.sha1(path.encode()).hexdigest(), block)
+
+    def revision(self, path: str):
+        # (revision, size) the cached blocks of path belong to, (None, None) if nothing is cached
+        with self.__lock:
+            row = self.__db.execute('SELECT revision, size, block_size FROM files WHERE path = ?', (path,)).fetchone()
+        if row is None or row[2] != self.block_size:
+            return None, None
+        return row[0], row[1]
+
+    def set_revision(self, path: str, revision: str, size: int):
+        with self.__lock:
+            if self.revision(path) != (revision, size):
+                self.__drop(path)
+            with self.__db:
+                self.__db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                                  (path, revision, size, self.block_size))
+
+    def has(self, path: str, block: int):
+        with self.__lock:
+            return self.__db.execute('SELECT 1 FROM blocks WHERE path = ? AND block = ?',
+                                     (path, block)).fetchone() is not None
+
+    def get(self, path: str, block: int):
+        with self.__lock:
+            if not self.has(path, block):
+                return None
+            try:
+                with open(self.__block_file(path, block), 'rb') as block_file:
+                    data = block_file.read()
+            except OSError:
+                self.__forget_blocks([(path, block)])
+                return None
+            with self.__db:
+                self.__db.execute('UPDATE blocks SET used = ? WHERE path = ? AND block = ?',
+                                  (self.__tick(), path, block))
+        return data
+
+    def put(self, path: str, block: int, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        block_file = self.__block_file(path, block)
+        # written aside and renamed, a reader never sees half a block
+        temp_file = block_file.with_name(block_file.name + '.{0}.tmp'.format(threading.get_ident()))
+        with open(temp_file, 'wb') as output:
+            output.write(data)
+        with self.__lock:
+            os.replace(str(temp_file), str(block_file))
+            previous = self.__db.execute('SELECT bytes FROM blocks WHERE path = ? AND block = ?',
+                                         (path, block)).fetchone()
+            with self.__db:
+                self.__db.execute('INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?)',
+                                  (path, block, len(data), self.__tick()))
+            self.__total += len(data) - (previous[0] if previous else 0)
+            self.__evict()
+
+    def __tick(self):
+        self.__clock += 1
+        return self.__clock
+
+    def __evict(self):
+        while self.__total > self.max_bytes:
+            oldest = self.__db.execute('SELECT path, block FROM blocks ORDER BY used LIMIT 1').fetchone()
+            if oldest is None:
+                break
+            self.__forget_blocks([oldest], remove_files=True)
+
+    def __forget_blocks(self, blocks, remove_files=False):
+        for path, block in blocks:
+            row = self.__db.execute('SELECT bytes FROM blocks WHERE path = ? AND block = ?', (path, block)).fetchone()
+            if row is None:
+                continue
+            with self.__db:
+                self.__db.execute('DELETE FROM blocks WHERE path = ? AND block = ?', (path, block))
+            self.__total -= row[0]
+            if remove_files:
+                try:
+                    os.remove(str(self.__block_file(path, block)))
+                except OSError:
+                    pass
+
+    def __drop(self, path: str):
+        blocks = self.__db.execute('SELECT path, block FROM blocks WHERE path = ?', (path,)).fetchall()
+        self.__forget_blocks(blocks, remove_files=True)
+        with self.__db:
+            self.__db.execute('DELETE FROM files WHERE path = ?', (path,))
+
+    def drop(self, path: str):
+        # forgets path and everything below it
+        with self.__lock:
+            pattern = path.rstrip('/').replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '/%'
+            paths = self.__db.execute("SELECT path FROM files WHERE path = ? OR path LIKE ? ESCAPE '\\'",
+                                      (path, pattern)).fetchall()
+            for row in paths:
+                self.__drop(row[0])
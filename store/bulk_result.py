@@ -0,0 +1,27 @@
+class BulkResult:
+    # outcome of one item of a bulk operation, error is the exception it raised
+    def __init__(self, path, value=None, error=None):
+        self.__path = path
+        self.__value = value
+        self.__error = error
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def value(self):
+        return self.__value
+
+    @property
+    def error(self):
+        return self.__error
+
+    @property
+    def ok(self):
+        return self.__error is None
+
+    def __repr__(self):
+        if self.ok:
+            return 'BulkResult({0!r})'.format(self.__path)
+        return 'BulkResult({0!r}, error={1!r})'.format(self.__path, self.__error)
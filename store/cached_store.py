@@ -0,0 +1,142 @@
+import time
+import threading
+from pathlib import PurePath
+from . store import Store
+from . block_cache import BlockCache
+from exceptions import *
+
+
+class CachedStore(Store):
+    # keeps downloaded blocks of the wrapped store on local disk. before blocks are used the
+    # revision of the file is checked with one metadata call, at most once every
+    # revalidate_after seconds. reads only fetch the ranges that are not cached yet
+    def __init__(self, store, cache_dir, max_bytes=1024 * 1024 * 1024, block_size=1024 * 1024,
+                 revalidate_after=0):
+        self.store = store
+        self.cache = BlockCache(cache_dir, max_bytes, block_size)
+        self.revalidate_after = revalidate_after
+        self.case_sensitive = store.case_sensitive
+        self.lists_file_sizes = store.lists_file_sizes
+        # path -> (checked at, revision, size)
+        self.__validated = {}
+        self.__lock = threading.Lock()
+
+    def authorized(self):
+        return self.store.authorized()
+
+    def configure_pool(self, size: int, socket_options=None):
+        self.store.configure_pool(size, socket_options)
+
+    def __key(self, path: PurePath):
+        key = path.as_posix()
+        return key if self.case_sensitive else key.lower()
+
+    def __validate(self, path: PurePath):
+        # returns (revision, size), revision None when the store can't tell one
+        key = self.__key(path)
+        with self.__lock:
+            checked = self.__validated.get(key)
+        if checked is not None and time.monotonic() - checked[0] < self.revalidate_after:
+            return checked[1], checked[2]
+        entry = self.store.get_entry(path)
+        revision = entry.revision or entry.content_hash
+        if revision is not None:
+            self.cache.set_revision(key, revision, entry.file_size)
+        with self.__lock:
+            self.__validated[key] = (time.monotonic(), revision, entry.file_size)
+        return revision, entry.file_size
+
+    def __forget(self, path: PurePath):
+        key = self.__key(path)
+        self.cache.drop(key)
+        with self.__lock:
+            for validated in [validated for validated in self.__validated
+                              if validated == key or validated.startswith(key.rstrip('/') + '/')]:
+                del self.__validated[validated]
+
+    def download_file(self, path: PurePath):
+        return b''.join(self.download_stream(path))
+
+    def download_stream(self, path: PurePath, offset=0, length=None):
+        revision, size = self.__validate(path)
+        if revision is None:
+            return self.store.download_stream(path, offset, length)
+        end = size if length is None else min(size, offset + length)
+        return self.__iter_blocks(path, offset, end)
+
+    def __iter_blocks(self, path: PurePath, start: int, end: int):
+        key = self.__key(path)
+        block_size = self.cache.block_size
+        block = start // block_size
+        last = (end - 1) // block_size
+        while block <= last:
+            data = self.cache.get(key, block)
+            if data is not None:
+                yield data[max(start - block * block_size, 0):end - block * block_size]
+                block += 1
+                continue
+            # fetch the whole run of missing blocks with one ranged read
+            run_end = block
+            while run_end < last and not self.cache.has(key, run_end + 1):
+                run_end += 1
+            offset = block * block_size
+            buffer = bytearray()
+            for chunk in self.store.download_stream(path, offset, (run_end + 1) * block_size - offset):
+                buffer += chunk
+                while len(buffer) >= block_size:
+                    yield self.__keep(key, block, bytes(buffer[:block_size]), start, end)
+                    del buffer[:block_size]
+                    block += 1
+            if buffer:
+                # the last block of the file
+                yield self.__keep(key, block, bytes(buffer), start, end)
+                block += 1
+            if block <= run_end:
+                raise Exception('download fail : reason = file is shorter than its metadata says')
+
+    def __keep(self, key: str, block: int, data: bytes, start: int, end: int):
+        self.cache.put(key, block, data)
+        block_start = block * self.cache.block_size
+        return data[max(start - block_start, 0):end - block_start]
+
+    def get_entry(self, path: PurePath):
+        return self.store.get_entry(path)
+
+    def get_list(self, path: PurePath):
+        return self.store.get_list(path)
+
+    def iter_list(self, path: PurePath):
+        return self.store.iter_list(path)
+
+    def upload_file(self, path: PurePath, data, is_chunk=False):
+        self.__forget(path)
+        return self.store.upload_file(path, data, is_chunk)
+
+    def make_dir(self, path: PurePath, name: str):
+        self.store.make_dir(path, name)
+
+    def remove(self, path: PurePath):
+        self.__forget(path)
+        self.store.remove(path)
+
+    def copy(self, source: PurePath, destination: PurePath):
+        self.__forget(destination)
+        self.store.copy(source, destination)
+
+    def move(self, source: PurePath, destination: PurePath):
+        self.__forget(source)
+        self.__forget(destination)
+        self.store.move(source, destination)
+
+    def copy_batch(self, pairs, max_workers=8):
+        pairs = list(pairs)
+        for source, destination in pairs:
+            self.__forget(destination)
+        return self.store.copy_batch(pairs, max_workers)
+
+    def move_batch(self, pairs, max_workers=8):
+        pairs = list(pairs)
+        for source, destination in pairs:
+            self.__forget(source)
+            self.__forget(destination)
+        return self.store.move_batch(pairs, max_workers)
@@ -0,0 +1,35 @@
+class Change:
+    # one entry of a store's change feed, entry None means the file was removed.
+    # stores that know files by id give file_id, and parent_id instead of path when they
+    # can't tell the full path themselves
+    def __init__(self, path=None, entry=None, file_id=None, parent_id=None):
+        self.__path = path
+        self.__entry = entry
+        self.__file_id = file_id
+        self.__parent_id = parent_id
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def entry(self):
+        return self.__entry
+
+    @property
+    def file_id(self):
+        return self.__file_id
+
+    @property
+    def parent_id(self):
+        return self.__parent_id
+
+    @property
+    def removed(self):
+        return self.__entry is None
+
+    def __repr__(self):
+        target = self.__path if self.__path is not None else self.__file_id
+        if self.removed:
+            return 'Change({0!r}, removed)'.format(target)
+        return 'Change({0!r})'.format(target)
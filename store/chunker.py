@@ -0,0 +1,98 @@
+import random
+from . stream import iter_parts
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# gear hash table, fixed so the same data always gets the same boundaries
+_gear_random = random.Random(0x756e6964)
+GEAR = [_gear_random.getrandbits(64) for _ in range(256)]
+_mask64 = (1 << 64) - 1
+_gear_array = None if numpy is None else numpy.array(GEAR, dtype=numpy.uint64)
+
+
+def _high_bits(count: int):
+    # the newest byte moves the low bits of a gear hash, older bytes the high ones
+    return ((1 << count) - 1) << (64 - count)
+
+
+class ContentChunker:
+    # content defined chunking (FastCDC). boundaries depend on the bytes around them,
+    # so an insert only changes the chunks next to it. below avg_size a harder mask
+    # is used and above it an easier one, which keeps chunk sizes close to avg_size.
+    # with numpy the hashes are computed a block at a time, around 100 MB/s with the default
+    # sizes and less with chunks of a few KB. without it every byte goes through a python loop,
+    # about 5 MB/s, slower than most uplinks
+    block_size = 64 * 1024
+
+    def __init__(self, min_size=256 * 1024, avg_size=1024 * 1024, max_size=4 * 1024 * 1024):
+        if not 0 < min_size <= avg_size <= max_size:
+            raise ValueError('chunk sizes have to be 0 < min_size <= avg_size <= max_size')
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        bits = max(avg_size.bit_length() - 1, 3)
+        self.__mask_small = _high_bits(bits + 2)
+        self.__mask_large = _high_bits(bits - 2)
+
+    def cut(self, data, length: int):
+        # length of the first chunk of data[:length], length itself when no boundary is found.
+        # the first min_size bytes can't end a chunk and are not hashed
+        if length <= self.min_size:
+            return length
+        end = min(length, self.max_size)
+        center = min(end, self.avg_size)
+        if numpy is not None:
+            return self.__cut_blocks(data, center, end)
+        gear = GEAR
+        value = 0
+        mask = self.__mask_small
+        for index in range(self.min_size, center):
+            value = ((value << 1) + gear[data[index]]) & _mask64
+            if not value & mask:
+                return index + 1
+        mask = self.__mask_large
+        for index in range(center, end):
+            value = ((value << 1) + gear[data[index]]) & _mask64
+            if not value & mask:
+                return index + 1
+        return end
+
+    def __cut_blocks(self, data, center: int, end: int):
+        # same boundaries as the loop in cut. a gear hash only depends on the last 64 bytes,
+        # so the hashes after every byte of a block come from adding shifted copies of the
+        # gear values, doubling the bytes covered each time
+        start = self.min_size
+        # most chunks end near avg_size, blocks grow from there
+        block = max(min(self.avg_size - self.min_size, self.block_size), 4096)
+        while start < end:
+            stop = min(start + block, center if start < center else end)
+            block = min(block * 2, self.block_size)
+            mask = numpy.uint64(self.__mask_small if start < center else self.__mask_large)
+            # the bytes of the chunk before the block that still count
+            first = max(self.min_size, start - 63)
+            values = _gear_array[numpy.frombuffer(data, numpy.uint8, stop - first, first)]
+            shift = 1
+            while shift < 64:
+                values[shift:] += values[:-shift] << numpy.uint64(shift)
+                shift *= 2
+            found = numpy.flatnonzero((values[start - first:] & mask) == 0)
+            if len(found):
+                return start + int(found[0]) + 1
+            start = stop
+        return end
+
+    def iter_chunks(self, data):
+        # data can be bytes, a file-like object or an iterable of bytes
+        buffer = bytearray()
+        for part in iter_parts(data, self.max_size):
+            buffer += part
+            while len(buffer) >= self.max_size:
+                size = self.cut(buffer, len(buffer))
+                yield bytes(buffer[:size])
+                del buffer[:size]
+        while buffer:
+            size = self.cut(buffer, len(buffer))
+            yield bytes(buffer[:size])
+            del buffer[:size]
@@ -0,0 +1,210 @@
+import json
+import hashlib
+import threading
+from pathlib import PurePath
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from . store import Store
+from . chunker import ContentChunker
+from exceptions import *
+
+
+class DedupStore(Store):
+    # content addressed storage on top of another store. files are cut into content defined
+    # chunks, every chunk is stored once in chunk_dir named by its sha256 and the file path
+    # holds a json manifest of the chunks. a chunk that is already stored is not sent again,
+    # so a new backup of mostly unchanged data uploads only the chunks that changed.
+    # listings carry the sizes of the manifests, file_size and get_entry read the manifest
+    manifest_version = 1
+    lists_file_sizes = False
+
+    def __init__(self, store, chunk_dir='/.chunks', chunker=None, max_workers=8):
+        self.store = store
+        self.chunk_dir = PurePath(chunk_dir)
+        self.chunker = chunker or ContentChunker()
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers)
+        self.case_sensitive = store.case_sensitive
+        # chunk name -> hash the provider reported for it, listed on first use
+        self.__known = None
+        self.__lock = threading.Lock()
+
+    def authorized(self):
+        return self.store.authorized()
+
+    def configure_pool(self, size: int, socket_options=None):
+        self.store.configure_pool(size, socket_options)
+
+    def chunk_path(self, digest: str):
+        return self.chunk_dir / digest
+
+    def known_chunks(self):
+        with self.__lock:
+            if self.__known is None:
+                try:
+                    entries = self.store.get_list(self.chunk_dir)
+                except NoEntryError:
+                    entries = []
+                    try:
+                        self.store.make_dir(self.chunk_dir.parent, self.chunk_dir.name)
+                    except DuplicateEntryError:
+                        pass
+                self.__known = {entry.name: entry.content_hash for entry in entries}
+            return self.__known
+
+    def store_chunk(self, digest: str, chunk: bytes):
+        # returns True if the chunk had to be uploaded
+        known = self.known_chunks()
+        if digest in known:
+            # trust the stored copy unless the provider's own hash says it differs
+            stored = known[digest]
+            expected = self.store.content_hash(chunk) if stored is not None else None
+            if expected is None or stored == expected:
+                return False
+            self.store.remove(self.chunk_path(digest))
+        try:
+            self.store.upload_file(self.chunk_path(digest), chunk, is_chunk=True)
+        except DuplicateEntryError:
+            # uploaded by someone else meanwhile, same name means same content
+            pass
+        with self.__lock:
+            known[digest] = self.store.content_hash(chunk)
+        return True
+
+    def load_chunk(self, digest: str):
+        chunk = self.store.download_file(self.chunk_path(digest))
+        if hashlib.sha256(chunk).hexdigest() != digest:
+            raise Exception('download fail : reason = chunk {0} is corrupted'.format(digest))
+        return chunk
+
+    def upload_file(self, path: PurePath, data, is_chunk=False):
+        records = []
+        submitted = set()
+        pending = set()
+        size = 0
+        for chunk in self.chunker.iter_chunks(data):
+            digest = hashlib.sha256(chunk).hexdigest()
+            records.append([digest, len(chunk)])
+            size += len(chunk)
+            if digest in submitted:
+                continue
+            submitted.add(digest)
+            pending.add(self.executor.submit(self.store_chunk, digest, chunk))
+            if len(pending) >= self.max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+        for future in pending:
+            # chunks stored before a failure are kept, collect_garbage removes them
+            future.result()
+        manifest = {
+            'dedup': DedupStore.manifest_version,
+            'size': size,
+            'chunks': records
+        }
+        self.store.upload_file(path, json.dumps(manifest).encode(), is_chunk)
+        return manifest
+
+    def load_manifest(self, path: PurePath):
+        manifest = self.store.download_file(path)
+        try:
+            manifest = json.loads(manifest.decode())
+        except ValueError:
+            raise Exception('not a dedup file : {0}'.format(path.as_posix()))
+        if not isinstance(manifest, dict) or manifest.get('dedup') != DedupStore.manifest_version:
+            raise Exception('not a dedup file : {0}'.format(path.as_posix()))
+        return manifest
+
+    def download_file(self, path: PurePath):
+        return b''.join(self.download_stream(path))
+
+    def file_size(self, path: PurePath):
+        # listings give the size of the manifest
+        return self.load_manifest(path)['size']
+
+    def download_stream(self, path: PurePath, offset=0, length=None):
+        manifest = self.load_manifest(path)
+        end = manifest['size'] if length is None else min(manifest['size'], offset + length)
+        return self.__iter_chunks(manifest['chunks'], offset, end)
+
+    def __iter_chunks(self, records, start: int, end: int):
+        reads = []
+        chunk_start = 0
+        for digest, size in records:
+            if chunk_start < end and chunk_start + size > start:
+                reads.append((digest, max(start - chunk_start, 0), min(end - chunk_start, size)))
+            chunk_start += size
+        # keep up to max_workers chunks in flight ahead of the one being yielded
+        pending = []
+        try:
+            for read in reads:
+                pending.append((self.executor.submit(self.load_chunk, read[0]), read))
+                if len(pending) >= self.max_workers:
+                    future, (digest, first, last) = pending.pop(0)
+                    yield future.result()[first:last]
+            while pending:
+                future, (digest, first, last) = pending.pop(0)
+                yield future.result()[first:last]
+        finally:
+            for future, read in pending:
+                future.cancel()
+
+    def get_entry(self, path: PurePath):
+        if path == self.chunk_dir:
+            raise NoEntryError('path is not valid')
+        entry = self.store.get_entry(path)
+        if not entry.is_dir:
+            entry.file_size = self.load_manifest(path)['size']
+        return entry
+
+    def get_list(self, path: PurePath):
+        return list(self.iter_list(path))
+
+    def iter_list(self, path: PurePath):
+        for entry in self.store.iter_list(path):
+            if path != self.chunk_dir.parent or entry.name != self.chunk_dir.name:
+                yield entry
+
+    def make_dir(self, path: PurePath, name: str):
+        self.store.make_dir(path, name)
+
+    def remove(self, path: PurePath):
+        # chunks stay, other files may share them. collect_garbage removes the unused ones
+        self.store.remove(path)
+
+    def copy(self, source: PurePath, destination: PurePath):
+        # copies of manifests share the chunks
+        self.store.copy(source, destination)
+
+    def move(self, source: PurePath, destination: PurePath):
+        self.store.move(source, destination)
+
+    def copy_batch(self, pairs, max_workers=8):
+        return self.store.copy_batch(pairs, max_workers)
+
+    def move_batch(self, pairs, max_workers=8):
+        return self.store.move_batch(pairs, max_workers)
+
+    def collect_garbage(self):
+        # removes chunks no manifest refers to, run it while nothing is uploading. every file of
+        # the wrapped store is scanned, the chunks are shared by all of them. returns the removed
+        # chunk names
+        used = set()
+        directories = [PurePath('/')]
+        while directories:
+            directory = directories.pop()
+            for entry in self.iter_list(directory):
+                if entry.is_dir:
+                    directories.append(directory / entry.name)
+                else:
+                    used.update(digest for digest, size in self.load_manifest(directory / entry.name)['chunks'])
+        with self.__lock:
+            self.__known = None
+        unused = [name for name in self.known_chunks() if name not in used]
+        results = self.store.remove_batch([self.chunk_path(name) for name in unused])
+        removed = []
+        with self.__lock:
+            for name, result in zip(unused, results):
+                if result.ok or isinstance(result.error, NoEntryError):
+                    self.__known.pop(name, None)
+                    removed.append(name)
+        return removed
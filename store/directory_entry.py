@@ -1,10 +1,29 @@
 # TODO class for directory, file and chunk
 class DirectoryEntry:
-    def __init__(self, name, is_chunk=False, is_directory=False, file_size=0):
+    # listings of big folders hold many entries, slots keep each one small
+    __slots__ = ('__node_name', '__is_chunk', '__is_dir', '__file_size', '__content_hash', '__revision',
+                 '__file_id', '__modified', '__properties')
+
+    def __init__(self, name, is_chunk=False, is_directory=False, file_size=0, content_hash=None, revision=None,
+                 file_id=None, modified=None, properties=None):
         self.__node_name = name
         self.__is_chunk = is_chunk
         self.__is_dir = is_directory
         self.__file_size = file_size
+        # hash the provider keeps for the file, see Store.content_hash
+        self.__content_hash = content_hash
+        # changes whenever the file content changes
+        self.__revision = revision
+        # id the provider gives the entry
+        self.__file_id = file_id
+        # RFC 3339 time of the last change, as the provider reports it
+        self.__modified = modified
+        # strings the store keeps with the file, None when it keeps none. see Store.keeps_properties
+        self.__properties = properties
+
+    def __repr__(self):
+        return 'DirectoryEntry({0!r}, is_dir={1}, file_size={2})'.format(self.__node_name, self.__is_dir,
+                                                                         self.__file_size)
 
     @property
     def name(self):
@@ -40,4 +59,44 @@ class DirectoryEntry:
     def file_size(self, val):
         if val < 0:
             val = 0
-        self.__file_size = val
\ No newline at end of file
+        self.__file_size = val
+
+    @property
+    def content_hash(self):
+        return self.__content_hash
+
+    @content_hash.setter
+    def content_hash(self, val):
+        self.__content_hash = val
+
+    @property
+    def revision(self):
+        return self.__revision
+
+    @revision.setter
+    def revision(self, val):
+        self.__revision = val
+
+    @property
+    def file_id(self):
+        return self.__file_id
+
+    @file_id.setter
+    def file_id(self, val):
+        self.__file_id = val
+
+    @property
+    def modified(self):
+        return self.__modified
+
+    @modified.setter
+    def modified(self, val):
+        self.__modified = val
+
+    @property
+    def properties(self):
+        return self.__properties
+
+    @properties.setter
+    def properties(self, val):
+        self.__properties = val
@@ -1,9 +1,17 @@
 import json
+import time
+import hashlib
 from pathlib import PurePath
 from . store import Store
 from . directory_entry import DirectoryEntry
+from . change import Change
+from . bulk_result import BulkResult
+from . stream import split_first_part, iter_with_last, range_header, iter_response
 from exceptions import *
-from requests_oauthlib import OAuth2Session
+from requests import RequestException
+from . scheduled_session import ScheduledSession
+from . request_scheduler import RequestScheduler
+from . store_metrics import StoreMetrics
 
 
 class DropboxStore(Store):
@@ -11,6 +19,24 @@ class DropboxStore(Store):
     __delete_url = "https://api.dropboxapi.com/2/files/delete"
     __mkdir_url = "https://api.dropboxapi.com/2/files/create_folder"
     __list_url = "https://api.dropboxapi.com/2/files/list_folder"
+    __metadata_url = "https://api.dropboxapi.com/2/files/get_metadata"
+    __session_start_url = "https://content.dropboxapi.com/2/files/upload_session/start"
+    __session_append_url = "https://content.dropboxapi.com/2/files/upload_session/append_v2"
+    __session_finish_url = "https://content.dropboxapi.com/2/files/upload_session/finish"
+    __delete_batch_url = "https://api.dropboxapi.com/2/files/delete_batch"
+    __mkdir_batch_url = "https://api.dropboxapi.com/2/files/create_folder_batch"
+    __copy_url = "https://api.dropboxapi.com/2/files/copy_v2"
+    __move_url = "https://api.dropboxapi.com/2/files/move_v2"
+    __copy_batch_url = "https://api.dropboxapi.com/2/files/copy_batch_v2"
+    __move_batch_url = "https://api.dropboxapi.com/2/files/move_batch_v2"
+    __copy_batch_check_url = "https://api.dropboxapi.com/2/files/copy_batch/check_v2"
+    __move_batch_check_url = "https://api.dropboxapi.com/2/files/move_batch/check_v2"
+    __space_usage_url = "https://api.dropboxapi.com/2/users/get_space_usage"
+    # entries per batch call, and the first wait before polling an asynchronous batch job
+    batch_size = 1000
+    batch_poll_interval = 0.5
+    case_sensitive = False
+    __hash_block_size = 4 * 1024 * 1024
 
     def __init__(self, global_config, name):
         super()
@@ -22,24 +48,45 @@ class DropboxStore(Store):
         self.authorization_base_url = "https://www.dropbox.com/oauth2/authorize"
         self.token_url = "https://api.dropboxapi.com/oauth2/token"
         self.upload_url = "https://content.dropboxapi.com/2/files/upload"
+        # single request uploads are limited to 150MB
+        self.upload_part_size = min(global_config.get('upload_part_size', self.upload_part_size),
+                                    150 * 1024 * 1024)
 
         self.load_token()
-        self.session = OAuth2Session(self.client_id, scope=self.scope, token=self.token,
-                                     redirect_uri=self.redirect_url)
+        # a StoreMetrics in the config is shared by the stores made with it
+        self.metrics = global_config.get('__metrics') or StoreMetrics()
+        # every store of this account shares the rate limit
+        scheduler = RequestScheduler.for_account(str(self.token_path), global_config.get('dropbox_request_rate'),
+                                                 global_config.get('dropbox_request_burst'))
+        self.session = ScheduledSession(self.client_id, scope=self.scope, token=self.token,
+                                        redirect_uri=self.redirect_url, scheduler=scheduler, metrics=self.metrics)
 
     def get_authorization_url(self):
         authorization_url, state = self.session.authorization_url(self.authorization_base_url)
         return authorization_url
 
     def download_file(self, path: PurePath):
+        return self.__open_download(path).content
+
+    def download_stream(self, path: PurePath, offset=0, length=None):
+        if length == 0:
+            return iter(())
+        response = self.__open_download(path, range_header(offset, length), stream=True)
+        return iter_response(response, self.download_chunk_size, offset, length)
+
+    def __open_download(self, path: PurePath, content_range=None, stream=False):
         args = {
             'path': path.as_posix()
         }
         headers = {
             'Dropbox-API-Arg': json.dumps(args)
         }
-        response = self.session.post(self.__download_url, headers=headers)
+        if content_range:
+            headers['Range'] = content_range
+        response = self.session.post(self.__download_url, headers=headers, stream=stream, idempotent=True)
         # TODO handle download failure
+        if response.status_code == 416:
+            return response
         try:
             response.raise_for_status()
         except Exception:
@@ -49,10 +96,17 @@ class DropboxStore(Store):
                 raise NoEntryError('download fail')
             else:
                 raise Exception('download fail : reason = {0}'.format(reason))
-        return response.content
+        return response
 
-    def upload_file(self, path: PurePath, data: bytes, is_chunk=False):
+    def upload_file(self, path: PurePath, data, is_chunk=False):
         # TODO handle chunk
+        parts, single = split_first_part(data, self.upload_part_size)
+        if single:
+            self.__upload_single(path, next(parts))
+        else:
+            self.__upload_session(path, parts)
+
+    def __upload_single(self, path: PurePath, data: bytes):
         args = {
             'path': path.as_posix(),
             'mode': 'add'
@@ -65,46 +119,182 @@ class DropboxStore(Store):
         # TODO handle upload failure
         response = response.json()
         if 'error' in response:
-            reason = response['error']['reason']['.tag']
-            if 'conflict' == reason:
-                raise DuplicateEntryError('duplicate upload')
-            elif 'malformed_path' == reason:
-                raise NoEntryError('wrong path')
+            self.__raise_write_error(response['error']['reason']['.tag'])
+
+    def __upload_session(self, path: PurePath, parts):
+        cursor = {
+            'session_id': None,
+            'offset': 0
+        }
+        for part, is_last in iter_with_last(parts):
+            if cursor['session_id'] is None:
+                response = self.__send_part(self.__session_start_url, {'close': False}, part)
+                if 'session_id' in response:
+                    cursor['session_id'] = response['session_id']
+            elif not is_last:
+                response = self.__send_part(self.__session_append_url, {'cursor': cursor, 'close': False}, part)
             else:
-                raise Exception('upload fail : reason = {0}'.format(reason))
+                args = {
+                    'cursor': cursor,
+                    'commit': {
+                        'path': path.as_posix(),
+                        'mode': 'add',
+                        'autorename': False
+                    }
+                }
+                response = self.__send_part(self.__session_finish_url, args, part)
+            if 'error' in response:
+                error = response['error']
+                if 'path' == error['.tag']:
+                    self.__raise_write_error(error['path']['.tag'])
+                raise Exception('upload fail : reason = {0}'.format(error['.tag']))
+            cursor['offset'] += len(part)
+
+    def __send_part(self, url: str, args, part: bytes):
+        # resend the part on network or server failure, dropbox tells how much it already has
+        sent = 0
+        failures = 0
+        offset = args['cursor']['offset'] if 'cursor' in args else 0
+        while failures <= self.upload_part_retries:
+            request_args = dict(args)
+            if 'cursor' in args:
+                request_args['cursor'] = dict(args['cursor'], offset=offset + sent)
+            headers = {
+                'Content-Type': 'application/octet-stream',
+                'Dropbox-API-Arg': json.dumps(request_args)
+            }
+            try:
+                response = self.session.post(url, data=part[sent:], headers=headers)
+            except RequestException:
+                failures += 1
+                continue
+            if response.status_code >= 500:
+                failures += 1
+                continue
+            result = (response.json() if response.content else None) or {}
+            if 'error' not in result:
+                return result
+            error = result['error']
+            if 'lookup_failed' == error['.tag']:
+                error = error['lookup_failed']
+            if 'incorrect_offset' == error['.tag'] and offset <= error['correct_offset'] <= offset + len(part):
+                # a correct offset that doesn't move forward counts as a failed try, a server
+                # repeating it would keep the part going round forever
+                if error['correct_offset'] - offset <= sent:
+                    failures += 1
+                sent = error['correct_offset'] - offset
+                continue
+            return result
+        raise Exception('upload fail : reason = part retries exhausted')
+
+    def __raise_write_error(self, reason):
+        if 'conflict' == reason:
+            raise DuplicateEntryError('duplicate upload')
+        elif 'malformed_path' == reason:
+            raise NoEntryError('wrong path')
+        elif 'insufficient_space' == reason:
+            raise DiskFullError('upload fail')
+        else:
+            raise Exception('upload fail : reason = {0}'.format(reason))
 
     def get_list(self, path):
+        return list(self.iter_list(path))
+
+    def iter_list(self, path: PurePath):
+        # yields the entries of each page as it arrives
         body = {'path': path.as_posix()}
         if body['path'] == '/':
             body['path'] = ''
         response = self.session.post(self.__list_url, data=json.dumps(body),
-                                     headers={'Content-Type':'application/json'})
-        results = []
+                                     headers={'Content-Type':'application/json'}, idempotent=True)
         while True:
-            # TODO
-            try:
-                response.raise_for_status()
-            except Exception:
-                response = response.json()
-                if 'error' in response:
-                    reason = response['error']['path']['.tag']
-                    if 'not_found' == reason:
-                        raise NoEntryError('get list fail')
-                    else :
-                        raise Exception('get list fail : reason = {0}'.format(reason))
-            response = response.json()
-            for file in response['entries']:
-                entry = DirectoryEntry(file['name'])
-                if file['.tag'] == 'folder':
-                    entry.is_dir = True
-                results.append(entry)
+            if response.status_code == 409:
+                error = response.json()['error']
+                reason = error['path']['.tag'] if 'path' in error else error['.tag']
+                if 'not_found' == reason:
+                    raise NoEntryError('get list fail')
+                else :
+                    raise Exception('get list fail : reason = {0}'.format(reason))
+            response.raise_for_status()
+            result = response.json()
+            for file in result['entries']:
+                yield self.__make_entry(file)
             # TODO handle chunk
-            if response['has_more'] is False:
+            if result['has_more'] is False:
                 break
             response = self.session.post(self.__list_url + '/continue',
-                                         data=json.dumps({'cursor':response['cursor']}),
-                                         headers={'Content-Type':'application/json'})
-        return results
+                                         data=json.dumps({'cursor':result['cursor']}),
+                                         headers={'Content-Type':'application/json'}, idempotent=True)
+
+    @staticmethod
+    def __make_entry(file):
+        entry = DirectoryEntry(file['name'], file_id=file.get('id'))
+        if file['.tag'] == 'folder':
+            entry.is_dir = True
+        else:
+            entry.file_size = file.get('size', 0)
+            entry.content_hash = file.get('content_hash')
+            entry.revision = file.get('rev')
+            entry.modified = file.get('server_modified')
+        return entry
+
+    def get_entry(self, path: PurePath):
+        response = self.session.post(self.__metadata_url, data=json.dumps({'path': path.as_posix()}),
+                                     headers={'Content-Type': 'application/json'}, idempotent=True)
+        response = response.json()
+        if 'error' in response:
+            reason = response['error']['path']['.tag']
+            if 'not_found' == reason:
+                raise NoEntryError('get entry fail')
+            raise Exception('get entry fail : reason = {0}'.format(reason))
+        return self.__make_entry(response)
+
+    def space_usage(self):
+        # team accounts report the team's space unless the user has a limit of their own
+        response = self.session.post(self.__space_usage_url, data='null',
+                                     headers={'Content-Type': 'application/json'}, idempotent=True)
+        if response.status_code != 200:
+            raise Exception('space usage fail : reason = {0}'.format(response.text))
+        response = response.json()
+        allocation = response['allocation']
+        allocated = allocation.get('user_within_team_space_allocated') or allocation.get('allocated')
+        return response['used'], allocated
+
+    def content_hash(self, data: bytes):
+        # sha256 of the sha256 digests of every 4MB block
+        view = memoryview(data)
+        digests = b''.join(hashlib.sha256(view[offset:offset + DropboxStore.__hash_block_size]).digest()
+                           for offset in range(0, len(view), DropboxStore.__hash_block_size))
+        return hashlib.sha256(digests).hexdigest()
+
+    def list_changes(self, cursor=None):
+        # the recursive listing of the whole tree ends with a cursor, continuing from it later
+        # gives only what changed since
+        if cursor is None:
+            url = self.__list_url
+            body = {'path': '', 'recursive': True}
+        else:
+            url = self.__list_url + '/continue'
+            body = {'cursor': cursor}
+        changes = []
+        while True:
+            response = self.session.post(url, data=json.dumps(body), headers={'Content-Type': 'application/json'},
+                                         idempotent=True)
+            response = response.json()
+            if 'error' in response:
+                reason = response['error']['.tag']
+                if 'reset' == reason:
+                    raise CursorResetError('list changes fail')
+                raise Exception('list changes fail : reason = {0}'.format(reason))
+            for file in response['entries']:
+                if file['.tag'] == 'deleted':
+                    changes.append(Change(PurePath(file['path_display'])))
+                else:
+                    changes.append(Change(PurePath(file['path_display']), self.__make_entry(file), file['id']))
+            if response['has_more'] is False:
+                return changes, response['cursor']
+            url = self.__list_url + '/continue'
+            body = {'cursor': response['cursor']}
 
     def make_dir(self, path, name):
         body = {
@@ -116,13 +306,36 @@ class DropboxStore(Store):
         # TODO
         response = response.json()
         if 'error' in response:
-            reason = response['error']['path']['.tag']
-            if 'conflict' == reason:
-                raise DuplicateEntryError("make dir fail")
-            elif 'insufficient_space' == reason:
-                raise DiskFullError("make dir fail")
-            else:
-                raise Exception('make dir fail : reason = {0}'.format(reason))
+            raise self.__make_dir_error(response['error'])
+
+    def make_dir_batch(self, items, max_workers=8):
+        # dropbox creates missing parents itself, so one create_folder_batch call per 1000 paths
+        paths = [path / name for path, name in items]
+        results = []
+        for start in range(0, len(paths), self.batch_size):
+            batch = paths[start:start + self.batch_size]
+            body = {
+                'paths': [path.as_posix() for path in batch],
+                'autorename': False,
+                'force_async': False
+            }
+            entries = self.__run_batch(self.__mkdir_batch_url, body)
+            for path, entry in zip(batch, entries):
+                if 'success' == entry['.tag']:
+                    results.append(BulkResult(path, entry['metadata']))
+                else:
+                    results.append(BulkResult(path, error=self.__make_dir_error(entry['failure'])))
+        return results
+
+    @staticmethod
+    def __make_dir_error(error):
+        reason = error['path']['.tag']
+        if 'conflict' == reason:
+            return DuplicateEntryError("make dir fail")
+        elif 'insufficient_space' == reason:
+            return DiskFullError("make dir fail")
+        else:
+            return Exception('make dir fail : reason = {0}'.format(reason))
 
     def remove(self, path):
         body = {
@@ -133,14 +346,113 @@ class DropboxStore(Store):
         # TODO handle remove fail
         response = response.json()
         if 'error' in response:
-            reason = response['error']['.tag']
-            if 'path_lookup' == reason:
-                reason = response['error']['path_lookup']['.tag']
-                if 'not_found' == reason:
-                    raise NoEntryError('remove fail')
+            raise self.__remove_error(response['error'])
+
+    def remove_batch(self, paths):
+        paths = list(paths)
+        results = []
+        for start in range(0, len(paths), self.batch_size):
+            batch = paths[start:start + self.batch_size]
+            body = {
+                'entries': [{'path': path.as_posix()} for path in batch]
+            }
+            entries = self.__run_batch(self.__delete_batch_url, body)
+            for path, entry in zip(batch, entries):
+                if 'success' == entry['.tag']:
+                    results.append(BulkResult(path, entry['metadata']))
+                else:
+                    results.append(BulkResult(path, error=self.__remove_error(entry['failure'])))
+        return results
+
+    @staticmethod
+    def __remove_error(error):
+        reason = error['.tag']
+        if 'path_lookup' == reason:
+            reason = error['path_lookup']['.tag']
+            if 'not_found' == reason:
+                return NoEntryError('remove fail')
+        elif 'path_write' == reason:
+            reason = error['path_write']['.tag']
+        return Exception('remove fail : reason = {0}'.format(reason))
+
+    def copy(self, source: PurePath, destination: PurePath):
+        # done by dropbox, folders included, without the data passing through here
+        self.__relocate(self.__copy_url, source, destination, 'copy')
+
+    def move(self, source: PurePath, destination: PurePath):
+        self.__relocate(self.__move_url, source, destination, 'move')
+
+    def __relocate(self, url: str, source: PurePath, destination: PurePath, operation: str):
+        body = {
+            'from_path': source.as_posix(),
+            'to_path': destination.as_posix(),
+            'autorename': False
+        }
+        response = self.session.post(url, data=json.dumps(body), headers={'Content-Type': 'application/json'})
+        response = response.json()
+        if 'error' in response:
+            raise self.__relocation_error(response['error'], operation)
+        return response['metadata']
+
+    def copy_batch(self, pairs, max_workers=8):
+        # one copy_batch_v2 job per 1000 pairs
+        return self.__relocate_batch(self.__copy_batch_url, self.__copy_batch_check_url, pairs, 'copy')
+
+    def move_batch(self, pairs, max_workers=8):
+        return self.__relocate_batch(self.__move_batch_url, self.__move_batch_check_url, pairs, 'move')
+
+    def __relocate_batch(self, url: str, check_url: str, pairs, operation: str):
+        pairs = list(pairs)
+        results = []
+        for start in range(0, len(pairs), self.batch_size):
+            batch = pairs[start:start + self.batch_size]
+            body = {
+                'entries': [{'from_path': source.as_posix(), 'to_path': destination.as_posix()}
+                            for source, destination in batch],
+                'autorename': False
+            }
+            entries = self.__run_batch(url, body, check_url)
+            for (source, destination), entry in zip(batch, entries):
+                if 'success' == entry['.tag']:
+                    results.append(BulkResult(destination, entry['success']))
                 else:
-                    raise Exception('remove fail : reason = {0}'.format(reason))
-            elif 'path_write' == reason:
-                reason = response['error']['path_write']['.tag']
-                raise Exception('remove fail : reason = {0}'.format(reason))
-            raise Exception('remove fail : reason = {0}'.format(reason))
\ No newline at end of file
+                    failure = entry['failure']
+                    error = failure.get('relocation_error', failure)
+                    results.append(BulkResult(destination, error=self.__relocation_error(error, operation)))
+        return results
+
+    @staticmethod
+    def __relocation_error(error, operation: str):
+        reason = error['.tag']
+        if reason in ('from_lookup', 'from_write', 'to'):
+            detail = error[reason]['.tag']
+            if 'from_lookup' == reason and 'not_found' == detail:
+                return NoEntryError('{0} fail'.format(operation))
+            if 'to' == reason and 'conflict' == detail:
+                return DuplicateEntryError('{0} fail'.format(operation))
+            if 'insufficient_space' == detail:
+                return DiskFullError('{0} fail'.format(operation))
+            reason = '{0}/{1}'.format(reason, detail)
+        elif 'insufficient_quota' == reason:
+            return DiskFullError('{0} fail'.format(operation))
+        return Exception('{0} fail : reason = {1}'.format(operation, reason))
+
+    def __run_batch(self, url: str, body, check_url=None):
+        # returns the entries of a batch call, polling its job when dropbox runs it asynchronously
+        check_url = check_url or url + '/check'
+        response = self.session.post(url, data=json.dumps(body), headers={'Content-Type': 'application/json'})
+        response = response.json()
+        interval = self.batch_poll_interval
+        while 'error' not in response and response['.tag'] in ('async_job_id', 'in_progress'):
+            if 'async_job_id' == response['.tag']:
+                job = {'async_job_id': response['async_job_id']}
+            time.sleep(interval)
+            interval = min(interval * 2, 5)
+            response = self.session.post(check_url, data=json.dumps(job),
+                                         headers={'Content-Type': 'application/json'}, idempotent=True)
+            response = response.json()
+        if 'error' in response:
+            raise Exception('batch fail : reason = {0}'.format(response['error']['.tag']))
+        if 'failed' == response['.tag']:
+            raise Exception('batch fail : reason = {0}'.format(response['failed']['.tag']))
+        return response['entries']
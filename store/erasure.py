@@ -0,0 +1,116 @@
+def _build_tables():
+    # GF(2^8) with the 0x11d polynomial
+    exp = [0] * 512
+    log = [0] * 256
+    value = 1
+    for power in range(255):
+        exp[power] = value
+        log[value] = power
+        value <<= 1
+        if value & 0x100:
+            value ^= 0x11d
+    for power in range(255, 512):
+        exp[power] = exp[power - 255]
+    return exp, log
+
+
+_EXP, _LOG = _build_tables()
+
+
+def gf_mul(a: int, b: int):
+    if a == 0 or b == 0:
+        return 0
+    return _EXP[_LOG[a] + _LOG[b]]
+
+
+def gf_inv(a: int):
+    if a == 0:
+        raise ZeroDivisionError('0 has no inverse in GF(256)')
+    return _EXP[255 - _LOG[a]]
+
+
+class ReedSolomon:
+    # systematic k+m erasure code, any k of the k+m shards restore the data.
+    # parity rows come from a cauchy matrix so every k x k sub matrix is invertible
+    def __init__(self, data_shards: int, parity_shards: int):
+        if data_shards < 1 or parity_shards < 0 or data_shards + parity_shards > 256:
+            raise ValueError('invalid shard counts {0}+{1}'.format(data_shards, parity_shards))
+        self.data_shards = data_shards
+        self.parity_shards = parity_shards
+        self.__rows = []
+        for index in range(data_shards):
+            self.__rows.append([1 if column == index else 0 for column in range(data_shards)])
+        for parity in range(parity_shards):
+            self.__rows.append([gf_inv((data_shards + parity) ^ column) for column in range(data_shards)])
+        self.__tables = {}
+
+    @property
+    def total_shards(self):
+        return self.data_shards + self.parity_shards
+
+    def shard_size(self, size: int):
+        return max(1, -(-size // self.data_shards))
+
+    def encode(self, data: bytes):
+        # returns data_shards + parity_shards shards of equal size
+        shard_size = self.shard_size(len(data))
+        data = bytes(data).ljust(shard_size * self.data_shards, b'\0')
+        shards = [data[index * shard_size:(index + 1) * shard_size] for index in range(self.data_shards)]
+        for row in self.__rows[self.data_shards:]:
+            shards.append(self.__combine(row, shards, shard_size))
+        return shards
+
+    def decode(self, shards, size: int):
+        # shards maps shard index -> shard, at least data_shards of them are needed
+        if len(shards) < self.data_shards:
+            raise ValueError('need {0} shards, got {1}'.format(self.data_shards, len(shards)))
+        # data shards first, they need no arithmetic
+        indexes = sorted(shards)[:self.data_shards]
+        shard_size = len(shards[indexes[0]])
+        if indexes == list(range(self.data_shards)):
+            return b''.join(shards[index] for index in indexes)[:size]
+        inverse = self.__invert([self.__rows[index] for index in indexes])
+        present = [shards[index] for index in indexes]
+        data = []
+        for column in range(self.data_shards):
+            if column in shards:
+                data.append(shards[column])
+            else:
+                data.append(self.__combine(inverse[column], present, shard_size))
+        return b''.join(data)[:size]
+
+    def __table(self, factor: int):
+        table = self.__tables.get(factor)
+        if table is None:
+            table = bytes(gf_mul(factor, value) for value in range(256))
+            self.__tables[factor] = table
+        return table
+
+    def __combine(self, factors, shards, shard_size: int):
+        # xor of factor * shard over all shards, whole buffers at a time
+        result = 0
+        for factor, shard in zip(factors, shards):
+            if factor == 0:
+                continue
+            if factor != 1:
+                shard = shard.translate(self.__table(factor))
+            result ^= int.from_bytes(shard, 'little')
+        return result.to_bytes(shard_size, 'little')
+
+    @staticmethod
+    def __invert(matrix):
+        # gauss-jordan elimination in GF(256)
+        size = len(matrix)
+        work = [list(row) + [1 if column == index else 0 for column in range(size)]
+                for index, row in enumerate(matrix)]
+        for column in range(size):
+            pivot = next(row for row in range(column, size) if work[row][column])
+            work[column], work[pivot] = work[pivot], work[column]
+            factor = gf_inv(work[column][column])
+            work[column] = [gf_mul(factor, value) for value in work[column]]
+            for row in range(size):
+                if row != column and work[row][column]:
+                    factor = work[row][column]
+                    work[row] = [value ^ gf_mul(factor, pivot_value)
+                                 for value, pivot_value in zip(work[row], work[column])]
+        return [row[size:] for row in work]
@@ -1,18 +1,37 @@
 import json
+import uuid
+import hashlib
 from typing import Dict
+from urllib.parse import urlencode
 from pathlib import PurePath
-from requests_oauthlib import OAuth2Session
-from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
-from email.encoders import encode_noop
+from requests import HTTPError, RequestException
+from . scheduled_session import ScheduledSession
+from . request_scheduler import RequestScheduler
+from . store_metrics import StoreMetrics
 from . store import Store
 from . directory_entry import DirectoryEntry
+from . change import Change
+from . path_cache import PathCache
+from . bulk_result import BulkResult
+from . multipart import MultipartRelatedEncoder, encode_batch, parse_batch_response
+from . stream import split_first_part, iter_with_last, range_header, iter_response
 from exceptions import *
 
 
 class GoogleDriveStore(Store):
     __root_id = 'appDataFolder'
     __file_url = "https://www.googleapis.com/drive/v3/files/"
+    __part_unit = 256 * 1024
+    __batch_url = "https://www.googleapis.com/batch/drive/v3"
+    __folder_type = 'application/vnd.google-apps.folder'
+    __changes_url = "https://www.googleapis.com/drive/v3/changes"
+    __about_url = "https://www.googleapis.com/drive/v3/about"
+    __file_fields = 'id,name,mimeType,size,md5Checksum,headRevisionId,modifiedTime,appProperties'
+    __change_fields = __file_fields + ',parents,trashed'
+    # google takes at most 100 calls in one batch request
+    batch_size = 100
+    # kept in appProperties
+    keeps_properties = True
     # __token_info_url = "https://www.googleapis.com/oauth2/v3/tokeninfo"
 
     def __init__(self, global_config: Dict, name: str):
@@ -37,144 +56,647 @@ class GoogleDriveStore(Store):
             'client_id' : self.client_id,
             'client_secret' : self.client_secret
         }
-        self.session = OAuth2Session(self.client_id, scope=self.scope, token=self.token,
-                                     redirect_uri=self.redirect_url,
-                                     auto_refresh_kwargs=extra,
-                                     auto_refresh_url=self.token_url,
-                                     token_updater=self.save_token)
+        # a StoreMetrics in the config is shared by the stores made with it
+        self.metrics = global_config.get('__metrics') or StoreMetrics()
+        # every store of this account shares the rate limit
+        scheduler = RequestScheduler.for_account(str(self.token_path), global_config.get('google_request_rate'),
+                                                 global_config.get('google_request_burst'))
+        self.session = ScheduledSession(self.client_id, scope=self.scope, token=self.token,
+                                        redirect_uri=self.redirect_url,
+                                        auto_refresh_kwargs=extra,
+                                        auto_refresh_url=self.token_url,
+                                        token_updater=self.save_token,
+                                        scheduler=scheduler, metrics=self.metrics)
+        # path -> file id, saves one search request per path segment
+        self.__path_cache = PathCache(global_config.get('google_path_cache_size', 4096))
+        # resumable upload parts have to be multiple of 256KB
+        part_size = global_config.get('upload_part_size', self.upload_part_size)
+        self.upload_part_size = max(1, -(-part_size // GoogleDriveStore.__part_unit)) * GoogleDriveStore.__part_unit
+        # real id of the appDataFolder alias, changes name parents by it
+        self.__app_root_id = None
 
     def get_authorization_url(self):
         authorization_url, state = self.session.authorization_url(self.authorization_base_url,
                                                                   access_type="offline")
         return authorization_url
 
-    def search_files_with_parent_id(self, parent_id: str, filename=""):
+    @staticmethod
+    def __search_params(parent_id: str, filename=""):
         params = {
             'corpora': 'user',
             'pageSize': 1000,
             'spaces': GoogleDriveStore.__root_id,
-            'q': "'{0}' in parents".format(parent_id)
+            'q': "'{0}' in parents".format(parent_id),
+            'fields': 'nextPageToken,files({0})'.format(GoogleDriveStore.__file_fields)
         }
         if filename:
             params['q'] = params['q'] + " and name = '{0}'".format(filename.replace("'",r"\'"))
-        results = []
+        return params
+
+    def search_files_with_parent_id(self, parent_id: str, filename=""):
+        return list(self.iter_files_with_parent_id(parent_id, filename))
+
+    def iter_files_with_parent_id(self, parent_id: str, filename=""):
+        for files in self.__iter_pages(parent_id, filename):
+            yield from files
+
+    def __iter_pages(self, parent_id: str, filename=""):
+        # one list of files per response, the next page is only requested when it is needed
+        params = GoogleDriveStore.__search_params(parent_id, filename)
         while True:
             response = self.session.get(GoogleDriveStore.__file_url, params=params)
             response.raise_for_status()
             response = response.json()
-            if 'files' in response:
-                results.extend(response['files'])
-            else:
-                print(response.keys())
-
-            if 'nextPageToken' in response:
-                params['nextPageToken'] = response['nextPageToken']
-            else:
+            yield response.get('files', [])
+            if 'nextPageToken' not in response:
                 break
+            params['pageToken'] = response['nextPageToken']
 
-        return results
-
-    def get_file_id(self, path: PurePath):
-        parent_id = GoogleDriveStore.__root_id
-        for filename  in path.parts[1:]:
-            search = self.search_files_with_parent_id(parent_id, filename)
+    def get_file_id(self, path: PurePath, refresh=False):
+        parts = path.parts[1:]
+        depth, parent_id = 0, None
+        if not refresh:
+            depth, parent_id = self.__path_cache.lookup(parts)
+        if parent_id is None:
+            parent_id = GoogleDriveStore.__root_id
+        for index in range(depth, len(parts)):
+            search = self.search_files_with_parent_id(parent_id, parts[index])
             if not search:
+                if index == depth > 0 and not self.__exists(parent_id):
+                    # the cached parent is stale, resolve the path again from the root
+                    self.__path_cache.invalidate(parts[:index])
+                    return self.get_file_id(path, refresh=True)
+                self.__path_cache.invalidate(parts[:index + 1])
                 raise NoEntryError('path is not valid')
             parent_id = search[0]['id']
+            self.__path_cache.put(parts[:index + 1], parent_id)
         return parent_id
 
+    def __exists(self, file_id: str):
+        # a stale parent id also gives an empty search, one metadata call tells
+        try:
+            self.__get_metadata(file_id)
+        except HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+            return False
+        return True
+
+    def __with_file_id(self, path: PurePath, action):
+        try:
+            return action(self.get_file_id(path))
+        except HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+        # cached id was stale, resolve the path again from the root
+        return action(self.get_file_id(path, refresh=True))
+
+    def __batch(self, requests):
+        # requests are (method, url, json body or None), returns (status, json body or None) for each
+        results = []
+        for start in range(0, len(requests), self.batch_size):
+            batch = requests[start:start + self.batch_size]
+            boundary = uuid.uuid4().hex
+            response = self.session.post(GoogleDriveStore.__batch_url, data=encode_batch(batch, boundary),
+                                         headers={'Content-Type': 'multipart/mixed; boundary={0}'.format(boundary)},
+                                         idempotent=all(request[0] == 'GET' for request in batch))
+            response.raise_for_status()
+            results.extend(parse_batch_response(response.headers['Content-Type'], response.content, len(batch)))
+        return results
+
+    def __batch_search(self, pairs):
+        # pairs are (parent id, name), returns the matching files of each pair
+        requests = []
+        for parent_id, name in pairs:
+            params = GoogleDriveStore.__search_params(parent_id, name)
+            requests.append(('GET', '/drive/v3/files?' + urlencode(params), None))
+        return self.__batch(requests)
+
+    def get_file_ids(self, paths):
+        # resolves many paths at once, one batch request per path depth instead of a search per segment.
+        # returns the file id or a NoEntryError for each path
+        paths = list(paths)
+        results = [None] * len(paths)
+        # index -> [parts, resolved depth, file id, resolved from the cache]
+        pending = {}
+        for index, path in enumerate(paths):
+            parts = path.parts[1:]
+            depth, file_id = self.__path_cache.lookup(parts)
+            if file_id is None:
+                depth, file_id = 0, GoogleDriveStore.__root_id
+            pending[index] = [parts, depth, file_id, depth > 0]
+        while pending:
+            for index in [index for index, state in pending.items() if state[1] == len(state[0])]:
+                results[index] = pending.pop(index)[2]
+            if not pending:
+                break
+            pairs = list({(state[2], state[0][state[1]]) for state in pending.values()})
+            found = dict(zip(pairs, self.__batch_search(pairs)))
+            # same as get_file_id, a stale cached parent also gives an empty search, one metadata call
+            # per cached parent tells
+            probed = list({state[2] for state in pending.values()
+                           if state[3] and not GoogleDriveStore.__files_of(*found[(state[2], state[0][state[1]])])})
+            checks = [('GET', '/drive/v3/files/{0}?fields=id'.format(file_id), None) for file_id in probed]
+            checked = {file_id: status for file_id, (status, response) in zip(probed, self.__batch(checks))}
+            for index, state in list(pending.items()):
+                parts, depth, file_id, cached = state
+                status, response = found[(file_id, parts[depth])]
+                files = GoogleDriveStore.__files_of(status, response)
+                if files:
+                    state[1], state[2], state[3] = depth + 1, files[0]['id'], False
+                    self.__path_cache.put(parts[:depth + 1], state[2])
+                elif cached and checked[file_id] == 404:
+                    # the cached parent is stale, resolve this path again from the root
+                    self.__path_cache.invalidate(parts[:depth])
+                    pending[index] = [parts, 0, GoogleDriveStore.__root_id, False]
+                elif cached and checked[file_id] != 200:
+                    del pending[index]
+                    results[index] = Exception('get metadata fail : reason = {0}'.format(checked[file_id]))
+                elif status in (200, 404):
+                    self.__path_cache.invalidate(parts[:depth + 1])
+                    del pending[index]
+                    results[index] = NoEntryError('path is not valid')
+                else:
+                    del pending[index]
+                    results[index] = Exception('search fail : reason = {0}'.format(status))
+        return results
+
+    @staticmethod
+    def __files_of(status, response):
+        return response.get('files', []) if status == 200 and response else []
+
+    def __get_metadata(self, file_id: str):
+        r = self.session.get(GoogleDriveStore.__file_url + file_id)
+        r.raise_for_status()
+        return r.json()
+
     def download_file(self, path: PurePath):
-        file_id = self.get_file_id(path)
-        file = self.__download_file(file_id)
+        response = self.__with_file_id(path, self.__download_file)
         # TODO Handle download failure
-        return file['data']
+        return response.content
 
-    def __download_file(self, file_id: str):
-        file = {}
-        url = GoogleDriveStore.__file_url + file_id
-        r = self.session.get(url=url)
-        # temporary
-        r.raise_for_status()
-        file['meta'] = r.json()
+    def download_stream(self, path: PurePath, offset=0, length=None):
+        if length == 0:
+            return iter(())
+        content_range = range_header(offset, length)
+        response = self.__with_file_id(path, lambda file_id: self.__download_file(file_id, content_range, True))
+        return iter_response(response, self.download_chunk_size, offset, length)
 
-        r = self.session.get(url=url, params={'alt': 'media'})
+    def __download_file(self, file_id: str, content_range=None, stream=False):
+        url = GoogleDriveStore.__file_url + file_id
+        headers = {}
+        if content_range:
+            headers['Range'] = content_range
+        r = self.session.get(url=url, params={'alt': 'media'}, headers=headers, stream=stream)
+        if r.status_code == 416:
+            return r
         # TODO raise proper exceiption
         r.raise_for_status()
-        file['data'] = r.content
-        return file
+        return r
 
-    def upload_file(self, path: PurePath, data: bytes, is_chunk=False):
-        # prevent duplicate path
-        try:
-            self.get_file_id(path)
-        except NoEntryError:
-            parent_id = self.get_file_id(path.parent)
+    def upload_file(self, path: PurePath, data, is_chunk=False, properties=None):
+        # properties are read once data fits in one part and read again after the last part of a
+        # session, so data may fill them in while it is read
+        parts, single = split_first_part(data, self.upload_part_size)
+        if single:
+            data = next(parts)
+
+        def upload(parent_id):
+            # prevent duplicate path
+            if self.search_files_with_parent_id(parent_id, path.name):
+                raise DuplicateEntryError('Duplicate path')
             metadata = {
                 'name': path.name,
                 'parents': [parent_id]
             }
-            if is_chunk:
-                metadata['appProperties'] = {
-                    'chunk': True
-                }
+            if is_chunk or properties:
+                metadata['appProperties'] = GoogleDriveStore.__app_properties(is_chunk, properties)
             # TODO handle upload failure
-            return self.__upload_file(metadata, data)
-        else:
-            raise DuplicateEntryError('Duplicate path')
+            if single:
+                return self.__upload_file(metadata, data)
+            file = self.__upload_resumable(metadata, parts)
+            if properties and GoogleDriveStore.__app_properties(is_chunk, properties) != metadata['appProperties']:
+                self.__update_properties(file['id'], GoogleDriveStore.__app_properties(is_chunk, properties))
+            return file
+
+        file = self.__with_file_id(path.parent, upload)
+        self.__path_cache.put(path.parts[1:], file['id'])
+        return file
+
+    @staticmethod
+    def __app_properties(is_chunk: bool, properties):
+        app_properties = dict(properties or {})
+        if is_chunk:
+            app_properties['chunk'] = True
+        return app_properties
+
+    def __update_properties(self, file_id: str, app_properties: Dict):
+        response = self.session.patch(GoogleDriveStore.__file_url + file_id,
+                                      data=json.dumps({'appProperties': app_properties}),
+                                      headers={'Content-Type': 'application/json'})
+        response.raise_for_status()
 
     def __upload_file(self, meta: Dict, data: bytes):
-        related = MIMEMultipart('related', 'separator')
-        mm = MIMEApplication(json.dumps(meta), 'json', encode_noop)
-        mm.set_payload(json.dumps(meta))
-        dd = MIMEApplication(data)
-        related.attach(mm)
-        related.attach(dd)
-        body = related.as_string().split('\n\n', 1)[1]
+        body = MultipartRelatedEncoder([
+            ('application/json; charset=UTF-8', json.dumps(meta).encode()),
+            ('application/octet-stream', data)
+        ])
         r = self.session.post(self.upload_url, data=body,
-                              headers={'Content-Type':'multipart/related; boundary=separator'},
+                              headers={'Content-Type': body.content_type},
                               params={'uploadType': 'multipart'})
-        # TODO raise proper exceiption
+        GoogleDriveStore.__raise_for_upload(r)
+        return r.json()
+
+    @staticmethod
+    def __raise_for_upload(r):
+        if r.status_code == 403 and 'storageQuotaExceeded' in r.text:
+            raise DiskFullError('upload fail')
         r.raise_for_status()
+
+    def __upload_resumable(self, meta: Dict, parts):
+        r = self.session.post(self.upload_url, data=json.dumps(meta),
+                              headers={'Content-Type': 'application/json; charset=UTF-8'},
+                              params={'uploadType': 'resumable'})
+        GoogleDriveStore.__raise_for_upload(r)
+        session_url = r.headers['Location']
+        offset = 0
+        for part, is_last in iter_with_last(parts):
+            # total size is known only when the last part is sent
+            total = str(offset + len(part)) if is_last else '*'
+            r = self.__send_part(session_url, part, offset, total)
+            offset += len(part)
         return r.json()
 
-    def get_list(self, path: PurePath):
-        parent_id = self.get_file_id(path)
-        search = self.search_files_with_parent_id(parent_id)
-        results = []
-        for file in search:
-            # TODO make file (virtual directory node) class which can express chunk, directory and file
-            entry = DirectoryEntry(file['name'])
-            if 'size' in file:
-                entry.file_size(file['size'])
-
-            if file['mimeType'] == 'application/vnd.google-apps.folder':
-                entry.is_dir = True
-            elif 'appProperties' in file:
-                if 'chunk' in file['appProperties']:
-                    entry.is_chunk = True
-            results.append(entry)
-        return results
+    def __send_part(self, session_url: str, part: bytes, offset: int, total: str):
+        # on failure ask google how much is persisted and resume the part from there
+        sent = 0
+        for attempt in range(self.upload_part_retries + 1):
+            content_range = 'bytes {0}-{1}/{2}'.format(offset + sent, offset + len(part) - 1, total)
+            try:
+                # not retried by the scheduler, a failed part is resumed from what google persisted
+                r = self.session.put(session_url, data=part[sent:], headers={'Content-Range': content_range},
+                                     allow_redirects=False, idempotent=False)
+            except RequestException:
+                r = None
+            if r is not None and r.status_code < 500 and r.status_code != 308:
+                if r.status_code in (404, 410):
+                    raise Exception('upload fail : reason = upload session expired')
+                GoogleDriveStore.__raise_for_upload(r)
+                return r
+            if r is None or r.status_code >= 500:
+                r = self.__query_upload(session_url, total)
+                if r is None:
+                    continue
+                if r.status_code in (200, 201):
+                    return r
+            persisted = self.__persisted_bytes(r)
+            if persisted < offset:
+                raise Exception('upload fail : reason = upload session lost data')
+            if persisted >= offset + len(part):
+                return r
+            sent = persisted - offset
+        raise Exception('upload fail : reason = part retries exhausted')
 
-    def make_dir(self, path: PurePath, name: str):
+    def __query_upload(self, session_url: str, total: str):
         try:
-            test_path = path / name
-            self.get_file_id(test_path)
-        except NoEntryError:
-            parent_id = self.get_file_id(path)
-            metadata = {
-                'parents' : [parent_id],
-                'name' : name,
-                'mimeType' : 'application/vnd.google-apps.folder'
+            r = self.session.put(session_url, headers={'Content-Range': 'bytes */{0}'.format(total)},
+                                 allow_redirects=False)
+        except RequestException:
+            return None
+        if r.status_code in (200, 201, 308):
+            return r
+        return None
+
+    @staticmethod
+    def __persisted_bytes(response):
+        # Range: bytes=0-N means N + 1 bytes are persisted
+        if 'Range' not in response.headers:
+            return 0
+        return int(response.headers['Range'].rsplit('-', 1)[1]) + 1
+
+    def get_list(self, path: PurePath):
+        return list(self.iter_list(path))
+
+    def iter_list(self, path: PurePath):
+        def first_page(parent_id):
+            pages = self.__iter_pages(parent_id)
+            page = next(pages)
+            if not page:
+                # a stale parent id also gives an empty result, make sure it still exists
+                self.__get_metadata(parent_id)
+            return page, pages
+
+        page, pages = self.__with_file_id(path, first_page)
+        for file in page:
+            yield GoogleDriveStore.__make_entry(file)
+        for page in pages:
+            for file in page:
+                yield GoogleDriveStore.__make_entry(file)
+
+    def content_hash(self, data: bytes):
+        return hashlib.md5(data).hexdigest()
+
+    def space_usage(self):
+        # the limit is missing for unlimited accounts
+        response = self.session.get(GoogleDriveStore.__about_url, params={'fields': 'storageQuota'})
+        response.raise_for_status()
+        quota = response.json()['storageQuota']
+        return int(quota.get('usage', 0)), int(quota['limit']) if 'limit' in quota else None
+
+    def list_changes(self, cursor=None):
+        if cursor is None:
+            # take the page token before listing so nothing changed meanwhile is missed
+            response = self.session.get(GoogleDriveStore.__changes_url + '/startPageToken')
+            response.raise_for_status()
+            start = response.json()['startPageToken']
+            params = {
+                'corpora': 'user',
+                'pageSize': 1000,
+                'spaces': GoogleDriveStore.__root_id,
+                'q': 'trashed = false',
+                'fields': 'nextPageToken,files({0})'.format(GoogleDriveStore.__change_fields)
             }
-            response = self.session.post(GoogleDriveStore.__file_url, data=json.dumps(metadata),
-                                         headers={'Content-Type': 'application/json'})
+            changes = []
+            while True:
+                response = self.session.get(GoogleDriveStore.__file_url, params=params)
+                response.raise_for_status()
+                response = response.json()
+                changes.extend(self.__make_change(file) for file in response.get('files', []))
+                if 'nextPageToken' not in response:
+                    return changes, start
+                params['pageToken'] = response['nextPageToken']
+        params = {
+            'pageToken': cursor,
+            'pageSize': 1000,
+            'spaces': GoogleDriveStore.__root_id,
+            'fields': 'nextPageToken,newStartPageToken,changes(fileId,removed,file({0}))'.format(
+                GoogleDriveStore.__change_fields)
+        }
+        changes = []
+        while True:
+            response = self.session.get(GoogleDriveStore.__changes_url, params=params)
+            if response.status_code in (400, 404, 410):
+                raise CursorResetError('list changes fail')
             response.raise_for_status()
+            response = response.json()
+            for change in response.get('changes', []):
+                file = change.get('file')
+                if change.get('removed') or file is None or file.get('trashed'):
+                    changes.append(Change(file_id=change['fileId']))
+                else:
+                    changes.append(self.__make_change(file))
+            if 'nextPageToken' not in response:
+                return changes, response['newStartPageToken']
+            params['pageToken'] = response['nextPageToken']
+
+    @staticmethod
+    def __make_entry(file):
+        # TODO make file (virtual directory node) class which can express chunk, directory and file
+        entry = DirectoryEntry(file['name'], file_id=file.get('id'), modified=file.get('modifiedTime'))
+        if file['mimeType'] == GoogleDriveStore.__folder_type:
+            entry.is_dir = True
         else:
-            raise DuplicateEntryError('Duplicate path')
+            entry.file_size = int(file.get('size', 0))
+            entry.is_chunk = 'chunk' in file.get('appProperties', {})
+            entry.properties = file.get('appProperties', {})
+            entry.content_hash = file.get('md5Checksum')
+            entry.revision = file.get('headRevisionId')
+        return entry
+
+    def get_entry(self, path: PurePath):
+        def get(file_id):
+            response = self.session.get(GoogleDriveStore.__file_url + file_id,
+                                        params={'fields': GoogleDriveStore.__file_fields})
+            response.raise_for_status()
+            return response.json()
+        return GoogleDriveStore.__make_entry(self.__with_file_id(path, get))
+
+    def __make_change(self, file):
+        entry = GoogleDriveStore.__make_entry(file)
+        parent_id = file['parents'][0] if file.get('parents') else None
+        if parent_id == self.__get_app_root_id():
+            return Change(PurePath('/') / file['name'], entry, file['id'])
+        return Change(entry=entry, file_id=file['id'], parent_id=parent_id)
+
+    def __get_app_root_id(self):
+        if self.__app_root_id is None:
+            self.__app_root_id = self.__get_metadata(GoogleDriveStore.__root_id)['id']
+        return self.__app_root_id
+
+    def make_dir(self, path: PurePath, name: str):
+        def create(parent_id):
+            if self.search_files_with_parent_id(parent_id, name):
+                raise DuplicateEntryError('Duplicate path')
+            return self.__create_folder(parent_id, name)
+
+        folder = self.__with_file_id(path, create)
+        self.__path_cache.put((path / name).parts[1:], folder['id'])
+
+    def __create_folder(self, parent_id: str, name: str):
+        metadata = {
+            'parents' : [parent_id],
+            'name' : name,
+            'mimeType' : GoogleDriveStore.__folder_type
+        }
+        response = self.session.post(GoogleDriveStore.__file_url, data=json.dumps(metadata),
+                                     headers={'Content-Type': 'application/json'})
+        response.raise_for_status()
+        return response.json()
+
+    def copy(self, source: PurePath, destination: PurePath):
+        # files are copied by google, folders are made here and filled with copies of their files
+        def copy(parent_id):
+            if self.search_files_with_parent_id(parent_id, destination.name):
+                raise DuplicateEntryError('Duplicate path')
+            file = self.__with_file_id(source, self.__get_metadata)
+            return self.__copy_file(file, parent_id, destination.name)
+
+        file = self.__with_file_id(destination.parent, copy)
+        self.__path_cache.put(destination.parts[1:], file['id'])
+
+    def __copy_file(self, file, parent_id: str, name: str):
+        if file['mimeType'] == GoogleDriveStore.__folder_type:
+            folder = self.__create_folder(parent_id, name)
+            for child in self.iter_files_with_parent_id(file['id']):
+                self.__copy_file(child, folder['id'], child['name'])
+            return folder
+        response = self.session.post(GoogleDriveStore.__file_url + file['id'] + '/copy',
+                                     data=json.dumps({'name': name, 'parents': [parent_id]}),
+                                     headers={'Content-Type': 'application/json'})
+        response.raise_for_status()
+        return response.json()
+
+    def move(self, source: PurePath, destination: PurePath):
+        # one update of the name and the parents, folders keep their children
+        attempts = []
+
+        def move(parent_id):
+            if self.search_files_with_parent_id(parent_id, destination.name):
+                raise DuplicateEntryError('Duplicate path')
+            # the cached ids of the source are resolved again when the first try failed on a stale one
+            refresh = bool(attempts)
+            attempts.append(parent_id)
+            file_id = self.get_file_id(source, refresh)
+            old_parent_id = self.get_file_id(source.parent, refresh)
+            params = {
+                'addParents': self.__real_id(parent_id),
+                'removeParents': self.__real_id(old_parent_id)
+            }
+            response = self.session.patch(GoogleDriveStore.__file_url + file_id, params=params,
+                                          data=json.dumps({'name': destination.name}),
+                                          headers={'Content-Type': 'application/json'})
+            response.raise_for_status()
+            return response.json()
+
+        file = self.__with_file_id(destination.parent, move)
+        self.__path_cache.invalidate(source.parts[1:])
+        self.__path_cache.put(destination.parts[1:], file['id'])
+
+    def __real_id(self, file_id: str):
+        # parents are changed by real ids, the appDataFolder alias is not one
+        return self.__get_app_root_id() if file_id == GoogleDriveStore.__root_id else file_id
+
+    def copy_batch(self, pairs, max_workers=8):
+        # one batch resolving the paths, one checking for duplicates and one copying.
+        # folders, which google doesn't copy, and stale ids go through the single call
+        def request(file_id, parent_id, old_parent_id, name):
+            return 'POST', '/drive/v3/files/{0}/copy'.format(file_id), {'name': name, 'parents': [parent_id]}
+        return self.__relocate_batch(pairs, request, self.copy, False)
+
+    def move_batch(self, pairs, max_workers=8):
+        def request(file_id, parent_id, old_parent_id, name):
+            params = {
+                'addParents': self.__real_id(parent_id),
+                'removeParents': self.__real_id(old_parent_id)
+            }
+            return 'PATCH', '/drive/v3/files/{0}?{1}'.format(file_id, urlencode(params)), {'name': name}
+        return self.__relocate_batch(pairs, request, self.move, True)
+
+    def __relocate_batch(self, pairs, request_of, single, moving: bool):
+        pairs = list(pairs)
+        count = len(pairs)
+        results = [None] * count
+        # sources, their parents and the destination parents resolved together
+        ids = self.get_file_ids([source for source, destination in pairs] +
+                                [source.parent for source, destination in pairs] +
+                                [destination.parent for source, destination in pairs])
+        relocations = []
+        targets = set()
+        for index, (source, destination) in enumerate(pairs):
+            file_id, old_parent_id, parent_id = ids[index], ids[count + index], ids[2 * count + index]
+            errors = [found for found in (file_id, old_parent_id, parent_id) if isinstance(found, Exception)]
+            if errors:
+                results[index] = BulkResult(destination, error=errors[0])
+            elif (parent_id, destination.name) in targets:
+                results[index] = BulkResult(destination, error=DuplicateEntryError('Duplicate path'))
+            else:
+                targets.add((parent_id, destination.name))
+                relocations.append((index, file_id, parent_id, old_parent_id))
+        found = self.__batch_search([(parent_id, pairs[index][1].name)
+                                     for index, file_id, parent_id, old_parent_id in relocations])
+        requests = []
+        for (index, file_id, parent_id, old_parent_id), (status, response) in zip(relocations, found):
+            destination = pairs[index][1]
+            if status != 200:
+                results[index] = BulkResult(destination, error=Exception('search fail : reason = {0}'.format(status)))
+            elif response.get('files'):
+                results[index] = BulkResult(destination, error=DuplicateEntryError('Duplicate path'))
+            else:
+                requests.append((index, request_of(file_id, parent_id, old_parent_id, destination.name)))
+        responses = self.__batch([request for index, request in requests])
+        for (index, request), (status, response) in zip(requests, responses):
+            source, destination = pairs[index]
+            if status == 200:
+                if moving:
+                    self.__path_cache.invalidate(source.parts[1:])
+                self.__path_cache.put(destination.parts[1:], response['id'])
+                results[index] = BulkResult(destination, response)
+            else:
+                results[index] = GoogleDriveStore.__single(pairs[index][1], single, *pairs[index])
+        return results
+
+    @staticmethod
+    def __single(path: PurePath, action, *args):
+        # BulkResult of one call, for the items a batch leaves to the single calls
+        try:
+            return BulkResult(path, action(*args))
+        except Exception as e:
+            return BulkResult(path, error=e)
 
     def remove(self, path: PurePath):
         # if path is directory all descendants will be deleted
-        file_id = self.get_file_id(path)
-        url = GoogleDriveStore.__file_url + file_id
-        response = self.session.delete(url)
-        response.raise_for_status()
\ No newline at end of file
+        def delete(file_id):
+            url = GoogleDriveStore.__file_url + file_id
+            response = self.session.delete(url)
+            response.raise_for_status()
+
+        self.__with_file_id(path, delete)
+        self.__path_cache.invalidate(path.parts[1:])
+
+    def remove_batch(self, paths):
+        paths = list(paths)
+        results = [None] * len(paths)
+        targets = []
+        for index, file_id in enumerate(self.get_file_ids(paths)):
+            if isinstance(file_id, Exception):
+                results[index] = BulkResult(paths[index], error=file_id)
+            else:
+                targets.append((index, file_id))
+        responses = self.__batch([('DELETE', '/drive/v3/files/' + file_id, None) for index, file_id in targets])
+        for (index, file_id), (status, response) in zip(targets, responses):
+            path = paths[index]
+            if status in (200, 204):
+                self.__path_cache.invalidate(path.parts[1:])
+                results[index] = BulkResult(path)
+            elif status == 404:
+                # stale cached id, the single call resolves the path again
+                results[index] = GoogleDriveStore.__single(path, self.remove, path)
+            else:
+                results[index] = BulkResult(path, error=Exception('remove fail : reason = {0}'.format(status)))
+        return results
+
+    def make_dir_batch(self, items, max_workers=8):
+        # per depth level: one batch resolving the parents, one checking for duplicates, one creating
+        items = list(items)
+        results = [None] * len(items)
+        for indexes in Store.group_by_depth([path / name for path, name in items]):
+            parent_ids = self.get_file_ids([items[index][0] for index in indexes])
+            creates = []
+            targets = set()
+            for index, parent_id in zip(indexes, parent_ids):
+                path, name = items[index]
+                if isinstance(parent_id, Exception):
+                    results[index] = BulkResult(path / name, error=parent_id)
+                elif (parent_id, name) in targets:
+                    # the same directory twice in one batch
+                    results[index] = BulkResult(path / name, error=DuplicateEntryError('Duplicate path'))
+                else:
+                    targets.add((parent_id, name))
+                    creates.append((index, parent_id))
+            found = self.__batch_search([(parent_id, items[index][1]) for index, parent_id in creates])
+            requests = []
+            for (index, parent_id), (status, response) in zip(creates, found):
+                path, name = items[index]
+                if status != 200:
+                    results[index] = BulkResult(path / name, error=Exception('make dir fail : reason = {0}'.format(status)))
+                elif response.get('files'):
+                    results[index] = BulkResult(path / name, error=DuplicateEntryError('Duplicate path'))
+                else:
+                    metadata = {
+                        'parents': [parent_id],
+                        'name': name,
+                        'mimeType': GoogleDriveStore.__folder_type
+                    }
+                    requests.append((index, ('POST', '/drive/v3/files', metadata)))
+            responses = self.__batch([request for index, request in requests])
+            for (index, request), (status, response) in zip(requests, responses):
+                path, name = items[index]
+                if status == 200:
+                    self.__path_cache.put((path / name).parts[1:], response['id'])
+                    results[index] = BulkResult(path / name, response)
+                elif status == 404:
+                    # stale cached parent id, the single call resolves the path again
+                    results[index] = GoogleDriveStore.__single(path / name, self.make_dir, path, name)
+                else:
+                    results[index] = BulkResult(path / name, error=Exception('make dir fail : reason = {0}'.format(status)))
+        return results
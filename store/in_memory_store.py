@@ -0,0 +1,160 @@
+import time
+import hashlib
+import threading
+from pathlib import PurePath
+from . store import Store
+from . directory_entry import DirectoryEntry
+from . stream import iter_parts
+from exceptions import *
+
+
+class MemoryFile:
+    __slots__ = ('data', 'hash', 'is_chunk', 'revision', 'modified')
+
+    def __init__(self, data: bytes, is_chunk: bool, revision: int):
+        self.data = data
+        self.hash = hashlib.sha256(data).hexdigest()
+        self.is_chunk = is_chunk
+        self.revision = revision
+        self.modified = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+
+class InMemoryStore(Store):
+    # a store held in this process, for scratch data, tests and benchmarks without accounts.
+    # directories are dicts of name -> dict or MemoryFile. max_bytes caps the data held,
+    # uploads past it raise DiskFullError like a full drive
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.__root = {}
+        self.__used = 0
+        self.__revision = 0
+        self.__lock = threading.Lock()
+
+    def authorized(self):
+        return True
+
+    def __node(self, path: PurePath):
+        node = self.__root
+        for name in path.parts[1:]:
+            if not isinstance(node, dict) or name not in node:
+                raise NoEntryError('path is not valid')
+            node = node[name]
+        return node
+
+    def __directory(self, path: PurePath):
+        node = self.__node(path)
+        if not isinstance(node, dict):
+            raise NoEntryError('path is not valid')
+        return node
+
+    def __file(self, path: PurePath):
+        node = self.__node(path)
+        if isinstance(node, dict):
+            raise NoEntryError('path is not a file')
+        return node
+
+    @staticmethod
+    def __size(node):
+        if isinstance(node, dict):
+            return sum(InMemoryStore.__size(child) for child in node.values())
+        return len(node.data)
+
+    @staticmethod
+    def __copy_node(node):
+        if isinstance(node, dict):
+            return {name: InMemoryStore.__copy_node(child) for name, child in node.items()}
+        copied = MemoryFile.__new__(MemoryFile)
+        for name in MemoryFile.__slots__:
+            setattr(copied, name, getattr(node, name))
+        return copied
+
+    @staticmethod
+    def __make_entry(name: str, node):
+        if isinstance(node, dict):
+            return DirectoryEntry(name, is_directory=True)
+        return DirectoryEntry(name, is_chunk=node.is_chunk, file_size=len(node.data),
+                              content_hash=node.hash, revision=str(node.revision),
+                              modified=node.modified)
+
+    def __reserve(self, size: int):
+        if self.max_bytes is not None and self.__used + size > self.max_bytes:
+            raise DiskFullError('upload fail')
+        self.__used += size
+
+    def space_usage(self):
+        # (used, allocated) bytes, allocated None without max_bytes
+        with self.__lock:
+            return self.__used, self.max_bytes
+
+    def download_file(self, path: PurePath):
+        with self.__lock:
+            return self.__file(path).data
+
+    def download_stream(self, path: PurePath, offset=0, length=None):
+        # the data is looked up now, a missing file raises here and not on the first chunk
+        with self.__lock:
+            data = self.__file(path).data
+        end = len(data) if length is None else min(offset + length, len(data))
+        return iter_parts(memoryview(data)[offset:end], self.download_chunk_size)
+
+    def file_size(self, path: PurePath):
+        with self.__lock:
+            return len(self.__file(path).data)
+
+    def upload_file(self, path: PurePath, data, is_chunk=False):
+        if not isinstance(data, bytes):
+            data = b''.join(iter_parts(data, self.upload_part_size))
+        with self.__lock:
+            parent = self.__directory(path.parent)
+            if path.name in parent:
+                raise DuplicateEntryError('duplicate upload')
+            self.__reserve(len(data))
+            self.__revision += 1
+            parent[path.name] = MemoryFile(data, is_chunk, self.__revision)
+
+    def get_list(self, path: PurePath):
+        with self.__lock:
+            return [InMemoryStore.__make_entry(name, node) for name, node in self.__directory(path).items()]
+
+    def get_entry(self, path: PurePath):
+        with self.__lock:
+            return InMemoryStore.__make_entry(path.name, self.__node(path))
+
+    def content_hash(self, data: bytes):
+        return hashlib.sha256(data).hexdigest()
+
+    def make_dir(self, path: PurePath, name: str):
+        with self.__lock:
+            parent = self.__directory(path)
+            if name in parent:
+                raise DuplicateEntryError('make dir fail')
+            parent[name] = {}
+
+    def remove(self, path: PurePath):
+        with self.__lock:
+            parent = self.__directory(path.parent)
+            if path.name not in parent or not path.name:
+                raise NoEntryError('remove fail')
+            self.__used -= InMemoryStore.__size(parent.pop(path.name))
+
+    def copy(self, source: PurePath, destination: PurePath):
+        # files share their data, bytes don't change
+        with self.__lock:
+            node = self.__node(source)
+            parent = self.__directory(destination.parent)
+            if destination.name in parent:
+                raise DuplicateEntryError('copy fail')
+            copied = InMemoryStore.__copy_node(node)
+            self.__reserve(InMemoryStore.__size(copied))
+            parent[destination.name] = copied
+
+    def move(self, source: PurePath, destination: PurePath):
+        with self.__lock:
+            node = self.__node(source)
+            parent = self.__directory(destination.parent)
+            if destination.name in parent:
+                raise DuplicateEntryError('move fail')
+            if destination.parts[:len(source.parts)] == source.parts:
+                raise Exception('move fail : reason = destination is inside the source')
+            del self.__directory(source.parent)[source.name]
+            parent[destination.name] = node
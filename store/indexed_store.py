@@ -0,0 +1,121 @@
+import time
+import threading
+from pathlib import PurePath
+from . store import Store
+from . change import Change
+from . directory_entry import DirectoryEntry
+from . metadata_index import MetadataIndex
+from exceptions import *
+
+
+class IndexedStore(Store):
+    # answers get_list and lookups from a local MetadataIndex of the wrapped store.
+    # the index is filled by one full listing, then kept current through the store's
+    # change feed with at most one delta call every max_age seconds.
+    # writes go to the store and are recorded in the index right away
+    def __init__(self, store, index_path, max_age=5):
+        self.store = store
+        self.index = MetadataIndex(index_path, store.case_sensitive)
+        self.max_age = max_age
+        self.case_sensitive = store.case_sensitive
+        self.lists_file_sizes = store.lists_file_sizes
+        self.__synced_at = None
+        self.__sync_lock = threading.Lock()
+
+    def authorized(self):
+        return self.store.authorized()
+
+    def configure_pool(self, size: int, socket_options=None):
+        self.store.configure_pool(size, socket_options)
+
+    def sync(self):
+        # one delta call, or a full listing when there is no cursor yet or it expired
+        with self.__sync_lock:
+            cursor = self.index.cursor
+            if cursor is not None:
+                try:
+                    changes, cursor = self.store.list_changes(cursor)
+                    self.index.apply(changes, cursor)
+                except CursorResetError:
+                    cursor = None
+            if cursor is None:
+                changes, cursor = self.store.list_changes()
+                self.index.reset(changes, cursor)
+            self.__synced_at = time.monotonic()
+
+    def __refresh(self):
+        if self.__synced_at is None or time.monotonic() - self.__synced_at >= self.max_age:
+            self.sync()
+
+    def list_changes(self, cursor=None):
+        return self.store.list_changes(cursor)
+
+    def get_entry(self, path: PurePath):
+        # answered without a request
+        self.__refresh()
+        entry = self.index.get(path)
+        if entry is None:
+            raise NoEntryError('path is not valid')
+        return entry
+
+    def get_list(self, path: PurePath):
+        self.__refresh()
+        return self.index.list(path)
+
+    def download_file(self, path: PurePath):
+        return self.store.download_file(path)
+
+    def download_stream(self, path: PurePath, offset=0, length=None):
+        return self.store.download_stream(path, offset, length)
+
+    def upload_file(self, path: PurePath, data, is_chunk=False):
+        result = self.store.upload_file(path, data, is_chunk)
+        # size and hash are filled in by the next delta call when data is a stream
+        size, digest = 0, None
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            size, digest = len(data), self.store.content_hash(bytes(data))
+        self.index.apply([Change(path, DirectoryEntry(path.name, is_chunk=is_chunk, file_size=size,
+                                                      content_hash=digest))])
+        return result
+
+    def make_dir(self, path: PurePath, name: str):
+        self.store.make_dir(path, name)
+        self.index.apply([Change(path / name, DirectoryEntry(name, is_directory=True))])
+
+    def make_dir_batch(self, items, max_workers=8):
+        items = list(items)
+        results = self.store.make_dir_batch(items, max_workers)
+        self.index.apply([Change(result.path, DirectoryEntry(name, is_directory=True))
+                          for (path, name), result in zip(items, results) if result.ok])
+        return results
+
+    def remove(self, path: PurePath):
+        self.store.remove(path)
+        self.index.apply([Change(path)])
+
+    def remove_batch(self, paths):
+        results = self.store.remove_batch(paths)
+        self.index.apply([Change(result.path) for result in results if result.ok])
+        return results
+
+    def copy(self, source: PurePath, destination: PurePath):
+        self.store.copy(source, destination)
+        # the copied tree comes in with the next delta call
+        self.__synced_at = None
+
+    def move(self, source: PurePath, destination: PurePath):
+        self.store.move(source, destination)
+        self.index.apply([Change(source)])
+        self.__synced_at = None
+
+    def copy_batch(self, pairs, max_workers=8):
+        results = self.store.copy_batch(pairs, max_workers)
+        self.__synced_at = None
+        return results
+
+    def move_batch(self, pairs, max_workers=8):
+        pairs = list(pairs)
+        results = self.store.move_batch(pairs, max_workers)
+        self.index.apply([Change(source) for (source, destination), result in zip(pairs, results) if result.ok])
+        self.__synced_at = None
+        return results
@@ -0,0 +1,205 @@
+import os
+import time
+import errno
+import shutil
+import uuid
+from pathlib import Path, PurePath
+from . store import Store
+from . directory_entry import DirectoryEntry
+from . stream import iter_parts
+from exceptions import *
+
+
+class LocalDiskStore(Store):
+    # a store in a local directory, for hot data that shouldn't pay for a round trip and for
+    # benchmarks without accounts. uploads are written next to their target and linked into
+    # place, so readers never see half a file and an existing name is never replaced.
+    # is_chunk isn't kept, chunks are told by their name like on dropbox
+    partial_suffix = '.unidrive-partial'
+
+    def __init__(self, root_dir):
+        self.root_dir = Path(root_dir)
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+
+    def authorized(self):
+        return True
+
+    def __local(self, path: PurePath):
+        if '..' in path.parts:
+            raise NoEntryError('path is not valid')
+        return self.root_dir.joinpath(*path.parts[1:])
+
+    @staticmethod
+    def __make_entry(name: str, stat, is_dir: bool):
+        if is_dir:
+            return DirectoryEntry(name, is_directory=True)
+        return DirectoryEntry(name, file_size=stat.st_size, revision=str(stat.st_mtime_ns),
+                              file_id=str(stat.st_ino),
+                              modified=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(stat.st_mtime)))
+
+    def __write(self, local: Path, parts):
+        # returns the partial file holding parts, ENOSPC becomes DiskFullError
+        partial = local.with_name('.{0}.{1}{2}'.format(local.name, uuid.uuid4().hex, LocalDiskStore.partial_suffix))
+        try:
+            with open(partial, 'wb') as partial_file:
+                for part in parts:
+                    partial_file.write(part)
+        except FileNotFoundError:
+            raise NoEntryError('path is not valid')
+        except NotADirectoryError:
+            raise NoEntryError('path is not valid')
+        except OSError as e:
+            if os.path.exists(partial):
+                os.remove(partial)
+            if e.errno == errno.ENOSPC:
+                raise DiskFullError('upload fail')
+            raise
+        except BaseException:
+            os.remove(partial)
+            raise
+        return partial
+
+    def __link(self, partial: Path, local: Path, operation: str):
+        # link fails on an existing name where rename would replace it
+        try:
+            os.link(partial, local)
+        except FileExistsError:
+            raise DuplicateEntryError('{0} fail'.format(operation))
+        finally:
+            os.remove(partial)
+
+    def space_usage(self):
+        # (used, allocated) bytes of the disk holding the store
+        usage = shutil.disk_usage(self.root_dir)
+        return usage.total - usage.free, usage.total
+
+    def download_file(self, path: PurePath):
+        return b''.join(self.download_stream(path))
+
+    def download_stream(self, path: PurePath, offset=0, length=None):
+        # the file is opened now, a missing file raises here and not on the first chunk
+        try:
+            local_file = open(self.__local(path), 'rb')
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            raise NoEntryError('download fail')
+        return self.__read(local_file, offset, length)
+
+    def __read(self, local_file, offset, length):
+        with local_file:
+            local_file.seek(offset)
+            remaining = length
+            while remaining is None or remaining > 0:
+                size = self.download_chunk_size if remaining is None else min(self.download_chunk_size, remaining)
+                chunk = local_file.read(size)
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def file_size(self, path: PurePath):
+        local = self.__local(path)
+        if not local.is_file():
+            raise NoEntryError('path is not a file')
+        return local.stat().st_size
+
+    def upload_file(self, path: PurePath, data, is_chunk=False):
+        local = self.__local(path)
+        if not local.parent.is_dir():
+            raise NoEntryError('wrong path')
+        if os.path.lexists(local):
+            raise DuplicateEntryError('duplicate upload')
+        self.__link(self.__write(local, iter_parts(data, self.upload_part_size)), local, 'upload')
+
+    def get_list(self, path: PurePath):
+        return list(self.iter_list(path))
+
+    def iter_list(self, path: PurePath):
+        try:
+            scanner = os.scandir(self.__local(path))
+        except (FileNotFoundError, NotADirectoryError):
+            raise NoEntryError('get list fail')
+        return self.__scan(scanner)
+
+    def __scan(self, scanner):
+        with scanner:
+            for item in scanner:
+                if item.name.endswith(LocalDiskStore.partial_suffix):
+                    continue
+                try:
+                    yield LocalDiskStore.__make_entry(item.name, item.stat(), item.is_dir())
+                except FileNotFoundError:
+                    # removed while listing
+                    continue
+
+    def get_entry(self, path: PurePath):
+        local = self.__local(path)
+        try:
+            stat = local.stat()
+        except (FileNotFoundError, NotADirectoryError):
+            raise NoEntryError('get entry fail')
+        return LocalDiskStore.__make_entry(path.name, stat, local.is_dir())
+
+    def make_dir(self, path: PurePath, name: str):
+        try:
+            os.mkdir(self.__local(path / name))
+        except FileExistsError:
+            raise DuplicateEntryError('make dir fail')
+        except (FileNotFoundError, NotADirectoryError):
+            raise NoEntryError('make dir fail')
+
+    def remove(self, path: PurePath):
+        local = self.__local(path)
+        if local == self.root_dir:
+            raise Exception('remove fail : reason = the root can not be removed')
+        try:
+            if local.is_dir() and not local.is_symlink():
+                shutil.rmtree(local)
+            else:
+                os.remove(local)
+        except (FileNotFoundError, NotADirectoryError):
+            raise NoEntryError('remove fail')
+
+    def copy(self, source: PurePath, destination: PurePath):
+        source_local = self.__local(source)
+        local = self.__local(destination)
+        if not source_local.exists():
+            raise NoEntryError('copy fail')
+        if not local.parent.is_dir():
+            raise NoEntryError('copy fail')
+        if os.path.lexists(local):
+            raise DuplicateEntryError('copy fail')
+        if not source_local.is_dir():
+            with open(source_local, 'rb') as source_file:
+                partial = self.__write(local, iter(lambda: source_file.read(self.upload_part_size), b''))
+            self.__link(partial, local, 'copy')
+            return
+        try:
+            shutil.copytree(source_local, local)
+        except FileExistsError:
+            raise DuplicateEntryError('copy fail')
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise DiskFullError('copy fail')
+            raise
+
+    def move(self, source: PurePath, destination: PurePath):
+        source_local = self.__local(source)
+        local = self.__local(destination)
+        if not source_local.exists():
+            raise NoEntryError('move fail')
+        if not local.parent.is_dir():
+            raise NoEntryError('move fail')
+        if destination.parts[:len(source.parts)] == source.parts:
+            raise Exception('move fail : reason = destination is inside the source')
+        if not source_local.is_dir():
+            # link and unlink, rename would replace a file of the same name
+            try:
+                os.link(source_local, local)
+            except FileExistsError:
+                raise DuplicateEntryError('move fail')
+            os.remove(source_local)
+            return
+        if os.path.lexists(local):
+            raise DuplicateEntryError('move fail')
+        os.rename(source_local, local)
@@ -0,0 +1,181 @@
+import sqlite3
+import threading
+from pathlib import PurePath
+from . directory_entry import DirectoryEntry
+from exceptions import *
+
+
+class MetadataIndex:
+    # sqlite mirror of one store's tree. rows point to their parent row, so moving or renaming
+    # a directory rewrites a single row. the change cursor of the store is kept with the rows
+    root_row = 0
+
+    def __init__(self, db_path, case_sensitive=True):
+        self.__lock = threading.RLock()
+        self.__db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.__db.executescript('''
+            CREATE TABLE IF NOT EXISTS entries (
+                row INTEGER PRIMARY KEY,
+                parent INTEGER,
+                name TEXT COLLATE {0},
+                file_id TEXT,
+                is_dir INTEGER,
+                is_chunk INTEGER,
+                size INTEGER,
+                content_hash TEXT,
+                revision TEXT,
+                modified TEXT,
+                UNIQUE (parent, name)
+            );
+            CREATE INDEX IF NOT EXISTS entries_file_id ON entries (file_id);
+            CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT);
+        '''.format('BINARY' if case_sensitive else 'NOCASE'))
+        with self.__db:
+            columns = [column[1] for column in self.__db.execute('PRAGMA table_info(entries)')]
+            if 'content_hash' not in columns:
+                # an index made before hashes were kept, the cursor goes so the next sync is a
+                # full listing that fills them in
+                for column in ('content_hash', 'revision', 'modified'):
+                    self.__db.execute('ALTER TABLE entries ADD COLUMN {0} TEXT'.format(column))
+                self.__db.execute('DELETE FROM state WHERE key = \'cursor\'')
+            self.__db.execute('INSERT OR IGNORE INTO entries (row, parent, name, file_id, is_dir, is_chunk, size) '
+                              'VALUES (?, NULL, \'\', NULL, 1, 0, 0)', (MetadataIndex.root_row,))
+
+    def close(self):
+        self.__db.close()
+
+    @property
+    def cursor(self):
+        with self.__lock:
+            row = self.__db.execute('SELECT value FROM state WHERE key = \'cursor\'').fetchone()
+        return row[0] if row else None
+
+    def reset(self, changes, cursor):
+        # replaces the whole tree with a full listing
+        with self.__lock, self.__db:
+            self.__db.execute('DELETE FROM entries WHERE row != ?', (MetadataIndex.root_row,))
+            self.__apply(changes, cursor, full=True)
+
+    def apply(self, changes, cursor=None):
+        # cursor None keeps the stored one, local writes are applied that way.
+        # raises CursorResetError and keeps nothing when a change has a parent the index doesn't know
+        with self.__lock, self.__db:
+            self.__apply(changes, cursor)
+
+    def __apply(self, changes, cursor, full=False):
+        pending = list(changes)
+        while pending:
+            # a child may come before its parent, retry those until nothing more resolves
+            deferred = [change for change in pending if not self.__apply_one(change)]
+            if len(deferred) == len(pending):
+                break
+            pending = deferred
+        if pending and cursor is not None and not full:
+            # the index missed the parent, moving the cursor past the change would lose it for good.
+            # what is left of a full listing is outside the tree
+            raise CursorResetError('apply fail : reason = {0} changes without a parent'.format(len(pending)))
+        if cursor is not None:
+            self.__db.execute('INSERT OR REPLACE INTO state VALUES (\'cursor\', ?)', (cursor,))
+
+    def __apply_one(self, change):
+        if change.removed:
+            row = self.__find(change.file_id, change.path)
+            if row is not None and row != MetadataIndex.root_row:
+                self.__delete_tree(row)
+            return True
+        if change.parent_id is not None:
+            parent = self.__row_of_id(change.parent_id)
+        elif change.path is not None:
+            parent = self.__resolve(change.path.parent)
+        else:
+            return False
+        if parent is None:
+            return False
+        entry = change.entry
+        row = self.__find(change.file_id, change.path)
+        taken = self.__db.execute('SELECT row, file_id FROM entries WHERE parent = ? AND name = ?',
+                                  (parent, entry.name)).fetchone()
+        if row is None and taken is not None and taken[1] is None:
+            # recorded by a local write before the store told its id
+            row = taken[0]
+        if taken is not None and taken[0] != row:
+            # something else was at the new place, it is gone now
+            self.__delete_tree(taken[0])
+        values = (parent, entry.name, change.file_id, int(entry.is_dir), int(entry.is_chunk), entry.file_size,
+                  entry.content_hash, entry.revision, entry.modified)
+        if row is None:
+            self.__db.execute('INSERT INTO entries (parent, name, file_id, is_dir, is_chunk, size, content_hash, '
+                              'revision, modified) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', values)
+        else:
+            self.__db.execute('UPDATE entries SET parent = ?, name = ?, file_id = COALESCE(?, file_id), '
+                              'is_dir = ?, is_chunk = ?, size = ?, content_hash = ?, revision = ?, modified = ? '
+                              'WHERE row = ?', values + (row,))
+        return True
+
+    def __find(self, file_id, path):
+        if file_id is not None:
+            row = self.__row_of_id(file_id)
+            if row is not None or path is None:
+                return row
+        return self.__resolve(path)
+
+    def __row_of_id(self, file_id):
+        row = self.__db.execute('SELECT row FROM entries WHERE file_id = ?', (file_id,)).fetchone()
+        return row[0] if row else None
+
+    def __resolve(self, path: PurePath):
+        row = MetadataIndex.root_row
+        for name in path.parts[1:]:
+            found = self.__db.execute('SELECT row FROM entries WHERE parent = ? AND name = ?', (row, name)).fetchone()
+            if found is None:
+                return None
+            row = found[0]
+        return row
+
+    def __delete_tree(self, row):
+        # starts with DELETE, so sqlite3 opens the transaction of apply before it and a failed apply undoes it
+        self.__db.execute('''
+            DELETE FROM entries WHERE row IN (
+                WITH RECURSIVE tree(row) AS (
+                    SELECT ? UNION ALL SELECT entries.row FROM entries JOIN tree ON entries.parent = tree.row
+                )
+                SELECT row FROM tree
+            )
+        ''', (row,))
+
+    entry_columns = 'name, is_dir, is_chunk, size, file_id, content_hash, revision, modified'
+
+    @staticmethod
+    def __entry(record):
+        name, is_dir, is_chunk, size, file_id, content_hash, revision, modified = record
+        return DirectoryEntry(name, is_chunk=bool(is_chunk), is_directory=bool(is_dir), file_size=size,
+                              content_hash=content_hash, revision=revision, file_id=file_id, modified=modified)
+
+    def get(self, path: PurePath):
+        # DirectoryEntry of path, None if it is not in the index
+        with self.__lock:
+            row = self.__resolve(path)
+            if row is None:
+                return None
+            return self.__entry(self.__db.execute('SELECT {0} FROM entries WHERE row = ?'.format(
+                MetadataIndex.entry_columns), (row,)).fetchone())
+
+    def file_id(self, path: PurePath):
+        with self.__lock:
+            row = self.__resolve(path)
+            if row is None:
+                return None
+            return self.__db.execute('SELECT file_id FROM entries WHERE row = ?', (row,)).fetchone()[0]
+
+    def list(self, path: PurePath):
+        with self.__lock:
+            row = self.__resolve(path)
+            if row is None:
+                raise NoEntryError('get list fail')
+            records = self.__db.execute('SELECT {0} FROM entries WHERE parent = ? ORDER BY name'.format(
+                MetadataIndex.entry_columns), (row,)).fetchall()
+        return [self.__entry(record) for record in records]
+
+    def __len__(self):
+        with self.__lock:
+            return self.__db.execute('SELECT COUNT(*) FROM entries').fetchone()[0] - 1
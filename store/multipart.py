@@ -0,0 +1,86 @@
+import json
+import uuid
+
+
+class MultipartRelatedEncoder:
+    # multipart/related body with raw binary parts, nothing is re-encoded or joined.
+    # iterating yields memoryview slices of the original buffers
+    block_size = 64 * 1024
+
+    def __init__(self, parts, boundary=None):
+        # parts is a list of (content_type, bytes-like) pairs
+        self.boundary = boundary or uuid.uuid4().hex
+        self.__segments = []
+        for content_type, data in parts:
+            header = '--{0}\r\nContent-Type: {1}\r\n\r\n'.format(self.boundary, content_type)
+            self.__segments.append(memoryview(header.encode()))
+            self.__segments.append(memoryview(data).cast('B'))
+            self.__segments.append(memoryview(b'\r\n'))
+        self.__segments.append(memoryview('--{0}--\r\n'.format(self.boundary).encode()))
+
+    @property
+    def content_type(self):
+        return 'multipart/related; boundary={0}'.format(self.boundary)
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.__segments)
+
+    def __iter__(self):
+        for segment in self.__segments:
+            for offset in range(0, len(segment), self.block_size):
+                yield segment[offset:offset + self.block_size]
+
+
+def encode_batch(requests, boundary: str):
+    # multipart/mixed body of a google batch request.
+    # requests are (method, url, json body or None), url is relative to the api host
+    lines = []
+    for index, (method, url, body) in enumerate(requests):
+        lines.append('--{0}'.format(boundary))
+        lines.append('Content-Type: application/http')
+        lines.append('Content-ID: <item{0}>'.format(index))
+        lines.append('')
+        lines.append('{0} {1} HTTP/1.1'.format(method, url))
+        if body is not None:
+            lines.append('Content-Type: application/json; charset=UTF-8')
+            lines.append('')
+            lines.append(json.dumps(body))
+        else:
+            # empty line ending the headers, then the empty body
+            lines.append('')
+            lines.append('')
+    lines.append('--{0}--'.format(boundary))
+    lines.append('')
+    return '\r\n'.join(lines).encode()
+
+
+def parse_batch_response(content_type: str, body: bytes, count: int):
+    # returns (status, json body or None) for each of the `count` requests, in request order
+    boundary = content_type.split('boundary=', 1)[1].split(';', 1)[0].strip('"')
+    results = [None] * count
+    for position, part in enumerate(body.split(('--' + boundary).encode())[1:]):
+        if part.startswith(b'--'):
+            break
+        headers, response = _split_head(part.strip(b'\r\n'))
+        # parts without a Content-ID are taken in order
+        index = position
+        for line in headers.split(b'\n'):
+            name, _, value = line.decode().partition(':')
+            if name.strip().lower() == 'content-id':
+                index = int(value.strip().strip('<>').rsplit('item', 1)[1])
+        head, content = _split_head(response)
+        status = int(head.split(b'\n', 1)[0].split()[1])
+        try:
+            content = json.loads(content.decode()) if content.strip() else None
+        except ValueError:
+            content = None
+        results[index] = (status, content)
+    return results
+
+
+def _split_head(data: bytes):
+    # header block and body, separated by an empty line
+    for separator in (b'\r\n\r\n', b'\n\n'):
+        if separator in data:
+            return data.split(separator, 1)
+    return data, b''
@@ -0,0 +1,108 @@
+from threading import RLock
+from collections import OrderedDict
+
+
+class PathCache:
+    # trie of path parts -> file id, least recently used entries are evicted first
+    class _Node:
+        __slots__ = ('file_id', 'children')
+
+        def __init__(self, file_id=None):
+            self.file_id = file_id
+            self.children = {}
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.__root = PathCache._Node()
+        # every cached node keyed by its parts, ordered by last access
+        self.__recent = OrderedDict()
+        self.__lock = RLock()
+
+    def __len__(self):
+        return len(self.__recent)
+
+    def __contains__(self, parts):
+        return tuple(parts) in self.__recent
+
+    def lookup(self, parts):
+        # returns (depth, file_id) of the deepest cached prefix of parts
+        parts = tuple(parts)
+        with self.__lock:
+            node = self.__root
+            depth = 0
+            for part in parts:
+                child = node.children.get(part)
+                if child is None:
+                    break
+                node = child
+                depth += 1
+                self.__recent.move_to_end(parts[:depth])
+            return depth, node.file_id
+
+    def get(self, parts):
+        depth, file_id = self.lookup(parts)
+        if depth != len(tuple(parts)):
+            return None
+        return file_id
+
+    def put(self, parts, file_id):
+        parts = tuple(parts)
+        if not parts:
+            return
+        with self.__lock:
+            parent = self.__find(parts[:-1])
+            if parent is None:
+                # parent was evicted or never resolved, nothing to attach to
+                return
+            node = parent.children.get(parts[-1])
+            if node is None:
+                node = PathCache._Node(file_id)
+                parent.children[parts[-1]] = node
+            elif node.file_id != file_id:
+                # id changed so everything cached below it is stale
+                self.__drop_children(parts, node)
+                node.file_id = file_id
+            self.__recent[parts] = node
+            self.__recent.move_to_end(parts)
+            while len(self.__recent) > self.max_entries:
+                oldest = next(iter(self.__recent))
+                self.invalidate(oldest)
+
+    def invalidate(self, parts):
+        # drop the entry and all of its descendants
+        parts = tuple(parts)
+        with self.__lock:
+            if not parts:
+                self.clear()
+                return
+            parent = self.__find(parts[:-1])
+            if parent is None:
+                return
+            node = parent.children.pop(parts[-1], None)
+            if node is None:
+                return
+            self.__drop_children(parts, node)
+            del self.__recent[parts]
+
+    def clear(self):
+        with self.__lock:
+            self.__root.children.clear()
+            self.__recent.clear()
+
+    def __find(self, parts):
+        node = self.__root
+        for part in parts:
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def __drop_children(self, parts, node):
+        stack = [(parts, node)]
+        while stack:
+            prefix, current = stack.pop()
+            for name, child in current.children.items():
+                child_parts = prefix + (name,)
+                self.__recent.pop(child_parts, None)
+                stack.append((child_parts, child))
+            current.children.clear()
@@ -0,0 +1,102 @@
+import time
+import threading
+from exceptions import *
+
+
+class PlacementScheduler:
+    # picks the stores new chunks go to. a chunk goes to the store where it would be done
+    # soonest: the bytes already on their way there plus the chunk, over the throughput the
+    # store showed lately. throughput is a moving average of the measured uploads, cut down
+    # by the recent error rate, stores not measured yet count as the fastest so they get
+    # measured. a store without room for the chunk gets none, so it never has to answer with
+    # DiskFullError. free space is asked every refresh_interval seconds and counted down with
+    # every chunk placed in between, reserve bytes are left free on every store
+    def __init__(self, stores, refresh_interval=300, reserve=0, smoothing=0.3):
+        self.stores = list(stores)
+        self.refresh_interval = refresh_interval
+        self.reserve = reserve
+        # weight of the newest measurement in the averages
+        self.smoothing = smoothing
+        count = len(self.stores)
+        # bytes per second
+        self.__throughput = [None] * count
+        self.__error_rate = [0.0] * count
+        self.__in_flight = [0] * count
+        # None when the store has no limit or can't tell
+        self.__free = [None] * count
+        self.__refreshed_at = [None] * count
+        # ties go to the stores in turn
+        self.__turn = 0
+        self.__lock = threading.Lock()
+
+    def refresh(self, indexes=None):
+        # asks the stores for their free space now
+        for index in range(len(self.stores)) if indexes is None else indexes:
+            try:
+                used, allocated = self.stores[index].space_usage()
+                free = None if allocated is None else allocated - used
+            except Exception:
+                # stores that can't tell are taken to have room, a full one says so on upload
+                free = None
+            with self.__lock:
+                # chunks on their way are not in the answer yet
+                self.__free[index] = None if free is None else free - self.__in_flight[index]
+                self.__refreshed_at[index] = time.monotonic()
+
+    def place(self, size: int, count=1, exclude=()):
+        # returns the indexes of count different stores for a chunk of size bytes, every one
+        # has to be reported back with finished. raises DiskFullError when too few have room
+        now = time.monotonic()
+        with self.__lock:
+            stale = [index for index, refreshed_at in enumerate(self.__refreshed_at)
+                     if index not in exclude and (refreshed_at is None or now - refreshed_at >= self.refresh_interval)]
+        if stale:
+            self.refresh(stale)
+        with self.__lock:
+            candidates = [index for index in range(len(self.stores)) if index not in exclude
+                          and (self.__free[index] is None or self.__free[index] - self.reserve >= size)]
+            if len(candidates) < count:
+                raise DiskFullError('place fail')
+            measured = [throughput for throughput in self.__throughput if throughput]
+            fastest = max(measured) if measured else 1.0
+
+            def done_in(index):
+                rate = (self.__throughput[index] or fastest) * max(1 - self.__error_rate[index], 0.05)
+                return (self.__in_flight[index] + size) / rate
+
+            chosen = sorted(candidates, key=lambda index: (done_in(index),
+                                                           (index - self.__turn) % len(self.stores)))[:count]
+            self.__turn = chosen[0] + 1
+            for index in chosen:
+                self.__in_flight[index] += size
+                if self.__free[index] is not None:
+                    self.__free[index] -= size
+        return chosen
+
+    def finished(self, index: int, size: int, seconds: float, error=None):
+        # reports how the upload of a placed chunk went
+        with self.__lock:
+            self.__in_flight[index] -= size
+            if error is None:
+                rate = size / max(seconds, 1e-6)
+                previous = self.__throughput[index]
+                self.__throughput[index] = rate if previous is None else \
+                    previous + self.smoothing * (rate - previous)
+                self.__error_rate[index] *= 1 - self.smoothing
+                return
+            self.__error_rate[index] += self.smoothing * (1 - self.__error_rate[index])
+            if isinstance(error, DiskFullError):
+                # nothing more goes there until the provider reports room again
+                self.__free[index] = 0
+            elif self.__free[index] is not None:
+                self.__free[index] += size
+
+    def stats(self):
+        # what the placement is based on, per store
+        with self.__lock:
+            return [{
+                'throughput': self.__throughput[index],
+                'error_rate': self.__error_rate[index],
+                'in_flight': self.__in_flight[index],
+                'free': self.__free[index]
+            } for index in range(len(self.stores))]
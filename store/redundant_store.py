@@ -0,0 +1,203 @@
+from functools import partial
+from pathlib import PurePath
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from . striped_store import StripedStore
+from . erasure import ReedSolomon
+from exceptions import *
+
+
+class RedundantStore(StripedStore):
+    # every chunk is kept either as `replicas` full copies or as data_shards + parity_shards
+    # reed-solomon shards, each piece on a different store. reads race the pieces and keep
+    # the fastest ones, so a slow or unreachable store doesn't hold a download up.
+    # manifests are written to every store
+    def __init__(self, stores, replicas=2, data_shards=None, parity_shards=1, hedge_delay=0,
+                 chunk_size=4 * 1024 * 1024, max_workers=8, scheduler=None):
+        super().__init__(stores, chunk_size, max_workers, scheduler)
+        if data_shards:
+            self.redundancy = {
+                'data_shards': data_shards,
+                'parity_shards': parity_shards
+            }
+            self.pieces = data_shards + parity_shards
+        else:
+            self.redundancy = {
+                'replicas': replicas
+            }
+            self.pieces = replicas
+        if self.pieces > len(self.stores):
+            raise ValueError('{0} pieces per chunk need as many stores, got {1}'.format(self.pieces,
+                                                                                        len(self.stores)))
+        # seconds to wait for the first pieces before asking the other stores, 0 races all of them
+        self.hedge_delay = hedge_delay
+        self.piece_executor = ThreadPoolExecutor(max_workers * len(self.stores))
+        self.__codecs = {}
+
+    def piece_path(self, path: PurePath, index: int, piece: int):
+        return path.parent / StripedStore.chunk_dir_name / '{0}.{1}.{2}{3}'.format(path.name, index, piece,
+                                                                                  StripedStore.chunk_suffix)
+
+    def build_manifest(self, size: int, records):
+        manifest = super().build_manifest(size, records)
+        manifest['redundancy'] = self.redundancy
+        return manifest
+
+    def place_chunk(self, path: PurePath, index: int, size: int, exclude=()):
+        # size is that of one piece
+        if self.scheduler is not None:
+            return self.scheduler.place(size, self.pieces, exclude)
+        stores = [(index + offset) % len(self.stores) for offset in range(len(self.stores))]
+        stores = [store for store in stores if store not in exclude][:self.pieces]
+        if len(stores) < self.pieces:
+            raise DiskFullError('place fail')
+        return stores
+
+    def store_chunk(self, path: PurePath, index: int, chunk: bytes):
+        if 'replicas' in self.redundancy:
+            pieces = [chunk] * self.pieces
+        else:
+            pieces = self.__codec(self.redundancy).encode(chunk)
+        full = set()
+        while True:
+            stores = self.place_chunk(path, index, len(pieces[0]), full)
+            futures = [self.piece_executor.submit(self.send_chunk, store, self.piece_path(path, index, piece), data)
+                       for piece, (store, data) in enumerate(zip(stores, pieces))]
+            wait(futures)
+            record = {
+                'size': len(chunk),
+                'stores': stores
+            }
+            errors = [(store, future.exception()) for store, future in zip(stores, futures)
+                      if future.exception() is not None]
+            if not errors:
+                return record
+            self.remove_chunk(path, index, record)
+            if not all(isinstance(error, DiskFullError) for store, error in errors):
+                raise next(error for store, error in errors if not isinstance(error, DiskFullError))
+            # the whole chunk again without the stores that are full
+            full.update(store for store, error in errors)
+
+    def load_chunk(self, path: PurePath, manifest, index: int, offset=0, length=None):
+        record = manifest['chunks'][index]
+        redundancy = manifest['redundancy']
+        stores = record['stores']
+        if 'replicas' in redundancy:
+            # start from a different replica for every chunk to spread hedged reads
+            first = index % len(stores)
+            fetchers = [(piece, partial(self.__fetch_piece, path, index, piece, stores[piece], offset, length))
+                        for piece in list(range(first, len(stores))) + list(range(first))]
+            return next(iter(self.__race(fetchers, 1).values()))
+        codec = self.__codec(redundancy)
+        # data shards first, they decode without arithmetic
+        fetchers = [(piece, partial(self.__fetch_piece, path, index, piece, store))
+                    for piece, store in enumerate(stores)]
+        data = codec.decode(self.__race(fetchers, codec.data_shards), record['size'])
+        if length is None:
+            return data[offset:]
+        return data[offset:offset + length]
+
+    def remove_chunk(self, path: PurePath, index: int, record):
+        def remove(piece, store):
+            try:
+                self.stores[store].remove(self.piece_path(path, index, piece))
+            except NoEntryError:
+                pass
+        wait([self.piece_executor.submit(remove, piece, store) for piece, store in enumerate(record['stores'])])
+
+    def __fetch_piece(self, path: PurePath, index: int, piece: int, store: int, offset=0, length=None):
+        return b''.join(self.stores[store].download_stream(self.piece_path(path, index, piece), offset, length))
+
+    def __codec(self, redundancy):
+        key = (redundancy['data_shards'], redundancy['parity_shards'])
+        if key not in self.__codecs:
+            self.__codecs[key] = ReedSolomon(*key)
+        return self.__codecs[key]
+
+    def __race(self, fetchers, needed: int):
+        # runs (key, fetch) pairs until `needed` of them succeed, returns {key: result}.
+        # the first `needed` start right away, the rest after hedge_delay or when one fails
+        pending = list(fetchers)
+        running = {}
+        results = {}
+        error = None
+
+        def launch(count):
+            for key, fetch in pending[:count]:
+                running[self.piece_executor.submit(fetch)] = key
+            del pending[:count]
+
+        launch(needed if self.hedge_delay else len(pending))
+        while len(results) < needed:
+            if not running:
+                if not pending:
+                    raise error
+                launch(needed - len(results))
+                continue
+            timeout = self.hedge_delay if pending else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # the first pieces are slow, hedge with every other store
+                launch(len(pending))
+                continue
+            for future in done:
+                key = running.pop(future)
+                if future.exception() is None:
+                    results[key] = future.result()
+                else:
+                    error = future.exception()
+                    launch(1)
+        for future in running:
+            future.cancel()
+        return results
+
+    def store_manifest(self, path: PurePath, manifest: bytes):
+        futures = [self.piece_executor.submit(store.upload_file, path, manifest) for store in self.stores]
+        wait(futures)
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            for store, future in zip(self.stores, futures):
+                if future.exception() is None:
+                    store.remove(path)
+            raise errors[0]
+
+    def fetch_manifest(self, path: PurePath):
+        fetchers = [(index, partial(store.download_file, path)) for index, store in enumerate(self.stores)]
+        return next(iter(self.__race(fetchers, 1).values()))
+
+    def remove_manifest(self, path: PurePath):
+        def remove(store):
+            try:
+                store.remove(path)
+                return True
+            except NoEntryError:
+                return False
+        futures = [self.piece_executor.submit(remove, store) for store in self.stores]
+        wait(futures)
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            raise errors[0]
+        if not any(future.result() for future in futures):
+            raise NoEntryError('path is not valid')
+
+    def list_entries(self, path: PurePath):
+        # any store can answer, they all hold the manifests
+        error = None
+        for store in self.stores:
+            try:
+                return store.get_list(path)
+            except NoEntryError:
+                raise
+            except Exception as e:
+                error = e
+        raise error
+
+    def find_entry(self, path: PurePath):
+        error = None
+        for store in self.stores:
+            try:
+                return store.get_entry(path)
+            except NoEntryError:
+                raise
+            except Exception as e:
+                error = e
+        raise error
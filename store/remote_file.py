@@ -0,0 +1,114 @@
+import io
+from collections import OrderedDict
+from pathlib import PurePath
+
+
+class RemoteFile(io.RawIOBase):
+    # read-only seekable file over a stored file. reads are ranged downloads of whole blocks,
+    # kept in a small in-memory cache. the first read after a seek fetches only the blocks it
+    # needs, every read continuing where the last one ended doubles the blocks fetched ahead,
+    # up to max_read_ahead, so sequential reads take few requests and random ones stay small
+    def __init__(self, store, path: PurePath, size: int, block_size=64 * 1024, cache_blocks=64,
+                 max_read_ahead=4 * 1024 * 1024):
+        super().__init__()
+        self.store = store
+        self.path = path
+        self.size = size
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self.max_read_ahead = max_read_ahead
+        self.__position = 0
+        # block index -> bytes, least recently used first
+        self.__blocks = OrderedDict()
+        self.__read_ahead = 0
+        self.__sequential_end = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        self._checkClosed()
+        return self.__position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._checkClosed()
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.__position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError('invalid whence ({0})'.format(whence))
+        if position < 0:
+            raise ValueError('negative seek position {0}'.format(position))
+        self.__position = position
+        return position
+
+    def readinto(self, buffer):
+        self._checkClosed()
+        with memoryview(buffer).cast('B') as view:
+            end = min(self.__position + len(view), self.size)
+            if end <= self.__position:
+                return 0
+            self.__fetch(self.__position, end)
+            written = 0
+            position = self.__position
+            while position < end:
+                block = position // self.block_size
+                data = self.__blocks[block]
+                self.__blocks.move_to_end(block)
+                start = position - block * self.block_size
+                piece = data[start:start + end - position]
+                view[written:written + len(piece)] = piece
+                written += len(piece)
+                position += len(piece)
+        self.__position = end
+        return written
+
+    def readall(self):
+        # the rest in one go, read ahead is of no use here
+        self._checkClosed()
+        if self.__position >= self.size:
+            return b''
+        data = b''.join(self.store.download_stream(self.path, self.__position, self.size - self.__position))
+        self.__position += len(data)
+        return data
+
+    def __fetch(self, start: int, end: int):
+        # makes the blocks of [start, end) cached with one ranged download, plus the read ahead
+        first = start // self.block_size
+        last = (end - 1) // self.block_size
+        if self.__sequential_end == start:
+            self.__read_ahead = min(max(self.__read_ahead * 2, self.block_size), self.max_read_ahead)
+        else:
+            self.__read_ahead = 0
+        self.__sequential_end = end
+        missing = [block for block in range(first, last + 1) if block not in self.__blocks]
+        if not missing:
+            return
+        for block in range(first, missing[0]):
+            self.__blocks.move_to_end(block)
+        # whole blocks only, a short block in the cache would look like the end of the file
+        ahead = -(-(end + self.__read_ahead) // self.block_size)
+        fetch_end = min(max(last + 1, ahead) * self.block_size, self.size)
+        fetch_start = missing[0] * self.block_size
+        # cached blocks past the first missing one are fetched again, one request beats several
+        data = b''.join(self.store.download_stream(self.path, fetch_start, fetch_end - fetch_start))
+        if len(data) != fetch_end - fetch_start:
+            raise Exception('read fail : reason = file changed while open')
+        for offset in range(0, len(data), self.block_size):
+            block = missing[0] + offset // self.block_size
+            self.__blocks[block] = data[offset:offset + self.block_size]
+            self.__blocks.move_to_end(block)
+        # the blocks of this read stay even when it needs more than cache_blocks
+        needed = missing[0] - first + -(-len(data) // self.block_size)
+        while len(self.__blocks) > max(self.cache_blocks, needed):
+            self.__blocks.popitem(last=False)
+
+    def close(self):
+        self.__blocks.clear()
+        super().close()
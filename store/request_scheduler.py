@@ -0,0 +1,199 @@
+import json
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+
+class RequestScheduler:
+    # paces the requests of one account and retries the ones that can be retried.
+    # a token bucket keeps the rate under `rate` requests per second. when the provider
+    # throttles, every request of the account waits out Retry-After (or an exponential
+    # backoff with jitter) and the rate is halved, then it climbs back to just under the
+    # rate that was throttled. rate None means no limit until the first throttle
+    throttle_statuses = (429,)
+    retry_statuses = (500, 502, 503, 504)
+    # google answers 403 with these reasons when a rate limit is hit
+    throttle_reasons = ('rateLimitExceeded', 'userRateLimitExceeded')
+    # seconds without a throttle before the rate may grow past where it was throttled
+    probe_interval = 60
+    min_rate = 0.5
+    __accounts = {}
+    __accounts_lock = threading.Lock()
+
+    def __init__(self, rate=None, burst=None, max_retries=5, backoff=0.5, max_backoff=60):
+        self.max_rate = rate
+        # as they were given, for_account compares them
+        self.__given = (rate, burst)
+        self.rate = rate
+        self.burst = burst or max(1, int(rate or 1))
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.__tokens = self.burst
+        self.__refilled_at = time.monotonic()
+        self.__paused_until = 0
+        self.__ceiling = rate
+        self.__throttled_at = 0
+        # send times of the last second, the rate the provider cut us at
+        self.__recent = deque()
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def for_account(cls, account: str, rate=None, burst=None):
+        # stores of the same account share one scheduler, so they share the quota too. rate and
+        # burst None take what the account has, other values have to match what it was made with
+        with cls.__accounts_lock:
+            if account not in cls.__accounts:
+                cls.__accounts[account] = cls(rate, burst)
+            scheduler = cls.__accounts[account]
+        given_rate, given_burst = scheduler.__given
+        if (rate is not None and rate != given_rate) or (burst is not None and burst != given_burst):
+            raise ValueError('the scheduler of the account has rate {0} and burst {1}, not {2} and {3}'.format(
+                given_rate, given_burst, rate, burst))
+        return scheduler
+
+    def reserve(self):
+        # takes a token and returns how long to wait before sending
+        with self.__lock:
+            now = time.monotonic()
+            self.__recent.append(now)
+            while self.__recent and self.__recent[0] < now - 1:
+                self.__recent.popleft()
+            wait = max(0, self.__paused_until - now)
+            if self.rate is None:
+                return wait
+            # nothing refills while paused
+            self.__tokens = min(self.burst, self.__tokens + max(0, now - self.__refilled_at) * self.rate)
+            self.__refilled_at = max(now, self.__refilled_at)
+            self.__tokens -= 1
+            if self.__tokens < 0:
+                wait = max(wait, -self.__tokens / self.rate)
+            return wait
+
+    def wait_time(self):
+        # how long a request sent now would wait, without taking a token
+        with self.__lock:
+            now = time.monotonic()
+            wait = max(0, self.__paused_until - now)
+            if self.rate is None:
+                return wait
+            tokens = min(self.burst, self.__tokens + max(0, now - self.__refilled_at) * self.rate)
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) / self.rate)
+            return wait
+
+    def throttled(self, delay: float):
+        with self.__lock:
+            now = time.monotonic()
+            self.__paused_until = max(self.__paused_until, now + delay)
+            if now - self.__throttled_at < 1:
+                # the other requests that were in flight with the first throttled one
+                return
+            cut_at = self.rate if self.rate is not None else max(len(self.__recent), 1)
+            self.__ceiling = cut_at
+            self.__throttled_at = now
+            self.rate = max(RequestScheduler.min_rate, cut_at / 2)
+            self.burst = max(1, int(self.rate))
+            # one request may go as soon as the pause is over
+            self.__tokens = 1
+            self.__refilled_at = self.__paused_until
+
+    def succeeded(self):
+        with self.__lock:
+            if self.rate is None:
+                return
+            now = time.monotonic()
+            if now - self.__throttled_at > RequestScheduler.probe_interval:
+                # quiet for a while, try a little above the old limit
+                self.__ceiling = self.__ceiling * 1.1
+                self.__throttled_at = now
+            if self.max_rate is not None:
+                self.__ceiling = min(self.__ceiling, self.max_rate)
+            limit = self.__ceiling * 0.9 if self.__ceiling != self.max_rate else self.__ceiling
+            self.rate = min(limit, max(self.rate, self.rate + self.__ceiling / 100))
+            self.burst = max(1, int(self.rate))
+
+    def backoff_delay(self, attempt: int):
+        # full jitter
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    @staticmethod
+    def retry_after(headers):
+        value = headers.get('Retry-After')
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def is_throttle(self, status: int, body: bytes):
+        if status in RequestScheduler.throttle_statuses:
+            return True
+        if status == 403 and body:
+            try:
+                errors = json.loads(body.decode())['error'].get('errors', [])
+            except (ValueError, KeyError, AttributeError, TypeError):
+                return False
+            return any(error.get('reason') in RequestScheduler.throttle_reasons for error in errors)
+        return False
+
+    def run(self, send, idempotent: bool, retry_errors=()):
+        # send() returns a requests response. a throttled request was not carried out, so it is
+        # retried whatever the method. other failures are retried only when idempotent
+        for attempt in range(self.max_retries + 1):
+            time.sleep(self.reserve())
+            try:
+                response = send()
+            except retry_errors:
+                if not idempotent or attempt == self.max_retries:
+                    raise
+                time.sleep(self.backoff_delay(attempt))
+                continue
+            status = response.status_code
+            if attempt < self.max_retries:
+                if self.is_throttle(status, response.content if status == 403 else None):
+                    delay = self.retry_after(response.headers)
+                    self.throttled(self.backoff_delay(attempt) if delay is None else delay)
+                    response.close()
+                    continue
+                if idempotent and status in RequestScheduler.retry_statuses:
+                    response.close()
+                    time.sleep(self.retry_after(response.headers) or self.backoff_delay(attempt))
+                    continue
+            if status < 400:
+                self.succeeded()
+            return response
+
+    async def arun(self, send, idempotent: bool, retry_errors=()):
+        # same as run for aiohttp, send is a coroutine function
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(self.reserve())
+            try:
+                response = await send()
+            except retry_errors:
+                if not idempotent or attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self.backoff_delay(attempt))
+                continue
+            status = response.status
+            if attempt < self.max_retries:
+                if self.is_throttle(status, await response.read() if status == 403 else None):
+                    delay = self.retry_after(response.headers)
+                    self.throttled(self.backoff_delay(attempt) if delay is None else delay)
+                    response.release()
+                    continue
+                if idempotent and status in RequestScheduler.retry_statuses:
+                    response.release()
+                    await asyncio.sleep(self.retry_after(response.headers) or self.backoff_delay(attempt))
+                    continue
+            if status < 400:
+                self.succeeded()
+            return response
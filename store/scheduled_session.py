@@ -0,0 +1,67 @@
+import time
+from urllib.parse import urlsplit
+from collections.abc import Iterator
+from requests import ConnectionError, Timeout
+from requests_oauthlib import OAuth2Session
+from . store_metrics import StoreMetrics, body_size
+
+
+class ScheduledSession(OAuth2Session):
+    # OAuth2Session whose requests all go through a RequestScheduler and are recorded in a StoreMetrics
+    idempotent_methods = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+    def __init__(self, *args, scheduler=None, metrics=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler
+        self.metrics = metrics if metrics is not None else StoreMetrics()
+
+    def request(self, method, url, data=None, headers=None, idempotent=None, **kwargs):
+        # idempotent marks POST calls that only read, like most of the dropbox api
+        attempts = []
+
+        def send():
+            attempt = len(attempts)
+            attempts.append(attempt)
+            started = time.perf_counter()
+            try:
+                response = super(ScheduledSession, self).request(method, url, data=data, headers=headers, **kwargs)
+            except Exception as e:
+                self.metrics.record_request(method, url, None, time.perf_counter() - started, body_size(data), 0,
+                                            attempt, error=e)
+                raise
+            self.__record(method, url, data, response, started, attempt, kwargs.get('stream'))
+            return response
+
+        if self.scheduler is None:
+            return send()
+        if idempotent is None:
+            idempotent = method.upper() in ScheduledSession.idempotent_methods
+        if hasattr(data, 'read') or isinstance(data, Iterator):
+            # a consumed stream can't be sent again
+            response = send()
+        else:
+            response = self.scheduler.run(send, idempotent, (ConnectionError, Timeout))
+        status = response.status_code
+        if self.scheduler.is_throttle(status, response.content if status == 403 else None):
+            # still throttled once the retries ran out, the body is no answer the caller could read
+            response.close()
+            raise Exception('{0} {1} fail : reason = rate limited'.format(method.upper(), urlsplit(url).path))
+        return response
+
+    def __record(self, method, url, data, response, started, attempt, stream):
+        status = response.status_code
+        if stream:
+            # the body is not read yet, its announced size has to do
+            bytes_in = int(response.headers.get('Content-Length') or 0)
+        else:
+            bytes_in = len(response.content)
+        if self.scheduler is not None:
+            throttled = self.scheduler.is_throttle(status, response.content if status == 403 else None)
+        else:
+            throttled = status == 429
+        self.metrics.record_request(method, url, status, time.perf_counter() - started, body_size(data), bytes_in,
+                                    attempt, throttled)
+
+    def refresh_token(self, *args, **kwargs):
+        self.metrics.record_refresh()
+        return super().refresh_token(*args, **kwargs)
@@ -1,6 +1,17 @@
+import io
+import os
 import json
-from pathlib import PurePath
+import queue
+import threading
+import contextvars
+from collections import deque
+from pathlib import Path, PurePath
 from abc import ABC, abstractclassmethod
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from . bulk_result import BulkResult
+from . remote_file import RemoteFile
+from . store_metrics import instrument_methods
+from exceptions import *
 
 
 class Store(ABC):
@@ -14,6 +25,27 @@ class Store(ABC):
     session = None
     client_secret = ""
     client_id = ""
+    # uploads larger than one part go through a resumable session
+    upload_part_size = 8 * 1024 * 1024
+    upload_part_retries = 3
+    download_chunk_size = 1024 * 1024
+    # paths differing only in case name the same file when False
+    case_sensitive = True
+    # upload_file takes a properties dict of strings, kept with the file and listed in
+    # DirectoryEntry.properties
+    keeps_properties = False
+    # listings give the sizes download_stream gives. stores listing the size of something else,
+    # a manifest or the stored bytes, set this False and callers ask file_size
+    lists_file_sizes = True
+    # StoreMetrics the calls and requests of the store are recorded in
+    metrics = None
+    # public methods that are not operations of the metrics
+    uninstrumented = ('load_token', 'save_token', 'authorized', 'get_authorization_url', 'fetch_token',
+                      'configure_pool', 'run_bulk', 'content_hash')
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        instrument_methods(cls, Store.uninstrumented)
 
     def load_token(self):
         if self.token_path.exists():
@@ -41,22 +73,396 @@ class Store(ABC):
                                               authorization_response=redirect_response)
         self.save_token()
 
+    def configure_pool(self, size: int, socket_options=None):
+        # keep up to `size` connections alive per host, enough for `size` threads. socket_options
+        # are set on every new connection, as urllib3 takes them. the pool is only rebuilt when it
+        # has to grow or the options change, a rebuild drops the connections it kept alive
+        if self.session is None:
+            return
+        adapter = self.session.get_adapter('https://')
+        current = getattr(getattr(adapter, 'poolmanager', None), 'connection_pool_kw', {}).get('socket_options')
+        maxsize = getattr(adapter, '_pool_maxsize', size)
+        if maxsize >= size and (socket_options is None or socket_options == current):
+            return
+        options = {}
+        if socket_options is not None or current is not None:
+            options['socket_options'] = current if socket_options is None else socket_options
+        adapter.init_poolmanager(adapter._pool_connections, max(size, maxsize), block=adapter._pool_block, **options)
+
+    def run_bulk(self, action, items, max_workers=8, path_of=None):
+        # runs action(item) for every item over a thread pool and returns a BulkResult per item
+        # in the same order, a failing item doesn't stop the rest. items may be a generator,
+        # only a bounded number of them is pulled ahead
+        self.configure_pool(max_workers)
+        paths = []
+        futures = []
+        with ThreadPoolExecutor(max_workers) as executor:
+            pending = set()
+            for item in items:
+                paths.append(path_of(item) if path_of else item)
+                # workers run in the caller's context, their requests count for its operation
+                futures.append(executor.submit(contextvars.copy_context().run, action, item))
+                pending.add(futures[-1])
+                if len(pending) >= max_workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        results = []
+        for path, future in zip(paths, futures):
+            if future.exception() is not None:
+                results.append(BulkResult(path, error=future.exception()))
+            else:
+                results.append(BulkResult(path, future.result()))
+        return results
+
+    def upload_many(self, items, max_workers=8, is_chunk=False):
+        # items are (path, data) pairs
+        return self.run_bulk(lambda item: self.upload_file(item[0], item[1], is_chunk), items, max_workers,
+                             path_of=lambda item: item[0])
+
+    def download_many(self, paths, max_workers=8):
+        # the data of every file is the value of its result
+        return self.run_bulk(self.download_file, paths, max_workers)
+
+    def remove_many(self, paths, max_workers=8):
+        return self.run_bulk(self.remove, paths, max_workers)
+
+    def remove_batch(self, paths):
+        # stores with a native batch endpoint override this, one BulkResult per path
+        return self.remove_many(paths)
+
+    def copy(self, source: PurePath, destination: PurePath):
+        # copies a file or a directory tree to destination, which must not exist yet. stores with
+        # a server side copy override this, here every byte goes through this host
+        if not self.get_entry(source).is_dir:
+            self.upload_file(destination, self.download_stream(source, 0, None))
+            return
+        self.make_dir(destination.parent, destination.name)
+        for entry in self.iter_list(source):
+            self.copy(source / entry.name, destination / entry.name)
+
+    def move(self, source: PurePath, destination: PurePath):
+        # stores that can move or rename in place override this
+        self.copy(source, destination)
+        self.remove(source)
+
+    def copy_batch(self, pairs, max_workers=8):
+        # pairs are (source, destination), one BulkResult per pair named by its destination
+        return self.run_bulk(lambda pair: self.copy(pair[0], pair[1]), pairs, max_workers,
+                             path_of=lambda pair: pair[1])
+
+    def move_batch(self, pairs, max_workers=8):
+        return self.run_bulk(lambda pair: self.move(pair[0], pair[1]), pairs, max_workers,
+                             path_of=lambda pair: pair[1])
+
+    def make_dir_batch(self, items, max_workers=8):
+        # items are (path, name) pairs, one BulkResult per item. directories are made
+        # level by level so parents in the same batch exist before their children
+        items = list(items)
+        results = [None] * len(items)
+        for indexes in Store.group_by_depth([path / name for path, name in items]):
+            level = self.run_bulk(lambda item: self.make_dir(item[0], item[1]), [items[index] for index in indexes],
+                                  max_workers, path_of=lambda item: item[0] / item[1])
+            for index, result in zip(indexes, level):
+                results[index] = result
+        return results
+
+    @staticmethod
+    def group_by_depth(paths):
+        # indexes of paths grouped by depth, shallowest first
+        levels = {}
+        for index, path in enumerate(paths):
+            levels.setdefault(len(path.parts), []).append(index)
+        return [levels[depth] for depth in sorted(levels)]
+
+    def upload_tree(self, local_dir, remote_dir, max_workers=8, progress=None):
+        # copies the local directory tree into remote_dir. directories are made one depth level per
+        # make_dir_batch call, and the files of a level start uploading while the next level is made.
+        # returns a BulkResult for every file and every directory that could not be made.
+        # progress(files done, files found, bytes done, bytes found) is called after each file
+        local_dir = Path(local_dir)
+        remote_dir = PurePath(remote_dir)
+        if not local_dir.is_dir():
+            raise NoEntryError('local path is not a directory')
+        levels = []
+        files = {}
+        bytes_total = 0
+        for root, directories, names in os.walk(local_dir):
+            directories.sort()
+            relative = PurePath(*Path(root).relative_to(local_dir).parts)
+            depth = len(relative.parts)
+            if depth == len(levels):
+                levels.append([])
+            levels[depth].append(relative)
+            files[relative] = []
+            for name in sorted(names):
+                size = os.path.getsize(os.path.join(root, name))
+                files[relative].append((name, size))
+                bytes_total += size
+        files_total = sum(len(names) for names in files.values())
+
+        def make_level(depth):
+            # (relative directory, error) for the directories of one level
+            if depth == 0:
+                if remote_dir != remote_dir.parent:
+                    try:
+                        self.make_dir(remote_dir.parent, remote_dir.name)
+                    except DuplicateEntryError:
+                        pass
+                return [(levels[0][0], None)]
+            items = [(remote_dir / relative.parent, relative.name) for relative in levels[depth]]
+            results = self.make_dir_batch(items, max_workers)
+            return [(relative, None if result.ok or isinstance(result.error, DuplicateEntryError) else result.error)
+                    for relative, result in zip(levels[depth], results)]
+
+        def upload(relative, name, size):
+            with open(local_dir / relative / name, 'rb') as local_file:
+                # small files go in one request, bigger ones stream through an upload session
+                data = local_file.read() if size <= self.upload_part_size else local_file
+                self.upload_file(remote_dir / relative / name, data)
+            return size
+
+        results = []
+        backlog = deque()
+        done = [0, 0]
+
+        def finished(path, future):
+            try:
+                done[1] += future.result()
+                results.append(BulkResult(path))
+            except Exception as e:
+                results.append(BulkResult(path, error=e))
+            done[0] += 1
+            if progress is not None:
+                progress(done[0], files_total, done[1], bytes_total)
+
+        self.configure_pool(max_workers * 2)
+        with ThreadPoolExecutor(max_workers + 1) as executor:
+            # directory levels run one at a time, files fill the rest of the workers
+            pending = {executor.submit(contextvars.copy_context().run, make_level, 0): ('level', 0)}
+            while pending or backlog:
+                while backlog and len(pending) <= max_workers:
+                    relative, name, size = backlog.popleft()
+                    future = executor.submit(contextvars.copy_context().run, upload, relative, name, size)
+                    pending[future] = ('file', remote_dir / relative / name)
+                completed, other = wait(pending, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    kind, value = pending.pop(future)
+                    if kind == 'file':
+                        finished(value, future)
+                        continue
+                    try:
+                        created = future.result()
+                    except Exception as e:
+                        created = [(relative, e) for relative in levels[value]]
+                    for relative, error in created:
+                        if error is None:
+                            backlog.extend((relative, name, size) for name, size in files[relative])
+                            continue
+                        results.append(BulkResult(remote_dir / relative, error=error))
+                        for name, size in files[relative]:
+                            results.append(BulkResult(remote_dir / relative / name, error=error))
+                            done[0] += 1
+                            if progress is not None:
+                                progress(done[0], files_total, done[1], bytes_total)
+                    if value + 1 < len(levels):
+                        future = executor.submit(contextvars.copy_context().run, make_level, value + 1)
+                        pending[future] = ('level', value + 1)
+        return results
+
+    def download_tree(self, remote_dir, local_dir, max_workers=8, progress=None):
+        # copies the tree under remote_dir into the local directory local_dir. directories are listed
+        # ahead of the downloads, which run on max_workers threads and stream into the local files.
+        # returns a BulkResult for every file and every directory that could not be listed.
+        # progress(files done, files found, bytes done, bytes found) is called after each file,
+        # the totals grow while directories are still being listed
+        remote_dir = PurePath(remote_dir)
+        local_dir = Path(local_dir)
+        results = []
+        backlog = deque()
+        found = [0, 0]
+        done = [0, 0]
+
+        def download(remote_path, local_path):
+            with open(local_path, 'wb') as local_file:
+                return self.download_to(remote_path, local_file)
+
+        self.configure_pool(max_workers * 2)
+        with ThreadPoolExecutor(max_workers * 2) as executor:
+
+            def list_entries(path):
+                entries = list(self.iter_list(path))
+                if not self.lists_file_sizes:
+                    files = [entry for entry in entries if not entry.is_dir]
+                    sizes = self.run_bulk(lambda entry: self.file_size(path / entry.name), files, max_workers)
+                    for entry, size in zip(files, sizes):
+                        # a file that can't be sized still downloads, it counts when it's done
+                        entry.file_size = size.value if size.ok else 0
+                return entries
+
+            # listings don't wait behind the downloads
+            pending = {executor.submit(contextvars.copy_context().run, list_entries, remote_dir):
+                       ('list', remote_dir, local_dir)}
+            while pending or backlog:
+                while backlog and len(pending) < max_workers:
+                    remote_path, local_path = backlog.popleft()
+                    future = executor.submit(contextvars.copy_context().run, download, remote_path, local_path)
+                    pending[future] = ('file', remote_path, local_path)
+                completed, other = wait(pending, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    kind, remote_path, local_path = pending.pop(future)
+                    if kind == 'list':
+                        try:
+                            entries = future.result()
+                            local_path.mkdir(parents=True, exist_ok=True)
+                        except Exception as e:
+                            results.append(BulkResult(remote_path, error=e))
+                            continue
+                        for entry in entries:
+                            if entry.is_dir:
+                                future = executor.submit(contextvars.copy_context().run, list_entries,
+                                                         remote_path / entry.name)
+                                pending[future] = ('list', remote_path / entry.name, local_path / entry.name)
+                            else:
+                                backlog.append((remote_path / entry.name, local_path / entry.name))
+                                found[0] += 1
+                                found[1] += entry.file_size
+                        continue
+                    try:
+                        done[1] += future.result()
+                        results.append(BulkResult(remote_path))
+                    except Exception as e:
+                        results.append(BulkResult(remote_path, error=e))
+                    done[0] += 1
+                    if progress is not None:
+                        progress(done[0], found[0], done[1], found[1])
+        return results
+
+    def transfer_file(self, path: PurePath, destination, destination_path: PurePath, buffer_chunks=8):
+        # streams a file of this store into destination_path of the destination store, nothing is
+        # staged locally. a reader thread keeps up to buffer_chunks download chunks ahead of the
+        # upload, so both links stay busy and memory is the buffer plus the part being uploaded
+        chunks = queue.Queue(buffer_chunks)
+        stopped = threading.Event()
+        finished = object()
+
+        def put(item):
+            # gives up when the upload stopped taking chunks
+            while not stopped.is_set():
+                try:
+                    chunks.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def read():
+            stream = None
+            try:
+                stream = self.download_stream(path, 0, None)
+                for chunk in stream:
+                    if not put(chunk):
+                        return
+                put(finished)
+            except Exception as e:
+                put(e)
+            finally:
+                if hasattr(stream, 'close'):
+                    # releases the connection of a download that was not read to the end
+                    stream.close()
+
+        def receive():
+            while True:
+                item = chunks.get()
+                if item is finished:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+
+        # the reader's requests count for this call
+        reader = threading.Thread(target=contextvars.copy_context().run, args=(read,), daemon=True)
+        reader.start()
+        try:
+            return destination.upload_file(destination_path, receive())
+        finally:
+            stopped.set()
+            reader.join()
+
+    def transfer_many(self, pairs, destination, max_workers=4, buffer_chunks=8):
+        # pairs are (path, destination path), files stream into the destination store max_workers at
+        # a time. one BulkResult per pair named by its destination path
+        destination.configure_pool(max_workers)
+        return self.run_bulk(lambda pair: self.transfer_file(pair[0], destination, pair[1], buffer_chunks), pairs,
+                             max_workers, path_of=lambda pair: pair[1])
+
+    def get_entry(self, path: PurePath):
+        # DirectoryEntry of a single path, stores with a metadata call override this
+        for entry in self.iter_list(path.parent):
+            if entry.name == path.name:
+                return entry
+        raise NoEntryError('path is not valid')
+
+    def file_size(self, path: PurePath):
+        # size of the file as download_stream gives it, stores keeping something else override this
+        return self.get_entry(path).file_size
+
+    def open(self, path: PurePath, buffering=-1, **options):
+        # read-only seekable file object over ranged downloads, see RemoteFile for the options.
+        # buffering 0 gives the raw RemoteFile, otherwise it comes in a BufferedReader
+        raw = RemoteFile(self, path, self.file_size(path), **options)
+        if buffering == 0:
+            return raw
+        return io.BufferedReader(raw, buffering if buffering > 0 else io.DEFAULT_BUFFER_SIZE)
+
+    def content_hash(self, data: bytes):
+        # the hash the provider reports for a file with this data, None if it reports none
+        return None
+
+    def space_usage(self):
+        # returns (used, allocated) bytes of the account, allocated None when there is no limit
+        raise Exception('space usage fail : reason = not supported')
+
+    def list_changes(self, cursor=None):
+        # returns (list of Change, cursor). without a cursor every entry is listed, with one only
+        # what changed since it was given. raises CursorResetError when the cursor expired
+        raise Exception('list changes fail : reason = not supported')
+
     @abstractclassmethod
     def download_file(self, path: PurePath):
         pass
 
     @abstractclassmethod
-    def upload_file(self, path: PurePath, data: bytes, is_chunk: bool):
+    def download_stream(self, path: PurePath, offset: int, length: int):
+        # returns an iterator of bytes, length None reads up to the end of the file
+        pass
+
+    def download_to(self, path: PurePath, writable, offset=0, length=None):
+        written = 0
+        for chunk in self.download_stream(path, offset, length):
+            writable.write(chunk)
+            written += len(chunk)
+        return written
+
+    @abstractclassmethod
+    def upload_file(self, path: PurePath, data, is_chunk: bool):
+        # data can be bytes, a file-like object or an iterable of bytes
         pass
 
     @abstractclassmethod
     def get_list(self, path: PurePath):
         pass
 
+    def iter_list(self, path: PurePath):
+        # entries of path as they are listed, stores that list page by page override this
+        # so big folders don't have to be held in memory
+        return iter(self.get_list(path))
+
     @abstractclassmethod
     def make_dir(self, path: PurePath, name: str):
         pass
 
     @abstractclassmethod
     def remove(self, path: PurePath):
-        pass
\ No newline at end of file
+        pass
+
+
+instrument_methods(Store, Store.uninstrumented)
@@ -0,0 +1,301 @@
+import re
+import time
+import types
+import inspect
+import threading
+import functools
+import contextvars
+from collections import Counter
+from urllib.parse import urlsplit
+
+# (store id, operation name) of the store calls running in this context, outermost first.
+# requests are attributed to every operation on it, so upload_file counts the lookups it made
+active_calls = contextvars.ContextVar('store_active_calls', default=())
+
+
+class LatencyHistogram:
+    # seconds, the last bucket takes everything above the last bound
+    bounds = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self):
+        self.counts = [0] * (len(LatencyHistogram.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        index = 0
+        while index < len(LatencyHistogram.bounds) and seconds > LatencyHistogram.bounds[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction: float):
+        # upper bound of the bucket holding the fraction, max for the last bucket
+        if self.count == 0:
+            return 0.0
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= fraction * self.count:
+                return LatencyHistogram.bounds[index] if index < len(LatencyHistogram.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            'bounds': list(LatencyHistogram.bounds),
+            'counts': list(self.counts),
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99)
+        }
+
+
+class OperationStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency = LatencyHistogram()
+        self.requests = 0
+        self.request_errors = 0
+        self.request_latency = LatencyHistogram()
+        self.retries = 0
+        self.throttled = 0
+        self.refreshes = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.endpoints = Counter()
+
+    def snapshot(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'latency': self.latency.snapshot(),
+            'requests': self.requests,
+            'request_errors': self.request_errors,
+            'request_latency': self.request_latency.snapshot(),
+            'retries': self.retries,
+            'throttled': self.throttled,
+            'refreshes': self.refreshes,
+            'bytes_out': self.bytes_out,
+            'bytes_in': self.bytes_in,
+            'endpoints': dict(self.endpoints)
+        }
+
+
+class StoreMetrics:
+    # what the calls of a store cost, per operation. stores get their own unless the config
+    # passes one in '__metrics', then they all record into it.
+    # hooks are called with an event dict for every store call, http request and token refresh
+    unattributed = '-'
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__operations = {}
+        self.__total = OperationStats()
+        self.__hooks = []
+
+    def add_hook(self, hook):
+        with self.__lock:
+            self.__hooks = self.__hooks + [hook]
+
+    def remove_hook(self, hook):
+        with self.__lock:
+            self.__hooks = [other for other in self.__hooks if other is not hook]
+
+    def __emit(self, event):
+        for hook in self.__hooks:
+            try:
+                hook(event)
+            except Exception:
+                # a broken metrics pipeline must not fail the store call
+                pass
+
+    def __stats(self, operation: str):
+        stats = self.__operations.get(operation)
+        if stats is None:
+            stats = self.__operations[operation] = OperationStats()
+        return stats
+
+    @staticmethod
+    def operations():
+        names = []
+        for store_id, name in active_calls.get():
+            if name not in names:
+                names.append(name)
+        return tuple(names)
+
+    def record_call(self, operation: str, seconds: float, error=None):
+        with self.__lock:
+            stats = self.__stats(operation)
+            stats.calls += 1
+            stats.errors += error is not None
+            stats.latency.add(seconds)
+        self.__emit({'type': 'call', 'operation': operation, 'operations': self.operations(), 'seconds': seconds,
+                     'error': error})
+
+    def record_request(self, method: str, url: str, status, seconds: float, bytes_out=0, bytes_in=0,
+                       attempt=0, throttled=False, error=None):
+        # status is None when no response came back
+        endpoint = '{0} {1}'.format(method.upper(), StoreMetrics.endpoint(url))
+        operations = self.operations()
+        with self.__lock:
+            for stats in [self.__total] + [self.__stats(name) for name in operations or (StoreMetrics.unattributed,)]:
+                stats.requests += 1
+                stats.request_errors += error is not None or status is None or status >= 400
+                stats.request_latency.add(seconds)
+                stats.retries += attempt > 0
+                stats.throttled += throttled
+                stats.bytes_out += bytes_out
+                stats.bytes_in += bytes_in
+                stats.endpoints[endpoint] += 1
+        self.__emit({'type': 'request', 'operations': operations, 'endpoint': endpoint, 'status': status,
+                     'seconds': seconds, 'bytes_out': bytes_out, 'bytes_in': bytes_in, 'attempt': attempt,
+                     'throttled': throttled, 'error': error})
+
+    def record_refresh(self):
+        operations = self.operations()
+        with self.__lock:
+            for stats in [self.__total] + [self.__stats(name) for name in operations or (StoreMetrics.unattributed,)]:
+                stats.refreshes += 1
+        self.__emit({'type': 'refresh', 'operations': operations})
+
+    @staticmethod
+    def endpoint(url: str):
+        # host and path, without the file id of google urls
+        url = urlsplit(url)
+        return url.netloc + re.sub(r'(/drive/v3/files/)[^/]+(/copy)?$', r'\1<id>\2', url.path)
+
+    def snapshot(self):
+        with self.__lock:
+            return {
+                'total': self.__total.snapshot(),
+                'operations': {name: stats.snapshot() for name, stats in self.__operations.items()}
+            }
+
+    def reset(self):
+        with self.__lock:
+            self.__operations = {}
+            self.__total = OperationStats()
+
+
+def body_size(data):
+    # bytes of a request body, 0 for streams whose size is not known up front
+    if isinstance(data, str):
+        return len(data.encode())
+    if isinstance(data, (bytes, bytearray, memoryview)) or hasattr(data, 'content_type'):
+        return len(data)
+    return 0
+
+
+def instrumented(function):
+    # times a store method as an operation of the store's metrics and makes it the operation
+    # the requests inside are attributed to. generators are timed until they are exhausted
+    name = function.__name__
+
+    def enter(store):
+        key = (id(store), name)
+        calls = active_calls.get()
+        # a method calling the same method of its base class is one call
+        nested = key in calls
+        return nested, calls if nested else calls + (key,)
+
+    def finish(store, nested, started, error=None):
+        if not nested and getattr(store, 'metrics', None) is not None:
+            store.metrics.record_call(name, time.perf_counter() - started, error)
+
+    def iterate(store, iterator, calls, nested, started):
+        # runs every step of the generator inside the operation
+        error = None
+        try:
+            while True:
+                token = active_calls.set(calls)
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    active_calls.reset(token)
+                yield item
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            finish(store, nested, started, error)
+
+    async def aiterate(store, iterator, calls, nested, started):
+        error = None
+        try:
+            while True:
+                token = active_calls.set(calls)
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    active_calls.reset(token)
+                yield item
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            finish(store, nested, started, error)
+
+    if inspect.isasyncgenfunction(function):
+        @functools.wraps(function)
+        def async_generator_wrapper(self, *args, **kwargs):
+            nested, calls = enter(self)
+            return aiterate(self, function(self, *args, **kwargs), calls, nested, time.perf_counter())
+        return async_generator_wrapper
+
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def coroutine_wrapper(self, *args, **kwargs):
+            started = time.perf_counter()
+            nested, calls = enter(self)
+            token = active_calls.set(calls)
+            try:
+                result = await function(self, *args, **kwargs)
+            except Exception as e:
+                finish(self, nested, started, e)
+                raise
+            finally:
+                active_calls.reset(token)
+            if hasattr(result, '__anext__'):
+                return aiterate(self, result, calls, nested, started)
+            finish(self, nested, started)
+            return result
+        return coroutine_wrapper
+
+    @functools.wraps(function)
+    def wrapper(self, *args, **kwargs):
+        started = time.perf_counter()
+        nested, calls = enter(self)
+        token = active_calls.set(calls)
+        try:
+            result = function(self, *args, **kwargs)
+        except Exception as e:
+            finish(self, nested, started, e)
+            raise
+        finally:
+            active_calls.reset(token)
+        if isinstance(result, types.GeneratorType):
+            return iterate(self, result, calls, nested, started)
+        finish(self, nested, started)
+        return result
+    return wrapper
+
+
+def instrument_methods(cls, skipped=()):
+    # wraps the public methods defined on cls
+    for name, value in list(vars(cls).items()):
+        if name.startswith('_') or name in skipped or not inspect.isfunction(value):
+            continue
+        if getattr(value, '__isabstractmethod__', False):
+            continue
+        setattr(cls, name, instrumented(value))
@@ -0,0 +1,384 @@
+import time
+import socket
+import threading
+import contextvars
+from collections import OrderedDict
+from pathlib import PurePath
+from concurrent.futures import ThreadPoolExecutor, wait
+from . store import Store
+from exceptions import *
+
+
+class StorePool(Store):
+    # spreads one tree over several accounts of a provider, so their request quotas add up.
+    # every file lives whole in one account and directories are made in all of them.
+    # stores with the same token_path are sessions of one account and share its quota.
+    # each call goes to the session with the fewest calls in flight, new files go to the
+    # account that would send soonest and has the fewest calls in flight, accounts that ran
+    # out of space get no new files until space_usage shows room again, asked at most every
+    # refresh_interval seconds. max_outstanding caps the calls in flight per session.
+    # names of listed directories are cached. other clients may write to the accounts, so a
+    # name the cache doesn't know is looked up in every account before it is claimed, and a
+    # path it doesn't know is listed again before NoEntryError
+    max_cached_dirs = 4096
+    keepalive_options = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1), (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)] + \
+        [(socket.IPPROTO_TCP, getattr(socket, name), value)
+         for name, value in (('TCP_KEEPIDLE', 60), ('TCP_KEEPINTVL', 10), ('TCP_KEEPCNT', 6)) if hasattr(socket, name)]
+
+    def __init__(self, stores, max_outstanding=None, max_workers=8, refresh_interval=300):
+        if not stores:
+            raise ValueError('at least one store is needed')
+        self.stores = list(stores)
+        self.max_outstanding = max_outstanding
+        self.max_workers = max_workers
+        self.refresh_interval = refresh_interval
+        self.case_sensitive = all(store.case_sensitive for store in self.stores)
+        self.lists_file_sizes = all(store.lists_file_sizes for store in self.stores)
+        accounts = OrderedDict()
+        for index, store in enumerate(self.stores):
+            account = getattr(store, 'token_path', None)
+            accounts.setdefault(index if account is None else str(account), []).append(index)
+        # store indexes of every account
+        self.accounts = list(accounts.values())
+        self.executor = ThreadPoolExecutor(max(max_workers, len(self.accounts)))
+        self.__outstanding = [0] * len(self.stores)
+        # account -> when it was last found full
+        self.__full = {}
+        # ties go to the accounts in turn
+        self.__turn = 0
+        # directory key -> {file name: account}, least recently used first
+        self.__names = OrderedDict()
+        # path key -> (path, account) of the uploads running, a listing doesn't know them yet
+        self.__claimed = {}
+        # directory key -> changes recorded by the listings of it running, applied over them
+        self.__listing = {}
+        self.__changed = threading.Condition()
+
+    def authorized(self):
+        return all(store.authorized() for store in self.stores)
+
+    def configure_pool(self, size: int, socket_options=None):
+        # every session may get all calls when the others are busy. connections get tcp keep-alive
+        # unless other options are given, so idle ones are not dropped by routers between calls
+        connections = size if self.max_outstanding is None else min(size, self.max_outstanding)
+        for store in self.stores:
+            store.configure_pool(connections, StorePool.keepalive_options if socket_options is None else socket_options)
+
+    @staticmethod
+    def __wait_time(store):
+        scheduler = getattr(getattr(store, 'session', None), 'scheduler', None)
+        return 0 if scheduler is None else scheduler.wait_time()
+
+    def __key(self, path: PurePath):
+        key = path.as_posix()
+        return key if self.case_sensitive else key.lower()
+
+    def __name(self, name: str):
+        return name if self.case_sensitive else name.lower()
+
+    def __acquire(self, account=None):
+        # returns (account, store index) of the session to use. account None picks an account
+        # for a new file
+        with self.__changed:
+            while True:
+                if account is None:
+                    accounts = [index for index in range(len(self.accounts)) if index not in self.__full]
+                    if not accounts:
+                        raise DiskFullError('upload fail')
+                else:
+                    accounts = [account]
+                candidates = []
+                for candidate in accounts:
+                    sessions = [index for index in self.accounts[candidate]
+                                if self.max_outstanding is None or self.__outstanding[index] < self.max_outstanding]
+                    if sessions:
+                        load = sum(self.__outstanding[index] for index in self.accounts[candidate])
+                        candidates.append((StorePool.__wait_time(self.stores[sessions[0]]), load,
+                                           (candidate - self.__turn) % len(self.accounts), candidate,
+                                           min(sessions, key=lambda index: self.__outstanding[index])))
+                if candidates:
+                    chosen = min(candidates)
+                    self.__turn = chosen[3] + 1
+                    self.__outstanding[chosen[4]] += 1
+                    return chosen[3], chosen[4]
+                self.__changed.wait()
+
+    def __release(self, index: int):
+        with self.__changed:
+            self.__outstanding[index] -= 1
+            self.__changed.notify_all()
+
+    def __run(self, account, action):
+        account, index = self.__acquire(account)
+        try:
+            return action(self.stores[index])
+        finally:
+            self.__release(index)
+
+    def __on_all_accounts(self, action):
+        # returns (result, exception) for every account, in order
+        futures = [self.executor.submit(self.__run, account, action) for account in range(len(self.accounts))]
+        wait(futures)
+        return [(None, future.exception()) if future.exception() else (future.result(), None)
+                for future in futures]
+
+    def __list(self, path: PurePath):
+        # entries of path over every account, files recorded with the account holding them
+        changes = {}
+        with self.__changed:
+            self.__listing.setdefault(self.__key(path), []).append(changes)
+        try:
+            results = self.__on_all_accounts(lambda store: store.get_list(path))
+        finally:
+            with self.__changed:
+                # by identity, change dicts of other listings may be equal
+                running = [other for other in self.__listing[self.__key(path)] if other is not changes]
+                if running:
+                    self.__listing[self.__key(path)] = running
+                else:
+                    del self.__listing[self.__key(path)]
+        errors = [error for result, error in results if error is not None]
+        if len(errors) == len(results) or any(not isinstance(error, NoEntryError) for error in errors):
+            raise errors[0]
+        entries = OrderedDict()
+        names = {}
+        for account, (result, error) in enumerate(results):
+            for entry in result or []:
+                if not entry.is_dir:
+                    names[self.__name(entry.name)] = account
+                entries.setdefault(self.__name(entry.name), entry)
+        with self.__changed:
+            for claimed, account in self.__claimed.values():
+                if self.__key(claimed.parent) == self.__key(path):
+                    names[self.__name(claimed.name)] = account
+            # uploads and removals that finished while the accounts were listed
+            for name, account in changes.items():
+                if account is None:
+                    names.pop(name, None)
+                else:
+                    names[name] = account
+            self.__names[self.__key(path)] = names
+            self.__names.move_to_end(self.__key(path))
+            while len(self.__names) > StorePool.max_cached_dirs:
+                self.__names.popitem(last=False)
+        return list(entries.values())
+
+    def __files(self, directory: PurePath):
+        # ({name: account} of the files in directory, whether it was listed now), listed when
+        # it's not cached
+        with self.__changed:
+            names = self.__names.get(self.__key(directory))
+            if names is not None:
+                self.__names.move_to_end(self.__key(directory))
+                return names, False
+        self.__list(directory)
+        with self.__changed:
+            return self.__names.get(self.__key(directory), {}), True
+
+    def __locate(self, path: PurePath, refresh=False):
+        # account holding the file, None for directories and missing paths. with refresh a
+        # cached directory that doesn't know the name is listed again, others may have made it
+        names, listed = self.__files(path.parent)
+        account = names.get(self.__name(path.name))
+        if account is None and refresh and not listed:
+            self.__list(path.parent)
+            with self.__changed:
+                account = self.__names.get(self.__key(path.parent), {}).get(self.__name(path.name))
+        return account
+
+    def __check_free(self, path: PurePath):
+        # raises DuplicateEntryError when path is taken. a name a cached directory doesn't know
+        # is looked up in every account
+        names, listed = self.__files(path.parent)
+        if self.__name(path.name) in names:
+            raise DuplicateEntryError('duplicate entry')
+        if not listed:
+            self.__probe(path)
+
+    def __probe(self, path: PurePath):
+        # one metadata call per account, they don't wait for a session behind running uploads
+        futures = [self.executor.submit(contextvars.copy_context().run, self.stores[indexes[0]].get_entry, path)
+                   for indexes in self.accounts]
+        wait(futures)
+        results = [(None, future.exception()) if future.exception() else (future.result(), None)
+                   for future in futures]
+        for account, (result, error) in enumerate(results):
+            if error is not None and not isinstance(error, NoEntryError):
+                raise error
+            if result is not None:
+                if not result.is_dir:
+                    self.__record(path, account)
+                raise DuplicateEntryError('duplicate entry')
+
+    def __readmit(self):
+        # accounts found full longer than refresh_interval ago get new files again when
+        # space_usage shows room, or can't tell
+        now = time.monotonic()
+        with self.__changed:
+            stale = [account for account, found_at in self.__full.items() if now - found_at >= self.refresh_interval]
+        for account in stale:
+            try:
+                used, allocated = self.__run(account, lambda store: store.space_usage())
+                full = allocated is not None and used >= allocated
+            except Exception:
+                # a full account says so on the next upload
+                full = False
+            with self.__changed:
+                if full:
+                    self.__full[account] = time.monotonic()
+                else:
+                    self.__full.pop(account, None)
+                self.__changed.notify_all()
+
+    def __record(self, path: PurePath, account):
+        with self.__changed:
+            for changes in self.__listing.get(self.__key(path.parent), []):
+                changes[self.__name(path.name)] = account
+            names = self.__names.get(self.__key(path.parent))
+            if names is None:
+                return
+            if account is None:
+                names.pop(self.__name(path.name), None)
+            else:
+                names[self.__name(path.name)] = account
+
+    def __forget_below(self, path: PurePath):
+        key = self.__key(path)
+        prefix = key.rstrip('/') + '/'
+        with self.__changed:
+            for directory in [directory for directory in self.__names
+                              if directory == key or directory.startswith(prefix)]:
+                del self.__names[directory]
+
+    def __claim(self, path: PurePath):
+        # picks the account for a new file and holds its name, so a concurrent upload of
+        # the same name to another account fails
+        self.__check_free(path)
+        self.__readmit()
+        account, index = self.__acquire()
+        with self.__changed:
+            names = self.__names.get(self.__key(path.parent), {})
+            if self.__name(path.name) in names or self.__key(path) in self.__claimed:
+                self.__outstanding[index] -= 1
+                self.__changed.notify_all()
+                raise DuplicateEntryError('duplicate upload')
+            self.__claimed[self.__key(path)] = (path, account)
+        self.__record(path, account)
+        return account, index
+
+    @staticmethod
+    def __first_decides(results, ignored):
+        # the first account decides, others may hold leftovers of an earlier directory
+        for account, (result, error) in enumerate(results):
+            if error is not None and (account == 0 or not isinstance(error, ignored)):
+                raise error
+
+    def download_file(self, path: PurePath):
+        account = self.__locate(path, refresh=True)
+        if account is None:
+            raise NoEntryError('download fail')
+        return self.__run(account, lambda store: store.download_file(path))
+
+    def download_stream(self, path: PurePath, offset=0, length=None):
+        # only opening the download counts as in flight, the caller reads the rest
+        account = self.__locate(path, refresh=True)
+        if account is None:
+            raise NoEntryError('download fail')
+        return self.__run(account, lambda store: store.download_stream(path, offset, length))
+
+    def file_size(self, path: PurePath):
+        account = self.__locate(path, refresh=True)
+        if account is None:
+            raise NoEntryError('path is not a file')
+        return self.__run(account, lambda store: store.file_size(path))
+
+    def upload_file(self, path: PurePath, data, is_chunk=False):
+        while True:
+            account, index = self.__claim(path)
+            try:
+                result = self.stores[index].upload_file(path, data, is_chunk)
+                self.__record(path, account)
+                return result
+            except DiskFullError:
+                self.__record(path, None)
+                with self.__changed:
+                    self.__full[account] = time.monotonic()
+                # only bytes can be sent again to the next account
+                if not isinstance(data, (bytes, bytearray, memoryview)):
+                    raise
+            except BaseException:
+                self.__record(path, None)
+                raise
+            finally:
+                with self.__changed:
+                    self.__claimed.pop(self.__key(path), None)
+                self.__release(index)
+
+    def get_list(self, path: PurePath):
+        return self.__list(path)
+
+    def get_entry(self, path: PurePath):
+        account = self.__locate(path)
+        if account is not None:
+            return self.__run(account, lambda store: store.get_entry(path))
+        try:
+            # directories are in every account
+            return self.__run(0, lambda store: store.get_entry(path))
+        except NoEntryError:
+            account = self.__locate(path, refresh=True)
+            if account is None:
+                raise
+        return self.__run(account, lambda store: store.get_entry(path))
+
+    def content_hash(self, data: bytes):
+        return self.stores[0].content_hash(data)
+
+    def make_dir(self, path: PurePath, name: str):
+        if self.__locate(path / name) is not None:
+            raise DuplicateEntryError('make dir fail')
+        StorePool.__first_decides(self.__on_all_accounts(lambda store: store.make_dir(path, name)),
+                                  DuplicateEntryError)
+
+    def make_dir_batch(self, items, max_workers=8):
+        # one batch per account, so each account makes the directories in order
+        items = list(items)
+        results = self.__on_all_accounts(lambda store: store.make_dir_batch(items, max_workers))
+        for account, (result, error) in enumerate(results):
+            if error is not None:
+                raise error
+        merged = results[0][0]
+        for index, first in enumerate(merged):
+            for result, error in results[1:]:
+                if not result[index].ok and not isinstance(result[index].error, DuplicateEntryError) and first.ok:
+                    merged[index] = result[index]
+        return merged
+
+    def remove(self, path: PurePath):
+        account = self.__locate(path, refresh=True)
+        if account is not None:
+            self.__run(account, lambda store: store.remove(path))
+            self.__record(path, None)
+            return
+        self.__forget_below(path)
+        StorePool.__first_decides(self.__on_all_accounts(lambda store: store.remove(path)), NoEntryError)
+
+    def copy(self, source: PurePath, destination: PurePath):
+        self.__relocate(source, destination, lambda store: store.copy(source, destination), False)
+
+    def move(self, source: PurePath, destination: PurePath):
+        self.__relocate(source, destination, lambda store: store.move(source, destination), True)
+
+    def __relocate(self, source: PurePath, destination: PurePath, action, moved: bool):
+        # files are copied or moved within their account, directories in every account
+        self.__check_free(destination)
+        account = self.__locate(source, refresh=True)
+        if account is not None:
+            self.__run(account, action)
+            self.__record(destination, account)
+            if moved:
+                self.__record(source, None)
+            return
+        self.__forget_below(destination)
+        if moved:
+            self.__forget_below(source)
+        StorePool.__first_decides(self.__on_all_accounts(action), NoEntryError)
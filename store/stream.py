@@ -0,0 +1,172 @@
+def iter_parts(data, part_size: int):
+    # split bytes, a file-like object or an iterable of bytes into parts of part_size,
+    # only the last part may be shorter. at most one part is held in memory
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        view = memoryview(data)
+        for offset in range(0, len(view), part_size):
+            yield bytes(view[offset:offset + part_size])
+        return
+
+    if hasattr(data, 'read'):
+        chunks = iter(lambda: data.read(part_size), b'')
+    else:
+        chunks = iter(data)
+    buffer = bytearray()
+    for chunk in chunks:
+        if chunk is None:
+            # non-blocking raw stream without data yet
+            continue
+        buffer += chunk
+        while len(buffer) >= part_size:
+            yield bytes(buffer[:part_size])
+            del buffer[:part_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+def split_first_part(data, part_size: int):
+    # returns (parts, single) where single is True if data fits in one part
+    parts = iter_parts(data, part_size)
+    first = next(parts, b'')
+    second = next(parts, None)
+    if second is None:
+        return iter((first,)), True
+    return _chain(first, second, parts), False
+
+
+def _chain(first, second, rest):
+    yield first
+    yield second
+    yield from rest
+
+
+def iter_with_last(parts):
+    # yields (part, is_last) pairs
+    parts = iter(parts)
+    try:
+        current = next(parts)
+    except StopIteration:
+        return
+    for following in parts:
+        yield current, False
+        current = following
+    yield current, True
+
+
+def range_header(offset: int, length=None):
+    # returns None when the whole object is requested
+    if offset == 0 and length is None:
+        return None
+    if length is None:
+        return 'bytes={0}-'.format(offset)
+    return 'bytes={0}-{1}'.format(offset, offset + length - 1)
+
+
+def iter_response(response, chunk_size: int, offset=0, length=None):
+    # yields the body of a streamed response and closes it afterwards
+    try:
+        if response.status_code == 416:
+            # range starts beyond the end of the file
+            return
+        skip = 0
+        if response.status_code != 206:
+            # server ignored the range header, cut the range ourselves
+            skip = offset
+        remaining = length if response.status_code != 206 else None
+        for chunk in response.iter_content(chunk_size):
+            if skip:
+                if len(chunk) <= skip:
+                    skip -= len(chunk)
+                    continue
+                chunk = chunk[skip:]
+                skip = 0
+            if remaining is not None:
+                chunk = chunk[:remaining]
+                remaining -= len(chunk)
+            if chunk:
+                yield chunk
+            if remaining == 0:
+                break
+    finally:
+        response.close()
+
+
+async def aiter_response(response, chunk_size: int, offset=0, length=None):
+    # async counterpart of iter_response for an aiohttp response
+    async with response:
+        if response.status == 416:
+            return
+        skip = 0
+        if response.status != 206:
+            # server ignored the range header, cut the range ourselves
+            skip = offset
+        remaining = length if response.status != 206 else None
+        async for chunk in response.content.iter_chunked(chunk_size):
+            if skip:
+                if len(chunk) <= skip:
+                    skip -= len(chunk)
+                    continue
+                chunk = chunk[skip:]
+                skip = 0
+            if remaining is not None:
+                chunk = chunk[:remaining]
+                remaining -= len(chunk)
+            if chunk:
+                yield chunk
+            if remaining == 0:
+                break
+
+
+async def aiter_parts(data, part_size: int):
+    # async counterpart of iter_parts, also takes an async iterable of bytes
+    if not hasattr(data, '__aiter__'):
+        for part in iter_parts(data, part_size):
+            yield part
+        return
+    buffer = bytearray()
+    async for chunk in data:
+        buffer += chunk
+        while len(buffer) >= part_size:
+            yield bytes(buffer[:part_size])
+            del buffer[:part_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+async def asplit_first_part(data, part_size: int):
+    # async counterpart of split_first_part
+    parts = aiter_parts(data, part_size)
+    first = await _anext(parts, b'')
+    second = await _anext(parts, None)
+    if second is None:
+        return _aiter_of(first), True
+    return _achain(first, second, parts), False
+
+
+async def aiter_with_last(parts):
+    # yields (part, is_last) pairs of an async iterator
+    current = await _anext(parts, None)
+    if current is None:
+        return
+    async for following in parts:
+        yield current, False
+        current = following
+    yield current, True
+
+
+async def _anext(iterator, default):
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return default
+
+
+async def _aiter_of(part):
+    yield part
+
+
+async def _achain(first, second, rest):
+    yield first
+    yield second
+    async for part in rest:
+        yield part
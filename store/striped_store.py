@@ -0,0 +1,292 @@
+import json
+import time
+import threading
+from pathlib import PurePath
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from . store import Store
+from . stream import iter_parts
+from exceptions import *
+
+
+class StripedStore(Store):
+    # spreads fixed size chunks of every file over several stores, raid-0 style.
+    # the file path holds a json manifest on the first store, chunks live in the hidden
+    # chunk_dir_name directory next to it as '<name>.<index>.chunk' on the store the manifest
+    # records for them. that name is reserved, paths through it are refused and listings hide it.
+    # directories are mirrored on every store, a store that was full when a directory was
+    # made gets it with its first chunk there. chunks go round robin, or where a
+    # PlacementScheduler over the same stores says. a chunk a full store refused goes to the next.
+    # listings carry the sizes of the manifests, file_size and get_entry read the manifest
+    manifest_version = 1
+    lists_file_sizes = False
+    chunk_suffix = '.chunk'
+    chunk_dir_name = '.unidrive-chunks'
+
+    def __init__(self, stores, chunk_size=4 * 1024 * 1024, max_workers=8, scheduler=None):
+        if not stores:
+            raise ValueError('at least one store is needed')
+        self.stores = list(stores)
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.scheduler = scheduler
+        self.executor = ThreadPoolExecutor(max_workers)
+        # chunk directories are made one at a time, so no store gets two of the same name
+        self.__dir_lock = threading.Lock()
+
+    def authorized(self):
+        return all(store.authorized() for store in self.stores)
+
+    def configure_pool(self, size: int, socket_options=None):
+        for store in self.stores:
+            store.configure_pool(size, socket_options)
+
+    def chunk_path(self, path: PurePath, index: int):
+        return path.parent / StripedStore.chunk_dir_name / '{0}.{1}{2}'.format(path.name, index,
+                                                                             StripedStore.chunk_suffix)
+
+    def is_chunk_dir(self, entry):
+        return entry.is_dir and entry.name.lower() == StripedStore.chunk_dir_name
+
+    @staticmethod
+    def check_path(path: PurePath):
+        # paths through the chunk directories are not files of this store
+        if any(part.lower() == StripedStore.chunk_dir_name for part in path.parts):
+            raise NoEntryError('path is not valid')
+
+    def download_file(self, path: PurePath):
+        return b''.join(self.download_stream(path))
+
+    def file_size(self, path: PurePath):
+        # listings give the size of the manifest
+        StripedStore.check_path(path)
+        return self.load_manifest(path)['size']
+
+    def download_stream(self, path: PurePath, offset=0, length=None):
+        StripedStore.check_path(path)
+        manifest = self.load_manifest(path)
+        end = manifest['size'] if length is None else min(manifest['size'], offset + length)
+        return self.__iter_chunks(path, manifest, offset, end)
+
+    def __iter_chunks(self, path: PurePath, manifest, start: int, end: int):
+        chunk_size = manifest['chunk_size']
+        reads = []
+        for index in range(start // chunk_size, -(-end // chunk_size)):
+            chunk_start = index * chunk_size
+            chunk_length = manifest['chunks'][index]['size']
+            offset = max(start - chunk_start, 0)
+            length = min(end - chunk_start, chunk_length) - offset
+            if offset == 0 and length == chunk_length:
+                length = None
+            reads.append((index, offset, length))
+        # keep up to max_workers chunks in flight ahead of the one being yielded
+        pending = []
+        try:
+            for read in reads:
+                pending.append(self.executor.submit(self.load_chunk, path, manifest, *read))
+                if len(pending) >= self.max_workers:
+                    yield pending.pop(0).result()
+            while pending:
+                yield pending.pop(0).result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def upload_file(self, path: PurePath, data, is_chunk=False):
+        StripedStore.check_path(path)
+        records = []
+        pending = set()
+        error = None
+        size = 0
+        for index, chunk in enumerate(iter_parts(data, self.chunk_size)):
+            records.append(None)
+            pending.add(self.executor.submit(self.__store_chunk, path, records, index, chunk))
+            size += len(chunk)
+            if len(pending) >= self.max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                error = self.__first_error(done)
+                if error:
+                    break
+        done, pending = wait(pending)
+        error = error or self.__first_error(done)
+        if error is None:
+            try:
+                self.store_manifest(path, json.dumps(self.build_manifest(size, records)).encode())
+            except Exception as e:
+                error = e
+        if error is not None:
+            # don't leave orphan chunks behind
+            self.__remove_chunks(path, records)
+            raise error
+
+    def __store_chunk(self, path: PurePath, records, index: int, chunk: bytes):
+        records[index] = self.store_chunk(path, index, chunk)
+
+    @staticmethod
+    def __first_error(futures):
+        for future in futures:
+            if future.exception() is not None:
+                return future.exception()
+        return None
+
+    def place_chunk(self, path: PurePath, index: int, size: int, exclude=()):
+        # returns indexes of the stores a chunk goes to, none of them in exclude
+        if self.scheduler is not None:
+            return self.scheduler.place(size, 1, exclude)
+        for offset in range(len(self.stores)):
+            if (index + offset) % len(self.stores) not in exclude:
+                return [(index + offset) % len(self.stores)]
+        raise DiskFullError('place fail')
+
+    def store_chunk(self, path: PurePath, index: int, chunk: bytes):
+        # returns the manifest record of an uploaded chunk
+        full = set()
+        while True:
+            store_index = self.place_chunk(path, index, len(chunk), full)[0]
+            try:
+                self.send_chunk(store_index, self.chunk_path(path, index), chunk)
+            except DiskFullError:
+                full.add(store_index)
+                continue
+            return {
+                'store': store_index,
+                'size': len(chunk)
+            }
+
+    def send_chunk(self, store_index: int, path: PurePath, data: bytes):
+        # uploads a placed chunk and tells the scheduler how it went
+        started = time.perf_counter()
+        error = None
+        try:
+            try:
+                self.stores[store_index].upload_file(path, data, is_chunk=True)
+            except NoEntryError:
+                # the chunk directory is made with the first chunk there
+                self.__make_chunk_dir(store_index, path.parent)
+                self.stores[store_index].upload_file(path, data, is_chunk=True)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.finished(store_index, len(data), time.perf_counter() - started, error)
+
+    def __make_chunk_dir(self, store_index: int, chunk_dir: PurePath):
+        store = self.stores[store_index]
+        with self.__dir_lock:
+            try:
+                store.make_dir(chunk_dir.parent, chunk_dir.name)
+            except DuplicateEntryError:
+                pass
+            except NoEntryError:
+                if store_index == 0:
+                    raise
+                # the directory was not made here, see make_dir
+                self.__make_parents(store, chunk_dir.parent)
+                store.make_dir(chunk_dir.parent, chunk_dir.name)
+
+    def __make_parents(self, store, directory: PurePath):
+        # makes the directories of the first store that are missing on another one
+        if len(directory.parts) <= 1:
+            return
+        if not self.stores[0].get_entry(directory).is_dir:
+            raise NoEntryError('path is not valid')
+        try:
+            store.make_dir(directory.parent, directory.name)
+        except NoEntryError:
+            self.__make_parents(store, directory.parent)
+            store.make_dir(directory.parent, directory.name)
+        except DuplicateEntryError:
+            pass
+
+    def load_chunk(self, path: PurePath, manifest, index: int, offset=0, length=None):
+        record = manifest['chunks'][index]
+        store = self.stores[record['store']]
+        return b''.join(store.download_stream(self.chunk_path(path, index), offset, length))
+
+    def remove_chunk(self, path: PurePath, index: int, record):
+        try:
+            self.stores[record['store']].remove(self.chunk_path(path, index))
+        except NoEntryError:
+            pass
+
+    def __remove_chunks(self, path: PurePath, records):
+        # records may have gaps for chunks that failed to upload
+        futures = [self.executor.submit(self.remove_chunk, path, index, record)
+                   for index, record in enumerate(records) if record is not None]
+        wait(futures)
+
+    def build_manifest(self, size: int, records):
+        return {
+            'striped': StripedStore.manifest_version,
+            'size': size,
+            'chunk_size': self.chunk_size,
+            'chunks': records
+        }
+
+    def store_manifest(self, path: PurePath, manifest: bytes):
+        self.stores[0].upload_file(path, manifest)
+
+    def fetch_manifest(self, path: PurePath):
+        return self.stores[0].download_file(path)
+
+    def remove_manifest(self, path: PurePath):
+        self.stores[0].remove(path)
+
+    def list_entries(self, path: PurePath):
+        return self.stores[0].get_list(path)
+
+    def load_manifest(self, path: PurePath):
+        manifest = self.fetch_manifest(path)
+        try:
+            manifest = json.loads(manifest.decode())
+        except ValueError:
+            raise Exception('not a striped file : {0}'.format(path.as_posix()))
+        if manifest.get('striped') != StripedStore.manifest_version:
+            raise Exception('not a striped file : {0}'.format(path.as_posix()))
+        return manifest
+
+    def get_list(self, path: PurePath):
+        StripedStore.check_path(path)
+        return [entry for entry in self.list_entries(path) if not self.is_chunk_dir(entry)]
+
+    def make_dir(self, path: PurePath, name: str):
+        StripedStore.check_path(path / name)
+        results = self.__on_all_stores(lambda store: store.make_dir(path, name))
+        # other stores may hold leftovers of an earlier directory, only the first one decides.
+        # a full store gets the directory when a chunk goes there
+        for index, (result, error) in enumerate(results):
+            if error is not None and (index == 0 or not isinstance(error, (DuplicateEntryError, DiskFullError))):
+                raise error
+
+    def remove(self, path: PurePath):
+        StripedStore.check_path(path)
+        entry = self.find_entry(path)
+        if entry.is_dir:
+            results = self.__on_all_stores(lambda store: store.remove(path))
+            for index, (result, error) in enumerate(results):
+                if error is not None and (index == 0 or not isinstance(error, NoEntryError)):
+                    raise error
+            return
+        # chunks are named after the name as it was stored, the first store may ignore case
+        path = path.parent / entry.name
+        manifest = self.load_manifest(path)
+        self.__remove_chunks(path, manifest['chunks'])
+        self.remove_manifest(path)
+
+    def get_entry(self, path: PurePath):
+        StripedStore.check_path(path)
+        entry = self.find_entry(path)
+        if not entry.is_dir:
+            entry.file_size = self.load_manifest(path.parent / entry.name)['size']
+        return entry
+
+    def find_entry(self, path: PurePath):
+        # the first store holds the directories and the manifests
+        return self.stores[0].get_entry(path)
+
+    def __on_all_stores(self, action):
+        # returns (result, exception) for every store, in order
+        futures = [self.executor.submit(action, store) for store in self.stores]
+        wait(futures)
+        return [(None, future.exception()) if future.exception() else (future.result(), None)
+                for future in futures]
@@ -0,0 +1,306 @@
+import os
+import mmap
+import json
+import contextvars
+from pathlib import Path, PurePath
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from . bulk_result import BulkResult
+from . sync_plan import SyncPlan
+from exceptions import *
+
+
+class SyncEngine:
+    # keeps a local directory and a store directory the same in both directions.
+    # the state file remembers every file as it was after the last sync, size and mtime of the
+    # local copy and the content hash of the remote one, so a run over unchanged data is only
+    # the listings. local files whose mtime moved are hashed the way the store hashes before
+    # they count as changed. a file changed on both sides is a conflict, which is skipped or
+    # settled by the `conflict` policy: 'skip', 'local' or 'remote'
+    conflict_policies = ('skip', 'local', 'remote')
+    # partial transfers are written next to the file under this suffix, on either side, and
+    # never synced
+    partial_suffix = '.unidrive-partial'
+
+    def __init__(self, store, local_dir, remote_dir, state_path, conflict='skip'):
+        if conflict not in SyncEngine.conflict_policies:
+            raise Exception('sync engine fail : reason = unknown conflict policy {0}'.format(conflict))
+        self.store = store
+        self.local_dir = Path(local_dir)
+        self.remote_dir = PurePath(remote_dir)
+        self.state_path = Path(state_path)
+        self.conflict = conflict
+        # stores without content hashes fall back to size and mtime
+        self.__hashes = store.content_hash(b'') is not None
+        self.__state = self.__load_state()
+
+    def __load_state(self):
+        try:
+            with open(self.state_path, 'r') as state_file:
+                state = json.loads(state_file.read())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        # a state of other directories or another store says nothing about these
+        if state.get('store') != type(self.store).__name__ or state.get('local_dir') != str(self.local_dir) \
+                or state.get('remote_dir') != self.remote_dir.as_posix():
+            return {}
+        return {PurePath(path): record for path, record in state['files'].items()}
+
+    def __save_state(self):
+        state = {
+            'store': type(self.store).__name__,
+            'local_dir': str(self.local_dir),
+            'remote_dir': self.remote_dir.as_posix(),
+            'files': {path.as_posix(): record for path, record in sorted(self.__state.items())}
+        }
+        temporary = self.state_path.with_name(self.state_path.name + '.tmp')
+        with open(temporary, 'w') as state_file:
+            state_file.write(json.dumps(state))
+        os.replace(temporary, self.state_path)
+
+    @staticmethod
+    def signature(entry):
+        # what tells a remote file changed, the provider hash when there is one
+        if entry.content_hash is not None:
+            return entry.content_hash
+        if entry.revision is not None:
+            return entry.revision
+        return '{0}:{1}'.format(entry.file_size, entry.modified)
+
+    def sync(self, max_workers=8):
+        return self.apply(self.plan(max_workers), max_workers)
+
+    def plan(self, max_workers=8):
+        local = self.__list_local()
+        try:
+            remote = self.__list_remote(max_workers)
+            remote_missing = False
+        except NoEntryError:
+            remote, remote_missing = {}, True
+        plan = SyncPlan(local, remote, remote_missing)
+        for path in sorted(set(local) | {path for path, entry in remote.items() if not entry.is_dir}
+                           | set(self.__state)):
+            self.__plan_file(plan, path)
+        return plan
+
+    def __plan_file(self, plan, path):
+        record = self.__state.get(path)
+        local = plan.local.get(path)
+        entry = plan.remote.get(path)
+        if entry is not None and entry.is_dir:
+            if local is not None:
+                plan.conflicts.append(path)
+            return
+        digest = []
+
+        def local_hash():
+            # hashed at most once, and only when size and mtime can't tell
+            if not digest:
+                digest.append(self.__local_hash(path, local[0]) if self.__hashes else None)
+            return digest[0]
+
+        if record is None:
+            if local is not None and entry is not None:
+                if local_hash() is not None and local_hash() == entry.content_hash:
+                    plan.refreshed[path] = self.__record(local, local_hash(), entry)
+                else:
+                    self.__plan_conflict(plan, path)
+            elif local is not None:
+                plan.uploads.append(path)
+            else:
+                plan.downloads.append(path)
+            return
+        if local is None and entry is None:
+            plan.forgotten.append(path)
+            return
+        local_changed = False
+        if local is not None and (local[0], local[1]) != (record['size'], record['mtime_ns']):
+            # touched but the same content only needs the new mtime
+            local_changed = local_hash() is None or local_hash() != record['hash']
+            if not local_changed:
+                plan.refreshed[path] = dict(record, size=local[0], mtime_ns=local[1])
+        remote_changed = entry is not None and SyncEngine.signature(entry) != record['remote']
+        if local is None:
+            if remote_changed:
+                plan.downloads.append(path)
+            else:
+                plan.remote_removals.append(path)
+        elif entry is None:
+            if local_changed:
+                plan.uploads.append(path)
+            else:
+                plan.local_removals.append(path)
+        elif local_changed and remote_changed:
+            if local_hash() is not None and local_hash() == entry.content_hash:
+                plan.refreshed[path] = self.__record(local, local_hash(), entry)
+            else:
+                self.__plan_conflict(plan, path)
+        elif local_changed:
+            plan.uploads.append(path)
+        elif remote_changed:
+            plan.downloads.append(path)
+
+    def __plan_conflict(self, plan, path):
+        if self.conflict == 'local':
+            plan.uploads.append(path)
+        elif self.conflict == 'remote':
+            plan.downloads.append(path)
+        else:
+            plan.conflicts.append(path)
+
+    @staticmethod
+    def __record(local, digest, entry):
+        return {'size': local[0], 'mtime_ns': local[1], 'hash': digest, 'remote': SyncEngine.signature(entry)}
+
+    def __list_local(self):
+        # relative path: (size, mtime_ns) of every file under local_dir
+        files = {}
+        if not self.local_dir.is_dir():
+            raise NoEntryError('local path is not a directory')
+        directories = [PurePath()]
+        while directories:
+            relative = directories.pop()
+            with os.scandir(self.local_dir / relative) as entries:
+                for entry in entries:
+                    path = relative / entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(path)
+                    elif entry.is_file(follow_symlinks=False) and not self.__ignored(entry):
+                        stat = entry.stat(follow_symlinks=False)
+                        files[path] = (stat.st_size, stat.st_mtime_ns)
+        return files
+
+    def __ignored(self, entry):
+        if entry.name.endswith(SyncEngine.partial_suffix):
+            return True
+        return Path(entry.path) in (self.state_path, self.state_path.with_name(self.state_path.name + '.tmp'))
+
+    def __list_remote(self, max_workers):
+        # relative path: DirectoryEntry of everything under remote_dir, directories are listed
+        # in parallel. a listing that fails fails the plan, an unlisted directory is not empty
+        entries = {}
+        self.store.configure_pool(max_workers)
+        list_entries = lambda relative: list(self.store.iter_list(self.remote_dir / relative))
+        with ThreadPoolExecutor(max_workers) as executor:
+            pending = {executor.submit(contextvars.copy_context().run, list_entries, PurePath()): PurePath()}
+            while pending:
+                completed, other = wait(pending, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    relative = pending.pop(future)
+                    for entry in future.result():
+                        if not entry.is_dir and entry.name.endswith(SyncEngine.partial_suffix):
+                            continue
+                        entries[relative / entry.name] = entry
+                        if entry.is_dir:
+                            future = executor.submit(contextvars.copy_context().run, list_entries,
+                                                     relative / entry.name)
+                            pending[future] = relative / entry.name
+        return entries
+
+    def __local_hash(self, path, size):
+        with open(self.local_dir / path, 'rb') as local_file:
+            return self.__hash_file(local_file, size)
+
+    def __hash_file(self, local_file, size):
+        if size == 0:
+            return self.store.content_hash(b'')
+        # mapped, big files are hashed without reading them into memory
+        with mmap.mmap(local_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return self.store.content_hash(mapped)
+
+    def apply(self, plan, max_workers=8):
+        # runs the plan and saves the new state. returns a BulkResult per transfer, removal and
+        # directory that could not be made. the state only takes what succeeded, failed files
+        # are planned again by the next run
+        results = []
+        if plan.remote_missing and plan.uploads and self.remote_dir != self.remote_dir.parent:
+            try:
+                self.store.make_dir(self.remote_dir.parent, self.remote_dir.name)
+            except DuplicateEntryError:
+                pass
+        directories = {parent for path in plan.uploads for parent in path.parents if parent != PurePath()}
+        directories = sorted(directory for directory in directories if directory not in plan.remote)
+        if directories:
+            made = self.store.make_dir_batch([(self.remote_dir / directory.parent, directory.name)
+                                              for directory in directories], max_workers)
+            results.extend(result for result in made
+                           if not result.ok and not isinstance(result.error, DuplicateEntryError))
+
+        transfers = [(self.__upload, path, plan) for path in plan.uploads]
+        transfers += [(self.__download, path, plan) for path in plan.downloads]
+        done = self.store.run_bulk(lambda transfer: transfer[0](transfer[1], transfer[2]), transfers, max_workers,
+                                   path_of=lambda transfer: self.remote_dir / transfer[1])
+        for transfer, result in zip(transfers, done):
+            if result.ok:
+                self.__state[transfer[1]] = result.value
+        results.extend(done)
+
+        if plan.remote_removals:
+            removed = self.store.remove_batch([self.remote_dir / path for path in plan.remote_removals])
+            for path, result in zip(plan.remote_removals, removed):
+                if result.ok or isinstance(result.error, NoEntryError):
+                    self.__state.pop(path, None)
+            results.extend(removed)
+        for path in plan.local_removals:
+            try:
+                os.remove(self.local_dir / path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                results.append(BulkResult(self.local_dir / path, error=e))
+                continue
+            self.__state.pop(path, None)
+            results.append(BulkResult(self.local_dir / path))
+
+        self.__state.update(plan.refreshed)
+        for path in plan.forgotten:
+            self.__state.pop(path, None)
+        self.__save_state()
+        return results
+
+    def __upload(self, path, plan):
+        remote_path = self.remote_dir / path
+        # uploads never overwrite, a new version goes up next to the old one and is moved over
+        # it once it's complete, so a failed upload leaves the old version as it was
+        target = remote_path
+        if path in plan.remote:
+            target = remote_path.with_name(remote_path.name + SyncEngine.partial_suffix)
+            try:
+                # left by a run that stopped before the move
+                self.store.remove(target)
+            except NoEntryError:
+                pass
+        with open(self.local_dir / path, 'rb') as local_file:
+            # the mtime before reading, a change while uploading shows up in the next run
+            stat = os.fstat(local_file.fileno())
+            if stat.st_size <= self.store.upload_part_size:
+                data = local_file.read()
+                digest = self.store.content_hash(data) if self.__hashes else None
+            else:
+                digest = self.__hash_file(local_file, stat.st_size) if self.__hashes else None
+                local_file.seek(0)
+                data = local_file
+            self.store.upload_file(target, data)
+        if target != remote_path:
+            self.store.remove(remote_path)
+            self.store.move(target, remote_path)
+        if digest is not None:
+            remote = digest
+        else:
+            remote = SyncEngine.signature(self.store.get_entry(remote_path))
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': digest, 'remote': remote}
+
+    def __download(self, path, plan):
+        entry = plan.remote[path]
+        local_path = self.local_dir / path
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+        # written aside and moved in place, a failed download leaves the old file as it was
+        partial = local_path.with_name(local_path.name + SyncEngine.partial_suffix)
+        try:
+            with open(partial, 'wb') as local_file:
+                self.store.download_to(self.remote_dir / path, local_file)
+            os.replace(partial, local_path)
+        finally:
+            if partial.exists():
+                partial.unlink()
+        stat = os.stat(local_path)
+        return self.__record((stat.st_size, stat.st_mtime_ns), entry.content_hash if self.__hashes else None, entry)
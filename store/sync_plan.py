@@ -0,0 +1,26 @@
+class SyncPlan:
+    # what one SyncEngine run would do, paths are relative to the synced directories.
+    # local and remote hold what was found on each side, (size, mtime_ns) per local file
+    # and the DirectoryEntry per remote one
+    def __init__(self, local, remote, remote_missing=False):
+        self.local = local
+        self.remote = remote
+        self.remote_missing = remote_missing
+        self.uploads = []
+        self.downloads = []
+        self.remote_removals = []
+        self.local_removals = []
+        self.conflicts = []
+        # path: state record, files that only need their state updated
+        self.refreshed = {}
+        # state records of files gone from both sides
+        self.forgotten = []
+
+    @property
+    def empty(self):
+        return not (self.uploads or self.downloads or self.remote_removals or self.local_removals)
+
+    def __repr__(self):
+        return 'SyncPlan(uploads={0}, downloads={1}, remote_removals={2}, local_removals={3}, conflicts={4})'.format(
+            len(self.uploads), len(self.downloads), len(self.remote_removals), len(self.local_removals),
+            len(self.conflicts))
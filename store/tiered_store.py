@@ -0,0 +1,289 @@
+import time
+import threading
+from collections import OrderedDict, deque
+from pathlib import PurePath
+from . store import Store
+from exceptions import *
+
+
+class TieredStore(Store):
+    # writes go to the fast store, usually a LocalDiskStore, and files not read or written for
+    # cold_after seconds are demoted to the slow store in the background, least recently used
+    # first and earlier when the fast store holds more than max_fast_bytes. reads try the fast
+    # store first. the tiered store has to be the only writer of the slow store, the names it
+    # holds are listed once per directory and kept up to date here, for the max_cached_dirs
+    # directories used last
+    max_cached_dirs = 4096
+
+    def __init__(self, fast, slow, cold_after=3600, max_fast_bytes=None, interval=60, max_workers=4):
+        self.fast = fast
+        self.slow = slow
+        self.cold_after = cold_after
+        self.max_fast_bytes = max_fast_bytes
+        self.max_workers = max_workers
+        self.case_sensitive = fast.case_sensitive and slow.case_sensitive
+        self.lists_file_sizes = fast.lists_file_sizes and slow.lists_file_sizes
+        # key -> [path, last access, size] of the files in the fast store, least recent first
+        self.__accessed = OrderedDict()
+        self.__fast_bytes = 0
+        # keys of the files being copied to the slow store
+        self.__demoting = set()
+        # directory key -> names in the slow store, least recently used first
+        self.__slow_names = OrderedDict()
+        self.__changed = threading.Condition()
+        self.__wake = threading.Event()
+        self.__stopped = threading.Event()
+        self.__register_fast()
+        self.__demoter = None
+        if interval is not None:
+            self.__demoter = threading.Thread(target=self.__run, args=(interval,), daemon=True)
+            self.__demoter.start()
+
+    def authorized(self):
+        return self.fast.authorized() and self.slow.authorized()
+
+    def configure_pool(self, size: int, socket_options=None):
+        self.fast.configure_pool(size, socket_options)
+        self.slow.configure_pool(size, socket_options)
+
+    def close(self):
+        # stops the background demotion, files stay where they are
+        self.__stopped.set()
+        self.__wake.set()
+        if self.__demoter is not None:
+            self.__demoter.join()
+
+    def __key(self, path: PurePath):
+        key = path.as_posix()
+        return key if self.case_sensitive else key.lower()
+
+    def __register_fast(self):
+        # files already in the fast store count as used now
+        now = time.monotonic()
+        directories = deque([PurePath('/')])
+        while directories:
+            directory = directories.popleft()
+            for entry in self.fast.iter_list(directory):
+                if entry.is_dir:
+                    directories.append(directory / entry.name)
+                else:
+                    self.__accessed[self.__key(directory / entry.name)] = [directory / entry.name, now,
+                                                                           entry.file_size]
+                    self.__fast_bytes += entry.file_size
+
+    def __touch(self, path: PurePath, size=None):
+        key = self.__key(path)
+        with self.__changed:
+            record = self.__accessed.get(key)
+            if record is None:
+                if size is None:
+                    return
+                record = self.__accessed[key] = [path, 0, size]
+                self.__fast_bytes += size
+            record[1] = time.monotonic()
+            self.__accessed.move_to_end(key)
+            over = self.max_fast_bytes is not None and self.__fast_bytes > self.max_fast_bytes
+        if over:
+            self.__wake.set()
+
+    def __forget_slow(self, path: PurePath):
+        key = self.__key(path)
+        prefix = key.rstrip('/') + '/'
+        with self.__changed:
+            for directory in [directory for directory in self.__slow_names
+                              if directory == key or directory.startswith(prefix)]:
+                del self.__slow_names[directory]
+            names = self.__slow_names.get(self.__key(path.parent))
+            if names is not None:
+                names.discard(path.name if self.case_sensitive else path.name.lower())
+
+    def __in_slow(self, path: PurePath):
+        # whether the slow store holds path, its directory is listed the first time it's asked
+        directory = self.__key(path.parent)
+        with self.__changed:
+            names = self.__slow_names.get(directory)
+            if names is not None:
+                self.__slow_names.move_to_end(directory)
+        if names is None:
+            try:
+                listed = {entry.name if self.case_sensitive else entry.name.lower()
+                          for entry in self.slow.iter_list(path.parent)}
+            except NoEntryError:
+                listed = set()
+            with self.__changed:
+                names = self.__slow_names.setdefault(directory, listed)
+                self.__slow_names.move_to_end(directory)
+                while len(self.__slow_names) > TieredStore.max_cached_dirs:
+                    self.__slow_names.popitem(last=False)
+        return (path.name if self.case_sensitive else path.name.lower()) in names
+
+    def __add_slow(self, path: PurePath):
+        with self.__changed:
+            names = self.__slow_names.get(self.__key(path.parent))
+            if names is not None:
+                names.add(path.name if self.case_sensitive else path.name.lower())
+
+    def __make_fast_dir(self, directory: PurePath):
+        # makes a directory of the slow store in the fast store, with its missing parents
+        if not self.slow.get_entry(directory).is_dir:
+            raise NoEntryError('path is not valid')
+        try:
+            self.fast.make_dir(directory.parent, directory.name)
+        except NoEntryError:
+            self.__make_fast_dir(directory.parent)
+            self.fast.make_dir(directory.parent, directory.name)
+        except DuplicateEntryError:
+            pass
+
+    def __make_slow_dirs(self, directory: PurePath):
+        for depth in range(2, len(directory.parts) + 1):
+            path = PurePath(*directory.parts[:depth])
+            if self.__in_slow(path):
+                continue
+            try:
+                self.slow.make_dir(path.parent, path.name)
+            except DuplicateEntryError:
+                pass
+            self.__add_slow(path)
+
+    def demote_cold(self):
+        # moves the cold files to the slow store now, one BulkResult per file moved.
+        # a failed file stays in the fast store and is tried again next time
+        now = time.monotonic()
+        with self.__changed:
+            excess = 0 if self.max_fast_bytes is None else self.__fast_bytes - self.max_fast_bytes
+            chosen = []
+            for key, (path, accessed, size) in self.__accessed.items():
+                if key in self.__demoting:
+                    continue
+                if now - accessed < self.cold_after and excess <= 0:
+                    break
+                chosen.append((path, accessed))
+                excess -= size
+            self.__demoting.update(self.__key(path) for path, accessed in chosen)
+        return self.run_bulk(self.__demote, chosen, self.max_workers, path_of=lambda item: item[0])
+
+    def __demote(self, item):
+        path, accessed = item
+        key = self.__key(path)
+        try:
+            self.__make_slow_dirs(path.parent)
+            if self.__in_slow(path):
+                # left by a demotion that couldn't remove the fast copy
+                self.slow.remove(path)
+                self.__forget_slow(path)
+            self.fast.transfer_file(path, self.slow, path)
+            self.__add_slow(path)
+            with self.__changed:
+                record = self.__accessed.get(key)
+                if record is None or record[1] != accessed:
+                    # used while it was copied, stays hot. the slow copy is replaced next time
+                    return
+            self.fast.remove(path)
+            with self.__changed:
+                record = self.__accessed.pop(key, None)
+                if record is not None:
+                    self.__fast_bytes -= record[2]
+        finally:
+            with self.__changed:
+                self.__demoting.discard(key)
+                self.__changed.notify_all()
+
+    def __run(self, interval):
+        while not self.__stopped.is_set():
+            self.__wake.wait(interval)
+            self.__wake.clear()
+            if self.__stopped.is_set():
+                return
+            try:
+                self.demote_cold()
+            except Exception:
+                # tried again on the next pass
+                continue
+
+    def __release(self, path: PurePath):
+        # waits for the demotions below path and stops tracking it, so no copy finished
+        # after a removal brings the file back
+        key = self.__key(path)
+        prefix = key.rstrip('/') + '/'
+        with self.__changed:
+            self.__changed.wait_for(lambda: not any(demoting == key or demoting.startswith(prefix)
+                                                    for demoting in self.__demoting))
+            for released in [accessed for accessed in self.__accessed
+                             if accessed == key or accessed.startswith(prefix)]:
+                self.__fast_bytes -= self.__accessed.pop(released)[2]
+
+    def download_file(self, path: PurePath):
+        return b''.join(self.download_stream(path))
+
+    def download_stream(self, path: PurePath, offset=0, length=None):
+        try:
+            stream = self.fast.download_stream(path, offset, length)
+        except NoEntryError:
+            return self.slow.download_stream(path, offset, length)
+        self.__touch(path)
+        return stream
+
+    def file_size(self, path: PurePath):
+        try:
+            return self.fast.file_size(path)
+        except NoEntryError:
+            return self.slow.file_size(path)
+
+    def upload_file(self, path: PurePath, data, is_chunk=False):
+        if self.__in_slow(path):
+            raise DuplicateEntryError('duplicate upload')
+        try:
+            self.fast.upload_file(path, data, is_chunk)
+        except NoEntryError:
+            # the directory may only be in the slow store, data can't be read twice so it's
+            # only retried for bytes
+            if not isinstance(data, (bytes, bytearray, memoryview)):
+                raise
+            self.__make_fast_dir(path.parent)
+            self.fast.upload_file(path, data, is_chunk)
+        self.__touch(path, self.fast.file_size(path))
+
+    def get_list(self, path: PurePath):
+        entries = {}
+        found = False
+        for store in (self.slow, self.fast):
+            try:
+                for entry in store.iter_list(path):
+                    entries[entry.name if self.case_sensitive else entry.name.lower()] = entry
+                found = True
+            except NoEntryError:
+                continue
+        if not found:
+            raise NoEntryError('path is not valid')
+        return list(entries.values())
+
+    def get_entry(self, path: PurePath):
+        try:
+            return self.fast.get_entry(path)
+        except NoEntryError:
+            return self.slow.get_entry(path)
+
+    def make_dir(self, path: PurePath, name: str):
+        if self.__in_slow(path / name):
+            raise DuplicateEntryError('make dir fail')
+        try:
+            self.fast.make_dir(path, name)
+        except NoEntryError:
+            self.__make_fast_dir(path)
+            self.fast.make_dir(path, name)
+
+    def remove(self, path: PurePath):
+        self.__release(path)
+        removed = False
+        try:
+            self.fast.remove(path)
+            removed = True
+        except NoEntryError:
+            pass
+        if self.__in_slow(path):
+            self.slow.remove(path)
+            removed = True
+        self.__forget_slow(path)
+        if not removed:
+            raise NoEntryError('remove fail')
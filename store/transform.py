@@ -0,0 +1,210 @@
+import os
+import zlib
+from abc import ABC, abstractclassmethod
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:
+    AESGCM = None
+
+
+class Coder:
+    # one direction of a transform over one stream. update takes the next piece of the
+    # stream and returns what is ready of the output, finish returns the rest
+    def __init__(self, update, finish):
+        self.update = update
+        self.finish = finish
+
+
+class Transform(ABC):
+    # a reversible change of the stored bytes. name goes into the header of every file
+    # it was applied to, so it has to stay the same for data to stay readable.
+    # context is what the stream is bound to, the file header. transforms that authenticate
+    # their output fail to decode it under another context, the others ignore it
+    name = ''
+
+    @abstractclassmethod
+    def encoder(self, context=b''):
+        # returns a Coder
+        pass
+
+    @abstractclassmethod
+    def decoder(self, context=b''):
+        # returns a Coder, its finish raises when the stream is incomplete or damaged
+        pass
+
+
+class ZlibTransform(Transform):
+    name = 'zlib'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def encoder(self, context=b''):
+        compressor = zlib.compressobj(self.level)
+        return Coder(compressor.compress, compressor.flush)
+
+    def decoder(self, context=b''):
+        decompressor = zlib.decompressobj()
+
+        def finish():
+            rest = decompressor.flush()
+            if not decompressor.eof:
+                raise Exception('transform fail : reason = zlib stream is truncated')
+            return rest
+        return Coder(decompressor.decompress, finish)
+
+
+class ZstdTransform(Transform):
+    # faster than zlib at a better ratio, needs zstandard
+    name = 'zstd'
+
+    def __init__(self, level=3):
+        if zstandard is None:
+            raise ImportError('zstd transform needs zstandard')
+        self.level = level
+
+    def encoder(self, context=b''):
+        compressor = zstandard.ZstdCompressor(level=self.level).compressobj()
+        return Coder(compressor.compress, compressor.flush)
+
+    def decoder(self, context=b''):
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        # the decompressor keeps the frame header to itself, so the frame is complete only
+        # once it reported eof
+        def finish():
+            rest = decompressor.flush()
+            if not decompressor.eof:
+                raise Exception('transform fail : reason = zstd frame is truncated')
+            return rest
+        return Coder(decompressor.decompress, finish)
+
+
+class EncryptionTransform(Transform):
+    # AES-256-GCM over segments of segment_size bytes, each with its own tag, so no byte is
+    # given out before the tag covering it checked out. every file is sealed with its own key,
+    # derived with HKDF-SHA256 from the key and a random salt that leads the stream, so nonces
+    # never repeat under one key however many files there are. the nonce of a segment is its
+    # number and a flag set only on the last segment, so reordered, dropped or cut off segments
+    # fail too. the context is the associated data of every segment.
+    # needs cryptography. should come after compression, encrypted data doesn't compress
+    name = 'aes-gcm-hkdf-segments'
+    salt_size = 16
+    tag_size = 16
+    segment_size = 64 * 1024
+
+    def __init__(self, key: bytes):
+        if AESGCM is None:
+            raise ImportError('encryption transform needs cryptography')
+        if len(key) != 32:
+            raise Exception('transform fail : reason = key must be 32 bytes')
+        self.key = key
+
+    @staticmethod
+    def __nonce(number: int, last: bool):
+        return number.to_bytes(11, 'big') + (b'\x01' if last else b'\x00')
+
+    def __cipher(self, salt: bytes):
+        key = HKDF(algorithm=hashes.SHA256(), length=32, salt=salt,
+                   info=EncryptionTransform.name.encode()).derive(self.key)
+        return AESGCM(key)
+
+    def encoder(self, context=b''):
+        salt = os.urandom(EncryptionTransform.salt_size)
+        cipher = self.__cipher(salt)
+        # a full segment is held until more data shows it isn't the last one
+        buffer = bytearray()
+        state = {'number': 0, 'started': False}
+
+        def seal(segment, last):
+            if state['number'] >= 2 ** 32:
+                raise Exception('transform fail : reason = stream is too long')
+            sealed = cipher.encrypt(EncryptionTransform.__nonce(state['number'], last), bytes(segment), context)
+            state['number'] += 1
+            if not state['started']:
+                state['started'] = True
+                return salt + sealed
+            return sealed
+
+        def update(data):
+            buffer.extend(data)
+            output = []
+            while len(buffer) > EncryptionTransform.segment_size:
+                output.append(seal(buffer[:EncryptionTransform.segment_size], False))
+                del buffer[:EncryptionTransform.segment_size]
+            return b''.join(output)
+
+        def finish():
+            return seal(buffer, True)
+        return Coder(update, finish)
+
+    def decoder(self, context=b''):
+        sealed_size = EncryptionTransform.segment_size + EncryptionTransform.tag_size
+        buffer = bytearray()
+        state = {'number': 0, 'cipher': None}
+
+        def open_segment(segment, last):
+            nonce = EncryptionTransform.__nonce(state['number'], last)
+            state['number'] += 1
+            # raises InvalidTag when the data, the context or the key is wrong
+            return state['cipher'].decrypt(nonce, bytes(segment), context)
+
+        def update(data):
+            buffer.extend(data)
+            if state['cipher'] is None:
+                if len(buffer) < EncryptionTransform.salt_size:
+                    return b''
+                state['cipher'] = self.__cipher(bytes(buffer[:EncryptionTransform.salt_size]))
+                del buffer[:EncryptionTransform.salt_size]
+            output = []
+            # a full segment is the last one when nothing follows, that is known in finish
+            while len(buffer) > sealed_size:
+                output.append(open_segment(buffer[:sealed_size], False))
+                del buffer[:sealed_size]
+            return b''.join(output)
+
+        def finish():
+            if state['cipher'] is None or len(buffer) < EncryptionTransform.tag_size:
+                raise Exception('transform fail : reason = encrypted stream is truncated')
+            return open_segment(buffer, True)
+        return Coder(update, finish)
+
+
+def encode_stream(chunks, transforms, context=b''):
+    # applies the transforms in order to an iterable of bytes, streamed
+    coders = [transform.encoder(context) for transform in transforms]
+    for chunk in chunks:
+        for coder in coders:
+            if not chunk:
+                break
+            chunk = coder.update(chunk)
+        if chunk:
+            yield chunk
+    yield from _finish(coders)
+
+
+def decode_stream(chunks, transforms, context=b''):
+    # reverses encode_stream with the same transforms and context
+    coders = [transform.decoder(context) for transform in reversed(transforms)]
+    for chunk in chunks:
+        for coder in coders:
+            if not chunk:
+                break
+            chunk = coder.update(chunk)
+        if chunk:
+            yield chunk
+    yield from _finish(coders)
+
+
+def _finish(coders):
+    # the rest of every coder still goes through the coders after it
+    data = b''
+    for coder in coders:
+        data = (coder.update(data) if data else b'') + coder.finish()
+    if data:
+        yield data
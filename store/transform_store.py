@@ -0,0 +1,214 @@
+from pathlib import PurePath
+from . store import Store
+from . stream import iter_parts
+from . transform import encode_stream, decode_stream
+
+
+class TransformStore(Store):
+    # passes every file through the transforms on the way to the wrapped store, compression
+    # first and encryption last, and back on the way out. both ways are streamed chunk by chunk.
+    # the store owns the files it reads: each one starts with a header naming its transforms,
+    # so files written with other transforms stay readable as long as those are given, and ends
+    # with its plain size and the magic again. files without the header are refused on reads.
+    # where the wrapped store keeps properties the plain size and the transforms are kept in
+    # them as well, so listings cost nothing more. elsewhere listings carry the stored sizes and
+    # file_size, get_entry and open read the trailer. hashes in listings are those of the stored bytes
+    magic = b'UDTF\x03'
+    trailer_size = 8 + len(magic)
+    chunk_size = 1024 * 1024
+
+    def __init__(self, store, transforms):
+        self.store = store
+        self.transforms = list(transforms)
+        self.case_sensitive = store.case_sensitive
+        # without properties listings carry the stored sizes
+        self.lists_file_sizes = store.lists_file_sizes and store.keeps_properties
+        self.__known = {transform.name: transform for transform in self.transforms}
+
+    def authorized(self):
+        return self.store.authorized()
+
+    def configure_pool(self, size: int, socket_options=None):
+        self.store.configure_pool(size, socket_options)
+
+    def header(self, transforms):
+        names = ','.join(transform.name for transform in transforms).encode()
+        return TransformStore.magic + bytes([len(names)]) + names
+
+    def upload_file(self, path: PurePath, data, is_chunk=False):
+        parts = iter_parts(data, TransformStore.chunk_size)
+        if not self.store.keeps_properties:
+            return self.store.upload_file(path, self.__encode(parts, {}), is_chunk)
+        # the plain size is filled in once the data is read, the wrapped store sends it after that
+        properties = {'transforms': ','.join(transform.name for transform in self.transforms)}
+        return self.store.upload_file(path, self.__encode(parts, properties), is_chunk, properties)
+
+    def __encode(self, parts, properties):
+        size = [0]
+
+        def counted():
+            for part in parts:
+                size[0] += len(part)
+                yield part
+        header = self.header(self.transforms)
+        yield header
+        # the header is authenticated by the transforms that can
+        yield from encode_stream(counted(), self.transforms, header)
+        properties['plain_size'] = str(size[0])
+        yield TransformStore.__trailer(size[0])
+
+    @staticmethod
+    def __trailer(size: int):
+        return size.to_bytes(TransformStore.trailer_size - len(TransformStore.magic), 'big') + TransformStore.magic
+
+    @staticmethod
+    def __size_in(trailer):
+        # the plain size in the trailer, None when it is not one
+        if len(trailer) != TransformStore.trailer_size or not trailer.endswith(TransformStore.magic):
+            return None
+        return int.from_bytes(trailer[:-len(TransformStore.magic)], 'big')
+
+    @staticmethod
+    def __prepend(first, parts):
+        yield first
+        yield from parts
+
+    def download_file(self, path: PurePath):
+        return b''.join(self.download_stream(path))
+
+    def download_stream(self, path: PurePath, offset=0, length=None):
+        # transformed bytes can't be read from the middle, ranges are decoded from the start
+        return self.__cut(self.__decode(self.store.download_stream(path, 0, None)), offset, length)
+
+    @staticmethod
+    def __not_owned():
+        return Exception('download fail : reason = file was not written by a transform store')
+
+    def __decode(self, chunks):
+        chunks = iter(chunks)
+        head = bytearray()
+        size = len(TransformStore.magic) + 1
+        for chunk in chunks:
+            head += chunk
+            if len(head) < size:
+                continue
+            if head[:len(TransformStore.magic)] != TransformStore.magic:
+                break
+            size = len(TransformStore.magic) + 1 + head[len(TransformStore.magic)]
+            if len(head) >= size:
+                break
+        if head[:len(TransformStore.magic)] != TransformStore.magic or len(head) < size:
+            raise TransformStore.__not_owned()
+        names = bytes(head[len(TransformStore.magic) + 1:size]).decode()
+        transforms = []
+        for name in names.split(',') if names else []:
+            if name not in self.__known:
+                raise Exception('download fail : reason = transform {0} is not configured'.format(name))
+            transforms.append(self.__known[name])
+        trailer = bytearray()
+        decoded = 0
+        for chunk in decode_stream(TransformStore.__hold_trailer(self.__prepend(bytes(head[size:]), chunks),
+                                                                 trailer), transforms, bytes(head[:size])):
+            decoded += len(chunk)
+            yield chunk
+        if TransformStore.__size_in(bytes(trailer)) != decoded:
+            raise Exception('download fail : reason = size does not match the stored one')
+
+    @staticmethod
+    def __hold_trailer(chunks, trailer: bytearray):
+        # yields all but the last trailer_size bytes, which end up in trailer
+        for chunk in chunks:
+            trailer += chunk
+            if len(trailer) > TransformStore.trailer_size:
+                yield bytes(trailer[:-TransformStore.trailer_size])
+                del trailer[:-TransformStore.trailer_size]
+
+    @staticmethod
+    def __cut(chunks, offset, length):
+        end = None if length is None else offset + length
+        position = 0
+        for chunk in chunks:
+            start = position
+            position += len(chunk)
+            if position <= offset:
+                continue
+            if end is not None and start >= end:
+                break
+            yield chunk[max(offset - start, 0):None if end is None else end - start]
+
+    def __plain_size(self, path: PurePath, stored_size: int):
+        # from the trailer, one ranged read. None when the file was not written here
+        if stored_size < len(TransformStore.magic) + 1 + TransformStore.trailer_size:
+            return None
+        trailer = b''.join(self.store.download_stream(path, stored_size - TransformStore.trailer_size,
+                                                      TransformStore.trailer_size))
+        return TransformStore.__size_in(trailer)
+
+    @staticmethod
+    def __listed(entry):
+        # the plain size from the properties, other entries as the wrapped store lists them
+        if not entry.is_dir and entry.properties and 'plain_size' in entry.properties:
+            entry.file_size = int(entry.properties['plain_size'])
+        return entry
+
+    def file_size(self, path: PurePath):
+        if self.store.keeps_properties:
+            entry = self.store.get_entry(path)
+            if entry.properties and 'plain_size' in entry.properties:
+                return int(entry.properties['plain_size'])
+            stored_size = entry.file_size
+        else:
+            stored_size = self.store.file_size(path)
+        size = self.__plain_size(path, stored_size)
+        if size is None:
+            raise TransformStore.__not_owned()
+        return size
+
+    def content_hash(self, data: bytes):
+        # the provider hashes the transformed bytes, which differ on every upload once encrypted
+        return None
+
+    def get_list(self, path: PurePath):
+        return [TransformStore.__listed(entry) for entry in self.store.get_list(path)]
+
+    def iter_list(self, path: PurePath):
+        return (TransformStore.__listed(entry) for entry in self.store.iter_list(path))
+
+    def get_entry(self, path: PurePath):
+        # one entry, so without properties its trailer is read. callers such as CachedStore size
+        # their reads by it
+        entry = self.store.get_entry(path)
+        if entry.is_dir or self.store.keeps_properties:
+            return TransformStore.__listed(entry)
+        size = self.__plain_size(path, entry.file_size)
+        if size is not None:
+            entry.file_size = size
+        return entry
+
+    def list_changes(self, cursor=None):
+        return self.store.list_changes(cursor)
+
+    def make_dir(self, path: PurePath, name: str):
+        return self.store.make_dir(path, name)
+
+    def make_dir_batch(self, items, max_workers=8):
+        return self.store.make_dir_batch(items, max_workers)
+
+    def remove(self, path: PurePath):
+        return self.store.remove(path)
+
+    def remove_batch(self, paths):
+        return self.store.remove_batch(paths)
+
+    def copy(self, source: PurePath, destination: PurePath):
+        # the stored bytes carry their header, copies stay readable
+        return self.store.copy(source, destination)
+
+    def move(self, source: PurePath, destination: PurePath):
+        return self.store.move(source, destination)
+
+    def copy_batch(self, pairs, max_workers=8):
+        return self.store.copy_batch(pairs, max_workers)
+
+    def move_batch(self, pairs, max_workers=8):
+        return self.store.move_batch(pairs, max_workers)
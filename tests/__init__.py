@@ -1,5 +1,5 @@
-from .test_store import BaseTestStoreMethods
+from .test_store import BaseTestStoreMethods, BaseTestWrapperStoreMethods
 from .test_google_drive_store import TestGoogleDriveStore
 
 
-__all__ = ['BaseTestStoreMethods', 'TestGoogleDriveStore']
\ No newline at end of file
+__all__ = ['BaseTestStoreMethods', 'BaseTestWrapperStoreMethods', 'TestGoogleDriveStore']
\ No newline at end of file
@@ -0,0 +1,148 @@
+import json
+import asyncio
+import pathlib
+import tempfile
+import unittest
+from exceptions import *
+from benchmarks.fake_servers import FakeServer, FakeResponse, fake_config, connect, connect_async
+from store import async_store, AsyncGoogleDriveStore, AsyncDropboxStore, GoogleDriveStore
+
+
+class BaseTestAsyncStoreMethods:
+
+    @unittest.skipIf(async_store.aiohttp is None, 'aiohttp is not installed')
+    class TestAsyncStoreMethods(unittest.TestCase):
+        # tokens come from the blocking store tests, run those first
+        project_dir = (pathlib.Path(__file__).resolve()).parents[1]
+        store_name = 'test'
+        store_class = None
+        config = None
+
+        @classmethod
+        def setUpClass(cls):
+            with open(cls.project_dir / 'config.json', 'r') as config_file:
+                cls.config = json.loads(config_file.read())
+            cls.config['__project_dir'] = cls.project_dir
+
+        def run_store(self, test):
+            async def run():
+                async with self.store_class(self.config, self.store_name) as store:
+                    try:
+                        await test(store)
+                    finally:
+                        for entry in await store.get_list(pathlib.PurePath('/')):
+                            await store.remove(pathlib.PurePath('/') / entry.name)
+            asyncio.run(run())
+
+        def test_upload_download(self):
+            test_path = pathlib.PurePath('/sample3')
+            with open(self.project_dir / 'tests' / 'samples' / 'sample3', 'rb') as testfile:
+                test_data = testfile.read()
+
+            async def test(store):
+                await store.upload_file(test_path, test_data)
+                self.assertEqual(test_data, await store.download_file(test_path))
+                chunks = [chunk async for chunk in store.download_stream(test_path, 1000, 5000)]
+                self.assertEqual(test_data[1000:6000], b''.join(chunks))
+                with self.assertRaises(DuplicateEntryError):
+                    await store.upload_file(test_path, test_data)
+            self.run_store(test)
+
+        def test_concurrent_uploads(self):
+            test_dir = pathlib.PurePath('/samples')
+
+            async def test(store):
+                await store.make_dir(test_dir.parent, test_dir.name)
+                names = ['file{0}'.format(index) for index in range(20)]
+                await asyncio.gather(*[store.upload_file(test_dir / name, name.encode()) for name in names])
+                entries = await store.get_list(test_dir)
+                self.assertCountEqual(names, [entry.name for entry in entries])
+                await store.remove(test_dir)
+                with self.assertRaises(NoEntryError):
+                    await store.get_list(test_dir)
+            self.run_store(test)
+
+
+class TestAsyncGoogleDriveStore(BaseTestAsyncStoreMethods.TestAsyncStoreMethods):
+    store_class = AsyncGoogleDriveStore
+
+
+class TestAsyncDropboxStore(BaseTestAsyncStoreMethods.TestAsyncStoreMethods):
+    store_class = AsyncDropboxStore
+
+
+@unittest.skipIf(async_store.aiohttp is None, 'aiohttp is not installed')
+class TestAsyncFakeServer(unittest.TestCase):
+    def test_replaced_cached_directory(self):
+        with FakeServer() as shared:
+            config = fake_config(pathlib.Path(tempfile.mkdtemp()), 'shared')
+            second = connect(GoogleDriveStore(config, 'shared'), shared.url)
+
+            async def run():
+                async with connect_async(AsyncGoogleDriveStore(config, 'shared'), shared.url) as first:
+                    await first.make_dir(pathlib.PurePath('/'), 'x')
+                    await first.make_dir(pathlib.PurePath('/x'), 'y')
+                    await first.upload_file(pathlib.PurePath('/x/y/f'), b'old')
+                    self.assertEqual(b'old', await first.download_file(pathlib.PurePath('/x/y/f')))
+                    # another client replaces the directories the first store has cached
+                    second.remove(pathlib.PurePath('/x'))
+                    second.make_dir(pathlib.PurePath('/'), 'x')
+                    second.make_dir(pathlib.PurePath('/x'), 'y')
+                    second.upload_file(pathlib.PurePath('/x/y/g'), b'new')
+                    self.assertEqual(b'new', await first.download_file(pathlib.PurePath('/x/y/g')))
+                    with self.assertRaises(NoEntryError):
+                        await first.download_file(pathlib.PurePath('/x/y/f'))
+            asyncio.run(run())
+
+    def test_multipart_upload_resent(self):
+        with FakeServer(rate_limit=3) as limited:
+            config = fake_config(pathlib.Path(tempfile.mkdtemp()), 'limited')
+            data = bytes(range(256)) * 400
+
+            async def run():
+                async with connect_async(AsyncGoogleDriveStore(config, 'limited'), limited.url) as store:
+                    # throttled uploads send the same body again
+                    await asyncio.gather(*[store.upload_file(pathlib.PurePath('/file{0}'.format(index)), data)
+                                           for index in range(6)])
+                    for index in range(6):
+                        self.assertEqual(data, await store.download_file(pathlib.PurePath('/file{0}'.format(index))))
+            asyncio.run(run())
+            self.assertGreater(limited.account('google-limited').stats()['throttled'], 0)
+
+    def test_single_upload_sent_once(self):
+        with FakeServer() as server:
+            config = fake_config(pathlib.Path(tempfile.mkdtemp()), 'lost')
+            dropbox = server.providers['content.dropboxapi.com']
+            handle = dropbox.handle
+
+            def lose_upload_response(account, request):
+                # the upload goes through but its answer doesn't
+                response = handle(account, request)
+                if request.path == '/2/files/upload':
+                    return FakeResponse(503, b'', 'text/plain')
+                return response
+            dropbox.handle = lose_upload_response
+
+            async def run():
+                async with connect_async(AsyncDropboxStore(config, 'lost'), server.url) as store:
+                    with self.assertRaises(Exception) as raised:
+                        await store.upload_file(pathlib.PurePath('/file'), b'data')
+                    self.assertNotIsInstance(raised.exception, DuplicateEntryError)
+                    self.assertEqual(b'data', await store.download_file(pathlib.PurePath('/file')))
+            asyncio.run(run())
+            requests = server.account('dropbox-lost').stats()['endpoints']
+            self.assertEqual(1, requests['POST content.dropboxapi.com/2/files/upload'])
+
+    def test_full_drive(self):
+        with FakeServer(quota=1000) as limited:
+            config = fake_config(pathlib.Path(tempfile.mkdtemp()), 'full', upload_part_size=256 * 1024)
+
+            async def run():
+                async with connect_async(AsyncGoogleDriveStore(config, 'full'), limited.url) as store:
+                    with self.assertRaises(DiskFullError):
+                        await store.upload_file(pathlib.PurePath('/single'), b'x' * 2000)
+                    # the resumable upload is refused with its last part
+                    with self.assertRaises(DiskFullError):
+                        await store.upload_file(pathlib.PurePath('/resumable'), b'x' * (512 * 1024))
+                    await store.upload_file(pathlib.PurePath('/small'), b'x' * 500)
+            asyncio.run(run())
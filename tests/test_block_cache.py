@@ -0,0 +1,77 @@
+import shutil
+import pathlib
+import tempfile
+import unittest
+from store import BlockCache, CachedStore, StripedStore, DedupStore, InMemoryStore
+
+
+class TestBlockCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = BlockCache(self.directory, max_bytes=30, block_size=10)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.directory)
+
+    def test_put_get(self):
+        self.cache.set_revision('/a', 'rev1', 15)
+        self.cache.put('/a', 0, b'0123456789')
+        self.assertEqual(b'0123456789', self.cache.get('/a', 0))
+        self.assertIsNone(self.cache.get('/a', 1))
+        self.assertEqual(('rev1', 15), self.cache.revision('/a'))
+
+    def test_new_revision_drops_blocks(self):
+        self.cache.set_revision('/a', 'rev1', 15)
+        self.cache.put('/a', 0, b'0123456789')
+        self.cache.set_revision('/a', 'rev2', 15)
+        self.assertIsNone(self.cache.get('/a', 0))
+        self.assertEqual(0, self.cache.total_bytes)
+
+    def test_evict_least_recently_used(self):
+        self.cache.set_revision('/a', 'rev1', 40)
+        for block in range(3):
+            self.cache.put('/a', block, b'x' * 10)
+        self.cache.get('/a', 0)
+        self.cache.put('/a', 3, b'y' * 10)
+        self.assertIsNone(self.cache.get('/a', 1))
+        self.assertEqual(b'x' * 10, self.cache.get('/a', 0))
+        self.assertEqual(30, self.cache.total_bytes)
+
+    def test_drop_tree_and_reopen(self):
+        self.cache.set_revision('/dir/a', 'rev1', 10)
+        self.cache.put('/dir/a', 0, b'a' * 10)
+        self.cache.set_revision('/dir_b', 'rev1', 10)
+        self.cache.put('/dir_b', 0, b'b' * 10)
+        self.cache.drop('/dir')
+        self.assertIsNone(self.cache.get('/dir/a', 0))
+        self.cache.close()
+        self.cache = BlockCache(self.directory, max_bytes=30, block_size=10)
+        self.assertEqual(b'b' * 10, self.cache.get('/dir_b', 0))
+        self.assertEqual(10, self.cache.total_bytes)
+
+
+class TestCachedStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.data = bytes(range(256)) * 1200
+
+    def check_reads(self, wrapped):
+        cached = CachedStore(wrapped, self.directory, block_size=4096)
+        self.addCleanup(cached.cache.close)
+        cached.upload_file(pathlib.PurePath('/file'), self.data)
+        self.assertEqual(self.data, cached.download_file(pathlib.PurePath('/file')))
+        self.assertEqual(self.data[5000:9000], b''.join(cached.download_stream(pathlib.PurePath('/file'), 5000, 4000)))
+        # every block of the file is cached
+        self.assertEqual(len(self.data), cached.cache.total_bytes)
+        self.assertTrue(cached.cache.has('/file', (len(self.data) - 1) // 4096))
+
+    def test_over_striped_store(self):
+        # listings of the striped store give the manifest size, reads go by the file size
+        self.check_reads(StripedStore([InMemoryStore(), InMemoryStore()], chunk_size=10000))
+
+    def test_over_dedup_store(self):
+        self.check_reads(DedupStore(InMemoryStore()))
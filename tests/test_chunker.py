@@ -0,0 +1,42 @@
+import os
+import io
+import unittest
+from store import ContentChunker, chunker
+
+
+class TestContentChunker(unittest.TestCase):
+
+    def setUp(self):
+        self.chunker = ContentChunker(1024, 4096, 16384)
+        self.data = os.urandom(256 * 1024)
+
+    def test_sizes(self):
+        chunks = list(self.chunker.iter_chunks(self.data))
+        self.assertEqual(self.data, b''.join(chunks))
+        for chunk in chunks[:-1]:
+            self.assertTrue(1024 <= len(chunk) <= 16384)
+
+    def test_same_boundaries_for_stream(self):
+        stream = io.BytesIO(self.data)
+        self.assertEqual(list(self.chunker.iter_chunks(self.data)), list(self.chunker.iter_chunks(stream)))
+
+    def test_insert_changes_few_chunks(self):
+        chunks = list(self.chunker.iter_chunks(self.data))
+        changed = self.data[:100000] + b'inserted' + self.data[100000:]
+        changed_chunks = list(self.chunker.iter_chunks(changed))
+        self.assertLessEqual(len(set(changed_chunks) - set(chunks)), 3)
+
+    def test_empty(self):
+        self.assertEqual([], list(self.chunker.iter_chunks(b'')))
+
+    @unittest.skipIf(chunker.numpy is None, 'needs numpy')
+    def test_blocks_match_loop(self):
+        data = self.data + bytes(50000)
+        for sizes in ((1024, 4096, 16384), (64, 64, 64), (100, 1000, 100000)):
+            blocks = [len(chunk) for chunk in ContentChunker(*sizes).iter_chunks(data)]
+            numpy, chunker.numpy = chunker.numpy, None
+            try:
+                looped = [len(chunk) for chunk in ContentChunker(*sizes).iter_chunks(data)]
+            finally:
+                chunker.numpy = numpy
+            self.assertEqual(looped, blocks)
@@ -0,0 +1,68 @@
+import os
+import pathlib
+import unittest
+from tests import BaseTestWrapperStoreMethods
+from store import DedupStore, ContentChunker, DropboxStore, InMemoryStore
+from exceptions import *
+
+
+class TestDedupStore(BaseTestWrapperStoreMethods.TestWrapperStoreMethods):
+    # small chunks so every sample is cut into several
+    store_class = staticmethod(lambda config, name: DedupStore(DropboxStore(config, name),
+                                                               chunker=ContentChunker(1024, 4096, 16384)))
+    wrapped_stores = staticmethod(lambda store: [store.store])
+
+    def test_unchanged_chunks_skipped(self):
+        with open(self.project_dir / 'tests' / 'samples' / 'sample3', 'rb') as testfile:
+            test_data = testfile.read()
+        self.store.upload_file(pathlib.PurePath('/backup1'), test_data)
+        changed = test_data[:5000] + b'changed' + test_data[5000:]
+        uploaded = []
+        store_chunk = self.store.store_chunk
+        self.store.store_chunk = lambda digest, chunk: uploaded.append(store_chunk(digest, chunk))
+        manifest = self.store.upload_file(pathlib.PurePath('/backup2'), changed)
+        self.assertLess(uploaded.count(True), len(manifest['chunks']) // 2)
+        self.assertEqual(changed, self.store.download_file(pathlib.PurePath('/backup2')))
+        self.store.remove(pathlib.PurePath('/backup1'))
+        self.store.collect_garbage()
+        self.assertEqual(changed, self.store.download_file(pathlib.PurePath('/backup2')))
+
+
+class TestDedupInMemory(unittest.TestCase):
+    def setUp(self):
+        self.dedup = DedupStore(InMemoryStore(), chunker=ContentChunker(1024, 4096, 16384))
+        self.data = os.urandom(64 * 1024)
+
+    def test_unchanged_chunks_skipped(self):
+        self.dedup.upload_file(pathlib.PurePath('/backup1'), self.data)
+        changed = self.data[:5000] + b'changed' + self.data[5000:]
+        uploaded = []
+        store_chunk = self.dedup.store_chunk
+        self.dedup.store_chunk = lambda digest, chunk: uploaded.append(store_chunk(digest, chunk))
+        manifest = self.dedup.upload_file(pathlib.PurePath('/backup2'), changed)
+        self.assertLess(uploaded.count(True), len(manifest['chunks']) // 2)
+        self.assertEqual(changed, self.dedup.download_file(pathlib.PurePath('/backup2')))
+
+    def test_collect_garbage(self):
+        for directory in ('a', 'b'):
+            self.dedup.make_dir(pathlib.PurePath('/'), directory)
+        self.dedup.upload_file(pathlib.PurePath('/a/x'), self.data)
+        other = os.urandom(64 * 1024)
+        self.dedup.upload_file(pathlib.PurePath('/b/y'), other)
+        self.dedup.upload_file(pathlib.PurePath('/a/gone'), os.urandom(64 * 1024))
+        self.dedup.remove(pathlib.PurePath('/a/gone'))
+        removed = self.dedup.collect_garbage()
+        self.assertTrue(removed)
+        # chunks of every directory are kept
+        self.assertEqual(self.data, self.dedup.download_file(pathlib.PurePath('/a/x')))
+        self.assertEqual(other, self.dedup.download_file(pathlib.PurePath('/b/y')))
+        self.assertEqual([], self.dedup.collect_garbage())
+
+    def test_get_entry_size(self):
+        data = bytes(range(256)) * 1200
+        self.dedup.upload_file(pathlib.PurePath('/file'), data)
+        # the listing has the size of the manifest, the entry that of the file
+        self.assertLess(self.dedup.get_list(pathlib.PurePath('/'))[0].file_size, len(data))
+        self.assertEqual(len(data), self.dedup.get_entry(pathlib.PurePath('/file')).file_size)
+        with self.assertRaises(NoEntryError):
+            self.dedup.get_entry(self.dedup.chunk_dir)
@@ -0,0 +1,37 @@
+import os
+import itertools
+import unittest
+from store.erasure import ReedSolomon, gf_mul, gf_inv
+
+
+class TestReedSolomon(unittest.TestCase):
+
+    def test_field(self):
+        for value in range(1, 256):
+            self.assertEqual(1, gf_mul(value, gf_inv(value)))
+
+    def test_encode_systematic(self):
+        data = os.urandom(1000)
+        shards = ReedSolomon(4, 2).encode(data)
+        self.assertEqual(6, len(shards))
+        self.assertTrue(all(len(shard) == 250 for shard in shards))
+        self.assertEqual(data, b''.join(shards[:4]))
+
+    def test_decode_any_shards(self):
+        codec = ReedSolomon(4, 3)
+        data = os.urandom(1001)
+        shards = codec.encode(data)
+        for indexes in itertools.combinations(range(7), 4):
+            available = {index: shards[index] for index in indexes}
+            self.assertEqual(data, codec.decode(available, len(data)))
+
+    def test_decode_missing_shards(self):
+        codec = ReedSolomon(3, 1)
+        shards = codec.encode(b'abc')
+        with self.assertRaises(ValueError):
+            codec.decode({0: shards[0], 3: shards[3]}, 3)
+
+    def test_empty(self):
+        codec = ReedSolomon(2, 1)
+        shards = codec.encode(b'')
+        self.assertEqual(b'', codec.decode({1: shards[1], 2: shards[2]}, 0))
@@ -0,0 +1,244 @@
+import json
+import pathlib
+import tempfile
+import unittest
+from tests import BaseTestStoreMethods
+from benchmarks.fake_servers import FakeServer, RedirectAdapter, fake_config, connect
+from store import DropboxStore, GoogleDriveStore
+from exceptions import *
+
+
+server = None
+
+
+def setUpModule():
+    global server
+    server = FakeServer().start()
+
+
+def tearDownModule():
+    server.stop()
+
+
+def fake_store(store_class):
+    # stores built by the tests, including test_save_token, talk to the fake server
+    return lambda config, name: connect(store_class(config, name), server.url)
+
+
+class FakeServerStoreMethods:
+
+    class TestStoreMethods(BaseTestStoreMethods.TestStoreMethods):
+        # the store tests without accounts, against benchmarks.fake_servers
+
+        @classmethod
+        def setUpClass(cls):
+            cls.config = fake_config(pathlib.Path(tempfile.mkdtemp()), cls.store_name)
+
+        def setUp(self):
+            self.store = self.store_class(self.config, self.store_name)
+
+        def tearDown(self):
+            test_dir = pathlib.PurePath('/')
+            for entry in self.store.get_list(test_dir):
+                self.store.remove(test_dir / entry.name)
+            del self.store
+
+
+class TestFakeDropboxStore(FakeServerStoreMethods.TestStoreMethods):
+    store_class = staticmethod(fake_store(DropboxStore))
+    store_name = 'fake_dropbox'
+
+
+class TestFakeGoogleDriveStore(FakeServerStoreMethods.TestStoreMethods):
+    store_class = staticmethod(fake_store(GoogleDriveStore))
+    store_name = 'fake_google'
+
+
+class ShiftedOffsetAdapter(RedirectAdapter):
+    # the fake never sees the offset sent to append, so it keeps answering the same correct one
+    def send(self, request, **kwargs):
+        if request.url.endswith('/append_v2'):
+            arg = json.loads(request.headers['Dropbox-API-Arg'])
+            arg['cursor']['offset'] += 1
+            request.headers['Dropbox-API-Arg'] = json.dumps(arg)
+        return super().send(request, **kwargs)
+
+
+class TestFakeServerLimits(unittest.TestCase):
+    def test_throttled_requests_retried(self):
+        with FakeServer(rate_limit=5) as limited:
+            config = fake_config(pathlib.Path(tempfile.mkdtemp()), 'limited')
+            for store_class in (DropboxStore, GoogleDriveStore):
+                store = connect(store_class(config, 'limited'), limited.url)
+                store.make_dir(pathlib.PurePath('/'), 'limited')
+                items = [(pathlib.PurePath('/limited/file{0}'.format(index)), b'data') for index in range(12)]
+                results = store.upload_many(items, max_workers=4)
+                self.assertTrue(all(result.ok for result in results))
+                self.assertEqual(12, len(store.get_list(pathlib.PurePath('/limited'))))
+            self.assertGreater(limited.account('dropbox-limited').stats()['throttled'], 0)
+            self.assertGreater(limited.account('google-limited').stats()['throttled'], 0)
+
+    def test_throttled_after_retries(self):
+        with FakeServer(rate_limit=2) as limited:
+            config = fake_config(pathlib.Path(tempfile.mkdtemp()), 'exhausted')
+            for store_class in (DropboxStore, GoogleDriveStore):
+                store = connect(store_class(config, 'exhausted'), limited.url)
+                store.session.scheduler.max_retries = 0
+                with self.assertRaises(Exception) as raised:
+                    for index in range(10):
+                        store.get_list(pathlib.PurePath('/'))
+                self.assertIn('rate limited', str(raised.exception))
+
+    def test_request_accounting(self):
+        with FakeServer() as counting:
+            config = fake_config(pathlib.Path(tempfile.mkdtemp()), 'counting')
+            store = connect(DropboxStore(config, 'counting'), counting.url)
+            store.upload_file(pathlib.PurePath('/file'), b'x' * 1000)
+            self.assertEqual(b'x' * 1000, store.download_file(pathlib.PurePath('/file')))
+            stats = counting.account('dropbox-counting').stats()
+            self.assertEqual(2, stats['requests'])
+            self.assertEqual(1000, stats['bytes_in'])
+            self.assertGreaterEqual(stats['bytes_out'], 1000)
+
+    def test_iter_list_pages(self):
+        with FakeServer(page_size=10) as paged:
+            config = fake_config(pathlib.Path(tempfile.mkdtemp()), 'paged')
+            for store_class, account in ((DropboxStore, 'dropbox-paged'), (GoogleDriveStore, 'google-paged')):
+                store = connect(store_class(config, 'paged'), paged.url)
+                store.make_dir(pathlib.PurePath('/'), 'paged')
+                items = [(pathlib.PurePath('/paged/file{0:02d}'.format(index)), b'data') for index in range(25)]
+                self.assertTrue(all(result.ok for result in store.upload_many(items)))
+                sent = paged.account(account).stats()['requests']
+                entries = store.iter_list(pathlib.PurePath('/paged'))
+                first = next(entries)
+                # the first entry arrives with the first page
+                self.assertLessEqual(paged.account(account).stats()['requests'] - sent, 2)
+                names = sorted([first.name] + [entry.name for entry in entries])
+                self.assertEqual(['file{0:02d}'.format(index) for index in range(25)], names)
+                entry = store.get_entry(pathlib.PurePath('/paged/file00'))
+                self.assertEqual(4, entry.file_size)
+                self.assertIsNotNone(entry.file_id)
+                self.assertIsNotNone(entry.modified)
+                self.assertIsNotNone(entry.content_hash)
+
+    def test_copy_without_data(self):
+        with FakeServer() as relocating:
+            config = fake_config(pathlib.Path(tempfile.mkdtemp()), 'relocating')
+            for store_class, account in ((DropboxStore, 'dropbox-relocating'), (GoogleDriveStore, 'google-relocating')):
+                store = connect(store_class(config, 'relocating'), relocating.url)
+                store.make_dir(pathlib.PurePath('/'), 'from')
+                store.make_dir(pathlib.PurePath('/'), 'to')
+                items = [(pathlib.PurePath('/from/file{0}'.format(index)), b'x' * 100000) for index in range(20)]
+                self.assertTrue(all(result.ok for result in store.upload_many(items)))
+                before = relocating.account(account).stats()
+                pairs = [(path, pathlib.PurePath('/to') / path.name) for path, data in items]
+                self.assertTrue(all(result.ok for result in store.copy_batch(pairs)))
+                self.assertTrue(all(result.ok for result in store.move_batch(
+                    [(destination, destination.with_name('moved' + destination.name)) for source, destination in pairs])))
+                store.copy(pathlib.PurePath('/from'), pathlib.PurePath('/copy'))
+                after = relocating.account(account).stats()
+                # 2MB of files were copied twice and moved once, none of it went either way
+                self.assertLess(after['bytes_in'] - before['bytes_in'], 100000)
+                self.assertLess(after['bytes_out'] - before['bytes_out'], 100000)
+                self.assertLess(after['requests'] - before['requests'], 40)
+                self.assertEqual(20, len(store.get_list(pathlib.PurePath('/copy'))))
+                self.assertEqual(['movedfile{0}'.format(index) for index in range(20)],
+                                 sorted((entry.name for entry in store.get_list(pathlib.PurePath('/to'))),
+                                        key=lambda name: int(name[9:])))
+
+    def test_transfer_between_stores(self):
+        with FakeServer() as transferring:
+            config = fake_config(pathlib.Path(tempfile.mkdtemp()), 'transferring')
+            source = connect(DropboxStore(config, 'transferring'), transferring.url)
+            destination = connect(GoogleDriveStore(config, 'transferring'), transferring.url)
+            # several parts each way, the upload takes them while the download still runs
+            source.download_chunk_size = 64 * 1024
+            destination.upload_part_size = 256 * 1024
+            data = bytes(range(256)) * 4000
+            source.upload_file(pathlib.PurePath('/big'), data)
+            destination.make_dir(pathlib.PurePath('/'), 'copies')
+            source.transfer_file(pathlib.PurePath('/big'), destination, pathlib.PurePath('/copies/big'))
+            # nothing came back from the destination
+            self.assertLess(transferring.account('google-transferring').stats()['bytes_out'], 100000)
+            self.assertEqual(data, destination.download_file(pathlib.PurePath('/copies/big')))
+            items = [(pathlib.PurePath('/file{0}'.format(index)), data[:index * 1000]) for index in range(1, 4)]
+            self.assertTrue(all(result.ok for result in source.upload_many(items)))
+            pairs = [(path, pathlib.PurePath('/copies') / path.name) for path, content in items]
+            pairs.append((pathlib.PurePath('/missing'), pathlib.PurePath('/copies/missing')))
+            pairs.append((pathlib.PurePath('/big'), pathlib.PurePath('/copies/big')))
+            results = source.transfer_many(pairs, destination)
+            self.assertEqual([path for source_path, path in pairs], [result.path for result in results])
+            self.assertTrue(all(result.ok for result in results[:3]))
+            self.assertIsInstance(results[3].error, NoEntryError)
+            self.assertIsInstance(results[4].error, DuplicateEntryError)
+            for path, content in items:
+                self.assertEqual(content, destination.download_file(pathlib.PurePath('/copies') / path.name))
+
+    def test_repeated_offset_gives_up(self):
+        with FakeServer() as stuck:
+            config = fake_config(pathlib.Path(tempfile.mkdtemp()), 'stuck', upload_part_size=1000)
+            store = DropboxStore(config, 'stuck')
+            store.session.mount('https://', ShiftedOffsetAdapter(stuck.url))
+            with self.assertRaises(Exception) as raised:
+                store.upload_file(pathlib.PurePath('/file'), b'x' * 5000)
+            self.assertIn('part retries exhausted', str(raised.exception))
+            self.assertLess(stuck.account('dropbox-stuck').stats()['requests'], 10)
+
+    def test_replaced_cached_directory(self):
+        with FakeServer() as shared:
+            config = fake_config(pathlib.Path(tempfile.mkdtemp()), 'shared')
+            first = connect(GoogleDriveStore(config, 'shared'), shared.url)
+            second = connect(GoogleDriveStore(config, 'shared'), shared.url)
+            first.make_dir(pathlib.PurePath('/'), 'x')
+            first.make_dir(pathlib.PurePath('/x'), 'y')
+            first.upload_file(pathlib.PurePath('/x/y/f'), b'old')
+            self.assertEqual(b'old', first.download_file(pathlib.PurePath('/x/y/f')))
+            # another client replaces the directories the first store has cached
+            second.remove(pathlib.PurePath('/x'))
+            second.make_dir(pathlib.PurePath('/'), 'x')
+            second.make_dir(pathlib.PurePath('/x'), 'y')
+            second.upload_file(pathlib.PurePath('/x/y/g'), b'new')
+            self.assertEqual(b'new', first.download_file(pathlib.PurePath('/x/y/g')))
+            with self.assertRaises(NoEntryError):
+                first.download_file(pathlib.PurePath('/x/y/f'))
+
+    def test_batch_lookup_in_cached_directories(self):
+        with FakeServer() as shared:
+            config = fake_config(pathlib.Path(tempfile.mkdtemp()), 'shared')
+            first = connect(GoogleDriveStore(config, 'shared'), shared.url)
+            second = connect(GoogleDriveStore(config, 'shared'), shared.url)
+            for parent, name in (('/', 'a'), ('/a', 'b'), ('/', 'x'), ('/x', 'y')):
+                first.make_dir(pathlib.PurePath(parent), name)
+            first.upload_file(pathlib.PurePath('/a/b/sibling'), b'data')
+            first.upload_file(pathlib.PurePath('/x/y/f'), b'old')
+            # another client replaces one of the directories the first store has cached
+            second.remove(pathlib.PurePath('/x'))
+            second.make_dir(pathlib.PurePath('/'), 'x')
+            second.make_dir(pathlib.PurePath('/x'), 'y')
+            second.upload_file(pathlib.PurePath('/x/y/g'), b'new')
+            before = shared.account('google-shared').stats()['batched']
+            results = first.remove_batch([pathlib.PurePath('/a/b/missing'), pathlib.PurePath('/x/y/g')])
+            self.assertIsInstance(results[0].error, NoEntryError)
+            self.assertTrue(results[1].ok)
+            batched = shared.account('google-shared').stats()['batched']
+            sent = {endpoint: count - before.get(endpoint, 0) for endpoint, count in batched.items()}
+            # one metadata call per cached parent, only the stale one is searched again from the root
+            self.assertEqual(2, sent['GET www.googleapis.com/drive/v3/files/<id>'])
+            self.assertEqual(5, sent['GET www.googleapis.com/drive/v3/files'])
+
+    def test_missing_file_in_cached_directory(self):
+        with FakeServer() as probed:
+            config = fake_config(pathlib.Path(tempfile.mkdtemp()), 'probed')
+            store = connect(GoogleDriveStore(config, 'probed'), probed.url)
+            store.make_dir(pathlib.PurePath('/'), 'a')
+            store.make_dir(pathlib.PurePath('/a'), 'b')
+            store.make_dir(pathlib.PurePath('/a/b'), 'c')
+            store.upload_file(pathlib.PurePath('/a/b/c/sibling'), b'data')
+            sent = probed.account('google-probed').stats()['requests']
+            with self.assertRaises(NoEntryError):
+                store.get_entry(pathlib.PurePath('/a/b/c/missing'))
+            # the search and one metadata call that finds the cached parent still there
+            self.assertEqual(2, probed.account('google-probed').stats()['requests'] - sent)
+            sent = probed.account('google-probed').stats()['requests']
+            self.assertEqual(4, store.get_entry(pathlib.PurePath('/a/b/c/sibling')).file_size)
+            self.assertEqual(1, probed.account('google-probed').stats()['requests'] - sent)
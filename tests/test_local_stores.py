@@ -0,0 +1,159 @@
+import time
+import pathlib
+import tempfile
+import unittest
+from tests import BaseTestStoreMethods
+from store import InMemoryStore, LocalDiskStore, TieredStore
+from exceptions import *
+
+
+class LocalStoreMethods:
+
+    class TestStoreMethods(BaseTestStoreMethods.TestStoreMethods):
+        # the store tests against stores that need no account
+
+        @classmethod
+        def setUpClass(cls):
+            cls.config = {}
+
+        def setUp(self):
+            # stores on disk get a directory of their own, removed after the test
+            temporary = tempfile.TemporaryDirectory()
+            self.addCleanup(temporary.cleanup)
+            self.config = {'__project_dir': pathlib.Path(temporary.name)}
+            self.store = self.store_class(self.config, self.store_name)
+
+        def tearDown(self):
+            test_dir = pathlib.PurePath('/')
+            for entry in self.store.get_list(test_dir):
+                self.store.remove(test_dir / entry.name)
+            del self.store
+
+
+class TestInMemoryStore(LocalStoreMethods.TestStoreMethods):
+    store_class = staticmethod(lambda config, name: InMemoryStore())
+
+
+class TestLocalDiskStore(LocalStoreMethods.TestStoreMethods):
+    store_class = staticmethod(lambda config, name: LocalDiskStore(config['__project_dir']))
+
+
+class TestTieredStore(LocalStoreMethods.TestStoreMethods):
+    store_class = staticmethod(lambda config, name: TieredStore(LocalDiskStore(config['__project_dir']), InMemoryStore(),
+                                                                interval=None))
+
+    def test_demote_cold(self):
+        fast = InMemoryStore()
+        slow = InMemoryStore()
+        store = TieredStore(fast, slow, cold_after=0, interval=None)
+        store.make_dir(pathlib.PurePath('/'), 'data')
+        items = [(pathlib.PurePath('/data/file{0}'.format(index)), b'x' * 1000 * index) for index in range(1, 4)]
+        self.assertTrue(all(result.ok for result in store.upload_many(items)))
+        results = store.demote_cold()
+        self.assertEqual([path for path, data in items], [result.path for result in results])
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual([], fast.get_list(pathlib.PurePath('/data')))
+        for path, data in items:
+            self.assertEqual(data, slow.download_file(path))
+            self.assertEqual(data, store.download_file(path))
+            self.assertEqual(len(data), store.file_size(path))
+        self.assertCountEqual(['file1', 'file2', 'file3'],
+                              [entry.name for entry in store.get_list(pathlib.PurePath('/data'))])
+        # names in the slow store stay taken
+        with self.assertRaises(DuplicateEntryError):
+            store.upload_file(items[0][0], b'other')
+        store.remove(items[0][0])
+        with self.assertRaises(NoEntryError):
+            slow.download_file(items[0][0])
+        store.upload_file(items[0][0], b'other')
+        self.assertEqual(b'other', fast.download_file(items[0][0]))
+        store.remove(pathlib.PurePath('/data'))
+        with self.assertRaises(NoEntryError):
+            store.get_list(pathlib.PurePath('/data'))
+        self.assertEqual([], slow.get_list(pathlib.PurePath('/')))
+
+    def test_demote_least_recently_used(self):
+        fast = InMemoryStore()
+        slow = InMemoryStore()
+        store = TieredStore(fast, slow, max_fast_bytes=2500, interval=None)
+        for name in ('a', 'b', 'c'):
+            store.upload_file(pathlib.PurePath('/') / name, b'x' * 1000)
+        store.download_file(pathlib.PurePath('/a'))
+        self.assertEqual(['/b'], [result.path.as_posix() for result in store.demote_cold()])
+        self.assertCountEqual(['a', 'c'], [entry.name for entry in fast.get_list(pathlib.PurePath('/'))])
+        self.assertEqual(['b'], [entry.name for entry in slow.get_list(pathlib.PurePath('/'))])
+        # nothing is cold and the fast store is below max_fast_bytes
+        self.assertEqual([], store.demote_cold())
+
+    def test_directories_of_slow_store(self):
+        # a new tiered store over a slow store written before
+        slow = InMemoryStore()
+        slow.make_dir(pathlib.PurePath('/'), 'old')
+        slow.upload_file(pathlib.PurePath('/old/file'), b'old')
+        store = TieredStore(InMemoryStore(), slow, interval=None)
+        with self.assertRaises(DuplicateEntryError):
+            store.make_dir(pathlib.PurePath('/'), 'old')
+        with self.assertRaises(DuplicateEntryError):
+            store.upload_file(pathlib.PurePath('/old/file'), b'new')
+        store.upload_file(pathlib.PurePath('/old/new'), b'new')
+        self.assertCountEqual(['file', 'new'], [entry.name for entry in store.get_list(pathlib.PurePath('/old'))])
+        self.assertEqual(b'old', store.download_file(pathlib.PurePath('/old/file')))
+
+    def test_slow_names_bounded(self):
+        slow = InMemoryStore()
+        store = TieredStore(InMemoryStore(), slow, cold_after=0, interval=None)
+        self.addCleanup(setattr, TieredStore, 'max_cached_dirs', TieredStore.max_cached_dirs)
+        TieredStore.max_cached_dirs = 2
+        for index in range(4):
+            store.make_dir(pathlib.PurePath('/'), 'dir{0}'.format(index))
+            store.upload_file(pathlib.PurePath('/dir{0}/file'.format(index)), b'data')
+        self.assertTrue(all(result.ok for result in store.demote_cold()))
+        # names of the directories dropped from the cache are listed again
+        for index in range(4):
+            with self.assertRaises(DuplicateEntryError):
+                store.upload_file(pathlib.PurePath('/dir{0}/file'.format(index)), b'other')
+
+    def test_background_demotion(self):
+        fast = LocalDiskStore(self.config['__project_dir'])
+        fast.upload_file(pathlib.PurePath('/kept'), b'kept')
+        slow = InMemoryStore()
+        store = TieredStore(fast, slow, cold_after=0.2, interval=0.05)
+        try:
+            store.upload_file(pathlib.PurePath('/new'), b'new')
+            deadline = time.monotonic() + 5
+            while fast.get_list(pathlib.PurePath('/')) and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            store.close()
+        self.assertEqual([], fast.get_list(pathlib.PurePath('/')))
+        self.assertEqual(b'kept', store.download_file(pathlib.PurePath('/kept')))
+        self.assertEqual(b'new', slow.download_file(pathlib.PurePath('/new')))
+
+
+class TestLocalStoreLimits(unittest.TestCase):
+    def test_memory_full(self):
+        store = InMemoryStore(max_bytes=1000)
+        store.upload_file(pathlib.PurePath('/a'), b'x' * 600)
+        with self.assertRaises(DiskFullError):
+            store.upload_file(pathlib.PurePath('/b'), b'x' * 600)
+        with self.assertRaises(DiskFullError):
+            store.copy(pathlib.PurePath('/a'), pathlib.PurePath('/b'))
+        store.remove(pathlib.PurePath('/a'))
+        store.upload_file(pathlib.PurePath('/b'), b'x' * 600)
+        self.assertEqual((600, 1000), store.space_usage())
+
+    def test_partial_upload_hidden(self):
+        temporary = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary.cleanup)
+        store = LocalDiskStore(temporary.name)
+
+        def parts():
+            yield b'first'
+            # written but not linked yet
+            self.assertEqual([], store.get_list(pathlib.PurePath('/')))
+            yield b'second'
+        store.upload_file(pathlib.PurePath('/file'), parts())
+        self.assertEqual(['file'], [entry.name for entry in store.get_list(pathlib.PurePath('/'))])
+        self.assertEqual(b'firstsecond', store.download_file(pathlib.PurePath('/file')))
+        with self.assertRaises(NoEntryError):
+            store.upload_file(pathlib.PurePath('/../outside'), b'data')
@@ -0,0 +1,147 @@
+import sqlite3
+import pathlib
+import tempfile
+import unittest
+from pathlib import PurePath
+from benchmarks.fake_servers import FakeServer, fake_config, connect
+from store import Change, DirectoryEntry, IndexedStore, DropboxStore, GoogleDriveStore
+from store.metadata_index import MetadataIndex
+from exceptions import *
+
+
+def folder(name):
+    return DirectoryEntry(name, is_directory=True)
+
+
+def file(name, size):
+    return DirectoryEntry(name, file_size=size)
+
+
+class TestMetadataIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = MetadataIndex(':memory:')
+        self.index.reset([
+            Change(PurePath('/a'), folder('a'), 'id_a'),
+            # children may be listed before their parent
+            Change(entry=file('c', 3), file_id='id_c', parent_id='id_b'),
+            Change(entry=folder('b'), file_id='id_b', parent_id='id_a'),
+            Change(PurePath('/d'), file('d', 1), 'id_d')
+        ], 'cursor1')
+
+    def test_list(self):
+        self.assertEqual(['a', 'd'], [entry.name for entry in self.index.list(PurePath('/'))])
+        entries = self.index.list(PurePath('/a/b'))
+        self.assertEqual([('c', False, 3)], [(entry.name, entry.is_dir, entry.file_size) for entry in entries])
+        self.assertEqual('cursor1', self.index.cursor)
+        self.assertEqual('id_c', self.index.file_id(PurePath('/a/b/c')))
+        with self.assertRaises(NoEntryError):
+            self.index.list(PurePath('/x'))
+
+    def test_remove_drops_descendants(self):
+        self.index.apply([Change(file_id='id_a')], 'cursor2')
+        self.assertEqual(['d'], [entry.name for entry in self.index.list(PurePath('/'))])
+        self.assertIsNone(self.index.get(PurePath('/a/b/c')))
+        self.assertEqual(1, len(self.index))
+        self.assertEqual('cursor2', self.index.cursor)
+
+    def test_move_directory(self):
+        self.index.apply([Change(entry=folder('e'), file_id='id_b', parent_id='id_d')])
+        self.assertEqual('id_c', self.index.file_id(PurePath('/d/e/c')))
+        self.assertEqual([], self.index.list(PurePath('/a')))
+        self.assertEqual('cursor1', self.index.cursor)
+
+    def test_unknown_parent_keeps_cursor(self):
+        with self.assertRaises(CursorResetError):
+            self.index.apply([Change(file_id='id_d'),
+                              Change(entry=file('x', 1), file_id='id_x', parent_id='id_missed')], 'cursor2')
+        # nothing of the delta is kept, the next sync starts over
+        self.assertEqual('cursor1', self.index.cursor)
+        self.assertEqual(1, self.index.get(PurePath('/d')).file_size)
+
+    def test_local_write_gets_id(self):
+        self.index.apply([Change(PurePath('/a/new'), file('new', 0))])
+        self.assertIsNone(self.index.file_id(PurePath('/a/new')))
+        self.index.apply([Change(entry=file('new', 5), file_id='id_new', parent_id='id_a')])
+        self.assertEqual('id_new', self.index.file_id(PurePath('/a/new')))
+        self.assertEqual(5, self.index.get(PurePath('/a/new')).file_size)
+        self.assertEqual(5, len(self.index))
+
+    def test_case_insensitive(self):
+        index = MetadataIndex(':memory:', case_sensitive=False)
+        index.apply([Change(PurePath('/Dir'), folder('Dir'), 'id_dir')])
+        self.assertEqual('id_dir', index.file_id(PurePath('/dir')))
+        self.assertIsNone(self.index.get(PurePath('/A')))
+
+    def test_versions_kept(self):
+        entry = DirectoryEntry('v', file_size=2, content_hash='hash1', revision='rev1', modified='2020-01-01T00:00:00Z')
+        self.index.apply([Change(PurePath('/a/v'), entry, 'id_v')])
+        kept = self.index.get(PurePath('/a/v'))
+        self.assertEqual(('hash1', 'rev1', '2020-01-01T00:00:00Z'), (kept.content_hash, kept.revision, kept.modified))
+        self.index.apply([Change(PurePath('/a/v'), DirectoryEntry('v', file_size=2, content_hash='hash2',
+                                                                  revision='rev2'), 'id_v')])
+        kept = self.index.list(PurePath('/a'))[1]
+        self.assertEqual(('hash2', 'rev2', None), (kept.content_hash, kept.revision, kept.modified))
+
+    def test_older_index_is_listed_again(self):
+        path = pathlib.Path(tempfile.mkdtemp()) / 'index.db'
+        db = sqlite3.connect(str(path))
+        with db:
+            db.executescript('''
+                CREATE TABLE entries (row INTEGER PRIMARY KEY, parent INTEGER, name TEXT, file_id TEXT,
+                                      is_dir INTEGER, is_chunk INTEGER, size INTEGER, UNIQUE (parent, name));
+                CREATE TABLE state (key TEXT PRIMARY KEY, value TEXT);
+                INSERT INTO entries VALUES (0, NULL, '', NULL, 1, 0, 0), (1, 0, 'f', 'id_f', 0, 0, 3);
+                INSERT INTO state VALUES ('cursor', 'old');
+            ''')
+        db.close()
+        index = MetadataIndex(path)
+        self.assertIsNone(index.cursor)
+        self.assertEqual(3, index.get(PurePath('/f')).file_size)
+        index.close()
+
+
+class TestIndexedStore(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.work_dir = pathlib.Path(tempfile.mkdtemp())
+        self.config = fake_config(self.work_dir, 'indexed')
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_entries_carry_versions(self):
+        for store_class in (DropboxStore, GoogleDriveStore):
+            plain = connect(store_class(self.config, 'indexed'), self.server.url)
+            plain.upload_file(PurePath('/{0}'.format(store_class.__name__)), b'first')
+            store = IndexedStore(plain, self.work_dir / '{0}.db'.format(store_class.__name__), max_age=0)
+            listed = [entry for entry in store.get_list(PurePath('/')) if entry.name == store_class.__name__][0]
+            direct = plain.get_entry(PurePath('/{0}'.format(store_class.__name__)))
+            self.assertEqual((direct.content_hash, direct.revision), (listed.content_hash, listed.revision))
+            self.assertIsNotNone(listed.revision)
+            # a new version is told apart
+            plain.remove(PurePath('/{0}'.format(store_class.__name__)))
+            plain.upload_file(PurePath('/{0}'.format(store_class.__name__)), b'second')
+            changed = store.get_entry(PurePath('/{0}'.format(store_class.__name__)))
+            self.assertNotEqual(listed.revision, changed.revision)
+            self.assertEqual(plain.content_hash(b'second'), changed.content_hash)
+            store.index.close()
+
+    def test_missed_parent_resets(self):
+        plain = connect(GoogleDriveStore(self.config, 'indexed'), self.server.url)
+        store = IndexedStore(plain, self.work_dir / 'missed.db', max_age=0)
+        store.get_list(PurePath('/'))
+        plain.make_dir(PurePath('/'), 'dir')
+        plain.upload_file(PurePath('/dir/file'), b'data')
+        list_changes = plain.list_changes
+
+        def lose_parent(cursor=None):
+            # the delta misses the directory the file went to
+            changes, next_cursor = list_changes(cursor)
+            if cursor is not None:
+                changes = [change for change in changes if change.entry is None or not change.entry.is_dir]
+            return changes, next_cursor
+        store.list_changes = plain.list_changes = lose_parent
+        self.assertEqual(['dir'], [entry.name for entry in store.get_list(PurePath('/'))])
+        self.assertEqual(4, store.get_entry(PurePath('/dir/file')).file_size)
+        store.index.close()
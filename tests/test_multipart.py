@@ -0,0 +1,50 @@
+import unittest
+from store.multipart import MultipartRelatedEncoder, encode_batch, parse_batch_response
+
+
+class TestMultipartRelatedEncoder(unittest.TestCase):
+
+    def test_body(self):
+        data = bytes(range(256)) * 1000
+        encoder = MultipartRelatedEncoder([('application/json', b'{}'), ('application/octet-stream', data)],
+                                          boundary='sep')
+        expected = (b'--sep\r\nContent-Type: application/json\r\n\r\n{}\r\n'
+                    b'--sep\r\nContent-Type: application/octet-stream\r\n\r\n' + data + b'\r\n'
+                    b'--sep--\r\n')
+        body = b''.join(encoder)
+        self.assertEqual(expected, body)
+        self.assertEqual(len(expected), len(encoder))
+        self.assertEqual('multipart/related; boundary=sep', encoder.content_type)
+
+    def test_iterate_views(self):
+        data = bytearray(200 * 1024)
+        encoder = MultipartRelatedEncoder([('application/octet-stream', data)])
+        chunks = list(encoder)
+        self.assertTrue(all(isinstance(chunk, memoryview) for chunk in chunks))
+        self.assertTrue(all(len(chunk) <= encoder.block_size for chunk in chunks))
+        # iterating again gives the same body
+        self.assertEqual(b''.join(chunks), b''.join(encoder))
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_encode_batch(self):
+        body = encode_batch([('DELETE', '/drive/v3/files/a', None), ('POST', '/drive/v3/files', {'name': 'b'})],
+                            'sep')
+        expected = ('--sep\r\nContent-Type: application/http\r\nContent-ID: <item0>\r\n\r\n'
+                    'DELETE /drive/v3/files/a HTTP/1.1\r\n\r\n\r\n'
+                    '--sep\r\nContent-Type: application/http\r\nContent-ID: <item1>\r\n\r\n'
+                    'POST /drive/v3/files HTTP/1.1\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n'
+                    '{"name": "b"}\r\n'
+                    '--sep--\r\n')
+        self.assertEqual(expected.encode(), body)
+
+    def test_parse_batch_response(self):
+        body = ('--batch_x\r\nContent-Type: application/http\r\nContent-ID: <response-item1>\r\n\r\n'
+                'HTTP/1.1 200 OK\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n'
+                '{"id": "b"}\r\n'
+                '--batch_x\r\nContent-Type: application/http\r\nContent-ID: <response-item0>\r\n\r\n'
+                'HTTP/1.1 204 No Content\r\n\r\n\r\n'
+                '--batch_x--\r\n')
+        results = parse_batch_response('multipart/mixed; boundary=batch_x', body.encode(), 2)
+        self.assertEqual([(204, None), (200, {'id': 'b'})], results)
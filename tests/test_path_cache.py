@@ -0,0 +1,58 @@
+import unittest
+from store.path_cache import PathCache
+
+
+class TestPathCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = PathCache(max_entries=4)
+
+    def test_lookup_deepest_prefix(self):
+        self.cache.put(('a',), 'id_a')
+        self.cache.put(('a', 'b'), 'id_b')
+        self.assertEqual((2, 'id_b'), self.cache.lookup(('a', 'b', 'c', 'd')))
+        self.assertEqual((0, None), self.cache.lookup(('x', 'b')))
+        self.assertEqual('id_a', self.cache.get(('a',)))
+        self.assertIsNone(self.cache.get(('a', 'b', 'c')))
+
+    def test_put_without_parent(self):
+        self.cache.put(('a', 'b'), 'id_b')
+        self.assertNotIn(('a', 'b'), self.cache)
+        self.assertEqual(0, len(self.cache))
+
+    def test_invalidate_drops_descendants(self):
+        self.cache.put(('a',), 'id_a')
+        self.cache.put(('a', 'b'), 'id_b')
+        self.cache.put(('a', 'b', 'c'), 'id_c')
+        self.cache.invalidate(('a', 'b'))
+        self.assertEqual((1, 'id_a'), self.cache.lookup(('a', 'b', 'c')))
+        self.assertEqual(1, len(self.cache))
+
+    def test_changed_id_drops_descendants(self):
+        self.cache.put(('a',), 'id_a')
+        self.cache.put(('a', 'b'), 'id_b')
+        self.cache.put(('a',), 'id_a2')
+        self.assertEqual((1, 'id_a2'), self.cache.lookup(('a', 'b')))
+
+    def test_evict_least_recently_used(self):
+        self.cache.put(('a',), 'id_a')
+        self.cache.put(('b',), 'id_b')
+        self.cache.put(('c',), 'id_c')
+        self.cache.put(('d',), 'id_d')
+        # touch a so b becomes the oldest
+        self.cache.lookup(('a',))
+        self.cache.put(('e',), 'id_e')
+        self.assertNotIn(('b',), self.cache)
+        self.assertIn(('a',), self.cache)
+        self.assertEqual(4, len(self.cache))
+
+    def test_evict_subtree(self):
+        self.cache.put(('a',), 'id_a')
+        self.cache.put(('a', 'b'), 'id_b')
+        self.cache.put(('c',), 'id_c')
+        self.cache.put(('d',), 'id_d')
+        # a is older than a/b, evicting it takes a/b as well
+        self.cache.put(('e',), 'id_e')
+        self.assertNotIn(('a',), self.cache)
+        self.assertNotIn(('a', 'b'), self.cache)
+        self.assertEqual(3, len(self.cache))
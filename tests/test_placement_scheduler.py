@@ -0,0 +1,110 @@
+import time
+import json
+import pathlib
+import tempfile
+import unittest
+from benchmarks.fake_servers import FakeServer, fake_config, connect
+from store import PlacementScheduler, StripedStore, RedundantStore, InMemoryStore, DropboxStore, GoogleDriveStore
+from exceptions import *
+
+
+class SlowMemoryStore(InMemoryStore):
+    # a drive that takes delay seconds per upload
+    def __init__(self, delay, max_bytes=None):
+        super().__init__(max_bytes)
+        self.delay = delay
+
+    def upload_file(self, path, data, is_chunk=False):
+        time.sleep(self.delay)
+        return super().upload_file(path, data, is_chunk)
+
+
+class SilentMemoryStore(InMemoryStore):
+    # a full drive that doesn't report its space
+    def space_usage(self):
+        raise Exception('space usage fail : reason = not supported')
+
+
+def chunk_stores(store, path):
+    return [record['store'] for record in json.loads(store.stores[0].download_file(path).decode())['chunks']]
+
+
+class TestPlacementScheduler(unittest.TestCase):
+    def test_faster_store_gets_more(self):
+        stores = [SlowMemoryStore(0.05), SlowMemoryStore(0.005)]
+        striped = StripedStore(stores, chunk_size=1000, max_workers=4, scheduler=PlacementScheduler(stores))
+        data = bytes(range(256)) * 200
+        striped.upload_file(pathlib.PurePath('/file'), data)
+        placed = chunk_stores(striped, pathlib.PurePath('/file'))
+        self.assertGreater(placed.count(1), 2 * placed.count(0))
+        self.assertGreater(placed.count(0), 0)
+        self.assertEqual(data, striped.download_file(pathlib.PurePath('/file')))
+        stats = striped.scheduler.stats()
+        self.assertGreater(stats[1]['throughput'], stats[0]['throughput'])
+        self.assertEqual([0, 0], [store['in_flight'] for store in stats])
+
+    def test_free_space(self):
+        stores = [InMemoryStore(), InMemoryStore(max_bytes=5000), InMemoryStore()]
+        scheduler = PlacementScheduler(stores, reserve=1000)
+        striped = StripedStore(stores, chunk_size=1000, scheduler=scheduler)
+        striped.make_dir(pathlib.PurePath('/'), 'data')
+        for index in range(5):
+            striped.upload_file(pathlib.PurePath('/data/file{0}'.format(index)), b'x' * 3000)
+        # the reserve stays free
+        self.assertLessEqual(stores[1].space_usage()[0], 4000)
+        self.assertEqual(0, scheduler.stats()[1]['error_rate'])
+        with self.assertRaises(DiskFullError):
+            PlacementScheduler([InMemoryStore(max_bytes=100)]).place(1000)
+
+    def test_full_store_without_space_usage(self):
+        stores = [InMemoryStore(), SilentMemoryStore(max_bytes=1500)]
+        scheduler = PlacementScheduler(stores)
+        striped = StripedStore(stores, chunk_size=1000, scheduler=scheduler)
+        data = b'x' * 10000
+        striped.upload_file(pathlib.PurePath('/file'), data)
+        self.assertEqual(data, striped.download_file(pathlib.PurePath('/file')))
+        # the refused chunk went elsewhere and nothing else was sent there
+        self.assertEqual(1, chunk_stores(striped, pathlib.PurePath('/file')).count(1))
+        self.assertEqual(0, scheduler.stats()[1]['free'])
+
+    def test_round_robin_skips_full_store(self):
+        stores = [InMemoryStore(), InMemoryStore(max_bytes=0), InMemoryStore()]
+        striped = StripedStore(stores, chunk_size=1000)
+        striped.upload_file(pathlib.PurePath('/file'), b'x' * 6000)
+        self.assertNotIn(1, chunk_stores(striped, pathlib.PurePath('/file')))
+
+    def test_replicas_on_stores_with_room(self):
+        stores = [InMemoryStore(), InMemoryStore(max_bytes=1500), InMemoryStore()]
+        # manifests go to every store, the reserve keeps room for them
+        scheduler = PlacementScheduler(stores, reserve=500)
+        redundant = RedundantStore(stores, replicas=2, chunk_size=1000, scheduler=scheduler)
+        data = b'x' * 6000
+        redundant.upload_file(pathlib.PurePath('/file'), data)
+        self.assertEqual(data, redundant.download_file(pathlib.PurePath('/file')))
+        try:
+            chunks = stores[1].get_list(pathlib.PurePath('/') / StripedStore.chunk_dir_name)
+        except NoEntryError:
+            chunks = []
+        self.assertLessEqual(len(chunks), 1)
+
+    def test_quota_on_fake_server(self):
+        with FakeServer(quota=20000) as limited:
+            project_dir = pathlib.Path(tempfile.mkdtemp())
+            config = fake_config(project_dir, 'placed', upload_part_size=256 * 1024)
+            stores = [connect(DropboxStore(config, 'placed'), limited.url),
+                      connect(GoogleDriveStore(config, 'placed'), limited.url),
+                      connect(DropboxStore(fake_config(project_dir, 'full'), 'full'), limited.url)]
+            limited.account('dropbox-full').quota = 0
+            scheduler = PlacementScheduler(stores)
+            striped = StripedStore(stores, chunk_size=1000, scheduler=scheduler)
+            # the full account can't make the directory, chunks don't go there
+            striped.make_dir(pathlib.PurePath('/'), 'data')
+            data = bytes(range(256)) * 40
+            striped.upload_file(pathlib.PurePath('/data/file'), data)
+            self.assertEqual(data, striped.download_file(pathlib.PurePath('/data/file')))
+            self.assertNotIn(2, chunk_stores(striped, pathlib.PurePath('/data/file')))
+            self.assertEqual(0, limited.account('dropbox-full').stats()['endpoints'].get(
+                'POST content.dropboxapi.com/2/files/upload', 0))
+            used, allocated = stores[1].space_usage()
+            self.assertEqual(20000, allocated)
+            self.assertGreater(used, 0)
@@ -0,0 +1,93 @@
+import time
+import pathlib
+import unittest
+from tests import BaseTestWrapperStoreMethods
+from store import RedundantStore, StripedStore, GoogleDriveStore, DropboxStore, InMemoryStore
+
+
+class CountingMemoryStore(InMemoryStore):
+    # counts the chunk reads and answers them after delay seconds
+    def __init__(self, delay=0):
+        super().__init__()
+        self.delay = delay
+        self.chunk_reads = 0
+
+    def download_stream(self, path, offset=0, length=None):
+        if StripedStore.chunk_dir_name in path.parts:
+            self.chunk_reads += 1
+            time.sleep(self.delay)
+        return super().download_stream(path, offset, length)
+
+
+def wipe(store):
+    root = pathlib.PurePath('/')
+    for entry in store.get_list(root):
+        store.remove(root / entry.name)
+
+
+class TestRedundantStore(BaseTestWrapperStoreMethods.TestWrapperStoreMethods):
+    # small chunks so every sample is spread over both drives
+    store_class = staticmethod(lambda config, name: RedundantStore([GoogleDriveStore(config, name),
+                                                                    DropboxStore(config, name)], replicas=2,
+                                                                   chunk_size=1024))
+
+    def test_download_with_lost_replica(self):
+        test_path = pathlib.PurePath('/sample2')
+        with open(self.project_dir / 'tests' / 'samples' / 'sample2', 'rb') as testfile:
+            test_data = testfile.read()
+        self.store.upload_file(test_path, test_data)
+        # drop every piece on the first drive
+        first = self.store.stores[0]
+        first.remove(test_path.parent / StripedStore.chunk_dir_name)
+        self.assertEqual(test_data, self.store.download_file(test_path))
+
+
+class TestRedundantInMemory(unittest.TestCase):
+    data = bytes(range(256)) * 40 + b'tail'
+
+    def test_erasure_with_stores_wiped(self):
+        stores = [InMemoryStore() for _ in range(5)]
+        redundant = RedundantStore(stores, data_shards=3, parity_shards=2, chunk_size=1000)
+        redundant.upload_file(pathlib.PurePath('/file'), self.data)
+        # any parity_shards stores may go, manifests included
+        wipe(stores[0])
+        wipe(stores[3])
+        self.assertEqual(self.data, redundant.download_file(pathlib.PurePath('/file')))
+        wipe(stores[4])
+        with self.assertRaises(Exception):
+            redundant.download_file(pathlib.PurePath('/file'))
+
+    def test_download_with_lost_replica(self):
+        stores = [InMemoryStore() for _ in range(3)]
+        redundant = RedundantStore(stores, replicas=2, chunk_size=1000)
+        redundant.upload_file(pathlib.PurePath('/file'), self.data)
+        stores[0].remove(pathlib.PurePath('/') / StripedStore.chunk_dir_name)
+        self.assertEqual(self.data, redundant.download_file(pathlib.PurePath('/file')))
+
+    def test_ranged_reads(self):
+        for options in ({'replicas': 2}, {'data_shards': 2, 'parity_shards': 1}):
+            redundant = RedundantStore([InMemoryStore() for _ in range(3)], chunk_size=1000, **options)
+            redundant.upload_file(pathlib.PurePath('/file'), self.data)
+            for offset, length in ((0, None), (0, 1), (999, 2), (1500, 3000), (10000, None), (10200, 100)):
+                end = None if length is None else offset + length
+                self.assertEqual(self.data[offset:end],
+                                 b''.join(redundant.download_stream(pathlib.PurePath('/file'), offset, length)))
+
+    def test_hedged_read(self):
+        slow = CountingMemoryStore(delay=2)
+        fast = CountingMemoryStore()
+        redundant = RedundantStore([slow, fast], replicas=2, chunk_size=len(self.data), hedge_delay=0.05)
+        redundant.upload_file(pathlib.PurePath('/file'), self.data)
+        # the only chunk is asked from the slow store first, the other one after hedge_delay
+        started = time.perf_counter()
+        self.assertEqual(self.data, redundant.download_file(pathlib.PurePath('/file')))
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertEqual((1, 1), (slow.chunk_reads, fast.chunk_reads))
+
+    def test_hedge_waits_for_first_replica(self):
+        stores = [CountingMemoryStore(), CountingMemoryStore()]
+        redundant = RedundantStore(stores, replicas=2, chunk_size=1000, hedge_delay=1)
+        redundant.upload_file(pathlib.PurePath('/file'), self.data)
+        self.assertEqual(self.data, redundant.download_file(pathlib.PurePath('/file')))
+        # fast answers need no second replica
+        self.assertEqual(-(-len(self.data) // 1000), sum(store.chunk_reads for store in stores))
@@ -0,0 +1,87 @@
+import io
+import os
+import pathlib
+import tempfile
+import unittest
+from benchmarks.fake_servers import FakeServer, fake_config, connect
+from store import DropboxStore, GoogleDriveStore, RemoteFile
+
+
+class TestRemoteFile(unittest.TestCase):
+    data = os.urandom(3 * 1024 * 1024 + 1234)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeServer().start()
+        config = fake_config(pathlib.Path(tempfile.mkdtemp()), 'remote')
+        cls.stores = [(connect(store_class(config, 'remote'), cls.server.url), account)
+                      for store_class, account in ((DropboxStore, 'dropbox-remote'), (GoogleDriveStore, 'google-remote'))]
+        for store, account in cls.stores:
+            store.upload_file(pathlib.PurePath('/file'), cls.data)
+            store.upload_file(pathlib.PurePath('/empty'), b'')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def requests(self, account):
+        return self.server.account(account).stats()['requests']
+
+    def test_tail_read(self):
+        for store, account in self.stores:
+            with store.open(pathlib.PurePath('/file')) as remote:
+                remote.seek(-64 * 1024, io.SEEK_END)
+                sent = self.requests(account)
+                self.assertEqual(self.data[-64 * 1024:], remote.read(64 * 1024))
+                # one ranged request of at most two blocks
+                self.assertEqual(sent + 1, self.requests(account))
+                self.assertEqual(b'', remote.read(10))
+                self.assertEqual(len(self.data), remote.tell())
+
+    def test_sequential_reads_grow(self):
+        for store, account in self.stores:
+            remote = store.open(pathlib.PurePath('/file'))
+            sent = self.requests(account)
+            pieces = []
+            while True:
+                piece = remote.read(16 * 1024)
+                if not piece:
+                    break
+                pieces.append(piece)
+            self.assertEqual(self.data, b''.join(pieces))
+            # 200 reads, the read ahead doubles up to 4MB
+            self.assertLess(self.requests(account) - sent, 10)
+            remote.close()
+            self.assertTrue(remote.closed)
+            with self.assertRaises(ValueError):
+                remote.read(1)
+
+    def test_random_access(self):
+        for store, account in self.stores:
+            raw = store.open(pathlib.PurePath('/file'), buffering=0, block_size=4096, cache_blocks=4)
+            self.assertIsInstance(raw, RemoteFile)
+            for offset, length in ((100, 10), (2000000, 5000), (50, 4000), (4090, 20), (100, 10), (len(self.data) - 1, 5)):
+                raw.seek(offset)
+                self.assertEqual(self.data[offset:offset + length], raw.read(length))
+            raw.seek(10, io.SEEK_SET)
+            raw.seek(20, io.SEEK_CUR)
+            self.assertEqual(self.data[30:40], raw.read(10))
+            self.assertEqual(self.data[40:], raw.read())
+            with self.assertRaises(ValueError):
+                raw.seek(-1)
+
+    def test_cached_blocks(self):
+        store, account = self.stores[0]
+        remote = store.open(pathlib.PurePath('/file'), buffering=0)
+        remote.seek(1000000)
+        remote.read(100)
+        sent = self.requests(account)
+        remote.seek(1000050)
+        self.assertEqual(self.data[1000050:1000100], remote.read(50))
+        self.assertEqual(sent, self.requests(account))
+
+    def test_empty_file(self):
+        for store, account in self.stores:
+            with store.open(pathlib.PurePath('/empty')) as remote:
+                self.assertEqual(b'', remote.read())
+                self.assertEqual(0, remote.seek(0, io.SEEK_END))
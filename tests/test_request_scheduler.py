@@ -0,0 +1,89 @@
+import json
+import unittest
+from store.request_scheduler import RequestScheduler
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None, body=b''):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = body
+
+    def close(self):
+        pass
+
+
+def sender(responses):
+    sent = []
+
+    def send():
+        sent.append(responses[len(sent)])
+        return sent[-1]
+    return send, sent
+
+
+class TestRequestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = RequestScheduler(max_retries=3, backoff=0.001)
+
+    def test_throttle_retried(self):
+        send, sent = sender([FakeResponse(429, {'Retry-After': '0'}), FakeResponse(200)])
+        self.assertEqual(200, self.scheduler.run(send, idempotent=False).status_code)
+        self.assertEqual(2, len(sent))
+        # the provider cut us, the rate is limited from now on
+        self.assertIsNotNone(self.scheduler.rate)
+
+    def test_google_rate_limit_reason(self):
+        body = json.dumps({'error': {'errors': [{'reason': 'userRateLimitExceeded'}]}}).encode()
+        send, sent = sender([FakeResponse(403, body=body), FakeResponse(200)])
+        self.assertEqual(200, self.scheduler.run(send, idempotent=False).status_code)
+        send, sent = sender([FakeResponse(403, body=b'{"error": {"errors": [{"reason": "forbidden"}]}}')])
+        self.assertEqual(403, RequestScheduler().run(send, idempotent=True).status_code)
+
+    def test_server_error_retried_when_idempotent(self):
+        send, sent = sender([FakeResponse(503), FakeResponse(503), FakeResponse(200)])
+        self.assertEqual(200, self.scheduler.run(send, idempotent=True).status_code)
+        send, sent = sender([FakeResponse(503), FakeResponse(200)])
+        self.assertEqual(503, self.scheduler.run(send, idempotent=False).status_code)
+        self.assertEqual(1, len(sent))
+
+    def test_retries_exhausted(self):
+        send, sent = sender([FakeResponse(500)] * 4)
+        self.assertEqual(500, self.scheduler.run(send, idempotent=True).status_code)
+        self.assertEqual(4, len(sent))
+
+    def test_connection_error(self):
+        attempts = []
+
+        def send():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise ConnectionError()
+            return FakeResponse(200)
+        self.assertEqual(200, self.scheduler.run(send, True, (ConnectionError,)).status_code)
+        with self.assertRaises(ConnectionError):
+            self.scheduler.run(lambda: (_ for _ in ()).throw(ConnectionError()), False, (ConnectionError,))
+
+    def test_token_bucket(self):
+        scheduler = RequestScheduler(rate=10, burst=2)
+        self.assertEqual(0, scheduler.reserve())
+        self.assertEqual(0, scheduler.reserve())
+        self.assertAlmostEqual(0.1, scheduler.reserve(), places=2)
+        self.assertAlmostEqual(0.2, scheduler.reserve(), places=2)
+
+    def test_retry_after(self):
+        self.assertEqual(3, RequestScheduler.retry_after({'Retry-After': '3'}))
+        self.assertEqual(0, RequestScheduler.retry_after({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}))
+        self.assertIsNone(RequestScheduler.retry_after({}))
+
+    def test_shared_per_account(self):
+        first = RequestScheduler.for_account('test-account', 5)
+        self.assertIs(first, RequestScheduler.for_account('test-account'))
+        self.assertIsNot(first, RequestScheduler.for_account('other-account'))
+        self.assertIs(first, RequestScheduler.for_account('test-account', 5))
+        # a store can't get other limits than the account already has
+        with self.assertRaises(ValueError):
+            RequestScheduler.for_account('test-account', 10)
+        with self.assertRaises(ValueError):
+            RequestScheduler.for_account('test-account', None, 20)
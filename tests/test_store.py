@@ -1,6 +1,9 @@
+import io
 import json
+import tempfile
 import unittest
 import pathlib
+import webbrowser
 from exceptions import *
 
 
@@ -58,6 +61,147 @@ class BaseTestStoreMethods:
             # clean
             self.store.remove(test_path)
 
+        def test_upload_stream(self):
+            test_path = pathlib.PurePath('/sample3')
+            with open(self.project_dir / 'tests' / 'samples' / 'sample3', 'rb') as testfile:
+                test_data = testfile.read() * 6
+            # force a resumable session with several parts
+            self.store.upload_part_size = 256 * 1024
+            self.store.upload_file(test_path, io.BytesIO(test_data))
+            download_data = self.store.download_file(test_path)
+            self.assertEqual(test_data, download_data)
+            # clean
+            self.store.remove(test_path)
+
+        def test_download_range(self):
+            test_path = pathlib.PurePath('/sample3')
+            with open(self.project_dir / 'tests' / 'samples' / 'sample3', 'rb') as testfile:
+                test_data = testfile.read()
+            self.store.upload_file(test_path, test_data)
+            download_data = b''.join(self.store.download_stream(test_path, 1000, 5000))
+            self.assertEqual(test_data[1000:6000], download_data)
+            download_data = b''.join(self.store.download_stream(test_path, 100000))
+            self.assertEqual(test_data[100000:], download_data)
+            # clean
+            self.store.remove(test_path)
+
+        def test_open(self):
+            test_path = pathlib.PurePath('/sample3')
+            with open(self.project_dir / 'tests' / 'samples' / 'sample3', 'rb') as testfile:
+                test_data = testfile.read()
+            self.store.upload_file(test_path, test_data)
+            with self.store.open(test_path) as remote:
+                remote.seek(-10, io.SEEK_END)
+                self.assertEqual(test_data[-10:], remote.read())
+                remote.seek(len(test_data) // 2)
+                self.assertEqual(test_data[len(test_data) // 2:len(test_data) // 2 + 100], remote.read(100))
+            # clean
+            self.store.remove(test_path)
+
+        def test_bulk_operations(self):
+            test_dir = pathlib.PurePath('/')
+            sample_files = ['sample1', 'sample2', 'sample3']
+            items = []
+            for sample in sample_files:
+                with open(self.project_dir / 'tests' / 'samples' / sample, 'rb') as infile:
+                    items.append((test_dir / sample, infile.read()))
+            results = self.store.upload_many(items, max_workers=3)
+            self.assertTrue(all(result.ok for result in results))
+            results = self.store.download_many([path for path, data in items] + [test_dir / 'someEntry'])
+            self.assertEqual([data for path, data in items], [result.value for result in results[:3]])
+            self.assertIsInstance(results[3].error, NoEntryError)
+            results = self.store.remove_many([path for path, data in items])
+            self.assertTrue(all(result.ok for result in results))
+            self.assertEqual([], self.store.get_list(test_dir))
+
+        def test_batch_operations(self):
+            test_dir = pathlib.PurePath('/')
+            items = [(test_dir, 'batchDir'), (test_dir / 'batchDir', 'child1'), (test_dir / 'batchDir', 'child2'),
+                     (test_dir, 'batchDir')]
+            results = self.store.make_dir_batch(items)
+            self.assertTrue(all(result.ok for result in results[:3]))
+            self.assertIsInstance(results[3].error, DuplicateEntryError)
+            entries = self.store.get_list(test_dir / 'batchDir')
+            self.assertEqual(['child1', 'child2'], sorted(entry.name for entry in entries))
+            results = self.store.remove_batch([test_dir / 'batchDir', test_dir / 'someEntry'])
+            self.assertTrue(results[0].ok)
+            self.assertIsInstance(results[1].error, NoEntryError)
+            self.assertEqual([], self.store.get_list(test_dir))
+
+        def test_get_entry(self):
+            test_path = pathlib.PurePath('/sample1')
+            with open(self.project_dir / 'tests' / 'samples' / 'sample1', 'rb') as testfile:
+                test_data = testfile.read()
+            self.store.upload_file(test_path, test_data)
+            entry = self.store.get_entry(test_path)
+            self.assertEqual('sample1', entry.name)
+            self.assertFalse(entry.is_dir)
+            self.assertEqual(len(test_data), entry.file_size)
+            with self.assertRaises(NoEntryError):
+                self.store.get_entry(pathlib.PurePath('/someEntry'))
+            # clean
+            self.store.remove(test_path)
+
+        def test_tree_transfer(self):
+            local_dir = pathlib.Path(tempfile.mkdtemp()) / 'tree'
+            samples = ['sample1', 'sample2', 'sample3']
+            for index, sample in enumerate(samples):
+                directory = local_dir.joinpath(*['level{0}'.format(level) for level in range(index)])
+                directory.mkdir(parents=True, exist_ok=True)
+                with open(self.project_dir / 'tests' / 'samples' / sample, 'rb') as infile:
+                    (directory / sample).write_bytes(infile.read())
+            progress = []
+            results = self.store.upload_tree(local_dir, pathlib.PurePath('/treeDir'),
+                                             progress=lambda *args: progress.append(args))
+            self.assertTrue(all(result.ok for result in results))
+            self.assertEqual(3, len(results))
+            self.assertEqual(3, progress[-1][0])
+            self.assertEqual(progress[-1][2], progress[-1][3])
+            download_dir = pathlib.Path(tempfile.mkdtemp()) / 'tree'
+            progress = []
+            results = self.store.download_tree(pathlib.PurePath('/treeDir'), download_dir,
+                                               progress=lambda *args: progress.append(args))
+            self.assertTrue(all(result.ok for result in results))
+            self.assertEqual(progress[-1][2], progress[-1][3])
+            for path in local_dir.rglob('sample*'):
+                self.assertEqual(path.read_bytes(), (download_dir / path.relative_to(local_dir)).read_bytes())
+            results = self.store.upload_tree(local_dir, pathlib.PurePath('/treeDir'))
+            self.assertTrue(all(isinstance(result.error, DuplicateEntryError) for result in results))
+            # clean
+            self.store.remove(pathlib.PurePath('/treeDir'))
+
+        def test_copy_move(self):
+            test_dir = pathlib.PurePath('/copyDir')
+            self.store.make_dir(test_dir.parent, test_dir.name)
+            self.store.make_dir(test_dir, 'inner')
+            with open(self.project_dir / 'tests' / 'samples' / 'sample1', 'rb') as testfile:
+                test_data = testfile.read()
+            self.store.upload_file(test_dir / 'inner' / 'sample1', test_data)
+            self.store.copy(test_dir / 'inner' / 'sample1', test_dir / 'copied')
+            self.assertEqual(test_data, self.store.download_file(test_dir / 'copied'))
+            self.store.copy(test_dir / 'inner', test_dir / 'innerCopy')
+            self.assertEqual(test_data, self.store.download_file(test_dir / 'innerCopy' / 'sample1'))
+            self.store.move(test_dir / 'copied', test_dir / 'inner' / 'moved')
+            self.assertEqual(test_data, self.store.download_file(test_dir / 'inner' / 'moved'))
+            self.assertNotIn('copied', [entry.name for entry in self.store.get_list(test_dir)])
+            self.store.move(test_dir / 'inner', test_dir / 'renamed')
+            self.assertEqual(['moved', 'sample1'],
+                             sorted(entry.name for entry in self.store.get_list(test_dir / 'renamed')))
+            with self.assertRaises(DuplicateEntryError):
+                self.store.copy(test_dir / 'renamed' / 'moved', test_dir / 'renamed' / 'sample1')
+            with self.assertRaises(NoEntryError):
+                self.store.move(test_dir / 'someEntry', test_dir / 'other')
+            results = self.store.copy_batch([(test_dir / 'renamed' / 'moved', test_dir / 'batch1'),
+                                             (test_dir / 'someEntry', test_dir / 'batch2')])
+            self.assertTrue(results[0].ok)
+            self.assertIsInstance(results[1].error, NoEntryError)
+            results = self.store.move_batch([(test_dir / 'batch1', test_dir / 'renamed' / 'batch1')])
+            self.assertTrue(results[0].ok)
+            self.assertEqual(['batch1', 'moved', 'sample1'],
+                             sorted(entry.name for entry in self.store.get_list(test_dir / 'renamed')))
+            # clean
+            self.store.remove(test_dir)
+
         def test_make_directory(self):
             test_dir = pathlib.PurePath('/')
             test_dir_name = 'myDir1'
@@ -148,3 +292,29 @@ class BaseTestStoreMethods:
             test_samples_dir = pathlib.PurePath('/samples')
             with self.assertRaises(NoEntryError):
                 entries = self.store.get_list(test_samples_dir)
+
+
+class BaseTestWrapperStoreMethods:
+
+    class TestWrapperStoreMethods(BaseTestStoreMethods.TestStoreMethods):
+        # store_class builds a store over other stores, wrapped_stores gives them back to be
+        # authorized before and wiped after every test
+        @staticmethod
+        def wrapped_stores(store):
+            return store.stores
+
+        def setUp(self):
+            self.store = self.store_class(self.config, self.store_name)
+            for store in self.wrapped_stores(self.store):
+                if store.authorized() is False:
+                    webbrowser.open(store.get_authorization_url())
+                    res = input('response url :')
+                    store.fetch_token(res)
+
+        def tearDown(self):
+            test_dir = pathlib.PurePath('/')
+            for store in self.wrapped_stores(self.store):
+                entries = store.get_list(test_dir)
+                for entry in entries:
+                    store.remove(test_dir / entry.name)
+            del self.store
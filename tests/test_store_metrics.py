@@ -0,0 +1,83 @@
+import pathlib
+import tempfile
+import unittest
+from benchmarks.fake_servers import FakeServer, fake_config, connect
+from store import StoreMetrics, DropboxStore, GoogleDriveStore
+from store.store_metrics import LatencyHistogram
+
+
+class TestStoreMetrics(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.metrics = StoreMetrics()
+        self.config = fake_config(pathlib.Path(tempfile.mkdtemp()), 'metrics', __metrics=self.metrics)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def store(self, store_class):
+        return connect(store_class(self.config, 'metrics'), self.server.url)
+
+    def test_requests_attributed_to_operations(self):
+        store = self.store(GoogleDriveStore)
+        store.make_dir(pathlib.PurePath('/'), 'dir1')
+        store.make_dir(pathlib.PurePath('/dir1'), 'dir2')
+        store.upload_file(pathlib.PurePath('/dir1/dir2/file'), b'data')
+        self.metrics.reset()
+        sent = self.server.account('google-metrics').stats()['requests']
+        # a new store resolves the path segment by segment
+        self.store(GoogleDriveStore).get_file_id(pathlib.PurePath('/dir1/dir2/file'))
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(1, snapshot['operations']['get_file_id']['calls'])
+        self.assertEqual(3, snapshot['operations']['get_file_id']['requests'])
+        self.assertEqual(3, snapshot['operations']['search_files_with_parent_id']['calls'])
+        self.assertEqual(3, snapshot['total']['requests'])
+        self.assertEqual(sent + 3, self.server.account('google-metrics').stats()['requests'])
+
+    def test_bulk_and_stream_attribution(self):
+        store = self.store(DropboxStore)
+        results = store.upload_many([(pathlib.PurePath('/file{0}'.format(index)), b'x' * 100) for index in range(5)])
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual(b'x' * 100, b''.join(store.download_stream(pathlib.PurePath('/file0'))))
+        operations = self.metrics.snapshot()['operations']
+        self.assertEqual(5, operations['upload_many']['requests'])
+        self.assertEqual(5, operations['upload_file']['calls'])
+        self.assertEqual(500, operations['upload_file']['bytes_out'])
+        self.assertEqual(1, operations['download_stream']['requests'])
+        self.assertEqual(100, operations['download_stream']['bytes_in'])
+        self.assertNotIn(StoreMetrics.unattributed, operations)
+
+    def test_errors_and_hooks(self):
+        events = []
+        self.metrics.add_hook(events.append)
+        self.metrics.add_hook(lambda event: 1 / 0)
+        store = self.store(DropboxStore)
+        with self.assertRaises(Exception):
+            store.download_file(pathlib.PurePath('/someEntry'))
+        operation = self.metrics.snapshot()['operations']['download_file']
+        self.assertEqual(1, operation['errors'])
+        self.assertEqual(1, operation['request_errors'])
+        self.assertEqual(['request', 'call'], [event['type'] for event in events])
+        self.assertEqual(('download_file',), events[0]['operations'])
+        self.assertEqual(409, events[0]['status'])
+
+    def test_throttled_requests_counted(self):
+        with FakeServer(rate_limit=5) as limited:
+            store = connect(DropboxStore(self.config, 'metrics'), limited.url)
+            store.upload_many([(pathlib.PurePath('/file{0}'.format(index)), b'x') for index in range(12)], 4)
+            throttled = limited.account('dropbox-metrics').stats()['throttled']
+        total = self.metrics.snapshot()['total']
+        self.assertGreater(throttled, 0)
+        self.assertEqual(throttled, total['throttled'])
+        self.assertEqual(throttled, total['retries'])
+
+    def test_latency_histogram(self):
+        histogram = LatencyHistogram()
+        for seconds in (0.001, 0.002, 0.02, 0.3, 100):
+            histogram.add(seconds)
+        snapshot = histogram.snapshot()
+        self.assertEqual(5, snapshot['count'])
+        self.assertEqual(2, snapshot['counts'][0])
+        self.assertEqual(1, snapshot['counts'][-1])
+        self.assertEqual(0.025, snapshot['p50'])
+        self.assertEqual(100, snapshot['p99'])
@@ -0,0 +1,124 @@
+import time
+import pathlib
+import tempfile
+import threading
+import unittest
+from tests import test_local_stores
+from benchmarks.fake_servers import FakeServer, fake_config, connect
+from store import StorePool, InMemoryStore, DropboxStore
+from exceptions import *
+
+
+class SlowMemoryStore(InMemoryStore):
+    # an account that answers late, counting the calls it has in flight
+    def __init__(self, delay, max_bytes=None):
+        super().__init__(max_bytes)
+        self.delay = delay
+        self.running = 0
+        self.most_running = 0
+        self.__lock = threading.Lock()
+
+    def upload_file(self, path, data, is_chunk=False):
+        with self.__lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        try:
+            time.sleep(self.delay)
+            return super().upload_file(path, data, is_chunk)
+        finally:
+            with self.__lock:
+                self.running -= 1
+
+
+class TestStorePool(test_local_stores.LocalStoreMethods.TestStoreMethods):
+    store_class = staticmethod(lambda config, name: StorePool([InMemoryStore() for index in range(3)]))
+
+    def test_files_spread(self):
+        accounts = [InMemoryStore() for index in range(3)]
+        pool = StorePool(accounts)
+        pool.make_dir(pathlib.PurePath('/'), 'data')
+        items = [(pathlib.PurePath('/data/file{0}'.format(index)), b'x' * index) for index in range(30)]
+        self.assertTrue(all(result.ok for result in pool.upload_many(items, max_workers=6)))
+        held = [len(account.get_list(pathlib.PurePath('/data'))) for account in accounts]
+        self.assertEqual(30, sum(held))
+        self.assertTrue(all(count > 0 for count in held))
+        # a new pool finds the files again
+        pool = StorePool(accounts)
+        for path, data in items:
+            self.assertEqual(data, pool.download_file(path))
+        with self.assertRaises(DuplicateEntryError):
+            pool.upload_file(items[0][0], b'again')
+        pool.move(items[0][0], pathlib.PurePath('/data/moved'))
+        self.assertEqual(b'', pool.download_file(pathlib.PurePath('/data/moved')))
+        self.assertEqual(30, len(pool.get_list(pathlib.PurePath('/data'))))
+
+    def test_least_outstanding(self):
+        slow = SlowMemoryStore(0.2)
+        fast = SlowMemoryStore(0.01)
+        pool = StorePool([slow, fast], max_outstanding=2)
+        items = [(pathlib.PurePath('/file{0}'.format(index)), b'data') for index in range(20)]
+        self.assertTrue(all(result.ok for result in pool.upload_many(items, max_workers=4)))
+        self.assertGreater(len(fast.get_list(pathlib.PurePath('/'))), 2 * len(slow.get_list(pathlib.PurePath('/'))))
+        self.assertLessEqual(slow.most_running, 2)
+        self.assertLessEqual(fast.most_running, 2)
+
+    def test_full_account(self):
+        small = InMemoryStore(max_bytes=1000)
+        large = InMemoryStore()
+        pool = StorePool([small, large])
+        for index in range(6):
+            pool.upload_file(pathlib.PurePath('/file{0}'.format(index)), b'x' * 400)
+        self.assertLessEqual(len(small.get_list(pathlib.PurePath('/'))), 2)
+        self.assertEqual(6, len(pool.get_list(pathlib.PurePath('/'))))
+        with self.assertRaises(DiskFullError):
+            StorePool([InMemoryStore(max_bytes=10)]).upload_file(pathlib.PurePath('/file'), b'x' * 400)
+
+    def test_other_pool_writes(self):
+        accounts = [InMemoryStore() for index in range(2)]
+        first = StorePool(accounts)
+        second = StorePool(accounts)
+        self.assertEqual([], first.get_list(pathlib.PurePath('/')))
+        self.assertEqual([], second.get_list(pathlib.PurePath('/')))
+        for index in range(4):
+            second.upload_file(pathlib.PurePath('/file{0}'.format(index)), b'old')
+        # the first pool's listing is cached but other writers are found
+        for index in range(4):
+            with self.assertRaises(DuplicateEntryError):
+                first.upload_file(pathlib.PurePath('/file{0}'.format(index)), b'new')
+        second.upload_file(pathlib.PurePath('/other'), b'other')
+        self.assertEqual(b'other', first.download_file(pathlib.PurePath('/other')))
+        self.assertEqual(5, first.get_entry(pathlib.PurePath('/other')).file_size)
+        self.assertEqual(5, sum(len(account.get_list(pathlib.PurePath('/'))) for account in accounts))
+
+    def test_full_account_readmitted(self):
+        small = InMemoryStore(max_bytes=1000)
+        pool = StorePool([small, InMemoryStore()], refresh_interval=0)
+        for index in range(6):
+            pool.upload_file(pathlib.PurePath('/file{0}'.format(index)), b'x' * 400)
+        for entry in small.get_list(pathlib.PurePath('/')):
+            pool.remove(pathlib.PurePath('/') / entry.name)
+        for index in range(6, 12):
+            pool.upload_file(pathlib.PurePath('/file{0}'.format(index)), b'x' * 400)
+        # space freed on the small account is used again
+        self.assertTrue(small.get_list(pathlib.PurePath('/')))
+
+    def test_accounts_on_fake_server(self):
+        with FakeServer(rate_limit=20) as limited:
+            project_dir = pathlib.Path(tempfile.mkdtemp())
+            stores = []
+            for name in ('first', 'second', 'first'):
+                stores.append(connect(DropboxStore(fake_config(project_dir, name), name), limited.url))
+            pool = StorePool(stores)
+            # two sessions of the first account share it
+            self.assertEqual([[0, 2], [1]], pool.accounts)
+            pool.configure_pool(8)
+            managers = [store.session.get_adapter('https://').poolmanager for store in stores]
+            self.assertIn(StorePool.keepalive_options[1], managers[0].connection_pool_kw['socket_options'])
+            items = [(pathlib.PurePath('/file{0}'.format(index)), b'data') for index in range(40)]
+            self.assertTrue(all(result.ok for result in pool.upload_many(items, max_workers=8)))
+            # bulk calls configure the pool again, the warm connections stay
+            self.assertEqual(managers, [store.session.get_adapter('https://').poolmanager for store in stores])
+            for account in ('dropbox-first', 'dropbox-second'):
+                self.assertGreater(limited.account(account).stats()['requests'], 10)
+            self.assertEqual(sorted(path.name for path, data in items),
+                             sorted(entry.name for entry in pool.get_list(pathlib.PurePath('/'))))
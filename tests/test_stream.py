@@ -0,0 +1,103 @@
+import io
+import asyncio
+import unittest
+from store.stream import iter_parts, split_first_part, iter_with_last, range_header, iter_response, aiter_response
+
+
+class FakeResponse:
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for offset in range(0, len(self.content), chunk_size):
+            yield self.content[offset:offset + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeAsyncResponse:
+    # the parts of an aiohttp response aiter_response uses
+    def __init__(self, status, content):
+        self.status = status
+        self.content = self
+        self.data = content
+        self.closed = False
+
+    async def iter_chunked(self, chunk_size):
+        for offset in range(0, len(self.data), chunk_size):
+            yield self.data[offset:offset + chunk_size]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        self.closed = True
+
+
+class TestStream(unittest.TestCase):
+    data = bytes(range(256)) * 10
+
+    def test_iter_parts_bytes(self):
+        parts = list(iter_parts(self.data, 1000))
+        self.assertEqual([1000, 1000, 560], [len(part) for part in parts])
+        self.assertEqual(self.data, b''.join(parts))
+
+    def test_iter_parts_file(self):
+        parts = list(iter_parts(io.BytesIO(self.data), 1280))
+        self.assertEqual([1280, 1280], [len(part) for part in parts])
+        self.assertEqual(self.data, b''.join(parts))
+
+    def test_iter_parts_iterable(self):
+        chunks = (self.data[i:i + 7] for i in range(0, len(self.data), 7))
+        parts = list(iter_parts(chunks, 1000))
+        self.assertEqual([1000, 1000, 560], [len(part) for part in parts])
+        self.assertEqual(self.data, b''.join(parts))
+
+    def test_split_first_part(self):
+        parts, single = split_first_part(io.BytesIO(b'abc'), 1000)
+        self.assertTrue(single)
+        self.assertEqual([b'abc'], list(parts))
+        parts, single = split_first_part(b'', 1000)
+        self.assertTrue(single)
+        self.assertEqual([b''], list(parts))
+        parts, single = split_first_part(self.data, 1000)
+        self.assertFalse(single)
+        self.assertEqual(self.data, b''.join(parts))
+
+    def test_iter_with_last(self):
+        self.assertEqual([(1, False), (2, False), (3, True)], list(iter_with_last([1, 2, 3])))
+        self.assertEqual([], list(iter_with_last([])))
+
+    def test_range_header(self):
+        self.assertIsNone(range_header(0))
+        self.assertEqual('bytes=10-', range_header(10))
+        self.assertEqual('bytes=10-19', range_header(10, 10))
+
+    def test_iter_response_partial(self):
+        response = FakeResponse(206, self.data[10:20])
+        self.assertEqual(self.data[10:20], b''.join(iter_response(response, 3, 10, 10)))
+        self.assertTrue(response.closed)
+
+    def test_iter_response_range_ignored(self):
+        response = FakeResponse(200, self.data)
+        self.assertEqual(self.data[1000:1500], b''.join(iter_response(response, 64, 1000, 500)))
+        self.assertTrue(response.closed)
+
+    def test_iter_response_out_of_range(self):
+        response = FakeResponse(416, b'')
+        self.assertEqual(b'', b''.join(iter_response(response, 64, 5000)))
+
+    def test_aiter_response(self):
+        async def read(response, offset, length):
+            return b''.join([chunk async for chunk in aiter_response(response, 64, offset, length)])
+        response = FakeAsyncResponse(206, self.data[10:20])
+        self.assertEqual(self.data[10:20], asyncio.run(read(response, 10, 10)))
+        self.assertTrue(response.closed)
+        # a server ignoring the range answers 200 with the whole file
+        response = FakeAsyncResponse(200, self.data)
+        self.assertEqual(self.data[1000:1500], asyncio.run(read(response, 1000, 500)))
+        self.assertTrue(response.closed)
+        self.assertEqual(b'', asyncio.run(read(FakeAsyncResponse(416, b''), 5000, None)))
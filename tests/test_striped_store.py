@@ -0,0 +1,95 @@
+import pathlib
+import tempfile
+import unittest
+from tests import BaseTestWrapperStoreMethods
+from benchmarks.fake_servers import FakeServer, fake_config, connect
+from store import StripedStore, GoogleDriveStore, DropboxStore, InMemoryStore
+from exceptions import *
+
+
+class TestStripedStore(BaseTestWrapperStoreMethods.TestWrapperStoreMethods):
+    # small chunks so every sample is spread over both drives
+    store_class = staticmethod(lambda config, name: StripedStore([GoogleDriveStore(config, name),
+                                                                  DropboxStore(config, name)], chunk_size=1024))
+
+    def test_chunks_spread(self):
+        test_path = pathlib.PurePath('/sample2')
+        with open(self.project_dir / 'tests' / 'samples' / 'sample2', 'rb') as testfile:
+            test_data = testfile.read()
+        self.store.upload_file(test_path, test_data)
+        for store in self.store.stores:
+            self.assertTrue(store.get_list(test_path.parent / StripedStore.chunk_dir_name))
+        self.assertEqual(test_data, self.store.download_file(test_path))
+
+
+class TestStripedRemove(unittest.TestCase):
+    def test_remove_looks_up_one_entry(self):
+        with FakeServer() as server:
+            config = fake_config(pathlib.Path(tempfile.mkdtemp()), 'striped')
+            stores = [connect(DropboxStore(config, 'striped'), server.url),
+                      connect(GoogleDriveStore(config, 'striped'), server.url)]
+            striped = StripedStore(stores, chunk_size=1024)
+            striped.make_dir(pathlib.PurePath('/'), 'dir')
+            for index in range(20):
+                striped.upload_file(pathlib.PurePath('/dir/file{0}'.format(index)), b'x' * 3000)
+            sent = server.account('dropbox-striped').stats()['requests']
+            # dropbox, the first store, doesn't care about case
+            striped.remove(pathlib.PurePath('/dir/FILE3'))
+            # the entry, the manifest, its chunk and the manifest removal, no listing
+            self.assertLessEqual(server.account('dropbox-striped').stats()['requests'] - sent, 5)
+            self.assertEqual(19, len(striped.get_list(pathlib.PurePath('/dir'))))
+            chunk_dir = pathlib.PurePath('/dir') / StripedStore.chunk_dir_name
+            self.assertNotIn('file3.1.chunk', [entry.name for entry in stores[1].get_list(chunk_dir)])
+            striped.remove(pathlib.PurePath('/dir'))
+            self.assertEqual([], striped.get_list(pathlib.PurePath('/')))
+
+
+class TestStripedSizes(unittest.TestCase):
+    def setUp(self):
+        self.striped = StripedStore([InMemoryStore(), InMemoryStore()], chunk_size=1000)
+        self.striped.make_dir(pathlib.PurePath('/'), 'dir')
+        self.striped.upload_file(pathlib.PurePath('/dir/file'), b'x' * 30000)
+
+    def test_get_entry_size(self):
+        # the listing has the size of the manifest, the entry that of the file
+        self.assertLess(self.striped.get_list(pathlib.PurePath('/dir'))[0].file_size, 30000)
+        self.assertEqual(30000, self.striped.get_entry(pathlib.PurePath('/dir/file')).file_size)
+        self.assertTrue(self.striped.get_entry(pathlib.PurePath('/dir')).is_dir)
+
+    def test_download_tree_progress(self):
+        progress = []
+        local_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(local_dir.cleanup)
+        results = self.striped.download_tree(pathlib.PurePath('/dir'), pathlib.Path(local_dir.name) / 'dir',
+                                             progress=lambda *args: progress.append(args))
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual([(1, 1, 30000, 30000)], progress)
+
+
+class TestStripedNames(unittest.TestCase):
+    def setUp(self):
+        self.striped = StripedStore([InMemoryStore(), InMemoryStore()], chunk_size=1000)
+
+    def test_chunk_like_names(self):
+        # names that look like chunks are files like any other
+        self.striped.upload_file(pathlib.PurePath('/notes.chunk'), b'notes')
+        self.striped.upload_file(pathlib.PurePath('/a.0.chunk'), b'y' * 1500)
+        self.striped.upload_file(pathlib.PurePath('/a'), b'x' * 3000)
+        self.assertEqual(['a', 'a.0.chunk', 'notes.chunk'],
+                         sorted(entry.name for entry in self.striped.get_list(pathlib.PurePath('/'))))
+        self.assertEqual(b'notes', self.striped.download_file(pathlib.PurePath('/notes.chunk')))
+        self.assertEqual(b'y' * 1500, self.striped.download_file(pathlib.PurePath('/a.0.chunk')))
+        self.assertEqual(b'x' * 3000, self.striped.download_file(pathlib.PurePath('/a')))
+
+    def test_chunk_dir_refused(self):
+        self.striped.upload_file(pathlib.PurePath('/a'), b'x' * 3000)
+        chunk_dir = pathlib.PurePath('/') / StripedStore.chunk_dir_name
+        with self.assertRaises(NoEntryError):
+            self.striped.upload_file(chunk_dir / 'a.0.chunk', b'y')
+        with self.assertRaises(NoEntryError):
+            self.striped.make_dir(pathlib.PurePath('/'), StripedStore.chunk_dir_name.upper())
+        with self.assertRaises(NoEntryError):
+            self.striped.get_list(chunk_dir)
+        with self.assertRaises(NoEntryError):
+            self.striped.remove(chunk_dir)
+        self.assertEqual(b'x' * 3000, self.striped.download_file(pathlib.PurePath('/a')))
@@ -0,0 +1,122 @@
+import os
+import pathlib
+import tempfile
+import unittest
+from benchmarks.fake_servers import FakeServer, fake_config, connect
+from store import SyncEngine, DropboxStore, GoogleDriveStore
+
+
+class TestSyncEngine(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.work_dir = pathlib.Path(tempfile.mkdtemp())
+        self.config = fake_config(self.work_dir, 'sync')
+        self.local_dir = self.work_dir / 'local'
+        self.local_dir.mkdir()
+        self.remote_dir = pathlib.PurePath('/backup')
+
+    def tearDown(self):
+        self.server.stop()
+
+    def engine(self, store_class=DropboxStore, conflict='skip'):
+        store = connect(store_class(self.config, 'sync'), self.server.url)
+        return SyncEngine(store, self.local_dir, self.remote_dir, self.work_dir / 'sync_state.json', conflict)
+
+    def write(self, relative, data):
+        path = self.local_dir / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+    def fill(self):
+        self.write('a', b'first')
+        self.write('dir1/b', b'second' * 1000)
+        self.write('dir1/dir2/c', b'')
+
+    def test_first_sync_uploads(self):
+        for store_class in (DropboxStore, GoogleDriveStore):
+            self.fill()
+            engine = self.engine(store_class)
+            results = engine.sync()
+            self.assertTrue(all(result.ok for result in results))
+            self.assertEqual(b'second' * 1000, engine.store.download_file(self.remote_dir / 'dir1' / 'b'))
+            self.assertEqual(0, engine.store.get_entry(self.remote_dir / 'dir1' / 'dir2' / 'c').file_size)
+            # nothing changed, nothing to do
+            self.assertTrue(self.engine(store_class).plan().empty)
+
+    def test_unchanged_sync_only_lists(self):
+        self.fill()
+        self.engine().sync()
+        account = self.server.account('dropbox-sync')
+        sent = account.stats()['requests']
+        # touching doesn't change the content
+        os.utime(self.local_dir / 'a', ns=(1, 1))
+        plan = self.engine().plan()
+        self.assertTrue(plan.empty)
+        self.engine().apply(plan)
+        # one listing per remote directory
+        self.assertEqual(sent + 3, account.stats()['requests'])
+        self.assertTrue(self.engine().plan().empty)
+
+    def test_existing_copy_is_not_uploaded_again(self):
+        self.fill()
+        self.engine().sync()
+        (self.work_dir / 'sync_state.json').unlink()
+        plan = self.engine().plan()
+        self.assertTrue(plan.empty)
+        self.assertEqual(3, len(plan.refreshed))
+
+    def test_changes_both_ways(self):
+        self.fill()
+        engine = self.engine()
+        engine.sync()
+        self.write('a', b'changed locally')
+        (self.local_dir / 'dir1' / 'dir2' / 'c').unlink()
+        engine.store.remove(self.remote_dir / 'dir1' / 'b')
+        engine.store.upload_file(self.remote_dir / 'dir1' / 'b', b'changed remotely')
+        engine.store.upload_file(self.remote_dir / 'd', b'new remotely')
+        plan = engine.plan()
+        self.assertEqual([pathlib.PurePath('a')], plan.uploads)
+        self.assertEqual([pathlib.PurePath('d'), pathlib.PurePath('dir1/b')], plan.downloads)
+        self.assertEqual([pathlib.PurePath('dir1/dir2/c')], plan.remote_removals)
+        self.assertTrue(all(result.ok for result in engine.apply(plan)))
+        self.assertEqual(b'changed locally', engine.store.download_file(self.remote_dir / 'a'))
+        self.assertEqual(b'changed remotely', (self.local_dir / 'dir1' / 'b').read_bytes())
+        self.assertEqual(b'new remotely', (self.local_dir / 'd').read_bytes())
+        self.assertNotIn('c', [entry.name for entry in engine.store.get_list(self.remote_dir / 'dir1' / 'dir2')])
+        engine.store.remove(self.remote_dir / 'd')
+        plan = self.engine().plan()
+        self.assertEqual([pathlib.PurePath('d')], plan.local_removals)
+        self.engine().apply(plan)
+        self.assertFalse((self.local_dir / 'd').exists())
+        self.assertTrue(self.engine().plan().empty)
+
+    def test_failed_upload_keeps_remote(self):
+        self.fill()
+        engine = self.engine()
+        engine.sync()
+        self.write('a', b'changed locally')
+        upload_file = engine.store.upload_file
+
+        def failing_upload(path, data, is_chunk=False):
+            raise Exception('upload fail : reason = connection lost')
+        engine.store.upload_file = failing_upload
+        self.assertFalse(all(result.ok for result in engine.sync()))
+        self.assertEqual(b'first', engine.store.download_file(self.remote_dir / 'a'))
+        engine.store.upload_file = upload_file
+        self.assertTrue(all(result.ok for result in engine.sync()))
+        self.assertEqual(b'changed locally', engine.store.download_file(self.remote_dir / 'a'))
+        self.assertEqual(['a', 'dir1'], sorted(entry.name for entry in engine.store.get_list(self.remote_dir)))
+
+    def test_conflicts(self):
+        self.fill()
+        self.engine().sync()
+        self.write('a', b'local version')
+        store = self.engine().store
+        store.remove(self.remote_dir / 'a')
+        store.upload_file(self.remote_dir / 'a', b'remote version')
+        plan = self.engine().plan()
+        self.assertEqual([pathlib.PurePath('a')], plan.conflicts)
+        self.assertTrue(plan.empty)
+        self.engine(conflict='remote').sync()
+        self.assertEqual(b'remote version', (self.local_dir / 'a').read_bytes())
+        self.assertTrue(self.engine().plan().empty)
@@ -0,0 +1,159 @@
+import os
+import pathlib
+import tempfile
+import unittest
+from benchmarks.fake_servers import FakeServer, fake_config, connect
+from store import DropboxStore, GoogleDriveStore, TransformStore, ZlibTransform, ZstdTransform, EncryptionTransform
+from store.transform import encode_stream, decode_stream, zstandard, AESGCM
+
+
+def pieces(data, size):
+    return [data[offset:offset + size] for offset in range(0, len(data), size)]
+
+
+class TestTransforms(unittest.TestCase):
+    data = b''.join(b'line %d of a compressible file\n' % index for index in range(20000)) + os.urandom(1000)
+
+    def round_trip(self, transforms):
+        encoded = b''.join(encode_stream(pieces(self.data, 4096), transforms))
+        # decoded from pieces that don't line up with the encoded ones
+        self.assertEqual(self.data, b''.join(decode_stream(pieces(encoded, 777), transforms)))
+        self.assertEqual(b'', b''.join(decode_stream([b''.join(encode_stream([], transforms))], transforms)))
+        return encoded
+
+    def test_zlib(self):
+        self.assertLess(len(self.round_trip([ZlibTransform()])), len(self.data) // 5)
+
+    @unittest.skipIf(zstandard is None, 'needs zstandard')
+    def test_zstd(self):
+        self.assertLess(len(self.round_trip([ZstdTransform()])), len(self.data) // 5)
+
+    @unittest.skipIf(AESGCM is None, 'needs cryptography')
+    def test_encryption(self):
+        transforms = [ZlibTransform(), EncryptionTransform(b'k' * 32)]
+        encoded = self.round_trip(transforms)
+        with self.assertRaises(Exception):
+            b''.join(decode_stream([encoded[:-1] + b'x'], transforms))
+        with self.assertRaises(Exception):
+            b''.join(decode_stream([encoded], [ZlibTransform(), EncryptionTransform(b'o' * 32)]))
+
+    @unittest.skipIf(AESGCM is None, 'needs cryptography')
+    def test_encryption_segments(self):
+        transforms = [EncryptionTransform(b'k' * 32)]
+        # several segments, the last one full
+        for size in (3 * EncryptionTransform.segment_size, 3 * EncryptionTransform.segment_size + 5):
+            data = os.urandom(size)
+            encoded = b''.join(encode_stream(pieces(data, 4096), transforms))
+            self.assertEqual(data, b''.join(decode_stream(pieces(encoded, 1000), transforms)))
+            # no byte of a damaged segment is given out
+            damaged = bytearray(encoded)
+            damaged[100] ^= 1
+            decoded = decode_stream(pieces(bytes(damaged), 1000), transforms)
+            with self.assertRaises(Exception):
+                next(decoded)
+            # cut off after a whole segment
+            sealed_size = EncryptionTransform.segment_size + EncryptionTransform.tag_size
+            cut = encoded[:EncryptionTransform.salt_size + sealed_size]
+            with self.assertRaises(Exception):
+                b''.join(decode_stream([cut], transforms))
+
+    @unittest.skipIf(AESGCM is None, 'needs cryptography')
+    def test_encryption_context(self):
+        transforms = [EncryptionTransform(b'k' * 32)]
+        encoded = b''.join(encode_stream([self.data], transforms, b'header'))
+        self.assertEqual(self.data, b''.join(decode_stream([encoded], transforms, b'header')))
+        # the context is authenticated
+        with self.assertRaises(Exception):
+            b''.join(decode_stream([encoded], transforms, b'other'))
+        # every file gets its own salt, so its own key
+        again = b''.join(encode_stream([self.data], transforms, b'header'))
+        self.assertNotEqual(encoded[:EncryptionTransform.salt_size], again[:EncryptionTransform.salt_size])
+        self.assertNotEqual(encoded[EncryptionTransform.salt_size:], again[EncryptionTransform.salt_size:])
+
+    def test_truncated(self):
+        encoded = b''.join(encode_stream([self.data], [ZlibTransform()]))
+        with self.assertRaises(Exception):
+            b''.join(decode_stream([encoded[:len(encoded) // 2]], [ZlibTransform()]))
+
+    @unittest.skipIf(zstandard is None, 'needs zstandard')
+    def test_zstd_truncated(self):
+        encoded = b''.join(encode_stream([self.data], [ZstdTransform()]))
+        with self.assertRaises(Exception):
+            b''.join(decode_stream([encoded[:len(encoded) // 2]], [ZstdTransform()]))
+
+
+class TestTransformStore(unittest.TestCase):
+    data = TestTransforms.data
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        # small parts, so transformed uploads go through upload sessions as well
+        self.config = fake_config(pathlib.Path(tempfile.mkdtemp()), 'transform', upload_part_size=64 * 1024)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_upload_download(self):
+        for store_class, account in ((DropboxStore, 'dropbox-transform'), (GoogleDriveStore, 'google-transform')):
+            plain = connect(store_class(self.config, 'transform'), self.server.url)
+            store = TransformStore(plain, [ZlibTransform()])
+            sent = self.server.account(account).stats()['bytes_in']
+            store.upload_file(pathlib.PurePath('/big'), self.data)
+            self.assertLess(self.server.account(account).stats()['bytes_in'] - sent, len(self.data) // 5)
+            store.upload_file(pathlib.PurePath('/small'), b'small')
+            self.assertEqual(self.data, store.download_file(pathlib.PurePath('/big')))
+            self.assertEqual(b'small', store.download_file(pathlib.PurePath('/small')))
+            self.assertEqual(self.data[1000:3000],
+                             b''.join(store.download_stream(pathlib.PurePath('/big'), 1000, 2000)))
+            self.assertLess(plain.get_entry(pathlib.PurePath('/big')).file_size, len(self.data) // 5)
+            self.assertEqual(len(self.data), store.get_entry(pathlib.PurePath('/big')).file_size)
+            # sizes are the plain ones
+            self.assertEqual(len(self.data), store.file_size(pathlib.PurePath('/big')))
+            if plain.keeps_properties:
+                self.assertEqual({'big': len(self.data), 'small': 5},
+                                 {entry.name: entry.file_size for entry in store.get_list(pathlib.PurePath('/'))})
+            with store.open(pathlib.PurePath('/big')) as remote:
+                remote.seek(5000)
+                self.assertEqual(self.data[5000:5100], remote.read(100))
+            # data that looks like a header is stored like any other
+            store.upload_file(pathlib.PurePath('/lookalike'), store.header([ZlibTransform()]) + b'plain')
+            self.assertEqual(store.header([ZlibTransform()]) + b'plain',
+                             store.download_file(pathlib.PurePath('/lookalike')))
+            # files written around the transform store are refused
+            plain.upload_file(pathlib.PurePath('/plain'), b'as given')
+            with self.assertRaises(Exception):
+                store.download_file(pathlib.PurePath('/plain'))
+            with self.assertRaises(Exception):
+                store.file_size(pathlib.PurePath('/plain'))
+            # but listed as they are
+            self.assertEqual(8, store.get_entry(pathlib.PurePath('/plain')).file_size)
+            self.assertIn('plain', [entry.name for entry in store.get_list(pathlib.PurePath('/'))])
+
+    def test_listing_requests(self):
+        for store_class, account in ((DropboxStore, 'dropbox-transform'), (GoogleDriveStore, 'google-transform')):
+            plain = connect(store_class(self.config, 'transform'), self.server.url)
+            store = TransformStore(plain, [ZlibTransform()])
+            store.make_dir(pathlib.PurePath('/'), 'many')
+            items = [(pathlib.PurePath('/many/file{0}'.format(index)), self.data[:index * 100]) for index in range(50)]
+            self.assertTrue(all(result.ok for result in store.upload_many(items)))
+            # streamed through an upload session
+            streamed = os.urandom(200 * 1024)
+            store.upload_file(pathlib.PurePath('/many/streamed'), iter(pieces(streamed, 1000)))
+            sent = self.server.account(account).stats()['requests']
+            entries = store.get_list(pathlib.PurePath('/many'))
+            self.assertEqual(51, len(entries))
+            self.assertLessEqual(self.server.account(account).stats()['requests'] - sent, 2)
+            if plain.keeps_properties:
+                sizes = {path.name: len(data) for path, data in items}
+                sizes['streamed'] = len(streamed)
+                self.assertEqual(sizes, {entry.name: entry.file_size for entry in entries})
+            for path, data in items[::10]:
+                self.assertEqual(len(data), store.file_size(path))
+            self.assertEqual(len(streamed), store.get_entry(pathlib.PurePath('/many/streamed')).file_size)
+            self.assertEqual(streamed, store.download_file(pathlib.PurePath('/many/streamed')))
+
+    def test_unknown_transform(self):
+        plain = connect(DropboxStore(self.config, 'transform'), self.server.url)
+        TransformStore(plain, [ZlibTransform()]).upload_file(pathlib.PurePath('/file'), self.data)
+        with self.assertRaises(Exception):
+            TransformStore(plain, []).download_file(pathlib.PurePath('/file'))